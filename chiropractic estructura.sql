@@ -74,6 +74,17 @@ CREATE TABLE `antecedentes` (
 
 -- --------------------------------------------------------
 
+--
+-- Estructura de tabla para la tabla `catalogo_version`
+--
+
+CREATE TABLE `catalogo_version` (
+  `catalogo` varchar(32) NOT NULL COMMENT 'productos, doctores o centros',
+  `version` bigint(20) UNSIGNED NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci COMMENT='Versión de cada catálogo en caché (la incrementa cada modificación).';
+
+-- --------------------------------------------------------
+
 --
 -- Estructura de tabla para la tabla `centro`
 --
@@ -147,6 +158,29 @@ CREATE TABLE `notas_generales` (
 
 -- --------------------------------------------------------
 
+--
+-- Estructura de tabla para la tabla `paciente_tokens`
+--
+
+CREATE TABLE `paciente_tokens` (
+  `token` varchar(40) NOT NULL COMMENT 'Palabra normalizada del nombre completo',
+  `id_px` int(11) NOT NULL COMMENT 'FK a datos_personales'
+) ENGINE=InnoDB DEFAULT CHARSET=ascii COLLATE=ascii_bin COMMENT='Índice de búsqueda de pacientes por prefijo de nombre.';
+
+-- --------------------------------------------------------
+
+--
+-- Estructura de tabla para la tabla `paciente_tokens_estado`
+--
+
+CREATE TABLE `paciente_tokens_estado` (
+  `id` tinyint(4) NOT NULL COMMENT 'Siempre 1 (una sola fila)',
+  `pacientes` int(11) NOT NULL DEFAULT 0 COMMENT 'Pacientes indexados en la última reindexación',
+  `completado` datetime NOT NULL COMMENT 'Fin de la última reindexación completa'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci COMMENT='Marca de índice paciente_tokens completo.';
+
+-- --------------------------------------------------------
+
 --
 -- Estructura de tabla para la tabla `plancuidado`
 --
@@ -166,7 +200,9 @@ CREATE TABLE `plancuidado` (
   `ahorro_calculado` decimal(10,2) DEFAULT 0.00,
   `adicionales_ids` text DEFAULT NULL COMMENT 'IDs prod servicios adicionales (0,id,id)',
   `notas_plan` text DEFAULT NULL,
-  `fecha_registro` timestamp NOT NULL DEFAULT current_timestamp() COMMENT 'Timestamp de cuando se guardó'
+  `fecha_registro` timestamp NOT NULL DEFAULT current_timestamp() COMMENT 'Timestamp de cuando se guardó',
+  `visitas_qp_realizadas` int(11) NOT NULL DEFAULT 0 COMMENT 'Seguimientos asociados (mantenido por save_seguimiento)',
+  `visitas_tf_realizadas` int(11) NOT NULL DEFAULT 0 COMMENT 'Seguimientos asociados con terapia (mantenido por save_seguimiento)'
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
 -- --------------------------------------------------------
@@ -315,6 +351,22 @@ CREATE TABLE `recibo_detalle` (
 
 -- --------------------------------------------------------
 
+--
+-- Estructura de tabla para la tabla `resumen_ingresos_diario`
+--
+
+CREATE TABLE `resumen_ingresos_diario` (
+  `fecha` date NOT NULL,
+  `id_dr` int(11) NOT NULL DEFAULT 0 COMMENT 'Doctor que emitió los recibos (0 = sin doctor)',
+  `id_centro` int(11) NOT NULL DEFAULT 0 COMMENT 'Clínica del doctor al guardar el recibo',
+  `ingresos` decimal(14,2) NOT NULL DEFAULT 0.00 COMMENT 'Suma de total_neto',
+  `costo` decimal(14,2) NOT NULL DEFAULT 0.00 COMMENT 'Suma de cantidad * costo_unitario_compra',
+  `utilidad` decimal(14,2) NOT NULL DEFAULT 0.00 COMMENT 'Suma de (cantidad * precio - descuento de línea) - costo',
+  `num_recibos` int(11) NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci COMMENT='Agregado diario de recibos (mantenido por save_recibo).';
+
+-- --------------------------------------------------------
+
 --
 -- Estructura de tabla para la tabla `revaloraciones`
 --
@@ -335,6 +387,26 @@ CREATE TABLE `revaloraciones` (
   `fecha_registro` timestamp NOT NULL DEFAULT current_timestamp() COMMENT 'Timestamp de cuando se guardó'
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci COMMENT='Registros de hitos de revaloración del paciente.';
 
+-- --------------------------------------------------------
+
+--
+-- Estructura de tabla para la tabla `trabajos_imagen`
+--
+
+CREATE TABLE `trabajos_imagen` (
+  `id_trabajo` int(11) NOT NULL,
+  `id_postura` int(11) NOT NULL COMMENT 'FK a postura',
+  `columna` varchar(30) NOT NULL COMMENT 'Columna de postura a actualizar (frente, lado, postura_extra)',
+  `view_type` varchar(20) NOT NULL COMMENT 'frontal, lateral_izq, lateral_der',
+  `ruta_original` varchar(255) NOT NULL COMMENT 'Foto subida (sin anotar), relativa a static',
+  `ruta_resultado` varchar(255) DEFAULT NULL COMMENT 'Foto anotada, relativa a static',
+  `estado` varchar(15) NOT NULL DEFAULT 'pendiente' COMMENT 'pendiente, procesando, completado, error',
+  `intentos` int(11) NOT NULL DEFAULT 0,
+  `error` text DEFAULT NULL,
+  `fecha_creacion` timestamp NOT NULL DEFAULT current_timestamp(),
+  `fecha_actualizacion` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp()
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci COMMENT='Cola de procesamiento de imágenes de postura en segundo plano.';
+
 --
 -- Índices para tablas volcadas
 --
@@ -354,6 +426,12 @@ ALTER TABLE `antecedentes`
   ADD PRIMARY KEY (`id_antecedente`),
   ADD KEY `idx_antecedentes_paciente_fecha` (`id_px`,`fecha`);
 
+--
+-- Indices de la tabla `catalogo_version`
+--
+ALTER TABLE `catalogo_version`
+  ADD PRIMARY KEY (`catalogo`);
+
 --
 -- Indices de la tabla `centro`
 --
@@ -381,6 +459,19 @@ ALTER TABLE `notas_generales`
   ADD PRIMARY KEY (`id_nota`),
   ADD KEY `fk_notas_paciente_idx` (`id_px`);
 
+--
+-- Indices de la tabla `paciente_tokens`
+--
+ALTER TABLE `paciente_tokens`
+  ADD PRIMARY KEY (`token`,`id_px`),
+  ADD KEY `idx_paciente_tokens_px` (`id_px`);
+
+--
+-- Indices de la tabla `paciente_tokens_estado`
+--
+ALTER TABLE `paciente_tokens_estado`
+  ADD PRIMARY KEY (`id`);
+
 --
 -- Indices de la tabla `plancuidado`
 --
@@ -434,6 +525,13 @@ ALTER TABLE `recibo_detalle`
   ADD KEY `fk_recibo_detalle_recibo_idx` (`id_recibo`),
   ADD KEY `fk_recibo_detalle_producto_idx` (`id_prod`);
 
+--
+-- Indices de la tabla `resumen_ingresos_diario`
+--
+ALTER TABLE `resumen_ingresos_diario`
+  ADD PRIMARY KEY (`fecha`,`id_dr`,`id_centro`),
+  ADD KEY `idx_resumen_ingresos_dr_fecha` (`id_dr`,`fecha`);
+
 --
 -- Indices de la tabla `revaloraciones`
 --
@@ -445,6 +543,14 @@ ALTER TABLE `revaloraciones`
   ADD KEY `fk_revaloracion_anamnesis_idx` (`id_anamnesis_inicial`),
   ADD KEY `fk_revaloracion_postura` (`id_postura_asociado`);
 
+--
+-- Indices de la tabla `trabajos_imagen`
+--
+ALTER TABLE `trabajos_imagen`
+  ADD PRIMARY KEY (`id_trabajo`),
+  ADD KEY `idx_trabajos_imagen_estado` (`estado`,`fecha_actualizacion`),
+  ADD KEY `idx_trabajos_imagen_postura` (`id_postura`,`columna`);
+
 --
 -- AUTO_INCREMENT de las tablas volcadas
 --
@@ -533,6 +639,12 @@ ALTER TABLE `recibo_detalle`
 ALTER TABLE `revaloraciones`
   MODIFY `id_revaloracion` int(11) NOT NULL AUTO_INCREMENT;
 
+--
+-- AUTO_INCREMENT de la tabla `trabajos_imagen`
+--
+ALTER TABLE `trabajos_imagen`
+  MODIFY `id_trabajo` int(11) NOT NULL AUTO_INCREMENT;
+
 --
 -- Restricciones para tablas volcadas
 --
@@ -561,6 +673,12 @@ ALTER TABLE `datos_personales`
 ALTER TABLE `notas_generales`
   ADD CONSTRAINT `fk_notas_paciente` FOREIGN KEY (`id_px`) REFERENCES `datos_personales` (`id_px`) ON DELETE CASCADE ON UPDATE CASCADE;
 
+--
+-- Filtros para la tabla `paciente_tokens`
+--
+ALTER TABLE `paciente_tokens`
+  ADD CONSTRAINT `fk_paciente_tokens_px` FOREIGN KEY (`id_px`) REFERENCES `datos_personales` (`id_px`) ON DELETE CASCADE ON UPDATE CASCADE;
+
 --
 -- Filtros para la tabla `plancuidado`
 --
@@ -610,6 +728,12 @@ ALTER TABLE `revaloraciones`
   ADD CONSTRAINT `fk_revaloracion_doctor` FOREIGN KEY (`id_dr`) REFERENCES `dr` (`id_dr`) ON DELETE NO ACTION ON UPDATE CASCADE,
   ADD CONSTRAINT `fk_revaloracion_paciente` FOREIGN KEY (`id_px`) REFERENCES `datos_personales` (`id_px`) ON DELETE CASCADE ON UPDATE CASCADE,
   ADD CONSTRAINT `fk_revaloracion_postura` FOREIGN KEY (`id_postura_asociado`) REFERENCES `postura` (`id_postura`) ON DELETE SET NULL ON UPDATE CASCADE;
+
+--
+-- Filtros para la tabla `trabajos_imagen`
+--
+ALTER TABLE `trabajos_imagen`
+  ADD CONSTRAINT `fk_trabajos_imagen_postura` FOREIGN KEY (`id_postura`) REFERENCES `postura` (`id_postura`) ON DELETE CASCADE ON UPDATE CASCADE;
 COMMIT;
 
 /*!40101 SET CHARACTER_SET_CLIENT=@OLD_CHARACTER_SET_CLIENT */;
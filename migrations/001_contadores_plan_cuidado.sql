@@ -0,0 +1,8 @@
+-- Contadores de consumo por plan de cuidado.
+-- Los mantiene save_seguimiento (src/database.py) en la misma transacción que el seguimiento.
+-- Después de aplicar esta migración, llenar los contadores con:
+--   flask --app main contadores-planes --reparar
+
+ALTER TABLE `plancuidado`
+  ADD COLUMN IF NOT EXISTS `visitas_qp_realizadas` int(11) NOT NULL DEFAULT 0 COMMENT 'Seguimientos asociados (mantenido por save_seguimiento)',
+  ADD COLUMN IF NOT EXISTS `visitas_tf_realizadas` int(11) NOT NULL DEFAULT 0 COMMENT 'Seguimientos asociados con terapia (mantenido por save_seguimiento)';
@@ -0,0 +1,21 @@
+-- Cola durable de procesamiento de imágenes de postura (ver src/utils/image_jobs.py).
+-- manage_pruebas guarda la foto original, registra el trabajo y responde de inmediato;
+-- un proceso en segundo plano dibuja la pose y actualiza la columna de 'postura'.
+
+CREATE TABLE IF NOT EXISTS `trabajos_imagen` (
+  `id_trabajo` int(11) NOT NULL AUTO_INCREMENT,
+  `id_postura` int(11) NOT NULL COMMENT 'FK a postura',
+  `columna` varchar(30) NOT NULL COMMENT 'Columna de postura a actualizar (frente, lado, postura_extra)',
+  `view_type` varchar(20) NOT NULL COMMENT 'frontal, lateral_izq, lateral_der',
+  `ruta_original` varchar(255) NOT NULL COMMENT 'Foto subida (sin anotar), relativa a static',
+  `ruta_resultado` varchar(255) DEFAULT NULL COMMENT 'Foto anotada, relativa a static',
+  `estado` varchar(15) NOT NULL DEFAULT 'pendiente' COMMENT 'pendiente, procesando, completado, error',
+  `intentos` int(11) NOT NULL DEFAULT 0,
+  `error` text DEFAULT NULL,
+  `fecha_creacion` timestamp NOT NULL DEFAULT current_timestamp(),
+  `fecha_actualizacion` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+  PRIMARY KEY (`id_trabajo`),
+  KEY `idx_trabajos_imagen_estado` (`estado`,`fecha_actualizacion`),
+  KEY `idx_trabajos_imagen_postura` (`id_postura`,`columna`),
+  CONSTRAINT `fk_trabajos_imagen_postura` FOREIGN KEY (`id_postura`) REFERENCES `postura` (`id_postura`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci COMMENT='Cola de procesamiento de imágenes de postura en segundo plano.';
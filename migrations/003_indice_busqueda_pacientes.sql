@@ -0,0 +1,16 @@
+-- Índice de búsqueda de pacientes por nombre (ver search_patients_by_name en src/database.py).
+-- Una fila por palabra normalizada (minúsculas, sin acentos) del nombre completo de cada paciente.
+-- La búsqueda por prefijo ('mar%') recorre un rango de la llave primaria en lugar de hacer
+-- LIKE '%mar%' sobre toda la tabla datos_personales.
+--
+-- Después de aplicar esta migración, llenar el índice con:
+--   flask --app main reindexar-pacientes
+-- (hasta entonces la búsqueda sigue usando el LIKE original; ver la migración 006).
+
+CREATE TABLE IF NOT EXISTS `paciente_tokens` (
+  `token` varchar(40) NOT NULL COMMENT 'Palabra normalizada del nombre completo',
+  `id_px` int(11) NOT NULL COMMENT 'FK a datos_personales',
+  PRIMARY KEY (`token`,`id_px`),
+  KEY `idx_paciente_tokens_px` (`id_px`),
+  CONSTRAINT `fk_paciente_tokens_px` FOREIGN KEY (`id_px`) REFERENCES `datos_personales` (`id_px`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=ascii COLLATE=ascii_bin COMMENT='Índice de búsqueda de pacientes por prefijo de nombre.';
@@ -0,0 +1,37 @@
+-- Resumen diario de ingresos para los reportes de administración
+-- (get_ingresos_por_periodo, get_utilidad_estimada_por_periodo y sus variantes por doctor).
+-- Una fila por fecha x doctor x clínica. La mantiene save_recibo (src/database.py) en la misma
+-- transacción que el recibo; id_dr = 0 agrupa los recibos sin doctor.
+--
+-- Esta migración también llena el resumen con los recibos existentes (la clínica de cada
+-- recibo es la que tiene hoy su doctor). Para reconstruirlo o verificarlo después:
+--   flask --app main resumen-ingresos --recalcular
+--   flask --app main resumen-ingresos --verificar
+
+CREATE TABLE IF NOT EXISTS `resumen_ingresos_diario` (
+  `fecha` date NOT NULL,
+  `id_dr` int(11) NOT NULL DEFAULT 0 COMMENT 'Doctor que emitió los recibos (0 = sin doctor)',
+  `id_centro` int(11) NOT NULL DEFAULT 0 COMMENT 'Clínica del doctor al guardar el recibo',
+  `ingresos` decimal(14,2) NOT NULL DEFAULT 0.00 COMMENT 'Suma de total_neto',
+  `costo` decimal(14,2) NOT NULL DEFAULT 0.00 COMMENT 'Suma de cantidad * costo_unitario_compra',
+  `utilidad` decimal(14,2) NOT NULL DEFAULT 0.00 COMMENT 'Suma de (cantidad * precio - descuento de línea) - costo',
+  `num_recibos` int(11) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`fecha`,`id_dr`,`id_centro`),
+  KEY `idx_resumen_ingresos_dr_fecha` (`id_dr`,`fecha`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci COMMENT='Agregado diario de recibos (mantenido por save_recibo).';
+
+DELETE FROM `resumen_ingresos_diario`;
+
+INSERT INTO `resumen_ingresos_diario` (fecha, id_dr, id_centro, ingresos, costo, utilidad, num_recibos)
+SELECT rr.fecha, IFNULL(rr.id_dr, 0), IFNULL(d.centro, 0),
+       SUM(rr.total_neto), SUM(rr.costo), SUM(rr.venta - rr.costo), COUNT(*)
+FROM (
+    SELECT r.id_recibo, r.fecha, r.id_dr, IFNULL(r.total_neto, 0) AS total_neto,
+           IFNULL(SUM(rd.cantidad * rd.costo_unitario_venta - IFNULL(rd.descuento_linea, 0)), 0) AS venta,
+           IFNULL(SUM(rd.cantidad * IFNULL(rd.costo_unitario_compra, 0)), 0) AS costo
+    FROM recibos r
+    LEFT JOIN recibo_detalle rd ON rd.id_recibo = r.id_recibo
+    GROUP BY r.id_recibo, r.fecha, r.id_dr, r.total_neto
+) rr
+LEFT JOIN dr d ON d.id_dr = rr.id_dr
+GROUP BY rr.fecha, IFNULL(rr.id_dr, 0), IFNULL(d.centro, 0);
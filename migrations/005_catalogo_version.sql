@@ -0,0 +1,16 @@
+-- Versión compartida de las tablas de catálogo (productos_servicios, dr, centro).
+-- Cada worker guarda en memoria los catálogos (src/utils/catalogos.py) y en cada request compara
+-- su versión con esta tabla; las funciones que modifican un catálogo (src/database.py) incrementan
+-- su versión en la misma transacción. Sin esta tabla los catálogos se leen de la BD como antes.
+--
+-- Si se modifica un catálogo directamente en la BD, incrementar su versión a mano:
+--   UPDATE catalogo_version SET version = version + 1 WHERE catalogo = 'productos';
+
+CREATE TABLE IF NOT EXISTS `catalogo_version` (
+  `catalogo` varchar(32) NOT NULL COMMENT 'productos, doctores o centros',
+  `version` bigint(20) UNSIGNED NOT NULL DEFAULT 0,
+  PRIMARY KEY (`catalogo`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci COMMENT='Versión de cada catálogo en caché (la incrementa cada modificación).';
+
+INSERT IGNORE INTO `catalogo_version` (catalogo, version) VALUES
+  ('productos', 1), ('doctores', 1), ('centros', 1);
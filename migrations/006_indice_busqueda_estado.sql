@@ -0,0 +1,15 @@
+-- Marca de índice de búsqueda completo (ver _indice_busqueda_disponible en src/database.py).
+-- La búsqueda usa paciente_tokens solo si existe esta fila, que escribe únicamente
+-- 'flask reindexar-pacientes' al terminar de indexar a todos los pacientes. Antes se usaba
+-- "paciente_tokens tiene filas", pero un paciente guardado entre la migración 003 y la primera
+-- reindexación activaba un índice con solo ese paciente.
+--
+-- Después de aplicar esta migración, ejecutar (aunque ya se hubiera hecho antes):
+--   flask --app main reindexar-pacientes
+
+CREATE TABLE IF NOT EXISTS `paciente_tokens_estado` (
+  `id` tinyint(4) NOT NULL COMMENT 'Siempre 1 (una sola fila)',
+  `pacientes` int(11) NOT NULL DEFAULT 0 COMMENT 'Pacientes indexados en la última reindexación',
+  `completado` datetime NOT NULL COMMENT 'Fin de la última reindexación completa',
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci COMMENT='Marca de índice paciente_tokens completo.';
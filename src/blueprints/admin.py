@@ -1,6 +1,8 @@
+import logging
 import os
 from flask import (
-    Blueprint, render_template, request, redirect, jsonify, session, flash, url_for
+    Blueprint, render_template, request, redirect, jsonify, session, flash, url_for,
+    Response, stream_with_context
 )
 from mysql.connector import Error
 from datetime import datetime, date
@@ -21,13 +23,31 @@ from database import (
     get_seguimientos_por_doctor_periodo, get_uso_planes_de_cuidado,
     get_all_productos_servicios, get_producto_servicio_by_id,
     add_producto_servicio, update_producto_servicio, 
-    set_producto_servicio_active_status
+    set_producto_servicio_active_status, get_pool_stats, get_ids_recibos_periodo,
+    get_mapa_identidad_stats
 )
 from utils.date_manager import to_frontend_str
+from utils.pose_pool import get_pose_pool
+from utils.ia_texto import estadisticas_ia
+from utils.ia_cache import cache_ia
+from utils.ia_imagenes import preparador_imagenes_ia
+from utils.pdf_cache import cache_pdf
+from utils.cache_busqueda import cache_busqueda_pacientes
+from utils.reportes import cache_reportes, obtener_reportes_combinados, validar_rango
+from utils.catalogos import cache_catalogos
+from utils.sql_metricas import SQL_METRICAS_CONFIG, metricas_sql
+from utils.registro import stats_logging
+from utils.pdf_jobs import get_pdf_jobs
+from utils.exportar_recibos import ExportacionIncompletaError, exportar_zip, exportar_pdf_unico
 
 # Importar los decoradores
 from decorators import login_required, admin_required
 
+logger = logging.getLogger(__name__)
+
+# Filas por página en la lista detallada del reporte de uso de planes
+PLANES_POR_PAGINA = 25
+
 # 1. Crear el Blueprint con prefijo /admin
 admin_bp = Blueprint('admin', 
                      __name__, 
@@ -68,10 +88,10 @@ def register():
                     else:
                         flash('Error al registrar el doctor en la base de datos.', 'danger')
             except Error as db_err:
-                print(f"Error de BD en register: {db_err}") # CAMBIO
+                logger.error('Error de BD en register: %s', db_err) # CAMBIO
                 flash(f"Error de base de datos: {db_err}", "danger")
             except Exception as e:
-                print(f"Error inesperado en register: {e}") # CAMBIO
+                logger.error('Error inesperado en register: %s', e) # CAMBIO
                 flash("Ocurrió un error inesperado durante el registro.", "danger")
             finally:
                 if connection and connection.is_connected():
@@ -182,7 +202,7 @@ def admin_dashboard():
                                num_seguimientos_hoy=num_seguimientos_hoy
                                )
     except Exception as e:
-        print(f"Error en admin_dashboard: {e}") # CAMBIO (eliminado exc_info)
+        logger.error('Error en admin_dashboard: %s', e) # CAMBIO (eliminado exc_info)
         flash("Ocurrió un error al cargar el dashboard de administrador.", "danger")
         return render_template('admin/dashboard_admin.html',
                                admin_name=session.get('nombre_dr', 'Admin'),
@@ -194,6 +214,91 @@ def admin_dashboard():
         if connection and connection.is_connected():
             connection.close()
 
+@admin_bp.route('/sistema/db_pool')
+@admin_required
+def admin_db_pool_stats():
+    """Estadísticas del pool de conexiones de este proceso (checkouts, esperas, conexiones en uso)."""
+    return jsonify(get_pool_stats())
+
+@admin_bp.route('/sistema/pose_pool')
+@admin_required
+def admin_pose_pool_stats():
+    """Estadísticas del pool de modelos MediaPipe Pose de este proceso (instancias, cargas, esperas)."""
+    return jsonify(get_pose_pool().stats())
+
+@admin_bp.route('/sistema/ia_stats')
+@admin_required
+def admin_ia_stats():
+    """Latencias y resultados por proveedor de IA de texto (llamadas, errores, p50/p95, veces que ganó)."""
+    return jsonify(estadisticas_ia.snapshot())
+
+@admin_bp.route('/sistema/ia_cache')
+@admin_required
+def admin_ia_cache():
+    """Métricas de la caché de informes de IA (aciertos, fallos, regeneraciones, tamaño en disco)."""
+    return jsonify(cache_ia.metricas())
+
+@admin_bp.route('/sistema/ia_imagenes')
+@admin_required
+def admin_ia_imagenes():
+    """Imágenes enviadas a Gemini: bytes originales vs. enviados y uso de la caché de imágenes preparadas."""
+    return jsonify(preparador_imagenes_ia.stats())
+
+@admin_bp.route('/sistema/pdf_cache')
+@admin_required
+def admin_pdf_cache():
+    """Métricas de la caché de PDF (servidos desde disco, 304 al navegador, regenerados, invalidados)."""
+    return jsonify(cache_pdf.metricas())
+
+@admin_bp.route('/sistema/busqueda_cache')
+@admin_required
+def admin_busqueda_cache():
+    """Caché de resultados del buscador de pacientes de este worker (hits, expirados, invalidaciones)."""
+    return jsonify(cache_busqueda_pacientes.stats())
+
+@admin_bp.route('/sistema/reportes_cache')
+@admin_required
+def admin_reportes_cache():
+    """Caché del reporte combinado de este worker (hits y tiempo total de cálculo)."""
+    return jsonify(cache_reportes.stats())
+
+@admin_bp.route('/sistema/catalogos_cache')
+@admin_required
+def admin_catalogos_cache():
+    """Catálogos en memoria de este worker (versión, filas, recargas)."""
+    return jsonify(cache_catalogos.stats())
+
+@admin_bp.route('/sistema/mapa_identidad')
+@admin_required
+def admin_mapa_identidad():
+    """Lecturas repetidas evitadas por el mapa de identidad por request (acumulado de este worker)."""
+    return jsonify(get_mapa_identidad_stats())
+
+@admin_bp.route('/sistema/sql')
+@admin_required
+def admin_sql_metricas():
+    """Consultas SQL más lentas de este worker, agrupadas por huella (?formato=json para el JSON)."""
+    orden = request.args.get('orden', 'max_ms')
+    if orden not in ('max_ms', 'total_ms', 'ejecuciones'):
+        orden = 'max_ms'
+    stats = metricas_sql.stats(SQL_METRICAS_CONFIG['top_n'], orden)
+    if request.args.get('formato') == 'json':
+        return jsonify(stats)
+    return render_template('admin/sql_metricas.html', stats=stats, habilitada=SQL_METRICAS_CONFIG['enabled'])
+
+@admin_bp.route('/sistema/sql/reiniciar', methods=['POST'])
+@admin_required
+def admin_sql_metricas_reiniciar():
+    metricas_sql.reiniciar()
+    flash("Métricas SQL reiniciadas (solo en este worker).", "success")
+    return redirect(url_for('admin.admin_sql_metricas'))
+
+@admin_bp.route('/sistema/logging')
+@admin_required
+def admin_logging():
+    """Registros encolados, descartados por cola llena y omitidos por límite o muestreo (este worker)."""
+    return jsonify(stats_logging())
+
 # --- RUTAS DE GESTIÓN DE PRODUCTOS ---
 
 @admin_bp.route('/productos')
@@ -209,7 +314,7 @@ def admin_manage_productos():
         productos = get_all_productos_servicios(connection, include_inactive=True)
         return render_template('admin/productos_lista.html', productos=productos)
     except Exception as e:
-        print(f"Error en admin_manage_productos: {e}") # CAMBIO
+        logger.error('Error en admin_manage_productos: %s', e) # CAMBIO
         flash("Error al cargar la lista de productos.", "danger")
         return redirect(url_for('admin.admin_dashboard'))
     finally:
@@ -347,7 +452,7 @@ def admin_edit_producto(id_prod):
 
     except Exception as e:
         if connection: connection.rollback()
-        print(f"Error en admin_edit_producto (ID {id_prod}): {e}")
+        logger.error('Error en admin_edit_producto (ID %s): %s', id_prod, e)
         flash('Ocurrió un error inesperado al editar.', 'danger')
         return redirect(url_for('admin.admin_manage_productos'))
     finally:
@@ -381,7 +486,7 @@ def admin_toggle_producto_status(id_prod):
         
         return redirect(url_for('admin.admin_manage_productos'))
     except Exception as e:
-        print(f"Error en admin_toggle_producto_status (ID {id_prod}): {e}") # CAMBIO
+        logger.error('Error en admin_toggle_producto_status (ID %s): %s', id_prod, e) # CAMBIO
         flash("Error inesperado al cambiar estado del producto.", "danger")
         return redirect(url_for('admin.admin_manage_productos'))
     finally:
@@ -402,7 +507,7 @@ def admin_manage_doctores():
         doctores = get_all_doctors(connection, include_inactive=True)
         return render_template('admin/doctores_lista.html', doctores=doctores)
     except Exception as e:
-        print(f"Error en admin_manage_doctores: {e}") # CAMBIO
+        logger.error('Error en admin_manage_doctores: %s', e) # CAMBIO
         flash("Error al cargar la lista de doctores.", "danger")
         return redirect(url_for('admin.admin_dashboard'))
     finally:
@@ -490,7 +595,7 @@ def admin_edit_doctor(id_dr):
         return render_template('admin/doctor_form.html', form=form, doctor=doctor)
 
     except Exception as e:
-        print(f"Error en admin_edit_doctor (ID {id_dr}): {e}")
+        logger.error('Error en admin_edit_doctor (ID %s): %s', id_dr, e)
         flash('Ocurrió un error inesperado al editar el doctor.', 'danger')
         return redirect(url_for('admin.admin_manage_doctores'))
     finally:
@@ -545,7 +650,7 @@ def admin_change_doctor_password(id_dr):
         return render_template('admin/doctor_cambiar_password_form.html', form=form, doctor=doctor)
 
     except Exception as e:
-        print(f"Error en admin_change_doctor_password (ID {id_dr}): {e}")
+        logger.error('Error en admin_change_doctor_password (ID %s): %s', id_dr, e)
         flash('Ocurrió un error inesperado al cambiar la contraseña.', 'danger')
         return redirect(url_for('admin.admin_manage_doctores'))
     finally:
@@ -577,7 +682,7 @@ def admin_toggle_doctor_status(id_dr):
         else:
             flash(f"Error al cambiar el estado del doctor '{doctor['nombre']}'.", "danger")
     except Exception as e:
-        print(f"Error en admin_toggle_doctor_status (ID {id_dr}): {e}") # CAMBIO
+        logger.error('Error en admin_toggle_doctor_status (ID %s): %s', id_dr, e) # CAMBIO
         flash("Error inesperado al cambiar estado del doctor.", "danger")
     finally:
         if connection and connection.is_connected():
@@ -599,7 +704,7 @@ def admin_manage_clinicas():
         centros = get_all_centros(connection)
         return render_template('admin/clinicas_lista.html', centros=centros)
     except Exception as e:
-        print(f"Error en admin_manage_clinicas: {e}") # CAMBIO
+        logger.error('Error en admin_manage_clinicas: %s', e) # CAMBIO
         flash("Error al cargar la lista de clínicas.", "danger")
         return redirect(url_for('admin.admin_dashboard'))
     finally:
@@ -687,7 +792,7 @@ def admin_edit_clinica(id_centro):
 
     except Exception as e:
         if connection: connection.rollback()
-        print(f"Error en admin_edit_centro (ID {id_centro}): {e}")
+        logger.error('Error en admin_edit_centro (ID %s): %s', id_centro, e)
         flash('Ocurrió un error inesperado al editar la clínica.', 'danger')
         return redirect(url_for('admin.admin_manage_clinicas'))
     finally:
@@ -739,6 +844,105 @@ def admin_add_clinica():
     return render_template('admin/clinica_form.html', form=form, title="Crear Nueva Clínica", centro=None)
 
 
+@admin_bp.route('/recibos/exportar')
+@admin_required
+def admin_exportar_recibos():
+    """
+    Exporta todos los recibos de un periodo (cierre de mes para contabilidad).
+    Parámetros: inicio, fin (YYYY-MM-DD), id_dr, id_centro (opcionales) y formato ('zip' o 'pdf').
+    El ZIP se envía por partes mientras se generan los PDF (memoria acotada sin importar el periodo).
+    """
+    try:
+        fecha_inicio = datetime.strptime(request.args.get('inicio', ''), '%Y-%m-%d').date()
+        fecha_fin = datetime.strptime(request.args.get('fin', ''), '%Y-%m-%d').date()
+    except ValueError:
+        flash('Indique un periodo válido (inicio y fin en formato AAAA-MM-DD).', 'warning')
+        return redirect(url_for('admin.admin_reportes_dashboard'))
+    id_dr = request.args.get('id_dr', type=int)
+    id_centro = request.args.get('id_centro', type=int)
+    formato = request.args.get('formato', 'zip')
+
+    connection = connect_to_db()
+    if not connection:
+        flash('Error de conexión.', 'danger')
+        return redirect(url_for('admin.admin_reportes_dashboard'))
+
+    ids_recibos = get_ids_recibos_periodo(connection, fecha_inicio, fecha_fin, id_dr, id_centro)
+    if not ids_recibos:
+        connection.close()
+        flash('No hay recibos en el periodo seleccionado.', 'info')
+        return redirect(url_for('admin.admin_reportes_dashboard'))
+
+    cola_pdf = get_pdf_jobs()
+    executor = cola_pdf.pool_procesos() if cola_pdf and cola_pdf.habilitada else None
+    nombre_base = f"recibos_{fecha_inicio.strftime('%Y%m%d')}_{fecha_fin.strftime('%Y%m%d')}"
+    logger.info('Exportando %s recibos (%s) del %s al %s.', len(ids_recibos), formato, fecha_inicio, fecha_fin)
+
+    if formato == 'pdf':
+        try:
+            contenido = exportar_pdf_unico(connection, ids_recibos, executor)
+        except ValueError as e:
+            flash(str(e), 'warning')
+            return redirect(url_for('admin.admin_reportes_dashboard'))
+        except ExportacionIncompletaError as e:
+            logger.error('Exportación de recibos a PDF incompleta: %s', e)
+            flash(f'No se generó el PDF: {e}', 'danger')
+            return redirect(url_for('admin.admin_reportes_dashboard'))
+        except Exception as e:
+            logger.error('Error exportando recibos a PDF: %s', e)
+            flash('Error al generar el PDF de recibos.', 'danger')
+            return redirect(url_for('admin.admin_reportes_dashboard'))
+        finally:
+            connection.close()
+        response = Response(contenido, mimetype='application/pdf')
+        response.headers['Content-Disposition'] = f'attachment; filename={nombre_base}.pdf'
+        return response
+
+    def generar():
+        try:
+            yield from exportar_zip(connection, ids_recibos, executor)
+        except Exception as e:
+            # Los encabezados ya se enviaron: el ZIP lleva ERROR_EXPORTACION_INCOMPLETA.txt en lugar de resumen.csv
+            logger.error('Error exportando recibos a ZIP: %s', e)
+        finally:
+            connection.close()
+
+    response = Response(stream_with_context(generar()), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename={nombre_base}.zip'
+    return response
+
+@admin_bp.route('/reportes/datos')
+@admin_required
+def admin_reportes_datos():
+    """
+    Datos de todas las gráficas del dashboard de reportes para un rango, en un solo JSON.
+    Parámetros: fecha_inicio y fecha_fin (YYYY-MM-DD), doctor_id y centro_id (0 = todos),
+    refrescar=1 para ignorar la caché. Responde con ETag (304 si no cambió).
+    """
+    fecha_inicio_str = request.args.get('fecha_inicio', '')
+    fecha_fin_str = request.args.get('fecha_fin', '')
+    error = validar_rango(fecha_inicio_str, fecha_fin_str)
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        doctor_id = int(request.args.get('doctor_id', 0) or 0)
+        centro_id = int(request.args.get('centro_id', 0) or 0)
+    except ValueError:
+        return jsonify({'error': 'doctor_id y centro_id deben ser números.'}), 400
+
+    reporte, etag = obtener_reportes_combinados(fecha_inicio_str, fecha_fin_str, doctor_id, centro_id,
+                                                refrescar=request.args.get('refrescar') == '1')
+    if reporte is None:
+        return jsonify({'error': 'No se pudieron calcular los reportes.'}), 500
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(reporte)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @admin_bp.route('/reportes', methods=['GET', 'POST'])
 @admin_required
 def admin_reportes_dashboard():
@@ -752,7 +956,7 @@ def admin_reportes_dashboard():
             'fecha_inicio': first_day_of_month,
             'fecha_fin': today
         }
-        print(f"DEBUG: Aplicando fechas por defecto: {default_date_data}") # Opcional
+        logger.debug('Aplicando fechas por defecto: %s', default_date_data) # Opcional
 
     # 1. Instanciar todos los formularios
     if request.method == 'POST':
@@ -818,6 +1022,11 @@ def admin_reportes_dashboard():
         form_utilidad.doctor_id.choices = doctor_choices
         form_nuevos_pac.doctor_id.choices = doctor_choices
         form_seguimientos.doctor_id.choices = doctor_choices
+        form_uso_planes.doctor_id.choices = doctor_choices
+
+        centro_choices = [(c['id_centro'], c['nombre']) for c in get_all_centros(connection)]
+        centro_choices.insert(0, (0, "Todas las Clínicas"))
+        form_uso_planes.centro_id.choices = centro_choices
 
         # --- 4. LÓGICA DE PROCESAMIENTO DE FORMULARIOS (POST) ---
         
@@ -923,7 +1132,11 @@ def admin_reportes_dashboard():
             fecha_inicio_str = form_uso_planes.fecha_inicio.data.strftime('%Y-%m-%d')
             fecha_fin_str = form_uso_planes.fecha_fin.data.strftime('%Y-%m-%d')
             
-            datos_uso_planes_dict = get_uso_planes_de_cuidado(connection, fecha_inicio_str, fecha_fin_str)
+            datos_uso_planes_dict = get_uso_planes_de_cuidado(connection, fecha_inicio_str, fecha_fin_str,
+                                                              doctor_id=form_uso_planes.doctor_id.data,
+                                                              centro_id=form_uso_planes.centro_id.data,
+                                                              pagina=form_uso_planes.pagina.data or 1,
+                                                              por_pagina=PLANES_POR_PAGINA)
             
             if datos_uso_planes_dict and datos_uso_planes_dict['total_creados'] > 0:
                 datos_uso_planes = datos_uso_planes_dict # Pasamos el dict completo
@@ -933,7 +1146,7 @@ def admin_reportes_dashboard():
                 flash("No se encontraron planes de cuidado creados en el periodo seleccionado.", "info")
 
     except Exception as e:
-        print(f"Error generando reporte: {e}")
+        logger.error('Error generando reporte: %s', e)
         flash(f"Error al procesar la solicitud del reporte: {str(e)}", "danger")
     finally:
         if connection and connection.is_connected():
@@ -1,3 +1,5 @@
+import hashlib
+import logging
 import os
 #import google.generativeai as genai
 #from groq import Groq
@@ -6,18 +8,12 @@ import os
 #import time
 from datetime import datetime, timedelta, date
 import uuid
-import base64
 import json
-from PIL import Image
 from flask import (
-    Blueprint, render_template, request, redirect, jsonify, session, flash, url_for, Response, current_app
+    Blueprint, render_template, request, redirect, jsonify, session, flash, url_for, current_app
 )
 from flask_wtf.csrf import CSRFProtect
 from mysql.connector import Error
-from io import BytesIO
-from xhtml2pdf import pisa
-import cv2
-import mediapipe as mp
 from werkzeug.utils import secure_filename
 
 from forms import AntecedentesForm,AnamnesisForm
@@ -38,17 +34,36 @@ from database import (
     get_productos_by_ids, get_latest_antecedente_on_or_before_date, 
     get_productos_servicios_venta, save_recibo, get_specific_recibo, 
     get_plan_cuidado_activo_para_paciente, get_seguimientos_for_plan,
-    get_recibo_detalles_by_id, get_all_doctors, #get_resumen_dia_anterior,
+    get_recibo_detalles_by_id, get_all_doctors, get_nombre_doctor, #get_resumen_dia_anterior,
     get_recibos_by_patient, get_recibo_by_id, get_centro_by_id,
     get_first_postura_on_or_after_date, get_active_plan_status,
     update_postura_ortho_notes, analizar_adicionales_plan, get_historial_compras_paciente,
-    mark_notes_as_seen,add_general_note, get_latest_postura_on_or_before_date
+    mark_notes_as_seen,add_general_note, get_latest_postura_on_or_before_date,
+    get_trabajos_imagen_por_postura
 )
 from utils.date_manager import to_frontend_str, to_db_str, calculate_age, parse_date
+from utils.pose_pool import POSE_POSTURA, POSE_PODAL
+from utils.pose_landmarks import (
+    obtener_landmarks, HOMBRO_IZQ, HOMBRO_DER, CADERA_IZQ, CADERA_DER,
+    TOBILLO_IZQ, TOBILLO_DER, TALON_IZQ, TALON_DER
+)
+from utils.ia_models import cargar_modelo_generativo, cargar_cliente_groq
+from utils.ia_cache import generar_contenido_con_cache, RespuestaIABloqueada
+from utils.ia_imagenes import LoteImagenesIA
+from utils.pdf_cache import responder_pdf, invalidar_pdfs_de_tabla, cache_pdf, respuesta_pdf
+from utils.pdf_jobs import get_pdf_jobs, responder_trabajo_pdf
+from utils.recursos import logo_data_uri
+from utils.ia_texto import (
+    generar_texto_con_cobertura, candidato_groq, candidato_gemini, candidatos_fake_desde_config
+)
+from utils.postura_imagen import anotar_imagen_postura
+from utils.image_jobs import get_image_jobs
 
 # Importar los decoradores
 from decorators import login_required#, admin_required
 
+logger = logging.getLogger(__name__)
+
 # --- Mapeos (copiados de main.py) ---
 CONDICIONES_GENERALES_MAP = {
     '1': 'Dolor de cuello', '2': 'Dolor de cabeza', '3': 'Alteraciones auditivas',
@@ -151,12 +166,12 @@ clinical_bp = Blueprint('clinical',
 
 
 def get_generative_model():
-    # Accede al modelo desde la configuración de la app
-    return current_app.config.get('GENERATIVE_MODEL')
+    # Accede al modelo de la app (se inicializa la primera vez que se usa)
+    return cargar_modelo_generativo(current_app._get_current_object())
 
 def get_groq_client():
-    # Accede al cliente de Groq desde la configuración de la app
-    return current_app.config.get('GROQ_CLIENT')
+    # Accede al cliente de Groq de la app (se crea la primera vez si hay GROQ_API_KEY)
+    return cargar_cliente_groq(current_app._get_current_object())
 
 def generar_historia_con_ia(datos_formulario, mapas):
     generative_model = get_generative_model()
@@ -197,48 +212,30 @@ def generar_historia_con_ia(datos_formulario, mapas):
         "--- FIN DE DATOS ---"
     )
    
-    # --- CADENA DE RESPALDO DE IA (NUEVA LÓGICA) ---
-    historia_generada = None
-    
-    # 1. Leer la lista de modelos desde la config
-    text_models_list = current_app.config['IA_MODELS_CONFIG'].get('text_models', [])
-
-    # 2. Intentar con Groq (si está disponible)
-    if groq_client and text_models_list:
-        for model_name in text_models_list:
-            print(f"INFO: Intentando generar historia con Groq (Modelo: {model_name})...")
-            try:
-                chat_completion = groq_client.chat.completions.create(
-                    messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
-                    model=model_name
-                )
-                historia_generada = chat_completion.choices[0].message.content.strip()
-                if historia_generada:
-                    print(f"--- ÉXITO CON GROQ ({model_name}) ---")
-                    break # ¡Éxito! Salimos del bucle
-                raise ValueError("Respuesta de Groq vacía.")
-            except Exception as e:
-                print(f"ADVERTENCIA: Modelo Groq '{model_name}' falló: {e}. Probando siguiente.")
-        
-        if historia_generada:
-            return historia_generada # Devolver si Groq tuvo éxito
+    # --- CADENA DE RESPALDO DE IA ---
+    ia_config = current_app.config['IA_MODELS_CONFIG']
 
-    # 3. Intentar con Gemini (si Groq falló o no estaba disponible)
-    if not historia_generada and generative_model:
-        print("INFO: Groq falló. Intentando generar historia con Gemini...")
-        try:
-            full_prompt_gemini = f"{system_prompt}\n{user_prompt}"
-            response = generative_model.generate_content(full_prompt_gemini)
-            historia_generada = response.text.strip()
-            if historia_generada:
-                print(f"--- ÉXITO CON GEMINI ---")
-                return historia_generada
-            raise ValueError("Respuesta de Gemini vacía.")
-        except Exception as e:
-            print(f"ADVERTENCIA: La llamada a Gemini falló: {e}.")
+    # 1. Candidatos en orden de preferencia: modelos de Groq (text_models) y luego Gemini.
+    #    Con "fake_text_providers" en ia_config.json se usan proveedores locales de prueba (sin red).
+    if ia_config.get('fake_text_providers'):
+        candidatos = candidatos_fake_desde_config(ia_config['fake_text_providers'])
+    else:
+        candidatos = []
+        if groq_client:
+            candidatos += [candidato_groq(groq_client, model_name) for model_name in ia_config.get('text_models', [])]
+        if generative_model:
+            candidatos.append(candidato_gemini(generative_model))
+
+    # 2. Secuencial o con hedging según "text_hedging" (ver utils/ia_texto.py)
+    historia_generada, proveedor = generar_texto_con_cobertura(
+        candidatos, system_prompt, user_prompt, ia_config.get('text_hedging')
+    )
+    if historia_generada:
+        logger.debug('Respuesta obtenida con %s', proveedor)
+        return historia_generada
 
-    # 4. Último Recurso (si todo lo demás falla)
-    print("ADVERTENCIA: Todas las APIs de IA fallaron. Usando el generador de historia de respaldo.")
+    # 3. Último Recurso (si todo lo demás falla)
+    logger.warning('Todas las APIs de IA fallaron. Usando el generador de historia de respaldo.')
     historia_respaldo = (
         f"Paciente refiere dolor de '{condicion_principal}' ({calificacion_principal}/10 según la escala de Borg) "
         # ... (tu texto de respaldo) ...
@@ -248,6 +245,7 @@ def generar_historia_con_ia(datos_formulario, mapas):
 def procesar_y_guardar_imagen_postura(file_storage, save_folder, base_filename, view_type='frontal'):
     """
     Procesa una imagen de postura replicando EXACTAMENTE la lógica y apariencia de pose.py.
+    (El re-escalado y dibujo están en utils/postura_imagen.py para poder usarlos también en segundo plano.)
     """
     # ... (la parte inicial de manejo de archivos no cambia)
     if not file_storage or file_storage.filename == '' or not allowed_file(file_storage.filename):
@@ -260,126 +258,16 @@ def procesar_y_guardar_imagen_postura(file_storage, save_folder, base_filename,
     temp_path = os.path.join(save_folder, f"temp_{unique_id}.{extension}")
     file_storage.save(temp_path)
 
-    image_to_save = None
-    mp_pose = mp.solutions.pose
-    pose = mp_pose.Pose(static_image_mode=True, model_complexity=2, min_detection_confidence=0.5)
-
     try:
-        image = cv2.imread(temp_path)
-        if image is None: raise ValueError("OpenCV no pudo leer la imagen.")
-
-        # Replicar el re-escalado del script para consistencia
-        image = cv2.resize(image, (600, 800), interpolation=cv2.INTER_AREA)
-        h, w, _ = image.shape
-        
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        results = pose.process(image_rgb)
-        annotated_image = image.copy()
-
-        if results.pose_landmarks:
-            landmarks = results.pose_landmarks.landmark
-            
-            # --- LÓGICA FRONTAL (IDÉNTICA A POSE.PY) ---
-            if view_type == 'frontal':
-                # Extraer coordenadas
-                p = {id: (int(landmarks[id].x * w), int(landmarks[id].y * h)) for id in [0, 2, 5, 11, 12, 13, 14, 23, 24, 25, 26, 27, 28]}
-                
-                cv2.circle(annotated_image, (p[0]), 6, (0, 255, 255), -1)
-                cv2.circle(annotated_image, (p[2]), 6, (0, 255, 255), -1)
-                cv2.circle(annotated_image, (p[5]), 6, (0, 255, 255), -1)
-                cv2.circle(annotated_image, (p[11]), 6, (0, 255, 255), -1)
-                cv2.circle(annotated_image, (p[12]), 6, (0, 255, 255), -1)
-                cv2.circle(annotated_image, (p[13]), 6, (0, 255, 255), -1)
-                cv2.circle(annotated_image, (p[14]), 6, (0, 255, 255), -1)
-                cv2.circle(annotated_image, (p[23]), 6, (0, 255, 255), -1)
-                cv2.circle(annotated_image, (p[24]), 6, (0, 255, 255), -1)
-                cv2.circle(annotated_image, (p[25]), 6, (0, 255, 255), -1)
-                cv2.circle(annotated_image, (p[26]), 6, (0, 255, 255), -1)
-                cv2.circle(annotated_image, (p[27]), 6, (0, 255, 255), -1)
-                cv2.circle(annotated_image, (p[28]), 6, (0, 255, 255), -1)
-
-                # Dibujar esqueleto básico (opcional, pero ayuda a visualizar)
-                
-                cv2.line(annotated_image, (p[5]), (p[2]), (0, 0, 255), 2)
-                cv2.line(annotated_image, (p[11]), (p[12]), (0, 0, 255), 2)
-                cv2.line(annotated_image, (p[13]), (p[14]), (0, 0, 255), 2)
-                cv2.line(annotated_image, (p[23]), (p[24]), (0, 0, 255), 2)
-                cv2.line(annotated_image, (p[25]), (p[26]), (0, 0, 255), 2)
-                cv2.line(annotated_image, (p[27]), (p[28]), (0, 0, 255), 2)
-
-                # Líneas horizontales de nivelación (ROJO en tu script)
-                cv2.line(annotated_image, p[11], p[12], (0, 0, 255), 2)
-                cv2.line(annotated_image, p[23], p[24], (0, 0, 255), 2)
-                
-                # Puntos medios y Línea de Plomada (ROJO en tu script)
-                puntos_medios = [
-                    ((p[2][0] + p[5][0]) // 2, (p[2][1] + p[5][1]) // 2),
-                    ((p[11][0] + p[12][0]) // 2, (p[11][1] + p[12][1]) // 2),
-                    ((p[13][0] + p[14][0]) // 2, (p[13][1] + p[14][1]) // 2),
-                    ((p[23][0] + p[24][0]) // 2, (p[23][1] + p[24][1]) // 2),
-                    ((p[25][0] + p[26][0]) // 2, (p[25][1] + p[26][1]) // 2),
-                    ((p[27][0] + p[28][0]) // 2, (p[27][1] + p[28][1]) // 2),
-                ]
-                for i in range(len(puntos_medios) - 1):
-                    cv2.line(annotated_image, puntos_medios[i], puntos_medios[i+1], (0, 0, 255), 2)
-                xm=int((p[27][0] + p[28][0])/2)
-                ym=int((p[27][1] + p[28][1])/2)
-                cv2.line(annotated_image, (xm, ym+50), (xm, 1), (50, 205, 50), 2)
-                
-
-            # --- LÓGICA LATERAL (IDÉNTICA A POSE.PY) ---
-            elif view_type in ['lateral_izq', 'lateral_der']:
-                side_map = {'lateral_der': (7, 11, 23, 25, 27), 'lateral_izq': (8, 12, 24, 26, 28)}
-                ids = side_map[view_type]
-                p = {
-                    'oreja': (int(landmarks[ids[0]].x * w), int(landmarks[ids[0]].y * h)),
-                    'hombro': (int(landmarks[ids[1]].x * w), int(landmarks[ids[1]].y * h)),
-                    'cadera': (int(landmarks[ids[2]].x * w), int(landmarks[ids[2]].y * h)),
-                    'rodilla': (int(landmarks[ids[3]].x * w), int(landmarks[ids[3]].y * h)),
-                    'tobillo': (int(landmarks[ids[4]].x * w), int(landmarks[ids[4]].y * h)),
-                }
-                
-                # Líneas de conexión (ROJO)
-                cv2.line(annotated_image, p['oreja'], p['hombro'], (0, 0, 255), 2)
-                cv2.line(annotated_image, p['hombro'], p['cadera'], (0, 0, 255), 2)
-                cv2.line(annotated_image, p['cadera'], p['rodilla'], (0, 0, 255), 2)
-                cv2.line(annotated_image, p['rodilla'], p['tobillo'], (0, 0, 255), 2)
-
-                # Círculos en las articulaciones (AMARILLO)
-                cv2.circle(annotated_image, p['oreja'], 6, (0, 255, 255), -1)
-                cv2.circle(annotated_image, p['hombro'], 6, (0, 255, 255), -1)
-                cv2.circle(annotated_image, p['cadera'], 6, (0, 255, 255), -1)
-                cv2.circle(annotated_image, p['rodilla'], 6 ,(0 , 255, 255), -1)
-                cv2.circle(annotated_image, p['tobillo'], 6, (0, 255, 255), -1)
-                
-                # Líneas de referencia para CVA (VERDE)
-                cv2.line(annotated_image, (p['tobillo'][0], p['tobillo'][1]+50), (p['tobillo'][0], 1), (0, 255, 0), 2)
-
-
-
-            image_to_save = annotated_image
-        else:
-            print(f"ADVERTENCIA: No se detectó pose en {final_filename}.")
-            image_to_save = image # Guardar la imagen re-escalada pero sin anotar
-
-    except Exception as e:
-        print(f"ERROR durante el procesamiento de pose: {e}. Se guardará la imagen original.")
-        image_to_save = cv2.imread(temp_path)
+        ok, error = anotar_imagen_postura(temp_path, final_save_path, view_type)
     finally:
-        pose.close()
         if os.path.exists(temp_path):
             os.remove(temp_path)
 
-    if image_to_save is not None:
-        save_success = cv2.imwrite(final_save_path, image_to_save)
-        if save_success:
-            print(f"ÉXITO: Imagen guardada en {final_save_path}")
-            relative_path = os.path.join('uploads', 'patient_images', final_filename).replace("\\", "/")
-            return relative_path, None
-        else:
-            return None, f"OpenCV no pudo guardar la imagen en {final_save_path}."
-    else:
-        return None, "La imagen a guardar estaba vacía."
+    if ok:
+        relative_path = os.path.join('uploads', 'patient_images', final_filename).replace("\\", "/")
+        return relative_path, None
+    return None, error
 
 def guardar_imagen_original(file_storage, save_folder, base_filename):
     """Función de respaldo para guardar la imagen sin procesar."""
@@ -394,9 +282,14 @@ def guardar_imagen_original(file_storage, save_folder, base_filename):
     relative_path = os.path.join('uploads', 'patient_images', filename).replace("\\", "/")
     return relative_path, None
 
-def generar_informe_postura_con_ia(rutas_imagenes, notas_adicionales, hallazgos_calculados):
+def nuevo_lote_imagenes_ia():
+    """Lote de imágenes para una solicitud a Gemini, reducidas según 'vision_images' de ia_config.json."""
+    return LoteImagenesIA(current_app.config.get('IA_MODELS_CONFIG', {}).get('vision_images'))
+
+def generar_informe_postura_con_ia(rutas_imagenes, notas_adicionales, hallazgos_calculados, forzar=False):
     """
     Llama a la IA multimodal (Gemini) con imágenes y texto para generar un informe.
+    Si ya se generó con las mismas imágenes y datos se usa la caché (forzar=True la ignora).
     """
     generative_model = get_generative_model()
     if not generative_model:
@@ -440,37 +333,38 @@ def generar_informe_postura_con_ia(rutas_imagenes, notas_adicionales, hallazgos_
     # Cargar las imágenes
     prompt_parts = [system_prompt, user_task]
     image_order = ['frontal', 'lateral_izq', 'lateral_der']
+    lote = nuevo_lote_imagenes_ia()
 
     for view in image_order:
         if rutas_imagenes.get(view):
             try:
                 # Construir la ruta absoluta completa a la imagen
                 full_image_path = os.path.join(current_app.root_path, 'static', rutas_imagenes[view])
-                print(f"DEBUG: Cargando imagen para IA desde: {full_image_path}")
-                img = Image.open(full_image_path)
+                logger.debug('Cargando imagen para IA desde: %s', full_image_path)
+                img = lote.agregar(full_image_path)
                 prompt_parts.append(f"\n--- IMAGEN: VISTA {view.upper()} ---")
                 prompt_parts.append(img)
             except FileNotFoundError:
-                print(f"ADVERTENCIA: No se encontró el archivo de imagen en la ruta: {full_image_path}")
+                logger.warning('No se encontró el archivo de imagen en la ruta: %s', full_image_path)
             except Exception as e:
-                print(f"ERROR: No se pudo cargar la imagen {full_image_path}: {e}")
+                logger.error('No se pudo cargar la imagen %s: %s', full_image_path, e)
 
     if len(prompt_parts) <= 2: # Si no se cargó ninguna imagen
          return "Error: No se encontraron imágenes válidas para analizar. Asegúrate de que las pruebas se hayan guardado primero."
 
     # Llamar a la IA
     try:
-        print("INFO: Enviando solicitud de análisis de postura a Gemini...")
-        response = generative_model.generate_content(prompt_parts)
-        return response.text.strip()
+        logger.info('Enviando solicitud de análisis de postura a Gemini...')
+        return generar_contenido_con_cache(generative_model, prompt_parts, forzar=forzar,
+                                           al_llamar=lambda: lote.registrar("Análisis de postura"))
     except Exception as e:
-        print(f"ERROR: La llamada a la API de Gemini para análisis de postura falló: {e}")
+        logger.error('La llamada a la API de Gemini para análisis de postura falló: %s', e)
         return f"Error al generar el informe con IA: {e}"
 
-def generar_informe_podal_unificado(rutas_imagenes, notas_adicionales, hallazgos_podales):
+def generar_informe_podal_unificado(rutas_imagenes, notas_adicionales, hallazgos_podales, forzar=False):
     """
     Llama a la IA multimodal (Gemini) con las 3 imágenes de los pies para
-    generar un informe podal unificado.
+    generar un informe podal unificado (con caché; forzar=True la ignora).
     """
     generative_model = get_generative_model()
     if not generative_model:
@@ -510,38 +404,38 @@ def generar_informe_podal_unificado(rutas_imagenes, notas_adicionales, hallazgos
     # Cargar las imágenes
     prompt_parts = [system_prompt, user_task]
     image_keys = {'frontal': 'pies_frontal', 'trasera': 'pies_trasera', 'plantografia': 'pies'}
-    
+    lote = nuevo_lote_imagenes_ia()
     imagenes_cargadas = 0
     for view, ruta_key in image_keys.items():
         if rutas_imagenes.get(ruta_key):
             try:
                 full_image_path = os.path.join(current_app.root_path, 'static', rutas_imagenes[ruta_key])
-                print(f"DEBUG: Cargando imagen podal para IA desde: {full_image_path}")
-                img = Image.open(full_image_path)
+                logger.debug('Cargando imagen podal para IA desde: %s', full_image_path)
+                img = lote.agregar(full_image_path)
                 prompt_parts.append(f"\n--- IMAGEN: VISTA {view.upper()} ---")
                 prompt_parts.append(img)
                 imagenes_cargadas += 1
             except FileNotFoundError:
-                print(f"ADVERTENCIA: No se encontró el archivo de imagen podal: {full_image_path}")
+                logger.warning('No se encontró el archivo de imagen podal: %s', full_image_path)
             except Exception as e:
-                print(f"ERROR: No se pudo cargar la imagen podal {full_image_path}: {e}")
+                logger.error('No se pudo cargar la imagen podal %s: %s', full_image_path, e)
 
     if imagenes_cargadas < 3: # Idealmente, necesitamos las 3
          return f"Error: Se encontraron {imagenes_cargadas} de 3 imágenes de pies necesarias. Asegúrate de que las tres imágenes (frontal, trasera y plantografía) estén guardadas."
 
     # Llamar a la IA
     try:
-        print("INFO: Enviando solicitud de análisis podal unificado a Gemini...")
-        response = generative_model.generate_content(prompt_parts)
-        return response.text.strip()
+        logger.info('Enviando solicitud de análisis podal unificado a Gemini...')
+        return generar_contenido_con_cache(generative_model, prompt_parts, forzar=forzar,
+                                           al_llamar=lambda: lote.registrar("Análisis podal"))
     except Exception as e:
-        print(f"ERROR: La llamada a la API de Gemini para análisis podal falló: {e}")
+        logger.error('La llamada a la API de Gemini para análisis podal falló: %s', e)
         return f"Error al generar el informe podal con IA: {e}"
 
 def analizar_coordenadas_postura(ruta_imagen_frontal):
     """
-    Analiza una imagen de postura frontal usando MediaPipe para determinar objetivamente
-    la elevación de hombros y pelvis. Devuelve un diccionario con los hallazgos.
+    Analiza una imagen de postura frontal con los landmarks de MediaPipe (guardados al subirla)
+    para determinar objetivamente la elevación de hombros y pelvis. Devuelve un diccionario con los hallazgos.
     """
     hallazgos = {
         "hombros": "Nivelación de hombros simétrica.",
@@ -549,46 +443,39 @@ def analizar_coordenadas_postura(ruta_imagen_frontal):
     }
     
     if not ruta_imagen_frontal or not os.path.exists(ruta_imagen_frontal):
-        print(f"ADVERTENCIA: No se encontró la imagen frontal en {ruta_imagen_frontal} para el análisis de coordenadas.")
+        logger.warning('No se encontró la imagen frontal en %s para el análisis de coordenadas.', ruta_imagen_frontal)
         return hallazgos
 
     try:
-        image = cv2.imread(ruta_imagen_frontal)
-        if image is None:
-            raise ValueError("OpenCV no pudo leer la imagen.")
-
-        mp_pose = mp.solutions.pose
-        with mp_pose.Pose(static_image_mode=True, model_complexity=2) as pose:
-            results = pose.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-
-            if results.pose_landmarks:
-                landmarks = results.pose_landmarks.landmark
-                
-                # Coordenadas Y de hombros (11=izq, 12=der) y pelvis (23=izq, 24=der)
-                hombro_izq_y = landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y
-                hombro_der_y = landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].y
-                pelvis_izq_y = landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y
-                pelvis_der_y = landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value].y
-
-                # Umbral de sensibilidad para evitar detectar micro-desviaciones
-                umbral_hombros = 0.007 # Un 0.7% de la altura de la imagen
-                
-                # Comparación de Hombros (menor 'y' significa más alto en la imagen)
-                if hombro_izq_y < hombro_der_y - umbral_hombros:
-                    hallazgos["hombros"] = "Elevación del hombro izquierdo."
-                elif hombro_der_y < hombro_izq_y - umbral_hombros:
-                    hallazgos["hombros"] = "Elevación del hombro derecho."
-
-                # Comparación de Pelvis
-                if pelvis_izq_y < pelvis_der_y - umbral_hombros:
-                    hallazgos["pelvis"] = "Elevación de la hemipelvis izquierda."
-                elif pelvis_der_y < pelvis_izq_y - umbral_hombros:
-                    hallazgos["pelvis"] = "Elevación de la hemipelvis derecha."
+        # Landmarks guardados al subir la imagen (solo se corre el modelo si no existen)
+        landmarks = obtener_landmarks(ruta_imagen_frontal, POSE_POSTURA)
+
+        if landmarks:
+            # Coordenadas Y de hombros (11=izq, 12=der) y pelvis (23=izq, 24=der); cada punto es [x, y, z, visibility]
+            hombro_izq_y = landmarks[HOMBRO_IZQ][1]
+            hombro_der_y = landmarks[HOMBRO_DER][1]
+            pelvis_izq_y = landmarks[CADERA_IZQ][1]
+            pelvis_der_y = landmarks[CADERA_DER][1]
+
+            # Umbral de sensibilidad para evitar detectar micro-desviaciones
+            umbral_hombros = 0.007 # Un 0.7% de la altura de la imagen
+            
+            # Comparación de Hombros (menor 'y' significa más alto en la imagen)
+            if hombro_izq_y < hombro_der_y - umbral_hombros:
+                hallazgos["hombros"] = "Elevación del hombro izquierdo."
+            elif hombro_der_y < hombro_izq_y - umbral_hombros:
+                hallazgos["hombros"] = "Elevación del hombro derecho."
+
+            # Comparación de Pelvis
+            if pelvis_izq_y < pelvis_der_y - umbral_hombros:
+                hallazgos["pelvis"] = "Elevación de la hemipelvis izquierda."
+            elif pelvis_der_y < pelvis_izq_y - umbral_hombros:
+                hallazgos["pelvis"] = "Elevación de la hemipelvis derecha."
         
         return hallazgos
 
     except Exception as e:
-        print(f"ERROR en analizar_coordenadas_postura: {e}")
+        logger.error('ERROR en analizar_coordenadas_postura: %s', e)
         return hallazgos # Devuelve los valores por defecto si hay un error
 
 def analizar_coordenadas_podal(ruta_imagen_trasera):
@@ -605,45 +492,40 @@ def analizar_coordenadas_podal(ruta_imagen_trasera):
         return hallazgos
 
     try:
-        image = cv2.imread(ruta_imagen_trasera)
-        mp_pose = mp.solutions.pose
-        with mp_pose.Pose(static_image_mode=True, model_complexity=2, min_detection_confidence=0.1) as pose:
-            results = pose.process(cv2.cvtColor(image, cv2.COLOR_BGR_RGB))
+        landmarks = obtener_landmarks(ruta_imagen_trasera, POSE_PODAL)
             
-            if results.pose_landmarks:
-                # Si la detección tiene éxito, calcula los hallazgos
-                landmarks = results.pose_landmarks.landmark
-                
-                tobillo_izq_x = landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].x
-                talon_izq_x = landmarks[mp_pose.PoseLandmark.LEFT_HEEL.value].x
-                tobillo_der_x = landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value].x
-                talon_der_x = landmarks[mp_pose.PoseLandmark.RIGHT_HEEL.value].x
-                
-                umbral_retropie = 0.01
+        if landmarks:
+            # Si la detección tiene éxito, calcula los hallazgos (cada punto es [x, y, z, visibility])
+            tobillo_izq_x = landmarks[TOBILLO_IZQ][0]
+            talon_izq_x = landmarks[TALON_IZQ][0]
+            tobillo_der_x = landmarks[TOBILLO_DER][0]
+            talon_der_x = landmarks[TALON_DER][0]
+            
+            umbral_retropie = 0.01
 
-                # Lógica para Pie Izquierdo
-                if tobillo_izq_x < talon_izq_x - umbral_retropie:
-                    hallazgos["retropie_izq"] = "Retropié izquierdo en valgo."
-                elif tobillo_izq_x > talon_izq_x + umbral_retropie:
-                    hallazgos["retropie_izq"] = "Retropié izquierdo en varo."
-                else:
-                    hallazgos["retropie_izq"] = "Alineación de retropié izquierdo neutra."
+            # Lógica para Pie Izquierdo
+            if tobillo_izq_x < talon_izq_x - umbral_retropie:
+                hallazgos["retropie_izq"] = "Retropié izquierdo en valgo."
+            elif tobillo_izq_x > talon_izq_x + umbral_retropie:
+                hallazgos["retropie_izq"] = "Retropié izquierdo en varo."
+            else:
+                hallazgos["retropie_izq"] = "Alineación de retropié izquierdo neutra."
 
-                # Lógica para Pie Derecho
-                if tobillo_der_x > talon_der_x + umbral_retropie:
-                    hallazgos["retropie_der"] = "Retropié derecho en valgo."
-                elif tobillo_der_x < talon_der_x - umbral_retropie:
-                    hallazgos["retropie_der"] = "Retropié derecho en varo."
-                else:
-                    hallazgos["retropie_der"] = "Alineación de retropié derecho neutra."
+            # Lógica para Pie Derecho
+            if tobillo_der_x > talon_der_x + umbral_retropie:
+                hallazgos["retropie_der"] = "Retropié derecho en valgo."
+            elif tobillo_der_x < talon_der_x - umbral_retropie:
+                hallazgos["retropie_der"] = "Retropié derecho en varo."
+            else:
+                hallazgos["retropie_der"] = "Alineación de retropié derecho neutra."
         
         return hallazgos
 
     except Exception as e:
-        print(f"ERROR durante el análisis silencioso de coordenadas podal: {e}")
+        logger.error('ERROR durante el análisis silencioso de coordenadas podal: %s', e)
         return hallazgos # Devuelve los hallazgos por defecto en caso de error
 
-def generar_informe_integral_con_ia(datos_paciente, datos_anamnesis, datos_pruebas, hallazgos_calculados):
+def generar_informe_integral_con_ia(datos_paciente, datos_anamnesis, datos_pruebas, hallazgos_calculados, forzar=False):
     generative_model = get_generative_model()
     if not generative_model:
         return "Error: El modelo de IA (Gemini) no está configurado."
@@ -694,27 +576,32 @@ def generar_informe_integral_con_ia(datos_paciente, datos_anamnesis, datos_prueb
     # Cargar las 6 imágenes
     image_keys = ['frente', 'lado', 'postura_extra', 'pies_frontal', 'pies_trasera', 'pies']
     imagenes_cargadas = 0
+    lote = nuevo_lote_imagenes_ia()
     for key in image_keys:
         ruta_relativa = datos_pruebas.get(key)
         if ruta_relativa:
             try:
                 full_image_path = os.path.join(current_app.root_path, 'static', ruta_relativa)
-                img = Image.open(full_image_path)
+                img = lote.agregar(full_image_path)
                 prompt_parts.append(f"\n--- IMAGEN: {key.upper()} ---")
                 prompt_parts.append(img)
                 imagenes_cargadas += 1
             except Exception as e:
-                print(f"ADVERTENCIA: No se pudo cargar la imagen para el informe integral: {ruta_relativa} ({e})")
+                logger.warning('No se pudo cargar la imagen para el informe integral: %s (%s)', ruta_relativa, e)
 
     if imagenes_cargadas == 0:
         return "No se encontraron imágenes de pruebas para analizar."
 
     try:
-        print("INFO: Enviando solicitud de informe integral a Gemini...")
-        response = generative_model.generate_content(prompt_parts)
-        # **VERIFICACIÓN INTELIGENTE ANTES DE LEER EL TEXTO**
-        # Si la respuesta no tiene partes (fue bloqueada), lo manejamos aquí.
-        if not response.parts:
+        logger.info('Enviando solicitud de informe integral a Gemini...')
+        try:
+            # Con caché: si las imágenes y los datos no cambiaron, no se vuelve a llamar a la API
+            informe_html = generar_contenido_con_cache(generative_model, prompt_parts, forzar=forzar,
+                                                       al_llamar=lambda: lote.registrar("Informe integral"))
+        except RespuestaIABloqueada as bloqueo:
+            # **VERIFICACIÓN INTELIGENTE ANTES DE LEER EL TEXTO**
+            # Si la respuesta no tiene partes (fue bloqueada), lo manejamos aquí.
+            response = bloqueo.response
             # Intentamos obtener la razón del bloqueo para dar un mensaje más claro.
             try:
                 block_reason = response.prompt_feedback.block_reason.name
@@ -727,10 +614,9 @@ def generar_informe_integral_con_ia(datos_paciente, datos_anamnesis, datos_prueb
                 error_message = (
                     "La IA no generó una respuesta. La solicitud pudo haber sido bloqueada por los filtros de contenido."
                 )
-            print(f"ERROR: Respuesta de Gemini bloqueada. Razón: {response.candidates[0].finish_reason}")
+            logger.error('Respuesta de Gemini bloqueada. Razón: %s', response.candidates[0].finish_reason)
             return error_message
 
-        informe_html = response.text.strip()
         # Limpiamos los marcadores de bloque de código de Markdown.
         if informe_html.startswith("```html"):
             informe_html = informe_html[7:] # Elimina "```html" del inicio
@@ -746,7 +632,7 @@ def generar_informe_integral_con_ia(datos_paciente, datos_anamnesis, datos_prueb
 
     except Exception as e:
         # Capturamos el error real y lo devolvemos como un mensaje HTML formateado.
-        print(f"ERROR: Falló la llamada a Gemini para el informe integral: {e}")
+        logger.error('Falló la llamada a Gemini para el informe integral: %s', e)
         # Devolvemos un mensaje de error más específico para mostrarlo en el PDF
         return f"<b>Error al contactar a la IA:</b><br><pre>{str(e)}</pre>"
 
@@ -797,16 +683,16 @@ def manage_antecedentes(patient_id):
         # --- INICIO DE BLOQUE DEBUG 1 ---
         # (Añade esto justo ANTES de form.validate_on_submit())
         if request.method == 'POST':
-            print("\n--- DEBUG ANTECEDENTES (POST) ---")
-            print(f"Datos crudos (request.form): {request.form}")
+            logger.debug('ANTECEDENTES (POST)')
+            logger.debug('Datos crudos (request.form): %s', request.form)
             # Esto es CLAVE: nos muestra qué valores envían tus checkboxes
-            print(f"Valores de 'cond_gen' (getlist): {request.form.getlist('cond_gen')}")
-            print("---------------------------------")
+            logger.debug("Valores de 'cond_gen' (getlist): %s", request.form.getlist('cond_gen'))
+            logger.debug('')
         # --- FIN DE BLOQUE DEBUG 1 ---
 
         if form.validate_on_submit():
             # --- LÓGICA POST (Guardar datos) ---
-            print("DEBUG: El formulario VALIDÓ CORRECTAMENTE.") # <--- Print de éxito
+            logger.debug('El formulario VALIDÓ CORRECTAMENTE.') # <--- Print de éxito
             
             id_antecedente_editado_str = request.form.get('id_antecedente')
             id_antecedente_editado = int(id_antecedente_editado_str) if id_antecedente_editado_str else None
@@ -915,10 +801,10 @@ def manage_antecedentes(patient_id):
             # (Añade esto DENTRO del 'else' principal,
             #  para que se ejecute si la validación falla en un POST)
             if request.method == 'POST':
-                print("\n--- DEBUG: VALIDACIÓN FALLIDA ---")
-                print(f"Errores del formulario: {form.errors}")
-                print(f"Datos procesados por WTForms (form.cond_gen.data): {form.cond_gen.data}")
-                print("--- FIN DEBUG VALIDACIÓN ---\n")
+                logger.debug('VALIDACIÓN FALLIDA')
+                logger.debug('Errores del formulario: %s', form.errors)
+                logger.debug('Datos procesados por WTForms (form.cond_gen.data): %s', form.cond_gen.data)
+                logger.debug('FIN DEBUG VALIDACIÓN')
             # --- FIN DE BLOQUE DEBUG 2 ---
 
             selected_id_str = request.args.get('selected_id')
@@ -997,7 +883,7 @@ def manage_antecedentes(patient_id):
                                    ) 
 
     except Exception as e:
-        print(f"Error en manage_antecedentes (PID {patient_id}): {e}") 
+        logger.error('Error en manage_antecedentes (PID %s): %s', patient_id, e) 
         flash('Ocurrió un error inesperado al gestionar antecedentes.', 'danger')
         safe_redirect_url = url_for('patient.patient_detail', patient_id=patient_id) 
         return redirect(safe_redirect_url)
@@ -1030,7 +916,7 @@ def manage_anamnesis(patient_id):
 
         if form.validate_on_submit():
             # --- LÓGICA POST ---
-            print(f"\n--- DEBUG (FORM SUBMIT): 'diagrama_puntos' recibido = {request.form.get('diagrama_puntos')} ---")
+            logger.debug("FORM SUBMIT: 'diagrama_puntos' recibido = %s", request.form.get('diagrama_puntos'))
             id_anamnesis_editado_str = request.form.get('id_anamnesis') 
             id_anamnesis_editado = int(id_anamnesis_editado_str) if id_anamnesis_editado_str else None
 
@@ -1105,6 +991,7 @@ def manage_anamnesis(patient_id):
             if success == "duplicate":
                 flash(f"Error: Ya existe un registro de anamnesis para este paciente en la fecha {data.get('fecha')}.", 'danger')
             elif success:
+                invalidar_pdfs_de_tabla('anamnesis', patient_id)
                 flash('Anamnesis guardada exitosamente.', 'success')
                 return redirect(url_for('patient.patient_detail', patient_id=patient_id))
             else:
@@ -1141,14 +1028,14 @@ def manage_anamnesis(patient_id):
             current_data = None 
             
             # --- INICIO DEBUG ---
-            print(f"\n--- DEBUG ANAMNESIS (PID: {patient_id}) ---")
-            print(f"--- 1. Método: {request.method} ---")
+            logger.debug('ANAMNESIS (PID: %s)', patient_id)
+            logger.debug('1. Método: %s', request.method)
             # --- FIN DEBUG ---
 
             if request.method == 'POST':
                 # --- POST con validación fallida ---
-                print(f"--- 2. Entrando a RAMA POST (Validación fallida) ---")
-                print(f"--- 3. Errores del Form: {form.errors} ---")
+                logger.debug('2. Entrando a RAMA POST (Validación fallida)')
+                logger.debug('3. Errores del Form: %s', form.errors)
                 
                 id_anamnesis_a_cargar_str = request.form.get('id_anamnesis')
                 try: id_anamnesis_a_cargar = int(id_anamnesis_a_cargar_str) if id_anamnesis_a_cargar_str else None
@@ -1165,12 +1052,12 @@ def manage_anamnesis(patient_id):
                 
                 # No hacemos nada más. 'form' ya tiene los datos del POST fallido.
                 # 'current_data' sigue siendo None, lo cual está bien.
-                print(f"--- 4. Variables (rama POST) actualizadas: 'selected_diagrama_puntos', 'is_editable', etc. ---")
+                logger.debug("4. Variables (rama POST) actualizadas: 'selected_diagrama_puntos', 'is_editable', etc.")
                 # 'form' ya contiene los datos del POST (no se toca)
 
             else:
                 # --- Lógica GET Pura ---
-                print(f"--- 2. Entrando a RAMA GET ---")
+                logger.debug('2. Entrando a RAMA GET')
                 selected_id_str = request.args.get('selected_id')
                 selected_id = int(selected_id_str) if selected_id_str else None
 
@@ -1210,16 +1097,16 @@ def manage_anamnesis(patient_id):
                 
                 selected_diagrama_puntos = current_data.get('diagrama', '0,').split(',')
                 
-                print(f"--- 3. Variables (rama GET) actualizadas y 'form.process()' ejecutado ---")
+                logger.debug("3. Variables (rama GET) actualizadas y 'form.process()' ejecutado")
 
             # --- DEBUG FINAL ANTES DEL RETURN ---
-            print(f"--- 5. Variables ANTES de 'render_template' (ahora deberían estar todas definidas) ---")
-            print(f"   > form (tipo): {type(form)}")
-            print(f"   > is_editable: {locals().get('is_editable', '--- ERROR ---')}")
-            print(f"   > loaded_id_anamnesis: {locals().get('id_anamnesis_a_cargar', '--- ERROR ---')}")
-            print(f"   > fecha_cargada: {locals().get('fecha_cargada_obj', '--- ERROR ---')}")
-            print(f"   > selected_diagrama_puntos (primeros 5): {selected_diagrama_puntos[:5]}")
-            print("---------------------------------------------------\n")
+            logger.debug("5. Variables ANTES de 'render_template' (ahora deberían estar todas definidas)")
+            logger.debug('> form (tipo): %s', type(form))
+            logger.debug('> is_editable: %s', locals().get('is_editable', '--- ERROR ---'))
+            logger.debug('> loaded_id_anamnesis: %s', locals().get('id_anamnesis_a_cargar', '--- ERROR ---'))
+            logger.debug('> fecha_cargada: %s', locals().get('fecha_cargada_obj', '--- ERROR ---'))
+            logger.debug('> selected_diagrama_puntos (primeros 5): %s', selected_diagrama_puntos[:5])
+            logger.debug('')
 
             # Este return ahora es seguro para ambas ramas (POST-fallido y GET)
             return render_template('anamnesis_form.html',
@@ -1236,7 +1123,7 @@ def manage_anamnesis(patient_id):
                                   )
 
     except Exception as e:
-        print(f"Error en manage_anamnesis (PID {patient_id}): {e}") 
+        logger.error('Error en manage_anamnesis (PID %s): %s', patient_id, e) 
         flash('Ocurrió un error inesperado al gestionar la anamnesis.', 'danger')
         safe_redirect_url = url_for('patient.patient_detail', patient_id=patient_id) 
         return redirect(safe_redirect_url)
@@ -1262,7 +1149,7 @@ def manage_pruebas(patient_id):
 
         # 2. Rollback Preventivo (opcional si autocommit=True, pero no hace daño)
         try: connection.rollback()
-        except Error as rb_err: print(f"WARN: Error rollback preventivo (pruebas): {rb_err}")
+        except Error as rb_err: logger.warning('Error rollback preventivo (pruebas): %s', rb_err)
 
         # 3. Datos comunes
         is_admin = session.get('is_admin', False)
@@ -1299,13 +1186,13 @@ def manage_pruebas(patient_id):
             foto_pies_trasera_file = request.files.get('foto_pies_trasera') 
 
 
-            print(f"INFO: Entering POST for pruebas. ID Editado: {id_postura_editado}, Fecha Guardada/Objetivo: {fecha_guardada}")
+            logger.info('Entering POST for pruebas. ID Editado: %s, Fecha Guardada/Objetivo: %s', id_postura_editado, fecha_guardada)
 
             # --- Iniciar Transacción ---
             try:
-                print("INFO: Preparado para operaciones DB (Pruebas POST).")
+                logger.info('Preparado para operaciones DB (Pruebas POST).')
             except Error as tx_err:
-                 print(f"ERROR: Falló start_transaction (Pruebas POST): {tx_err}")
+                 logger.error('Falló start_transaction (Pruebas POST): %s', tx_err)
                  flash('Error interno al iniciar la operación.', 'danger')
                  return redirect(url_for('patient.patient_detail', patient_id=patient_id))
 
@@ -1325,7 +1212,7 @@ def manage_pruebas(patient_id):
                 # Se puede añadir Rx si es admin o si el registro base ya existe (aunque no se pueda editar)
                 puede_anadir_rx = is_admin or record_exists
 
-                print(f"DEBUG POST PRUEBAS: FechaObjetivo={fecha_guardada}, EsHoy={es_fecha_de_hoy}, EsAdmin={is_admin}, PuedeEditarTodo={puede_editar_todo}, RecordExists={record_exists}, PuedeAddRx={puede_anadir_rx}")
+                logger.debug('POST PRUEBAS: FechaObjetivo=%s, EsHoy=%s, EsAdmin=%s, PuedeEditarTodo=%s, RecordExists=%s, PuedeAddRx=%s', fecha_guardada, es_fecha_de_hoy, is_admin, puede_editar_todo, record_exists, puede_anadir_rx)
 
                 # Verificar si la acción general está permitida
                 # Permite añadir datos faltantes (incluyendo Rx) si el registro existe, aunque no sea hoy/admin
@@ -1402,6 +1289,12 @@ def manage_pruebas(patient_id):
                     'foto_pies_trasera': ('pies_trasera', None) 
                 }
 
+                # Las fotos con análisis de pose se procesan en segundo plano (ver utils/image_jobs.py):
+                # aquí solo se guarda el original y, tras guardar el registro, se encola el trabajo.
+                cola_imagenes = get_image_jobs()
+                usar_cola_imagenes = cola_imagenes is not None and cola_imagenes.habilitada
+                imagenes_por_procesar = []
+
                 for input_name, (db_column, view_type) in image_inputs_map.items():
                     file = request.files.get(input_name)
                     original_path = existing_data.get(db_column)
@@ -1415,13 +1308,20 @@ def manage_pruebas(patient_id):
                     if should_save_new_file:
                         base_filename = secure_filename(f"{patient_id}_{data_to_save['fecha'].replace('/', '-')}_{db_column}")
                         
-                        # Si view_type no es None, procesamos la imagen. Si es None, solo la guardamos.
-                        new_relative_path, error = procesar_y_guardar_imagen_postura(
-                            file_storage=file,
-                            save_folder=current_app.config['UPLOAD_FOLDER'],
-                            base_filename=base_filename,
-                            view_type=view_type
-                        )
+                        if view_type and usar_cola_imagenes:
+                            new_relative_path, error = guardar_imagen_original(
+                                file, current_app.config['UPLOAD_FOLDER'], f"{base_filename}_orig"
+                            )
+                            if new_relative_path:
+                                imagenes_por_procesar.append((db_column, view_type, new_relative_path))
+                        else:
+                            # Si view_type no es None, procesamos la imagen. Si es None, solo la guardamos.
+                            new_relative_path, error = procesar_y_guardar_imagen_postura(
+                                file_storage=file,
+                                save_folder=current_app.config['UPLOAD_FOLDER'],
+                                base_filename=base_filename,
+                                view_type=view_type
+                            )
                         
                         if error:
                             flash(f"Advertencia al procesar '{input_name}': {error}", "warning")
@@ -1439,6 +1339,14 @@ def manage_pruebas(patient_id):
                 if not id_postura_resultante:
                      # Lanzar excepción específica para forzar rollback si save_postura falla
                      raise Exception("Fallo crítico al guardar/actualizar el registro base de postura.")
+                invalidar_pdfs_de_tabla('postura', patient_id)
+
+                # --- Encolar el análisis de pose de las fotos nuevas ---
+                for db_column, view_type, ruta_original in imagenes_por_procesar:
+                    if not cola_imagenes.encolar(connection, patient_id, id_postura_resultante, db_column, view_type, ruta_original):
+                        flash(f"No se pudo programar el análisis de pose de '{db_column}'; se guardó la foto sin anotar.", "warning")
+                if imagenes_por_procesar:
+                    flash("Las fotos de postura se están procesando; se actualizarán en unos segundos.", "info")
 
 
                 # --- Procesar NUEVAS Radiografías ---
@@ -1459,21 +1367,21 @@ def manage_pruebas(patient_id):
                                 insert_radiografia(connection, id_postura_resultante, file_path_to_save) 
                                 rx_insert_count += 1
                             except Exception as rx_save_err:
-                                 print(f"ERROR guardando Rx {filename}: {rx_save_err}")
+                                 logger.error('ERROR guardando Rx %s: %s', filename, rx_save_err)
                                  flash(f"Error al guardar Rx '{file.filename}'.", "warning")
                         elif file and file.filename != '':
                              flash(f"Tipo de archivo no permitido para Rx: {file.filename}", "warning")
-                    print(f"INFO: {rx_insert_count} nuevas Rx procesadas para id_postura {id_postura_resultante}.")
+                    logger.info('%s nuevas Rx procesadas para id_postura %s.', rx_insert_count, id_postura_resultante)
 
-                print(f"INFO: Operaciones DB (Pruebas POST) completadas. ID Postura: {id_postura_resultante}")
+                logger.info('Operaciones DB (Pruebas POST) completadas. ID Postura: %s', id_postura_resultante)
                 flash('Datos de pruebas guardados exitosamente.', 'success')
                 # Redirigir a la misma fecha/ID que se guardó/actualizó
                 return redirect(url_for('clinical.manage_pruebas', patient_id=patient_id, fecha=data_to_save['fecha']))
 
             except (PermissionError, ValueError, Exception) as e:
-                print(f"ERROR: Iniciando rollback (Pruebas): {type(e).__name__} - {e}")
-                print("INFO: Rollback ejecutado (o no necesario por autocommit) (Pruebas).")
-                print(f"Error POST manage_pruebas (PID {patient_id}): {e}")
+                logger.error('Iniciando rollback (Pruebas): %s - %s', type(e).__name__, e)
+                logger.info('Rollback ejecutado (o no necesario por autocommit) (Pruebas).')
+                logger.error('Error POST manage_pruebas (PID %s): %s', patient_id, e)
 
                 if isinstance(e, PermissionError): flash(str(e), 'warning')
                 elif isinstance(e, ValueError): flash(f"Error en datos o inconsistencia: {e}", 'danger')
@@ -1535,16 +1443,16 @@ def manage_pruebas(patient_id):
             # Lógica para determinar qué fecha cargar 
             if selected_fecha_param == 'hoy':
                 target_date_to_load = today_str
-                print(f"DEBUG Pruebas GET: Cargando 'hoy' ({today_str}) explícitamente.")
+                logger.debug("Pruebas GET: Cargando 'hoy' (%s) explícitamente.", today_str)
             elif selected_fecha_param and selected_fecha_param in available_dates:
                 target_date_to_load = selected_fecha_param
-                print(f"DEBUG Pruebas GET: Cargando fecha específica: {target_date_to_load}")
+                logger.debug('Pruebas GET: Cargando fecha específica: %s', target_date_to_load)
             elif available_dates:
                  target_date_to_load = available_dates[0] # Cargar el MÁS RECIENTE por defecto
-                 print(f"DEBUG Pruebas GET: No hay fecha seleccionada, cargando por defecto la más reciente: {target_date_to_load}")
+                 logger.debug('Pruebas GET: No hay fecha seleccionada, cargando por defecto la más reciente: %s', target_date_to_load)
             else:
                  target_date_to_load = today_str # Preparar para HOY (primer registro)
-                 print(f"DEBUG Pruebas GET: No hay registros previos, preparando para hoy: {target_date_to_load}")
+                 logger.debug('Pruebas GET: No hay registros previos, preparando para hoy: %s', target_date_to_load)
 
             # Obtener datos de postura para la fecha objetivo
             if target_date_to_load:
@@ -1587,7 +1495,7 @@ def manage_pruebas(patient_id):
 
     # --- Bloque except y finally exterior ---
     except Exception as e:
-        print(f"Error general en manage_pruebas (PID {patient_id}): {e}")
+        logger.error('Error general en manage_pruebas (PID %s): %s', patient_id, e)
         flash('Ocurrió un error inesperado al gestionar las pruebas.', 'danger')
         if connection and connection.is_connected():
              pass 
@@ -1596,7 +1504,7 @@ def manage_pruebas(patient_id):
     finally:
         if connection and connection.is_connected():
             connection.close()
-            print("INFO: Conexión a BD cerrada en finally de manage_pruebas.")
+            logger.info('Conexión a BD cerrada en finally de manage_pruebas.')
 
 @clinical_bp.route('/seguimiento', methods=['GET', 'POST'])
 @login_required
@@ -1638,7 +1546,7 @@ def manage_seguimiento(patient_id):
             # --- INICIO: AÑADIR LÓGICA DE TRANSACCIÓN ---
             try:
                 connection.autocommit = False 
-                print("INFO (Seguimiento POST): Autocommit deshabilitado. Iniciando transacción.")
+                logger.info('Seguimiento POST: Autocommit deshabilitado. Iniciando transacción.')
 
                 if id_seguimiento_editado:
                     record_original = get_specific_seguimiento(connection, id_seguimiento_editado)
@@ -1728,21 +1636,22 @@ def manage_seguimiento(patient_id):
 
                 # Solo actualizamos si el campo de notas fue enviado Y el ID de postura es válido
                 if notas_orto_form is not None and id_postura_para_actualizar and puede_editar_todo:
-                    print(f"INFO (Seguimiento POST): Actualizando notas ortopédicas para id_postura {id_postura_para_actualizar}...")
+                    logger.info('Seguimiento POST: Actualizando notas ortopédicas para id_postura %s...', id_postura_para_actualizar)
                     success_notas = update_postura_ortho_notes(connection, id_postura_para_actualizar, notas_orto_form.strip())
                     if not success_notas:
                         # Si falla, lanzamos error para revertir el guardado del seguimiento
                         raise Exception("Error al guardar las notas ortopédicas.")
+                    invalidar_pdfs_de_tabla('postura', patient_id)
 
                 # 3. Si todo salió bien, hacer commit
                 connection.commit()
-                print("INFO (Seguimiento POST): Transacción completada (Commit).")
+                logger.info('Seguimiento POST: Transacción completada (Commit).')
                 flash('Seguimiento guardado exitosamente.', 'success')
                 return redirect(url_for('clinical.manage_seguimiento', patient_id=patient_id, selected_id=saved_id_seguimiento))
             
 
             except (PermissionError, ValueError, Exception) as e:
-                 print(f"Error POST manage_seguimiento (PID {patient_id}): {e}")
+                 logger.error('Error POST manage_seguimiento (PID %s): %s', patient_id, e)
                  connection.rollback()
                  if isinstance(e, PermissionError): flash(str(e), 'warning')
                  elif isinstance(e, ValueError): flash(f"Error en datos: {e}", 'danger')
@@ -1816,7 +1725,7 @@ def manage_seguimiento(patient_id):
                 # Al final, restaurar autocommit a True
                 if connection:
                     connection.autocommit = True
-                    print("INFO (Seguimiento POST): Autocommit restaurado a True.")
+                    logger.info('Seguimiento POST: Autocommit restaurado a True.')
             # --- FIN: LÓGICA DE TRANSACCIÓN ---
                 
         else: # Método GET
@@ -1931,7 +1840,7 @@ def manage_seguimiento(patient_id):
                                    id_postura_hoy_para_form=id_postura_hoy_para_form
                                   )
     except Exception as e:
-        print(f"Error general en manage_seguimiento (PID {patient_id}): {e}")
+        logger.error('Error general en manage_seguimiento (PID %s): %s', patient_id, e)
         flash('Ocurrió un error inesperado al gestionar el seguimiento.', 'danger')
         safe_redirect_url = url_for('patient.patient_detail', patient_id=patient_id) if 'patient_id' in locals() and patient_id is not None else url_for('main')
         return redirect(safe_redirect_url)
@@ -1961,7 +1870,7 @@ def manage_revaloracion(patient_id):
 
             try:
                 connection.autocommit = False
-                print("INFO (Reval POST): Autocommit deshabilitado. Iniciando transacción.")
+                logger.info('Reval POST: Autocommit deshabilitado. Iniciando transacción.')
                 
                 is_editable_post = False
                 record_original = None
@@ -1979,7 +1888,7 @@ def manage_revaloracion(patient_id):
 
                     # 3. Comparar string vs string
                     if not (record_original and record_original.get('id_px') == patient_id and fecha_original_db_str == fecha_guardada):
-                         print(f"DEBUG REVAL FAIL: ID/PX Coinciden: {record_original.get('id_px') == patient_id}, Fecha DB: '{fecha_original_db_str}' != Fecha Form: '{fecha_guardada}'")
+                         logger.debug("REVAL FAIL: ID/PX Coinciden: %s, Fecha DB: '%s' != Fecha Form: '%s'", record_original.get('id_px') == patient_id, fecha_original_db_str, fecha_guardada)
                          raise ValueError("Revaloración a editar inválida.")
                     
                     # 4. Usar el string para la comprobación de 'is_editable'
@@ -2006,14 +1915,14 @@ def manage_revaloracion(patient_id):
                 except ValueError: raise ValueError("Calificaciones/Porcentaje deben ser números.")
 
                 # --- AÑADIR LÓGICA DE VINCULACIÓN DE POSTURA ---
-                print(f"INFO (Reval POST): Buscando registro de postura para fecha {data_to_save['fecha']}...")
+                logger.info('Reval POST: Buscando registro de postura para fecha %s...', data_to_save['fecha'])
                 postura_record_asociado = get_specific_postura_by_date(connection, patient_id, data_to_save['fecha'])
                 id_postura_a_vincular = None
                 if postura_record_asociado:
                     id_postura_a_vincular = postura_record_asociado.get('id_postura')
-                    print(f"INFO (Reval POST): Encontrado id_postura: {id_postura_a_vincular}")
+                    logger.info('Reval POST: Encontrado id_postura: %s', id_postura_a_vincular)
                 else:
-                    print(f"WARN (Reval POST): No se encontró registro de postura para la fecha {data_to_save['fecha']}. No se vincularán imágenes.")
+                    logger.warning('Reval POST: No se encontró registro de postura para la fecha %s. No se vincularán imágenes.', data_to_save['fecha'])
                     flash(f"Advertencia: No se encontraron 'Pruebas' para la fecha {data_to_save['fecha']}. Guardando revaloración sin imágenes.", "info")
                 
                 data_to_save['id_postura_asociado'] = id_postura_a_vincular
@@ -2026,20 +1935,20 @@ def manage_revaloracion(patient_id):
 
                 # --- Commit y Redirección ---
                 connection.commit()
-                print(f"INFO: Transacción completada (commit) Revaloración. ID: {saved_id}")
+                logger.info('Transacción completada (commit) Revaloración. ID: %s', saved_id)
                 flash('Revaloración guardada exitosamente.', 'success')
                 return redirect(url_for('clinical.manage_revaloracion', patient_id=patient_id, selected_id=saved_id))
 
             # ... (Bloque except para operaciones DB) ...
             except (PermissionError, ValueError, Exception) as e:
-                 print(f"ERROR: Rollback Revaloración: {type(e).__name__} - {e}")
+                 logger.error('Rollback Revaloración: %s - %s', type(e).__name__, e)
                  try:
                      connection.rollback()
-                     print("INFO (Reval POST): Rollback ejecutado.")
+                     logger.info('Reval POST: Rollback ejecutado.')
                  except Error as rb_err:
-                     print(f"ERROR: Falló el rollback de Revaloración: {rb_err}")
+                     logger.error('Falló el rollback de Revaloración: %s', rb_err)
 
-                 print(f"Error POST manage_revaloracion (PID {patient_id}): {e}")
+                 logger.error('Error POST manage_revaloracion (PID %s): %s', patient_id, e)
                  
                  if isinstance(e, PermissionError): flash(str(e), 'warning')
                  elif isinstance(e, ValueError): flash(f"Error en datos: {e}", 'danger')
@@ -2102,7 +2011,7 @@ def manage_revaloracion(patient_id):
             finally: 
                 if connection:
                     connection.autocommit = True
-                    print("INFO (Reval POST): Autocommit restaurado a True.")
+                    logger.info('Reval POST: Autocommit restaurado a True.')
 
         # --- MÉTODO GET ---
         else:
@@ -2153,7 +2062,7 @@ def manage_revaloracion(patient_id):
                 initial_anamnesis_data_for_labels = get_latest_anamnesis(connection, patient_id) or {}
 
             # 3. Cargar las Pruebas/Postura y RX asociadas a esta FECHA
-            print(f"INFO (Reval GET): Cargando datos de postura para la fecha: {fecha_cargada}")
+            logger.info('Reval GET: Cargando datos de postura para la fecha: %s', fecha_cargada)
             postura_data_for_date = get_specific_postura_by_date(connection, patient_id, fecha_cargada) or {}
             rx_list_for_date = []
             
@@ -2162,11 +2071,11 @@ def manage_revaloracion(patient_id):
             
             if id_postura_asociado:
                 # Si hay un registro de postura, buscar sus RX
-                print(f"INFO (Reval GET): Postura encontrada (ID: {id_postura_asociado}), buscando RX asociadas.")
+                logger.info('Reval GET: Postura encontrada (ID: %s), buscando RX asociadas.', id_postura_asociado)
                 rx_list_for_date = get_radiografias_for_postura(connection, id_postura_asociado)
             else:
                 # Si no hay registro de postura para esta fecha, las listas estarán vacías
-                print(f"INFO (Reval GET): No se encontró registro de postura para {fecha_cargada}.")
+                logger.info('Reval GET: No se encontró registro de postura para %s.', fecha_cargada)
                 pass 
 
             # 4. Renderizar
@@ -2187,13 +2096,13 @@ def manage_revaloracion(patient_id):
                                   )
 
     except Exception as e:
-        print(f"Error general en manage_revaloracion (PID {patient_id}): {e}")
+        logger.error('Error general en manage_revaloracion (PID %s): %s', patient_id, e)
         flash('Ocurrió un error inesperado al gestionar la revaloración.', 'danger')
         if connection and connection.is_connected():
              try: 
                  if not connection.autocommit: 
                      connection.rollback()
-             except Error as rb_error: print(f"WARN: Error rollback externo (reval): {rb_error}")
+             except Error as rb_error: logger.warning('Error rollback externo (reval): %s', rb_error)
         safe_redirect_url = url_for('patient.patient_detail', patient_id=patient_id) if 'patient_id' in locals() else url_for('main')
         return redirect(safe_redirect_url)
     finally:
@@ -2280,7 +2189,7 @@ def manage_plan_cuidado(patient_id):
 
                     # 3. Comparar string vs string (para la validación del ID)
                     if not (record_original and record_original.get('id_px') == patient_id and fecha_original_db_str == fecha_guardada):
-                         print(f"DEBUG PLAN FAIL: ID/PX Coinciden: {record_original.get('id_px') == patient_id}, Fecha DB: '{fecha_original_db_str}' != Fecha Form: '{fecha_guardada}'")
+                         logger.debug("PLAN FAIL: ID/PX Coinciden: %s, Fecha DB: '%s' != Fecha Form: '%s'", record_original.get('id_px') == patient_id, fecha_original_db_str, fecha_guardada)
                          raise ValueError("Plan de cuidado a editar inválido.")
                     
                     # 4. Usar el string para la comprobación de 'is_editable'
@@ -2321,7 +2230,7 @@ def manage_plan_cuidado(patient_id):
                 except ValueError:
                     raise ValueError("Visitas y promoción deben ser números enteros.")
                 except Exception as calc_err:
-                     print(f"Error calculando inversión POST: {calc_err}")
+                     logger.error('Error calculando inversión POST: %s', calc_err)
                      flash("Hubo un problema al calcular la inversión, se guardaron valores en 0.", "warning")
 
                 data_to_save['inversion_total'] = round(inversion_total_neta, 2)
@@ -2338,14 +2247,15 @@ def manage_plan_cuidado(patient_id):
                 if not saved_id:
                     # Si falló, autocommit no ocurrió o hubo error de BD
                     raise Exception("Error al guardar el Plan de Cuidado.")
+                invalidar_pdfs_de_tabla('plancuidado', patient_id, saved_id)
 
                 flash('Plan de Cuidado guardado exitosamente.', 'success')
                 return redirect(url_for('clinical.manage_plan_cuidado', patient_id=patient_id, selected_id=saved_id))
 
             # --- Bloque Except para operaciones ---
             except (PermissionError, ValueError, Exception) as e:
-                 print(f"ERROR: Ocurrió un error en Plan Cuidado POST: {type(e).__name__} - {e}")
-                 print(f"Error POST manage_plan_cuidado (PID {patient_id}): {e}")
+                 logger.error('Ocurrió un error en Plan Cuidado POST: %s - %s', type(e).__name__, e)
+                 logger.error('Error POST manage_plan_cuidado (PID %s): %s', patient_id, e)
                  if isinstance(e, PermissionError): flash(str(e), 'warning')
                  elif isinstance(e, ValueError): flash(f"Error en datos: {e}", 'danger')
                  else: flash(f'Error interno al guardar: {e}', 'danger')
@@ -2455,14 +2365,14 @@ def manage_plan_cuidado(patient_id):
                                    adicionales_status=adicionales_status
                                    )
     except Exception as e:
-        print(f"Error general en manage_plan_cuidado (PID {patient_id}): {e}")
+        logger.error('Error general en manage_plan_cuidado (PID %s): %s', patient_id, e)
         flash('Ocurrió un error inesperado al gestionar el Plan de Cuidado.', 'danger')
         safe_redirect_url = url_for('patient.patient_detail', patient_id=patient_id) if 'patient_id' in locals() else url_for('main')
         return redirect(safe_redirect_url)
     finally:
         if connection and connection.is_connected():
             connection.close()
-            print("INFO: Conexión a BD cerrada en finally (manage_plan_cuidado).")
+            logger.info('Conexión a BD cerrada en finally (manage_plan_cuidado).')
 
 @clinical_bp.route('/recibo', methods=['GET', 'POST'])
 @clinical_bp.route('/recibo/<int:recibo_id>', methods=['GET'])
@@ -2510,6 +2420,7 @@ def manage_recibos(patient_id, recibo_id=None):
             id_nuevo = save_recibo(connection_post, form_datos_recibo, form_detalles_recibo)
             if id_nuevo:
                 connection_post.commit()
+                invalidar_pdfs_de_tabla('recibos', patient_id, id_nuevo)
                 flash('Recibo guardado.', 'success')
                 return jsonify({ 
                     'success': True, 
@@ -2521,20 +2432,20 @@ def manage_recibos(patient_id, recibo_id=None):
             else:
                 # Si save_recibo devuelve None pero no lanza excepción
                 if connection_post and connection_post.in_transaction: connection_post.rollback()
-                print("Fallo al guardar recibo (save_recibo devolvió None).")
+                logger.error('Fallo al guardar recibo (save_recibo devolvió None).')
                 return jsonify({'success': False, 'message': 'Error interno al intentar guardar el recibo (Lógica).'}), 500
         
         except (ValueError, TypeError, json.JSONDecodeError) as ve:
             if connection_post and connection_post.in_transaction: connection_post.rollback()
-            print(f"Error de datos/JSON al procesar recibo: {ve}")
+            logger.error('Error de datos/JSON al procesar recibo: %s', ve)
             return jsonify({'success': False, 'message': f"Error en los datos del recibo: {str(ve)}. Verifique."}), 400
         except Error as db_err:
             if connection_post and connection_post.in_transaction: connection_post.rollback()
-            print(f"Error de BD al guardar recibo: {db_err}")
+            logger.error('Error de BD al guardar recibo: %s', db_err)
             return jsonify({'success': False, 'message': f"Error de base de datos al procesar el recibo."}), 500
         except Exception as e:
             if connection_post and connection_post.in_transaction: connection_post.rollback()
-            print(f"Error general al guardar recibo: {e}")
+            logger.error('Error general al guardar recibo: %s', e)
             return jsonify({'success': False, 'message': f'Error inesperado al guardar el recibo.'}), 500
         finally:
             if connection_post and connection_post.is_connected(): connection_post.close()
@@ -2551,8 +2462,8 @@ def manage_recibos(patient_id, recibo_id=None):
                                   )
 
         # --- !! INICIO DE DEBUG !! ---
-        print(f"\n--- DEBUG RECIBOS (GET) ---")
-        print(f"--- 1. ID de Recibo solicitado (desde URL): {recibo_id} ---")
+        logger.debug('RECIBOS (GET)')
+        logger.debug('1. ID de Recibo solicitado (desde URL): %s', recibo_id)
         # --- !! FIN DE DEBUG !! ---
 
         patient_context = get_patient_by_id(connection, patient_id)
@@ -2566,7 +2477,7 @@ def manage_recibos(patient_id, recibo_id=None):
         try:
             historial_compras_context = get_historial_compras_paciente(connection, patient_id)
         except Error as e_hist:
-            print(f"Error al llamar a get_historial_compras_paciente: {e_hist}")
+            logger.error('Error al llamar a get_historial_compras_paciente: %s', e_hist)
 
         # Definimos los defaults ANTES de la lógica
         is_new_recibo_context = True # Default es "Nuevo"
@@ -2579,14 +2490,14 @@ def manage_recibos(patient_id, recibo_id=None):
             current_recibo_data_context = get_recibo_by_id(connection, recibo_id)
             
             # --- !! INICIO DE DEBUG !! ---
-            print(f"--- 2. Datos devueltos por get_recibo_by_id: {'TIENE DATOS' if current_recibo_data_context else '!!!! NADA (None) !!!!'} ---")
+            logger.debug('2. Datos devueltos por get_recibo_by_id: %s', 'TIENE DATOS' if current_recibo_data_context else '!!!! NADA (None) !!!!')
             if current_recibo_data_context:
-                print(f"--- 2b. Fecha en los datos: {current_recibo_data_context.get('fecha')} (Tipo: {type(current_recibo_data_context.get('fecha'))}) ---")
+                logger.debug('2b. Fecha en los datos: %s (Tipo: %s)', current_recibo_data_context.get('fecha'), type(current_recibo_data_context.get('fecha')))
             # --- !! FIN DE DEBUG !! ---
 
             if current_recibo_data_context and current_recibo_data_context.get('id_px') == patient_id:
                 # --- !! INICIO DE DEBUG !! ---
-                print(f"--- 3. VALIDACIÓN: ¡ÉXITO! El recibo pertenece al paciente. ---")
+                logger.debug('3. VALIDACIÓN: ¡ÉXITO! El recibo pertenece al paciente.')
                 # --- !! FIN DE DEBUG !! ---
                 
                 current_recibo_detalles_context = get_recibo_detalles_by_id(connection, recibo_id)
@@ -2605,7 +2516,7 @@ def manage_recibos(patient_id, recibo_id=None):
                         pass
             else:
                 # --- !! INICIO DE DEBUG !! ---
-                print(f"--- 3. VALIDACIÓN: ¡¡FALLO!! El recibo no se encontró o no pertenece al paciente. ---")
+                logger.debug('3. VALIDACIÓN: ¡¡FALLO!! El recibo no se encontró o no pertenece al paciente.')
                 # --- !! FIN DE DEBUG !! ---
                 
                 flash("Recibo no encontrado o no pertenece a este paciente. Mostrando formulario nuevo.", "warning")
@@ -2615,12 +2526,12 @@ def manage_recibos(patient_id, recibo_id=None):
                 id_dr_actual_context = session.get('id_dr')
         
         else: # Si la URL NO trae un ID
-            print(f"--- 2. No se solicitó ID. Preparando recibo nuevo. ---")
+            logger.debug('2. No se solicitó ID. Preparando recibo nuevo.')
             is_new_recibo_context = True
             current_recibo_data_context = None 
             id_dr_actual_context = session.get('id_dr')
             
-        print(f"--- 4. ESTADO FINAL: Paciente ID: {patient_id}, Recibo ID Cargado: {recibo_id_cargado_context}, Es Nuevo: {is_new_recibo_context} ---")
+        logger.debug('4. ESTADO FINAL: Paciente ID: %s, Recibo ID Cargado: %s, Es Nuevo: %s', patient_id, recibo_id_cargado_context, is_new_recibo_context)
         
         return render_template('recibo_form.html', 
                                patient=patient_context,
@@ -2635,7 +2546,7 @@ def manage_recibos(patient_id, recibo_id=None):
                                historial_de_compras=historial_compras_context 
                                )
     except Exception as e:
-        print(f"Error general en GET manage_recibos: {e}")
+        logger.error('Error general en GET manage_recibos: %s', e)
         flash(f"Ocurrió un error al cargar la página de recibos: {str(e)}", "danger")
         return redirect(url_for('patient.patient_detail', patient_id=patient_id) if patient_id else url_for('main'))
     finally:
@@ -2791,7 +2702,7 @@ def generate_patient_report(patient_id):
 
     # --- Bloque except y finally exterior ---
     except Exception as e:
-         print(f"Error generando reporte para patient_id {patient_id}: {e}")
+         logger.error('Error generando reporte para patient_id %s: %s', patient_id, e)
          flash('Ocurrió un error inesperado al generar el reporte.', 'danger')
          if connection and connection.is_connected():
              try: connection.rollback()
@@ -2866,12 +2777,45 @@ def get_reporte_visual_data(patient_id):
         return jsonify(response_data)
 
     except Exception as e:
-        print(f"Error en get_reporte_visual_data (PID {patient_id}, Fecha {fecha_solicitada}): {e}")
+        logger.error('Error en get_reporte_visual_data (PID %s, Fecha %s): %s', patient_id, fecha_solicitada, e)
         return jsonify({'error': f'Error interno del servidor al procesar la fecha {fecha_solicitada}.'}), 500
     finally:
         if connection and connection.is_connected():
             connection.close()
 
+@clinical_bp.route('/pruebas/<int:id_postura>/estado_imagenes')
+@login_required
+def estado_imagenes_pruebas(patient_id, id_postura):
+    """
+    Endpoint AJAX: estado del procesamiento en segundo plano de las fotos de postura.
+    El formulario de pruebas lo consulta mientras haya trabajos pendientes.
+    """
+    connection = None
+    try:
+        connection = connect_to_db()
+        if not connection:
+            return jsonify({'error': 'Error de conexión.'}), 500
+
+        trabajos = get_trabajos_imagen_por_postura(connection, id_postura, patient_id)
+        imagenes = {}
+        pendientes = 0
+        for trabajo in trabajos:
+            if trabajo['estado'] in ('pendiente', 'procesando'):
+                pendientes += 1
+            ruta = trabajo['ruta_resultado'] if trabajo['estado'] == 'completado' else trabajo['ruta_original']
+            imagenes[trabajo['columna']] = {
+                'estado': trabajo['estado'],
+                'url': url_for('static', filename=ruta) if ruta else None,
+                'error': trabajo.get('error')
+            }
+        return jsonify({'pendientes': pendientes, 'imagenes': imagenes})
+    except Exception as e:
+        logger.error('Error en estado_imagenes_pruebas: %s', e)
+        return jsonify({'error': 'Error interno del servidor.'}), 500
+    finally:
+        if connection and connection.is_connected():
+            connection.close()
+
 @clinical_bp.route('/pruebas/generar_informe_ia', methods=['POST'])
 @login_required
 def ajax_generar_informe_postura(patient_id):
@@ -2901,7 +2845,8 @@ def ajax_generar_informe_postura(patient_id):
     informe_texto = generar_informe_postura_con_ia(
         rutas_imagenes, 
         notas_adicionales,
-        hallazgos_calculados 
+        hallazgos_calculados,
+        forzar=bool(data.get('regenerar'))  # 'regenerar' ignora la respuesta guardada en caché
     )
 
     # Devolver el informe como JSON
@@ -2925,7 +2870,8 @@ def ajax_generar_informe_podal(patient_id):
     ruta_trasera_absoluta = os.path.join(current_app.root_path, 'static', ruta_trasera_relativa) if ruta_trasera_relativa else None
     hallazgos_podales, ruta_imagen_anotada = analizar_coordenadas_podal(ruta_trasera_absoluta)
 
-    informe_texto = generar_informe_podal_unificado(rutas_imagenes, notas_adicionales, hallazgos_podales )
+    informe_texto = generar_informe_podal_unificado(rutas_imagenes, notas_adicionales, hallazgos_podales,
+                                                    forzar=bool(data.get('regenerar')))
 
     if ruta_imagen_anotada:
         url_imagen_anotada = url_for('static', filename=ruta_imagen_anotada)
@@ -2940,12 +2886,8 @@ def generate_plan_pdf(patient_id, id_plan):
     logo_base64_uri = None
     centro_info_for_pdf = None 
     try:
-        # --- Cargar y codificar el logo ---
-        logo_path = os.path.join(current_app.static_folder, 'img', 'logo.png')
-        if os.path.exists(logo_path):
-            with open(logo_path, "rb") as image_file:
-                encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-                logo_base64_uri = f"data:image/png;base64,{encoded_string}"
+        # --- Logo (codificado una vez por proceso, ver utils/recursos.py) ---
+        logo_base64_uri = logo_data_uri(current_app.static_folder)
         
         connection = connect_to_db()
         if not connection:
@@ -2973,9 +2915,7 @@ def generate_plan_pdf(patient_id, id_plan):
 
         doctor_name = "No especificado"
         if plan_obj.get('id_dr'): 
-            doctors = get_all_doctors(connection) 
-            found_doctor = next((doc for doc in doctors if doc['id_dr'] == plan_obj['id_dr']), None)
-            if found_doctor: doctor_name = found_doctor.get('nombre', doctor_name)
+            doctor_name = get_nombre_doctor(connection, plan_obj['id_dr'], default=doctor_name)
 
         adicionales_seleccionados_obj = [] 
         adicional_ids_str = plan_obj.get('adicionales_ids', '0,')
@@ -3005,31 +2945,22 @@ def generate_plan_pdf(patient_id, id_plan):
         }
         # ----------------------------------------------------
 
-        print(f"DEBUG generate_plan_pdf: Datos para plantilla: {data_for_pdf.keys()}") # Log de las claves principales
-
-        # Renderizar la plantilla HTML pasando el diccionario 'data_for_pdf' como 'data'
-        html_content = render_template('plan_cuidado_pdf.html', data=data_for_pdf) 
+        logger.debug('generate_plan_pdf: Datos para plantilla: %s', data_for_pdf.keys()) # Log de las claves principales
 
-        # Convertir HTML a PDF
-        pdf_buffer = BytesIO()
-        pisa_status = pisa.CreatePDF(
-            html_content.encode('utf-8'),
-            dest=pdf_buffer,
-            encoding='utf-8'
-        )
+        # Renderizar la plantilla HTML pasando el diccionario 'data_for_pdf' como 'data' y convertir a PDF
+        # (o servir la versión en caché si los datos no cambiaron)
+        response, pdf_error = responder_pdf('plan', patient_id, id_plan, 'plan_cuidado_pdf.html', data_for_pdf,
+                                            f'plan_cuidado_px{patient_id}_plan{id_plan}.pdf')
 
-        if pisa_status.err:
-            print(f"Error al generar PDF de Plan de Cuidado #{id_plan} con pisa: {pisa_status.err}")
+        if pdf_error:
+            logger.error('Error al generar PDF de Plan de Cuidado #%s con pisa: %s', id_plan, pdf_error)
             flash('Ocurrió un error al generar el archivo PDF del plan.', 'danger')
             return redirect(url_for('clinical.manage_plan_cuidado', patient_id=patient_id, selected_id=id_plan))
 
-        pdf_buffer.seek(0)
-        response = Response(pdf_buffer, mimetype='application/pdf')
-        response.headers['Content-Disposition'] = f'inline; filename=plan_cuidado_px{patient_id}_plan{id_plan}.pdf'
         return response
 
     except Exception as e:
-        print(f"Error en generate_plan_pdf (PID {patient_id}, PlanID {id_plan}): {e}")
+        logger.error('Error en generate_plan_pdf (PID %s, PlanID %s): %s', patient_id, id_plan, e)
         flash('Error inesperado al generar el PDF del plan.', 'danger')
         if connection and connection.is_connected() and not getattr(connection, 'autocommit', True): 
             try: connection.rollback()
@@ -3040,7 +2971,7 @@ def generate_plan_pdf(patient_id, id_plan):
     finally:
         if connection and connection.is_connected(): 
             connection.close()
-            print("INFO generate_plan_pdf: Conexión a BD cerrada en finally.")
+            logger.info('INFO generate_plan_pdf: Conexión a BD cerrada en finally.')
 
 @clinical_bp.route('/pdf_plantillas') 
 @login_required
@@ -3048,11 +2979,7 @@ def generate_plantillas_pdf(patient_id):
     connection = None
     logo_base64_uri = None
     try:
-        logo_path = os.path.join(current_app.static_folder, 'img', 'logo.png')
-        if os.path.exists(logo_path):
-            with open(logo_path, "rb") as image_file:
-                encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-                logo_base64_uri = f"data:image/png;base64,{encoded_string}"
+        logo_base64_uri = logo_data_uri(current_app.static_folder)
         
         connection = connect_to_db()
         if not connection:
@@ -3069,7 +2996,7 @@ def generate_plantillas_pdf(patient_id):
         postura_data = None
 
         if fecha_pruebas_solicitada:
-            print(f"DEBUG PDF Plantillas: Buscando pruebas para fecha específica: {fecha_pruebas_solicitada}")
+            logger.debug('PDF Plantillas: Buscando pruebas para fecha específica: %s', fecha_pruebas_solicitada)
             # Asume que get_specific_postura_by_date ya selecciona todas las columnas necesarias
             postura_data = get_specific_postura_by_date(connection, patient_id, fecha_pruebas_solicitada)
             if not postura_data:
@@ -3077,7 +3004,7 @@ def generate_plantillas_pdf(patient_id):
                  # Si no se encuentra para la fecha específica, intentamos el más reciente
                  postura_data = get_latest_postura_overall(connection, patient_id)
         else:
-            print("DEBUG PDF Plantillas: No se especificó fecha, buscando pruebas más recientes.")
+            logger.debug('PDF Plantillas: No se especificó fecha, buscando pruebas más recientes.')
             postura_data = get_latest_postura_overall(connection, patient_id)
         # -------------------------------------------------------------
 
@@ -3130,22 +3057,19 @@ def generate_plantillas_pdf(patient_id):
             'centro_info': centro_info_for_pdf 
         }
 
-        html_content = render_template('plantillas_pdf_template.html', data=pdf_data)
-        pdf_buffer = BytesIO()
-        pisa_status = pisa.CreatePDF(html_content.encode('utf-8'), dest=pdf_buffer, encoding='utf-8')
+        nombre_pdf = f'plantillas_px{patient_id}_{pdf_data["fecha_pruebas"].replace("/", "-") if pdf_data["fecha_pruebas"] else "reciente"}.pdf'
+        response, pdf_error = responder_pdf('plantillas', patient_id, postura_data.get('id_postura'),
+                                            'plantillas_pdf_template.html', pdf_data, nombre_pdf)
 
-        if pisa_status.err:
-            print(f"Error al generar PDF de plantillas con pisa: {pisa_status.err}")
+        if pdf_error:
+            logger.error('Error al generar PDF de plantillas con pisa: %s', pdf_error)
             flash('Ocurrió un error al generar el PDF para plantillas.', 'danger')
             return redirect(url_for('patient.patient_detail', patient_id=patient_id))
 
-        pdf_buffer.seek(0)
-        response = Response(pdf_buffer, mimetype='application/pdf')
-        response.headers['Content-Disposition'] = f'inline; filename=plantillas_px{patient_id}_{pdf_data["fecha_pruebas"].replace("/", "-") if pdf_data["fecha_pruebas"] else "reciente"}.pdf'
         return response
 
     except Exception as e:
-        print(f"Error en generate_plantillas_pdf (PID {patient_id}): {e}")
+        logger.error('Error en generate_plantillas_pdf (PID %s): %s', patient_id, e)
         flash('Error inesperado al generar PDF para plantillas.', 'danger')
         return redirect(url_for('patient.patient_detail', patient_id=patient_id))
     finally:
@@ -3184,7 +3108,7 @@ def check_plantillas_data_exists(patient_id):
         })
 
     except Exception as e:
-        print(f"Error en check_plantillas_data_exists (PID {patient_id}): {e}")
+        logger.error('Error en check_plantillas_data_exists (PID %s): %s', patient_id, e)
         return jsonify({'exists': False, 'message': 'Error interno al verificar datos.'}), 500
     finally:
         if connection and connection.is_connected():
@@ -3197,14 +3121,9 @@ def generate_recibo_pdf(patient_id, id_recibo):
     connection = None
     logo_base64_uri = None
     try:
-        logo_path = os.path.join(current_app.static_folder, 'img', 'logo.png')
-        if os.path.exists(logo_path):
-            with open(logo_path, "rb") as image_file:
-                encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-                logo_base64_uri = f"data:image/png;base64,{encoded_string}"
-                print("INFO generate_recibo_pdf: Logo cargado y codificado.")
-        else:
-            print("WARN generate_recibo_pdf: Archivo de logo no encontrado en", logo_path)
+        logo_base64_uri = logo_data_uri(current_app.static_folder)
+        if not logo_base64_uri:
+            logger.warning('WARN generate_recibo_pdf: Archivo de logo no encontrado.')
 
         connection = connect_to_db()
         if not connection:
@@ -3249,33 +3168,23 @@ def generate_recibo_pdf(patient_id, id_recibo):
         receipt_data['current_year_for_pdf'] = datetime.now().year
         receipt_data['centro_info'] = centro_info_for_pdf 
 
-        print(f"DEBUG generate_recibo_pdf: Datos para plantilla: {receipt_data}")
-
-        # Renderizar la plantilla HTML específica para el PDF del recibo
-        html_content = render_template('recibo_pdf_template.html', data=receipt_data)
+        logger.debug('generate_recibo_pdf: Datos para plantilla: %s', receipt_data)
 
-        # Convertir HTML a PDF
-        pdf_buffer = BytesIO()
-        pisa_status = pisa.CreatePDF(
-            html_content.encode('utf-8'), # Fuente HTML
-            dest=pdf_buffer,                # Salida al buffer
-            encoding='utf-8'                # Codificación
-        )
+        # Renderizar la plantilla HTML específica para el PDF del recibo y convertir a PDF
+        # (un recibo no cambia después de guardarse: normalmente se sirve desde la caché)
+        response, pdf_error = responder_pdf('recibo', patient_id, id_recibo, 'recibo_pdf_template.html', receipt_data,
+                                            f'recibo_px{patient_id}_rec{id_recibo}.pdf')
 
-        if pisa_status.err:
-            print(f"Error al generar PDF de recibo #{id_recibo} con pisa: {pisa_status.err}")
+        if pdf_error:
+            logger.error('Error al generar PDF de recibo #%s con pisa: %s', id_recibo, pdf_error)
             flash('Ocurrió un error al generar el PDF del recibo.', 'danger')
             if connection and connection.is_connected(): connection.close()
             return redirect(url_for('clinical.manage_recibos', patient_id=patient_id, selected_id=id_recibo)) # Volver al form del recibo
 
-        pdf_buffer.seek(0)
-        response = Response(pdf_buffer, mimetype='application/pdf')
-        # 'inline' intenta mostrarlo en el navegador, 'attachment' fuerza la descarga
-        response.headers['Content-Disposition'] = f'inline; filename=recibo_px{patient_id}_rec{id_recibo}.pdf'
         return response
 
     except Exception as e:
-        print(f"Error en generate_recibo_pdf (PID {patient_id}, ReciboID {id_recibo}): {e}")
+        logger.error('Error en generate_recibo_pdf (PID %s, ReciboID %s): %s', patient_id, id_recibo, e)
         flash('Error inesperado al generar PDF del recibo.', 'danger')
         # Si la conexión está abierta y ocurre un error no manejado antes, cerrarla.
         if connection and connection.is_connected():
@@ -3288,19 +3197,14 @@ def generate_recibo_pdf(patient_id, id_recibo):
         # Asegurar que la conexión se cierre si se abrió en el try principal
         if connection and connection.is_connected() and not connection.is_closed():
             connection.close()
-            print("INFO generate_recibo_pdf: Conexión a BD cerrada en finally.")
+            logger.info('INFO generate_recibo_pdf: Conexión a BD cerrada en finally.')
 
 @clinical_bp.route('/reporte_integral_pdf')
 @login_required
 def generar_reporte_integral_pdf(patient_id):
     connection = None
     try:
-        logo_base64_uri = None
-        logo_path = os.path.join(current_app.static_folder, 'img', 'logo.png')
-        if os.path.exists(logo_path):
-            with open(logo_path, "rb") as image_file:
-                encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-                logo_base64_uri = f"data:image/png;base64,{encoded_string}"
+        logo_base64_uri = logo_data_uri(current_app.static_folder)
 
         connection = connect_to_db()
         if not connection:
@@ -3316,76 +3220,91 @@ def generar_reporte_integral_pdf(patient_id):
             flash("Faltan datos esenciales (anamnesis o pruebas) para generar el informe.", "warning")
             return redirect(url_for('patient.patient_detail', patient_id=patient_id))
 
-        # 1.1 Obtener la ruta completa de la imagen frontal
-        ruta_frontal_relativa = pruebas_data.get('frente')
-        ruta_frontal_absoluta = os.path.join(current_app.root_path, 'static', ruta_frontal_relativa) if ruta_frontal_relativa else None
-
-        # 2.1 Llamar a nuestra nueva función para obtener los datos objetivos
-        hallazgos_calculados = analizar_coordenadas_postura(ruta_frontal_absoluta)
-
-        # 2. Generar el informe de texto con la IA
-        informe_ia_texto = generar_informe_integral_con_ia(patient_data, anamnesis_data, pruebas_data, hallazgos_calculados )
-
-        # 3. Preparar todos los datos para la plantilla PDF
-        edad_paciente = calculate_age(patient_data.get('nacimiento'))
-        
-        id_dr_sesion = session.get('id_dr')
+        # Datos de sesión y del centro: se leen aquí porque el informe puede generarse fuera del request
         nombre_doctor = session.get('nombre_dr', 'No especificado') 
         
         id_centro_sesion = session.get('id_centro_dr')
         centro_info = get_centro_by_id(connection, id_centro_sesion) if id_centro_sesion else None
 
-        print("\n--- DIAGNÓSTICO DEL PIE DE PÁGINA ---")
-        print(f"ID del Centro en Sesión: {id_centro_sesion}")
-        print(f"Información de la Clínica Obtenida de la BD: {centro_info}")
-        print("-------------------------------------\n")
+        logger.debug('DIAGNÓSTICO DEL PIE DE PÁGINA')
+        logger.debug('ID del Centro en Sesión: %s', id_centro_sesion)
+        logger.debug('Información de la Clínica Obtenida de la BD: %s', centro_info)
+        logger.debug('')
 
         if not centro_info: # Si no se encuentra info del centro, usar un default
             centro_info = {'nombre': 'Chiropractic Care Center'}
 
-         # 4. Preparar todos los datos para la plantilla PDF 
-        def get_safe_path(key):
-            path = pruebas_data.get(key)
-            return os.path.join(current_app.root_path, 'static', path) if path else ''
+        forzar_ia = request.args.get('regenerar') == '1'
 
-        data_for_pdf = {
-            'patient': patient_data,
-            'anamnesis': anamnesis_data,
-            'pruebas': pruebas_data,
-            'informe_ia': informe_ia_texto,
-            'today_str': datetime.now().strftime('%d/%m/%Y'),
-            'logo_uri': logo_base64_uri,
-            
-            'edad_paciente': edad_paciente,
-            'doctor_name': nombre_doctor,
-            'centro_info': centro_info,
-
-            'imagenes': {
-                'frente': get_safe_path('frente'),
-                'lado': get_safe_path('lado'),
-                'postura_extra': get_safe_path('postura_extra'),
-                'pies_frontal': get_safe_path('pies_frontal'),
-                'pies_trasera': get_safe_path('pies_trasera'),
-                'pies': get_safe_path('pies'), 
+        def preparar_datos_pdf():
+            # 1.1 Obtener la ruta completa de la imagen frontal
+            ruta_frontal_relativa = pruebas_data.get('frente')
+            ruta_frontal_absoluta = os.path.join(current_app.root_path, 'static', ruta_frontal_relativa) if ruta_frontal_relativa else None
+
+            # 2.1 Llamar a nuestra nueva función para obtener los datos objetivos
+            hallazgos_calculados = analizar_coordenadas_postura(ruta_frontal_absoluta)
+
+            # 2. Generar el informe de texto con la IA
+            informe_ia_texto = generar_informe_integral_con_ia(patient_data, anamnesis_data, pruebas_data, hallazgos_calculados,
+                                                               forzar=forzar_ia)
+
+            # 3. Preparar todos los datos para la plantilla PDF
+            edad_paciente = calculate_age(patient_data.get('nacimiento'))
+
+            def get_safe_path(key):
+                path = pruebas_data.get(key)
+                return os.path.join(current_app.root_path, 'static', path) if path else ''
+
+            return {
+                'patient': patient_data,
+                'anamnesis': anamnesis_data,
+                'pruebas': pruebas_data,
+                'informe_ia': informe_ia_texto,
+                'today_str': datetime.now().strftime('%d/%m/%Y'),
+                'logo_uri': logo_base64_uri,
+                
+                'edad_paciente': edad_paciente,
+                'doctor_name': nombre_doctor,
+                'centro_info': centro_info,
+
+                'imagenes': {
+                    'frente': get_safe_path('frente'),
+                    'lado': get_safe_path('lado'),
+                    'postura_extra': get_safe_path('postura_extra'),
+                    'pies_frontal': get_safe_path('pies_frontal'),
+                    'pies_trasera': get_safe_path('pies_trasera'),
+                    'pies': get_safe_path('pies'), 
+                }
             }
-        }
-        
-        # 5. Renderizar el HTML y generar el PDF
-        html_content = render_template('reporte_integral_pdf.html', data=data_for_pdf)
-        pdf_buffer = BytesIO()
-        pisa_status = pisa.CreatePDF(html_content.encode('utf-8'), dest=pdf_buffer, encoding='utf-8')
 
-        if pisa_status.err:
+        # 4. Generar el PDF. Con la cola de PDF activa, el informe de IA y pisa corren fuera del
+        #    request: se espera hasta un plazo y si no terminó se muestra la página "generando".
+        nombre_pdf = f'informe_integral_px{patient_id}.pdf'
+        cola_pdf = get_pdf_jobs()
+        if cola_pdf and cola_pdf.habilitada:
+            # La clave cubre todo lo que muestra el informe: doctor y centro de la sesión y las filas de
+            # paciente, anamnesis y postura (p. ej. fotos anotadas después por un trabajo de imagen)
+            sello_datos = hashlib.sha256(json.dumps([patient_data, anamnesis_data, pruebas_data],
+                                                    sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+            clave = (f"{anamnesis_data.get('id_anamnesis')}:{datetime.now().strftime('%Y%m%d')}:"
+                     f"{session.get('id_dr')}:{id_centro_sesion}:{sello_datos}")
+            if forzar_ia:
+                clave += f":{uuid.uuid4().hex}"  # Regenerar siempre crea un trabajo nuevo
+            trabajo = cola_pdf.enviar('integral', patient_id, pruebas_data.get('id_postura'), nombre_pdf, clave=clave,
+                                      plantilla='reporte_integral_pdf.html', preparar=preparar_datos_pdf)
+            response, pdf_error = responder_trabajo_pdf(trabajo)
+        else:
+            response, pdf_error = responder_pdf('integral', patient_id, pruebas_data.get('id_postura'),
+                                                'reporte_integral_pdf.html', preparar_datos_pdf(), nombre_pdf)
+
+        if pdf_error:
             flash('Ocurrió un error al generar el archivo PDF.', 'danger')
             return redirect(url_for('patient.patient_detail', patient_id=patient_id))
         
-        pdf_buffer.seek(0)
-        response = Response(pdf_buffer, mimetype='application/pdf')
-        response.headers['Content-Disposition'] = f'inline; filename=informe_integral_px{patient_id}.pdf'
         return response
 
     except Exception as e:
-        print(f"Error generando informe integral para PID {patient_id}: {e}")
+        logger.error('Error generando informe integral para PID %s: %s', patient_id, e)
         flash('Error inesperado al generar el informe integral.', 'danger')
         return redirect(url_for('patient.patient_detail', patient_id=patient_id))
     finally:
@@ -3394,6 +3313,42 @@ def generar_reporte_integral_pdf(patient_id):
 
 
 
+@clinical_bp.route('/pdf/trabajo/<id_trabajo>')
+@login_required
+def estado_trabajo_pdf(patient_id, id_trabajo):
+    """Endpoint AJAX: estado de un PDF que se genera en segundo plano (lo consulta la página "generando")."""
+    cola = get_pdf_jobs()
+    trabajo = cola.estado(id_trabajo) if cola else None
+    if not trabajo or trabajo.get('id_px') != patient_id:
+        return jsonify({'error': 'Trabajo no encontrado.'}), 404
+
+    estado = trabajo['estado']
+    if estado == 'completado' and not cache_pdf.existe(trabajo['tipo'], patient_id, trabajo['id_doc'], trabajo['version']):
+        estado = 'expirado'  # El PDF se invalidó (se guardaron datos nuevos): hay que volver a pedirlo
+    return jsonify({
+        'estado': estado,
+        'error': trabajo.get('error'),
+        'ms': trabajo.get('ms'),
+        'url_descarga': url_for('clinical.descargar_trabajo_pdf', patient_id=patient_id, id_trabajo=id_trabajo)
+                        if estado == 'completado' else None
+    })
+
+@clinical_bp.route('/pdf/trabajo/<id_trabajo>/descargar')
+@login_required
+def descargar_trabajo_pdf(patient_id, id_trabajo):
+    """Devuelve el PDF generado por un trabajo en segundo plano."""
+    cola = get_pdf_jobs()
+    trabajo = cola.estado(id_trabajo) if cola else None
+    if not trabajo or trabajo.get('id_px') != patient_id or trabajo['estado'] != 'completado':
+        flash('El PDF solicitado no está disponible. Vuelva a generarlo.', 'warning')
+        return redirect(url_for('patient.patient_detail', patient_id=patient_id))
+
+    contenido = cache_pdf.obtener(trabajo['tipo'], patient_id, trabajo['id_doc'], trabajo['version'])
+    if contenido is None:
+        flash('El PDF se actualizó con datos nuevos. Vuelva a generarlo.', 'warning')
+        return redirect(url_for('patient.patient_detail', patient_id=patient_id))
+    return respuesta_pdf(contenido, trabajo['version'], trabajo['nombre_archivo'])
+
 @clinical_bp.route('/comparador')
 @login_required
 def comparador_postura(patient_id):
@@ -3426,7 +3381,7 @@ def comparador_postura(patient_id):
                                available_dates=available_dates)
 
     except Exception as e:
-        print(f"Error en comparador_postura (PID {patient_id}): {e}")
+        logger.error('Error en comparador_postura (PID %s): %s', patient_id, e)
         flash("Ocurrió un error al cargar el comparador de posturas.", "danger")
         return redirect(url_for('patient.patient_detail', patient_id=patient_id))
     finally:
@@ -3468,7 +3423,7 @@ def get_postura_data_for_date(patient_id):
         return jsonify(image_paths)
 
     except Exception as e:
-        print(f"Error en get_postura_data_for_date (PID {patient_id}): {e}")
+        logger.error('Error en get_postura_data_for_date (PID %s): %s', patient_id, e)
         return jsonify({'error': 'Error interno del servidor.'}), 500
     finally:
         if connection and connection.is_connected():
@@ -3507,7 +3462,7 @@ def reporte_visual_fechado(patient_id):
                                available_dates=available_dates)
 
     except Exception as e:
-        print(f"Error en reporte_visual_fechado (PID {patient_id}): {e}")
+        logger.error('Error en reporte_visual_fechado (PID %s): %s', patient_id, e)
         flash("Ocurrió un error al cargar el reporte visual.", "danger")
         return redirect(url_for('patient.patient_detail', patient_id=patient_id))
     finally:
@@ -3543,11 +3498,11 @@ def api_mark_notes_seen(patient_id):
 
     except Error as e:
         if connection: connection.rollback()
-        print(f"Error en API mark_notes_seen: {e}")
+        logger.error('Error en API mark_notes_seen: %s', e)
         return jsonify({'success': False, 'message': 'Error de base de datos.'}), 500
     except Exception as ex:
         if connection: connection.rollback()
-        print(f"Error inesperado en API mark_notes_seen: {ex}")
+        logger.error('Error inesperado en API mark_notes_seen: %s', ex)
         return jsonify({'success': False, 'message': 'Error del servidor.'}), 500
     finally:
         if connection: 
@@ -3579,11 +3534,11 @@ def api_add_general_note(patient_id):
 
     except Error as e:
         if connection: connection.rollback()
-        print(f"Error en API add_general_note: {e}")
+        logger.error('Error en API add_general_note: %s', e)
         return jsonify({'success': False, 'message': 'Error de base de datos al guardar la nota.'}), 500
     except Exception as ex:
         if connection: connection.rollback()
-        print(f"Error inesperado en API add_general_note: {ex}")
+        logger.error('Error inesperado en API add_general_note: %s', ex)
         return jsonify({'success': False, 'message': 'Error del servidor al guardar la nota.'}), 500
     finally:
         if connection: 
@@ -15,6 +15,7 @@ from database import (
     get_postura_summary, get_active_plan_status, get_unseen_notes_for_patient
 )
 from utils.date_manager import to_frontend_str, to_db_str, parse_date, parse_date
+from utils.cache_busqueda import BUSQUEDA_CACHE_CONFIG, cache_busqueda_pacientes, buscar_pacientes_cacheado
 # Importar los decoradores
 from decorators import login_required, admin_required
 
@@ -86,6 +87,7 @@ def add_patient_route():
             )
 
             if nuevo_id:
+                cache_busqueda_pacientes.invalidar()
                 flash(f'Paciente {form.nombre.data} {form.apellidop.data} registrado con éxito (ID: {nuevo_id}).', 'success')
                 return redirect(url_for('patient.patient_detail', patient_id=nuevo_id))
             else:
@@ -207,6 +209,7 @@ def edit_patient_route(patient_id):
             success = update_patient_details(connection, patient_data_to_update)
             
             if success:
+                cache_busqueda_pacientes.invalidar()
                 flash('Datos del paciente actualizados exitosamente.', 'success')
                 return redirect(url_for('patient.patient_detail', patient_id=patient_id))
             else:
@@ -239,18 +242,53 @@ def edit_patient_route(patient_id):
         if connection and connection.is_connected():
             connection.close()
 
+def _entero_arg(nombre, default, minimo, maximo):
+    """Parámetro entero de la query string, acotado a [minimo, maximo]."""
+    try:
+        valor = int(request.args.get(nombre, default))
+    except (TypeError, ValueError):
+        valor = default
+    return max(minimo, min(valor, maximo))
+
 @patient_bp.route('/api/search_patients') 
 @login_required
 def api_search_patients():
+    """
+    Búsqueda para el buscador de pacientes. Devuelve la lista de pacientes (JSON).
+    - ?limit=N (por defecto 50) y ?cursor= (valor del encabezado X-Next-Cursor de la página anterior).
+    - Responde con ETag: si el navegador ya tiene el resultado (If-None-Match) devuelve 304.
+    - Los resultados se guardan unos segundos (utils/cache_busqueda.py): las búsquedas
+      repetidas no abren conexión a la BD.
+    """
     connection = None
     try:
         search_term = request.args.get('term', '') 
-        connection = connect_to_db()
-        if not connection:
+        limite = _entero_arg('limit', BUSQUEDA_CACHE_CONFIG['limite'], 1, BUSQUEDA_CACHE_CONFIG['limite_max'])
+        desplazamiento = _entero_arg('cursor', 0, 0, BUSQUEDA_CACHE_CONFIG['desplazamiento_max'])
+
+        def consultar(limite_consulta, desplazamiento_consulta):
+            nonlocal connection
+            connection = connect_to_db()
+            if not connection:
+                return None
+            return search_patients_by_name(connection, search_term, limit=limite_consulta,
+                                           offset=desplazamiento_consulta)
+
+        # Los pacientes no se filtran por centro, pero la clave lo incluye por si eso cambia
+        resultado = buscar_pacientes_cacheado(search_term, session.get('id_centro_dr'), limite,
+                                              desplazamiento, consultar)
+        if resultado is None:
              return jsonify({"error": "Database connection failed"}), 500 
-        
-        patients = search_patients_by_name(connection, search_term)
-        return jsonify(patients) 
+
+        if request.if_none_match.contains(resultado['etag']):
+            response = current_app.response_class(status=304)
+        else:
+            response = jsonify(resultado['pacientes'])
+        response.set_etag(resultado['etag'])
+        response.headers['Cache-Control'] = 'private, no-cache'
+        if resultado['siguiente'] is not None:
+            response.headers['X-Next-Cursor'] = str(resultado['siguiente'])
+        return response
 
     except Exception as e:
         current_app.logger.error(f"Error en API search_patients: {e}")
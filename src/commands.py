@@ -0,0 +1,643 @@
+# src/commands.py
+# Comandos de consola (flask <comando>) para mantenimiento y mediciones de rendimiento.
+# Se registran en main.py con register_commands(app). Ejemplo:
+#   flask --app main bench-fechas-clinicas --top 5
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import click
+from logging.handlers import QueueListener
+
+from database import (
+    connect_to_db, get_clinical_dates_with_types, recalcular_contadores_planes, get_ids_recibos_periodo,
+    search_patients_by_name, reindexar_busqueda_pacientes, recalcular_resumen_ingresos, verificar_resumen_ingresos,
+    get_ingresos_por_periodo, get_ingresos_por_doctor_periodo,
+    get_utilidad_estimada_por_periodo, get_utilidad_estimada_por_doctor_periodo,
+    get_pacientes_nuevos_por_periodo, get_seguimientos_por_doctor_periodo, get_uso_planes_de_cuidado,
+    get_reportes_combinados_periodo, get_productos_servicios_venta, get_terapias_fisicas, get_all_doctors,
+    get_all_centros, get_costos_internos_productos, save_recibo
+)
+from utils.catalogos import CATALOGOS_CONFIG, cache_catalogos
+from utils.cache_busqueda import BUSQUEDA_CACHE_CONFIG, CacheBusquedaPacientes, buscar_pacientes_cacheado
+from utils.exportar_recibos import ARCHIVO_ERROR_ZIP, ExportacionIncompletaError, exportar_zip, exportar_pdf_unico
+from utils.ia_cache import cache_ia
+from utils.ia_texto import generar_texto_con_cobertura, candidato_fake, estadisticas_ia
+from utils.registro import ColaNoBloqueante, FiltroLimite, FormatoJSON
+
+
+def _contar_queries(connection):
+    """Número de sentencias ejecutadas por la sesión actual (contador 'Questions' de MySQL)."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SHOW SESSION STATUS LIKE 'Questions'")
+        row = cursor.fetchone()
+        return int(row[1]) if row else 0
+    finally:
+        cursor.close()
+
+
+def _medir(connection, funcion, repeticiones):
+    """
+    Ejecuta 'funcion' varias veces y devuelve (resultado, round_trips_por_llamada, ms_promedio, ms_max).
+    Al contador de 'Questions' se le resta la propia consulta de SHOW STATUS.
+    """
+    resultado = None
+    tiempos = []
+    q_inicio = _contar_queries(connection)
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000.0)
+    q_fin = _contar_queries(connection)
+    round_trips = (q_fin - q_inicio - 1) / repeticiones
+    return resultado, round_trips, sum(tiempos) / len(tiempos), max(tiempos)
+
+
+# Módulos pesados que NO deberían cargarse al arrancar (se importan al primer uso)
+MODULOS_PESADOS = ['google.generativeai', 'groq', 'cv2', 'mediapipe', 'PIL', 'xhtml2pdf', 'numpy']
+
+# Script que corre en un proceso nuevo: mide el import de la app en frío.
+_SCRIPT_ARRANQUE = """
+import json, os, resource, sys, time
+sys.path.insert(0, os.getcwd())
+inicio = time.perf_counter()
+modulo = __import__(sys.argv[1])
+ms = (time.perf_counter() - inicio) * 1000.0
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+pesados = [m for m in json.loads(sys.argv[2]) if m in sys.modules]
+print(json.dumps({'ms': ms, 'rss_mb': rss_kb / 1024.0, 'pesados': pesados}))
+"""
+
+
+def _medir_arranque(modulo):
+    """Importa 'modulo' en un proceso nuevo y devuelve {'ms', 'rss_mb', 'pesados'}."""
+    resultado = subprocess.run(
+        [sys.executable, '-c', _SCRIPT_ARRANQUE, modulo, json.dumps(MODULOS_PESADOS)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+    )
+    # La app imprime mensajes al importarse; el resultado es la última línea
+    return json.loads(resultado.stdout.strip().splitlines()[-1])
+
+
+# Pacientes sintéticos para bench-busqueda-pacientes (se marcan en 'comoentero' para poder borrarlos)
+MARCA_BENCH_BUSQUEDA = '__bench_busqueda__'
+_NOMBRES_BENCH = ['José', 'María', 'Juan', 'Ana', 'Luis', 'Lucía', 'Jesús', 'Sofía', 'Martín', 'Mónica',
+                  'Andrés', 'Verónica', 'Raúl', 'Inés', 'Ángel', 'Rocío', 'Héctor', 'Noemí', 'Iván', 'Belén']
+_APELLIDOS_BENCH = ['García', 'Hernández', 'López', 'Martínez', 'González', 'Pérez', 'Rodríguez', 'Sánchez',
+                    'Ramírez', 'Cruz', 'Flores', 'Gómez', 'Díaz', 'Núñez', 'Peña', 'Ibáñez', 'Muñoz', 'Álvarez',
+                    'Jiménez', 'Ortíz', 'Castañeda', 'Domínguez', 'Vázquez', 'Zúñiga', 'Téllez']
+
+
+def _sembrar_pacientes_bench(connection, cantidad, lote=2000):
+    """Inserta 'cantidad' pacientes sintéticos (nombres con acentos y sufijo numérico para variar prefijos)."""
+    import random
+    rnd = random.Random(42)
+    cursor = connection.cursor()
+    try:
+        for inicio in range(0, cantidad, lote):
+            filas = []
+            for i in range(inicio, min(inicio + lote, cantidad)):
+                nombre = f"{rnd.choice(_NOMBRES_BENCH)} {rnd.choice(_NOMBRES_BENCH)}" if i % 3 == 0 else rnd.choice(_NOMBRES_BENCH)
+                filas.append((MARCA_BENCH_BUSQUEDA, nombre, f"{rnd.choice(_APELLIDOS_BENCH)}{i % 97 or ''}",
+                              rnd.choice(_APELLIDOS_BENCH)))
+            cursor.executemany(
+                "INSERT INTO datos_personales (comoentero, nombre, apellidop, apellidom) VALUES (%s, %s, %s, %s)", filas
+            )
+            connection.commit()
+    finally:
+        cursor.close()
+
+
+def _secuencias_tecleo(nombres):
+    """
+    Lo que el buscador pide mientras alguien escribe cada nombre (una búsqueda por tecla desde
+    el 2º carácter), incluyendo un error corregido con retroceso: "garz" -> "gar" -> "garc"...
+    """
+    secuencias = []
+    for nombre in nombres:
+        pasos = [nombre[:i] for i in range(2, len(nombre) + 1)]
+        if len(nombre) > 4:
+            corte = len(nombre) // 2
+            pasos[corte - 1:corte - 1] = [nombre[:corte] + 'z', nombre[:corte]]
+        secuencias.append(pasos)
+    return secuencias
+
+
+def register_commands(app):
+
+    @app.cli.command('bench-fechas-clinicas')
+    @click.option('--px', 'patient_ids', multiple=True, type=int, help='ID de paciente a medir (se puede repetir).')
+    @click.option('--top', default=5, show_default=True, help='Si no se indica --px, medir los N pacientes con más fechas clínicas.')
+    @click.option('--repeticiones', default=20, show_default=True)
+    def bench_fechas_clinicas(patient_ids, top, repeticiones):
+        """Mide round trips y latencia de get_clinical_dates_with_types en pacientes con historial largo."""
+        connection = connect_to_db()
+        if not connection:
+            click.echo("Error conectando a la base de datos.")
+            return
+        try:
+            if not patient_ids:
+                cursor = connection.cursor()
+                cursor.execute("""
+                    SELECT id_px, COUNT(DISTINCT fecha) AS n FROM (
+                        SELECT id_px, fecha FROM antecedentes
+                        UNION ALL SELECT id_px, fecha FROM anamnesis
+                        UNION ALL SELECT id_px, fecha FROM postura
+                        UNION ALL SELECT id_px, fecha FROM revaloraciones
+                    ) AS r
+                    GROUP BY id_px ORDER BY n DESC LIMIT %s
+                """, (top,))
+                patient_ids = [row[0] for row in cursor.fetchall()]
+                cursor.close()
+
+            click.echo(f"{'id_px':>8} {'fechas':>7} {'round trips':>12} {'prom ms':>9} {'max ms':>9}")
+            for patient_id in patient_ids:
+                fechas, round_trips, prom_ms, max_ms = _medir(
+                    connection, lambda: get_clinical_dates_with_types(connection, patient_id), repeticiones)
+                click.echo(f"{patient_id:>8} {len(fechas):>7} {round_trips:>12.1f} {prom_ms:>9.2f} {max_ms:>9.2f}")
+            click.echo("Referencia: la versión anterior hacía 4 + 4 x fechas round trips por llamada.")
+        finally:
+            connection.close()
+
+    @app.cli.command('contadores-planes')
+    @click.option('--reparar', is_flag=True, help='Corrige los contadores que no coincidan (backfill tras la migración 001).')
+    def contadores_planes(reparar):
+        """Verifica (o reconstruye con --reparar) visitas_qp_realizadas / visitas_tf_realizadas de plancuidado."""
+        connection = connect_to_db()
+        if not connection:
+            click.echo("Error conectando a la base de datos.")
+            return
+        try:
+            diferencias = recalcular_contadores_planes(connection, aplicar=reparar)
+            if diferencias is None:
+                click.echo("Error recalculando los contadores.")
+                return
+            if reparar:
+                connection.commit()
+            for d in diferencias:
+                click.echo(f"Plan {d['id_plan']}: QP {d['qp_guardado']} -> {d['qp_calculado']}, "
+                           f"TF {d['tf_guardado']} -> {d['tf_calculado']}")
+            accion = "corregidos" if reparar else "con diferencias"
+            click.echo(f"{len(diferencias)} planes {accion}.")
+        finally:
+            connection.close()
+
+    @app.cli.command('bench-arranque')
+    @click.option('--modulo', default='main', show_default=True, help='Módulo a importar en frío.')
+    @click.option('--repeticiones', default=3, show_default=True)
+    @click.option('--max-ms', type=float, default=None, help='Falla (código 1) si el promedio supera este tiempo.')
+    def bench_arranque(modulo, repeticiones, max_ms):
+        """Tiempo de arranque en frío y memoria (RSS) al importar la app, y qué módulos pesados se cargaron."""
+        mediciones = []
+        for i in range(repeticiones):
+            medicion = _medir_arranque(modulo)
+            mediciones.append(medicion)
+            click.echo(f"#{i + 1}: {medicion['ms']:.0f} ms, RSS máx {medicion['rss_mb']:.1f} MB")
+
+        prom_ms = sum(m['ms'] for m in mediciones) / len(mediciones)
+        max_rss = max(m['rss_mb'] for m in mediciones)
+        click.echo(f"Promedio: {prom_ms:.0f} ms | RSS máx: {max_rss:.1f} MB")
+        pesados = mediciones[-1]['pesados']
+        if pesados:
+            click.echo(f"ATENCIÓN: módulos pesados cargados al arrancar: {', '.join(pesados)}")
+        else:
+            click.echo("Ningún módulo pesado se cargó al arrancar.")
+        if max_ms is not None and prom_ms > max_ms:
+            click.echo(f"El arranque ({prom_ms:.0f} ms) supera el límite de {max_ms:.0f} ms.")
+            sys.exit(1)
+
+    @app.cli.command('probar-ia-hedging')
+    @click.option('--hedge-ms', default=300, show_default=True, help='Umbral para lanzar el siguiente candidato.')
+    @click.option('--timeout', 'timeout_s', default=3.0, show_default=True)
+    def probar_ia_hedging(hedge_ms, timeout_s):
+        """Compara generación secuencial vs. con hedging usando proveedores falsos locales (sin red)."""
+        escenarios = {
+            'primero lento': [candidato_fake('lento', 2.0, 'A'), candidato_fake('rapido', 0.1, 'B')],
+            'primero falla': [candidato_fake('falla', 0.05, falla=True), candidato_fake('ok', 0.2, 'B')],
+            'primero cuelga': [candidato_fake('colgado', 60.0, 'A'), candidato_fake('ok', 0.2, 'B')],
+            'todos fallan': [candidato_fake('f1', 0.1, falla=True), candidato_fake('f2', 0.1, falla=True)],
+        }
+        click.echo(f"{'escenario':<16} {'modo':<12} {'ganador':<14} {'ms':>7}")
+        for nombre, candidatos in escenarios.items():
+            for modo, enabled in (('secuencial', False), ('hedging', True)):
+                config = {'enabled': enabled, 'hedge_after_ms': hedge_ms, 'timeout_s': timeout_s}
+                inicio = time.perf_counter()
+                _, ganador = generar_texto_con_cobertura(candidatos, 'sistema', 'usuario', config)
+                ms = (time.perf_counter() - inicio) * 1000.0
+                click.echo(f"{nombre:<16} {modo:<12} {str(ganador):<14} {ms:>7.0f}")
+        click.echo(json.dumps(estadisticas_ia.snapshot(), indent=2))
+
+    @app.cli.command('limpiar-cache-ia')
+    def limpiar_cache_ia():
+        """Elimina las respuestas de IA expiradas y recorta la caché al tamaño máximo."""
+        cache_ia.recortar()
+        click.echo(json.dumps(cache_ia.metricas(), indent=2))
+
+    @app.cli.command('exportar-recibos')
+    @click.option('--inicio', required=True, type=click.DateTime(formats=['%Y-%m-%d']), help='Fecha inicial (AAAA-MM-DD).')
+    @click.option('--fin', required=True, type=click.DateTime(formats=['%Y-%m-%d']), help='Fecha final (AAAA-MM-DD).')
+    @click.option('--doctor', 'id_dr', type=int, default=None, help='Solo recibos de este doctor.')
+    @click.option('--centro', 'id_centro', type=int, default=None, help='Solo recibos de esta clínica.')
+    @click.option('--formato', type=click.Choice(['zip', 'pdf']), default='zip', show_default=True)
+    @click.option('--salida', type=click.Path(dir_okay=False, writable=True), default=None,
+                  help='Archivo de salida (por defecto recibos_<inicio>_<fin>.<formato>).')
+    @click.option('--workers', type=int, default=os.cpu_count() or 1, show_default=True,
+                  help='Procesos para generar los PDF en paralelo (1 = en este proceso).')
+    def exportar_recibos(inicio, fin, id_dr, id_centro, formato, salida, workers):
+        """Exporta los recibos de un periodo (ZIP con un PDF por recibo + resumen.csv, o un solo PDF)."""
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        connection = connect_to_db()
+        if not connection:
+            click.echo("No se pudo conectar a la base de datos.")
+            sys.exit(1)
+        salida = salida or f"recibos_{inicio.strftime('%Y%m%d')}_{fin.strftime('%Y%m%d')}.{formato}"
+        executor = None
+        try:
+            ids_recibos = get_ids_recibos_periodo(connection, inicio.date(), fin.date(), id_dr, id_centro)
+            if not ids_recibos:
+                click.echo("No hay recibos en el periodo.")
+                return
+            click.echo(f"Exportando {len(ids_recibos)} recibos a {salida} con {workers} procesos...")
+            if workers > 1:
+                executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            inicio_t = time.perf_counter()
+            if formato == 'pdf':
+                contenido = exportar_pdf_unico(connection, ids_recibos, executor)
+                with open(salida, 'wb') as f:
+                    f.write(contenido)
+            else:
+                with open(salida, 'wb') as f:
+                    for parte in exportar_zip(connection, ids_recibos, executor):
+                        f.write(parte)
+            segundos = time.perf_counter() - inicio_t
+            click.echo(f"Listo: {len(ids_recibos)} recibos en {segundos:.1f} s "
+                       f"({len(ids_recibos) / segundos:.1f} recibos/s), {os.path.getsize(salida) / 1024:.0f} KB.")
+        except (ValueError, ExportacionIncompletaError) as e:
+            click.echo(f"Error: {e}")
+            if formato != 'pdf' and os.path.exists(salida):
+                click.echo(f"{salida} quedó incompleto (ver {ARCHIVO_ERROR_ZIP} dentro del ZIP).")
+            sys.exit(1)
+        finally:
+            if executor:
+                executor.shutdown()
+            connection.close()
+
+    @app.cli.command('reindexar-pacientes')
+    def reindexar_pacientes():
+        """Reconstruye el índice de búsqueda de pacientes (tabla paciente_tokens)."""
+        connection = connect_to_db()
+        if not connection:
+            click.echo("Error conectando a la base de datos.")
+            sys.exit(1)
+        try:
+            inicio = time.perf_counter()
+            indexados = reindexar_busqueda_pacientes(connection)
+            if indexados is None:
+                click.echo("No se pudo reindexar (¿se aplicaron migrations/003_indice_busqueda_pacientes.sql y 006_indice_busqueda_estado.sql?).")
+                sys.exit(1)
+            click.echo(f"{indexados} pacientes indexados en {time.perf_counter() - inicio:.1f} s.")
+        finally:
+            connection.close()
+
+    @app.cli.command('bench-busqueda-pacientes')
+    @click.option('--sembrar', default=0, show_default=True, help='Insertar N pacientes sintéticos antes de medir (p. ej. 100000).')
+    @click.option('--limpiar', is_flag=True, help='Borrar los pacientes sintéticos al terminar.')
+    @click.option('--repeticiones', default=20, show_default=True)
+    @click.option('--termino', 'terminos', multiple=True, help='Búsqueda a medir (se puede repetir).')
+    def bench_busqueda_pacientes(sembrar, limpiar, repeticiones, terminos):
+        """Compara la búsqueda con índice de prefijos vs. el LIKE '%term%' original (latencia y resultados)."""
+        connection = connect_to_db()
+        if not connection:
+            click.echo("Error conectando a la base de datos.")
+            sys.exit(1)
+        try:
+            if sembrar:
+                click.echo(f"Insertando {sembrar} pacientes sintéticos...")
+                _sembrar_pacientes_bench(connection, sembrar)
+                click.echo(f"Reindexando: {reindexar_busqueda_pacientes(connection)} pacientes.")
+
+            cursor = connection.cursor()
+            cursor.execute("SELECT COUNT(*) FROM datos_personales")
+            total = cursor.fetchone()[0]
+            cursor.close()
+            click.echo(f"Pacientes en la tabla: {total}")
+
+            terminos = terminos or ('m', 'mar', 'gonzalez', 'jose gar', 'Peña', 'nunez ma', 'zzz')
+            click.echo(f"{'búsqueda':<14} {'modo':<7} {'filas':>6} {'prom ms':>9} {'p95 ms':>9}")
+            for termino in terminos:
+                for modo, usar_indice in (('indice', True), ('like', False)):
+                    tiempos = []
+                    resultado = []
+                    for _ in range(repeticiones):
+                        inicio = time.perf_counter()
+                        resultado = search_patients_by_name(connection, termino, usar_indice=usar_indice)
+                        tiempos.append((time.perf_counter() - inicio) * 1000.0)
+                    tiempos.sort()
+                    p95 = tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))]
+                    click.echo(f"{termino:<14} {modo:<7} {len(resultado):>6} {sum(tiempos) / len(tiempos):>9.2f} {p95:>9.2f}")
+        finally:
+            if limpiar:
+                cursor = connection.cursor()
+                cursor.execute("DELETE FROM datos_personales WHERE comoentero = %s", (MARCA_BENCH_BUSQUEDA,))
+                connection.commit()
+                click.echo(f"{cursor.rowcount} pacientes sintéticos eliminados.")
+                cursor.close()
+            connection.close()
+
+    @app.cli.command('bench-busqueda-api')
+    @click.option('--usuarios', default=5, show_default=True, help='Veces que se repiten las secuencias (recepcionistas buscando).')
+    @click.option('--nombre', 'nombres', multiple=True, help='Nombre a teclear (se puede repetir).')
+    def bench_busqueda_api(usuarios, nombres):
+        """Simula el tecleo en el buscador: consultas a la BD y latencia por tecla, sin caché vs. con caché."""
+        nombres = nombres or ('garcia lopez', 'maria gonzalez', 'jose perez', 'hernandez', 'ana martinez')
+        secuencias = _secuencias_tecleo(nombres)
+        limite = BUSQUEDA_CACHE_CONFIG['limite']
+        click.echo(f"{sum(len(p) for p in secuencias) * usuarios} búsquedas ({len(nombres)} nombres x {usuarios} usuarios)")
+        click.echo(f"{'modo':<10} {'consultas BD':>13} {'prom ms':>9} {'p95 ms':>9} {'total ms':>10}")
+
+        for modo, cache in (('sin cache', CacheBusquedaPacientes(ttl_s=0)),
+                            ('con cache', CacheBusquedaPacientes(ttl_s=BUSQUEDA_CACHE_CONFIG['ttl_s'] or 30,
+                                                                 max_entradas=BUSQUEDA_CACHE_CONFIG['max_entradas']))):
+            consultas = 0
+            tiempos = []
+            for _ in range(usuarios):
+                for pasos in secuencias:
+                    for termino in pasos:
+                        def consultar(limite_consulta, desplazamiento, termino=termino):
+                            # Como el endpoint: la conexión se pide al pool solo si hay que ir a la BD
+                            nonlocal consultas
+                            consultas += 1
+                            connection = connect_to_db()
+                            if not connection:
+                                return None
+                            try:
+                                return search_patients_by_name(connection, termino, limit=limite_consulta, offset=desplazamiento)
+                            finally:
+                                connection.close()
+
+                        inicio = time.perf_counter()
+                        if buscar_pacientes_cacheado(termino, None, limite, 0, consultar, cache=cache) is None:
+                            click.echo("Error conectando a la base de datos.")
+                            sys.exit(1)
+                        tiempos.append((time.perf_counter() - inicio) * 1000.0)
+            tiempos.sort()
+            p95 = tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))]
+            click.echo(f"{modo:<10} {consultas:>13} {sum(tiempos) / len(tiempos):>9.2f} {p95:>9.2f} {sum(tiempos):>10.1f}")
+
+    @app.cli.command('resumen-ingresos')
+    @click.option('--recalcular', is_flag=True, help='Reconstruye el resumen diario desde los recibos.')
+    @click.option('--verificar', is_flag=True, help='Compara el resumen guardado con los recibos.')
+    @click.option('--inicio', default=None, help='YYYY-MM-DD (por defecto, el primer recibo).')
+    @click.option('--fin', default=None, help='YYYY-MM-DD (por defecto, el último recibo).')
+    def resumen_ingresos(recalcular, verificar, inicio, fin):
+        """Mantenimiento de resumen_ingresos_diario (tabla de los reportes de ingresos y utilidad)."""
+        if not recalcular and not verificar:
+            click.echo("Indique --recalcular y/o --verificar.")
+            return
+        connection = connect_to_db()
+        if not connection:
+            click.echo("Error conectando a la base de datos.")
+            sys.exit(1)
+        try:
+            if not inicio or not fin:
+                cursor = connection.cursor()
+                cursor.execute("SELECT MIN(fecha), MAX(fecha) FROM recibos")
+                primera, ultima = cursor.fetchone()
+                cursor.close()
+                if primera is None:
+                    click.echo("No hay recibos.")
+                    return
+                inicio = inicio or primera.strftime('%Y-%m-%d')
+                fin = fin or ultima.strftime('%Y-%m-%d')
+
+            if recalcular:
+                # Un año por transacción para no bloquear la tabla con todo el historial
+                anio_inicio, anio_fin = int(inicio[:4]), int(fin[:4])
+                for anio in range(anio_inicio, anio_fin + 1):
+                    desde = inicio if anio == anio_inicio else f"{anio}-01-01"
+                    hasta = fin if anio == anio_fin else f"{anio}-12-31"
+                    filas = recalcular_resumen_ingresos(connection, desde, hasta)
+                    if filas is None:
+                        connection.rollback()
+                        click.echo(f"Error recalculando {desde} - {hasta}.")
+                        sys.exit(1)
+                    connection.commit()
+                    click.echo(f"{desde} - {hasta}: {filas} filas de resumen.")
+
+            if verificar:
+                diferencias = verificar_resumen_ingresos(connection, inicio, fin)
+                if diferencias is None:
+                    click.echo("Error verificando el resumen.")
+                    sys.exit(1)
+                for d in diferencias[:50]:
+                    click.echo(f"{d['fecha']} dr {d['id_dr']} centro {d['id_centro']}: "
+                               f"guardado {d['guardado']} | calculado {d['calculado']}")
+                click.echo(f"{len(diferencias)} filas con diferencias entre {inicio} y {fin}.")
+                if diferencias:
+                    sys.exit(1)
+        finally:
+            connection.close()
+
+    @app.cli.command('bench-reportes-ingresos')
+    @click.option('--repeticiones', default=5, show_default=True)
+    @click.option('--fin', default=None, help='Fecha final YYYY-MM-DD (por defecto, hoy).')
+    def bench_reportes_ingresos(repeticiones, fin):
+        """Compara los reportes de ingresos/utilidad leyendo el resumen diario vs. agregando los recibos."""
+        from datetime import date, datetime, timedelta
+        connection = connect_to_db()
+        if not connection:
+            click.echo("Error conectando a la base de datos.")
+            sys.exit(1)
+        fin_dt = datetime.strptime(fin, '%Y-%m-%d').date() if fin else date.today()
+        rangos = [('30 días', 30), ('1 año', 365), ('5 años', 365 * 5)]
+        reportes = [
+            ('ingresos/periodo', get_ingresos_por_periodo),
+            ('ingresos/doctor', get_ingresos_por_doctor_periodo),
+            ('utilidad/periodo', get_utilidad_estimada_por_periodo),
+            ('utilidad/doctor', get_utilidad_estimada_por_doctor_periodo),
+        ]
+        try:
+            click.echo(f"{'reporte':<18} {'rango':<8} {'recibos ms':>11} {'resumen ms':>11} {'filas':>6} {'iguales':>8}")
+            for etiqueta_rango, dias in rangos:
+                inicio_str = (fin_dt - timedelta(days=dias)).strftime('%Y-%m-%d')
+                fin_str = fin_dt.strftime('%Y-%m-%d')
+                for etiqueta, funcion in reportes:
+                    crudo, _, ms_crudo, _ = _medir(
+                        connection, lambda: funcion(connection, inicio_str, fin_str, usar_resumen=False), repeticiones)
+                    resumen, _, ms_resumen, _ = _medir(
+                        connection, lambda: funcion(connection, inicio_str, fin_str, usar_resumen=True), repeticiones)
+                    iguales = json.dumps(crudo, sort_keys=True, default=str) == json.dumps(resumen, sort_keys=True, default=str)
+                    click.echo(f"{etiqueta:<18} {etiqueta_rango:<8} {ms_crudo:>11.1f} {ms_resumen:>11.1f} "
+                               f"{len(resumen):>6} {'sí' if iguales else 'NO':>8}")
+        finally:
+            connection.close()
+
+    @app.cli.command('bench-reportes-combinados')
+    @click.option('--inicio', required=True, help='YYYY-MM-DD')
+    @click.option('--fin', required=True, help='YYYY-MM-DD')
+    @click.option('--repeticiones', default=5, show_default=True)
+    def bench_reportes_combinados(inicio, fin, repeticiones):
+        """Compara el reporte combinado del dashboard con las consultas individuales de cada gráfica."""
+        connection = connect_to_db()
+        if not connection:
+            click.echo("Error conectando a la base de datos.")
+            sys.exit(1)
+
+        def individuales():
+            return (get_ingresos_por_periodo(connection, inicio, fin),
+                    get_ingresos_por_doctor_periodo(connection, inicio, fin),
+                    get_utilidad_estimada_por_periodo(connection, inicio, fin),
+                    get_utilidad_estimada_por_doctor_periodo(connection, inicio, fin),
+                    get_pacientes_nuevos_por_periodo(connection, inicio, fin),
+                    get_seguimientos_por_doctor_periodo(connection, inicio, fin),
+                    get_uso_planes_de_cuidado(connection, inicio, fin))
+
+        try:
+            _, rt_ind, ms_ind, max_ind = _medir(connection, individuales, repeticiones)
+            _, rt_comb, ms_comb, max_comb = _medir(
+                connection, lambda: get_reportes_combinados_periodo(connection, inicio, fin), repeticiones)
+            click.echo(f"{'modo':<14} {'round trips':>12} {'prom ms':>9} {'max ms':>9}")
+            click.echo(f"{'individuales':<14} {rt_ind:>12.1f} {ms_ind:>9.1f} {max_ind:>9.1f}")
+            click.echo(f"{'combinado':<14} {rt_comb:>12.1f} {ms_comb:>9.1f} {max_comb:>9.1f}")
+        finally:
+            connection.close()
+
+    @app.cli.command('bench-catalogos')
+    @click.option('--repeticiones', default=20, show_default=True)
+    def bench_catalogos(repeticiones):
+        """Compara las consultas de catálogos de un formulario (recibo/seguimiento) con y sin la caché."""
+        connection = connect_to_db()
+        if not connection:
+            click.echo("Error conectando a la base de datos.")
+            sys.exit(1)
+
+        def formulario():
+            productos = get_productos_servicios_venta(connection)
+            get_costos_internos_productos(connection, [p['id_prod'] for p in productos[:10]])  # Como save_recibo
+            return (productos, get_terapias_fisicas(connection),
+                    get_all_doctors(connection, include_inactive=False), get_all_centros(connection))
+
+        habilitada = CATALOGOS_CONFIG['enabled']
+        try:
+            CATALOGOS_CONFIG['enabled'] = False
+            _, rt_bd, ms_bd, max_bd = _medir(connection, formulario, repeticiones)
+            CATALOGOS_CONFIG['enabled'] = True
+            formulario()  # Carga inicial de la caché
+            _, rt_cache, ms_cache, max_cache = _medir(connection, formulario, repeticiones)
+            click.echo(f"{'modo':<8} {'round trips':>12} {'prom ms':>9} {'max ms':>9}")
+            click.echo(f"{'bd':<8} {rt_bd:>12.1f} {ms_bd:>9.1f} {max_bd:>9.1f}")
+            click.echo(f"{'cache':<8} {rt_cache:>12.1f} {ms_cache:>9.1f} {max_cache:>9.1f}")
+            click.echo("(fuera de un request la versión se consulta en cada llamada; en un request, una vez)")
+            click.echo(json.dumps(cache_catalogos.stats(), indent=2))
+        finally:
+            CATALOGOS_CONFIG['enabled'] = habilitada
+            connection.close()
+
+    @app.cli.command('bench-guardar-recibo')
+    @click.option('--lineas', default='1,10,50,200', show_default=True, help='Tamaños de recibo, separados por coma')
+    @click.option('--repeticiones', default=5, show_default=True)
+    def bench_guardar_recibo(lineas, repeticiones):
+        """
+        Mide save_recibo con recibos de varias líneas (con y sin la caché de catálogos).
+        Cada recibo se guarda dentro de una transacción que se revierte (solo consume ids de AUTO_INCREMENT).
+        """
+        connection = connect_to_db()
+        if not connection:
+            click.echo("Error conectando a la base de datos.")
+            sys.exit(1)
+        cursor = connection.cursor()
+        cursor.execute("SELECT id_px FROM datos_personales ORDER BY id_px LIMIT 1")
+        paciente = cursor.fetchone()
+        cursor.execute("SELECT id_dr FROM dr ORDER BY id_dr LIMIT 1")
+        doctor = cursor.fetchone()
+        cursor.close()
+        productos = get_productos_servicios_venta(connection)
+        if not paciente or not doctor or not productos:
+            click.echo("Se necesita al menos un paciente, un doctor y un producto activo.")
+            connection.close()
+            sys.exit(1)
+
+        def guardar(detalles):
+            connection.start_transaction()
+            try:
+                return save_recibo(connection, {'id_px': paciente[0], 'id_dr': doctor[0],
+                                                'fecha': time.strftime('%Y-%m-%d'), 'total_neto': 0.0}, detalles)
+            finally:
+                connection.rollback()
+
+        habilitada = CATALOGOS_CONFIG['enabled']
+        try:
+            click.echo(f"{'lineas':>7} {'modo':<8} {'round trips':>12} {'prom ms':>9} {'max ms':>9}")
+            for n in [int(x) for x in lineas.split(',') if x.strip()]:
+                detalles = [{'id_prod': productos[i % len(productos)]['id_prod'], 'cantidad': 1,
+                             'descripcion_prod': productos[i % len(productos)]['nombre'],
+                             'costo_unitario_venta': productos[i % len(productos)]['venta'] or 0.0,
+                             'subtotal_linea_neto': productos[i % len(productos)]['venta'] or 0.0}
+                            for i in range(n)]
+                for modo, cache in (('bd', False), ('cache', True)):
+                    CATALOGOS_CONFIG['enabled'] = cache
+                    get_productos_servicios_venta(connection)  # Carga inicial de la caché
+                    _, rt, ms, ms_max = _medir(connection, lambda: guardar(detalles), repeticiones)
+                    click.echo(f"{n:>7} {modo:<8} {rt:>12.1f} {ms:>9.1f} {ms_max:>9.1f}")
+            click.echo("(los round trips incluyen START TRANSACTION y ROLLBACK)")
+        finally:
+            CATALOGOS_CONFIG['enabled'] = habilitada
+            connection.close()
+
+    @app.cli.command('bench-logging')
+    @click.option('--mensajes', default=20000, show_default=True, help='Llamadas por modo')
+    @click.option('--por-request', default=15, show_default=True, help='Mensajes de depuración de una ruta clínica')
+    def bench_logging(mensajes, por_request):
+        """
+        Compara el costo por llamada de print (stdout sin buffer hacia un pipe), logger.debug con
+        nivel INFO (se descarta antes de formatear) y logger.info encolado (lo escribe otro hilo).
+        """
+        lector, escritor = os.pipe()
+        salida = os.fdopen(escritor, 'w', buffering=1)
+
+        def vaciar():
+            while os.read(lector, 65536):
+                pass
+        hilo = threading.Thread(target=vaciar, daemon=True)
+        hilo.start()
+
+        datos = {'id_px': 123, 'fecha': '2024-01-01', 'notas': 'x' * 80}
+        cola = queue.Queue(maxsize=100000)
+        manejador = logging.StreamHandler(salida)
+        manejador.setFormatter(FormatoJSON())
+        listener = QueueListener(cola, manejador)
+        encolador = ColaNoBloqueante(cola)
+        encolador.addFilter(FiltroLimite(limite=0))
+        logger = logging.getLogger('bench.logging')
+        logger.propagate = False
+        logger.addHandler(encolador)
+        logger.setLevel(logging.INFO)
+
+        def medir(funcion):
+            inicio = time.perf_counter()
+            for i in range(mensajes):
+                funcion(i)
+            return (time.perf_counter() - inicio) * 1e6 / mensajes
+
+        listener.start()
+        try:
+            modos = [
+                ('print', medir(lambda i: print(f"DEBUG: Guardando datos {i}: {datos}", file=salida, flush=True))),
+                ('debug (filtrado)', medir(lambda i: logger.debug('Guardando datos %s: %s', i, datos))),
+                ('info (cola)', medir(lambda i: logger.info('Guardando datos %s: %s', i, datos))),
+            ]
+        finally:
+            listener.stop()
+            logger.removeHandler(encolador)
+            salida.close()
+        click.echo(f"{'modo':<18} {'us/llamada':>11} {'ms/request':>11}")
+        for modo, us in modos:
+            click.echo(f"{modo:<18} {us:>11.2f} {us * por_request / 1000:>11.3f}")
+        click.echo(f"(ms/request = {por_request} mensajes por request; no incluye el bloqueo por un pipe lleno)")
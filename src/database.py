@@ -1,13 +1,22 @@
 # src/database.py
+import logging
 import mysql.connector
 from mysql.connector import Error, IntegrityError
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, date
 from utils.date_manager import to_db_str, to_frontend_str, calculate_age, parse_date
+from utils.busqueda_pacientes import tokens_nombre_paciente, terminos_busqueda
+from utils.catalogos import CATALOGOS_CONFIG, cache_catalogos
 import os
 from dotenv import load_dotenv
 from datetime import timedelta
 from dateutil.relativedelta import relativedelta
+import threading
+from flask import g, has_app_context, has_request_context
+from utils.db_pool import ConnectionPool, PooledConnection
+from utils.sql_metricas import SQL_METRICAS_CONFIG, instrumentar_cursor
+
+logger = logging.getLogger(__name__)
 
 load_dotenv() # Carga variables del archivo .env en el entorno
 # Configuración de la base de datos leída desde variables de entorno
@@ -22,23 +31,259 @@ if not DB_CONFIG['user'] or not DB_CONFIG['database']: # Ya no verificamos DB_PA
     raise ValueError("Faltan variables de configuración de la base de datos (DB_USER, DB_NAME) en el archivo .env. DB_PASSWORD puede estar vacía si así está configurado.")
 
 
+# Configuración del pool de conexiones (también desde .env)
+DB_POOL_CONFIG = {
+    'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),             # Conexiones que se mantienen abiertas
+    'max_overflow': int(os.environ.get('DB_POOL_MAX_OVERFLOW', 5)),  # Conexiones extra permitidas en picos
+    'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),         # Segundos de espera máxima por una conexión
+    'ping_interval': float(os.environ.get('DB_POOL_PING_INTERVAL', 30)),  # Verificar conexiones inactivas más de N segundos
+    'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 10))
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Devuelve el pool de conexiones del proceso, creándolo en el primer uso."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_CONFIG, **DB_POOL_CONFIG)
+    return _pool
+
+
 def connect_to_db():
+    """
+    Obtiene una conexión del pool.
+    Dentro de un request de Flask, todas las llamadas comparten la misma conexión
+    (guardada en 'g') y connection.close() no la cierra: se devuelve al pool en el
+    teardown (ver release_request_connection). Fuera de un request, close() la devuelve al pool.
+    Devuelve None si no se pudo obtener una conexión.
+    """
+    en_contexto = has_app_context()
+    if en_contexto:
+        existente = g.get('_db_connection')
+        if existente is not None:
+            return existente
     try:
-        connection = mysql.connector.connect(
-            host=DB_CONFIG['host'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            database=DB_CONFIG['database'],
-            port=DB_CONFIG['port'], # Añadir puerto
-            autocommit=True # Mantener autocommit si así lo tenías
-        )
-        if connection.is_connected():
-            print("Connected to MySQL database successfully!")
-            return connection
+        raw_connection, wait_ms = get_pool().acquire()
+    except Error as e:
+        logger.error('Error while connecting to MySQL: %s', e)
+        return None
+
+    connection = PooledConnection(get_pool(), raw_connection, request_scoped=en_contexto,
+                                  envolver_cursor=instrumentar_cursor if SQL_METRICAS_CONFIG['enabled'] else None)
+    if en_contexto:
+        g._db_connection = connection
+        g.db_pool_wait_ms = wait_ms
+    return connection
+
+
+def release_request_connection(exc=None):
+    """Devuelve al pool la conexión del request actual (registrado como teardown en main.py)."""
+    connection = g.pop('_db_connection', None)
+    if connection is not None:
+        connection.release()
+
+
+# --- Catálogos en caché (productos_servicios, dr, centro) ---
+# Ver utils/catalogos.py. Las funciones get_* de catálogos leen un Catalogo en memoria que se
+# recarga cuando cambia su versión en 'catalogo_version'; las funciones que modifican esas tablas
+# llaman a _incrementar_version_catalogo en la misma transacción.
+_aviso_catalogos_sin_version = False
+
+def _entero_o_none(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+def _versiones_catalogos(connection):
+    """
+    Versiones compartidas de los catálogos ({nombre: versión}). Dentro de un request se consultan
+    una sola vez (se guardan en 'g'). Devuelve {} si la tabla no existe (falta la migración 005).
+    """
+    global _aviso_catalogos_sin_version
+    if has_request_context():
+        versiones = g.get('_versiones_catalogos')
+        if versiones is not None:
+            return versiones
+    cursor = None
+    versiones = {}
+    try:
+        cursor = connection.cursor(buffered=True)
+        cursor.execute("SELECT catalogo, version FROM catalogo_version")
+        versiones = {catalogo: version for catalogo, version in cursor.fetchall()}
+    except Error as e:
+        if not _aviso_catalogos_sin_version:
+            logger.warning('Catálogos sin caché (no se pudo leer catalogo_version): %s', e)
+            _aviso_catalogos_sin_version = True
+    finally:
+        if cursor:
+            cursor.close()
+    if has_request_context():
+        g._versiones_catalogos = versiones
+    return versiones
+
+def _incrementar_version_catalogo(cursor, catalogo):
+    """
+    Marca un catálogo como modificado para que todos los workers lo recarguen. NO HACE COMMIT:
+    la nueva versión se confirma (o se revierte) junto con el cambio en la tabla.
+    """
+    try:
+        cursor.execute("""
+            INSERT INTO catalogo_version (catalogo, version) VALUES (%s, 1)
+            ON DUPLICATE KEY UPDATE version = version + 1
+        """, (catalogo,))
+    except Error as e:
+        logger.warning("No se pudo incrementar la versión del catálogo '%s': %s", catalogo, e)
+    cache_catalogos.invalidar(catalogo)
+    if has_request_context():
+        # Hasta el commit, lo que lea este request no se guarda en la caché (podría revertirse)
+        g.pop('_versiones_catalogos', None)
+        g.setdefault('_catalogos_modificados', set()).add(catalogo)
+
+def _cargar_productos(connection):
+    cursor = connection.cursor(dictionary=True, buffered=True)
+    try:
+        cursor.execute("""
+            SELECT id_prod, nombre, costo, venta, adicional, esta_activo
+            FROM productos_servicios ORDER BY nombre ASC
+        """)
+        productos = cursor.fetchall()
+    finally:
+        cursor.close()
+    for prod in productos:
+        for key in ['costo', 'venta']:
+            if prod[key] is not None:
+                try: prod[key] = float(prod[key])
+                except (ValueError, TypeError): prod[key] = 0.0
+        prod['esta_activo'] = bool(prod.get('esta_activo', 0))
+    return productos
+
+def _cargar_doctores(connection):
+    """Doctores sin la contraseña (get_doctor_by_id la sigue leyendo de la BD)."""
+    cursor = connection.cursor(dictionary=True, buffered=True)
+    try:
+        cursor.execute("SELECT id_dr, nombre, usuario, centro, esta_activo FROM dr ORDER BY nombre ASC")
+        doctores = cursor.fetchall()
+    finally:
+        cursor.close()
+    for dr in doctores:
+        dr['esta_activo'] = bool(dr.get('esta_activo', 0))
+        dr['is_admin_role'] = (dr.get('centro') == 0)
+    return doctores
+
+def _cargar_centros(connection):
+    cursor = connection.cursor(dictionary=True, buffered=True)
+    try:
+        cursor.execute("SELECT id_centro, nombre, direccion, cel, tel FROM centro ORDER BY nombre ASC")
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+_CARGAR_CATALOGO = {'productos': _cargar_productos, 'doctores': _cargar_doctores, 'centros': _cargar_centros}
+
+def _catalogo(connection, nombre, solo_cache=False):
+    """
+    Catalogo 'nombre' vigente (utils/catalogos.py), o None si no se pudo cargar.
+    Con solo_cache=True devuelve None si el catálogo no se puede usar desde la caché (sin versión,
+    caché desactivada o modificado en este request), en vez de leer la tabla completa.
+    """
+    version = None
+    if CATALOGOS_CONFIG['enabled'] and not (has_request_context() and nombre in g.get('_catalogos_modificados', ())):
+        version = _versiones_catalogos(connection).get(nombre)
+    if solo_cache and version is None:
+        return None
+    try:
+        return cache_catalogos.obtener(nombre, version, lambda: _CARGAR_CATALOGO[nombre](connection))
     except Error as e:
-        print(f"Error while connecting to MySQL: {e}")
+        logger.error("Error cargando el catálogo '%s': %s", nombre, e)
         return None
-    return None # Asegurar que siempre devuelva algo
+
+
+# --- Mapa de identidad por request ---
+# Una página suele leer la misma fila varias veces (la ruta y después save_* para completar lo que no
+# viene del formulario, o get_active_plan_status y luego analizar_adicionales_plan). Dentro de un
+# request, las lecturas por llave de esas funciones se guardan en 'g' con clave (tabla, llave) y la
+# siguiente lectura devuelve una copia sin consultar la BD. Las funciones que modifican la tabla
+# llaman a _olvidar_identidad(tabla). Fuera de un request (comandos, hilos de fondo) no se guarda nada.
+MAPA_IDENTIDAD_CONFIG = {
+    'enabled': os.environ.get('MAPA_IDENTIDAD_ENABLED', '1') == '1',
+}
+_SIN_DATO = object()
+_stats_mapa_identidad = {'requests': 0, 'requests_con_aciertos': 0, 'consultas_ahorradas': 0,
+                         'max_por_request': 0, 'invalidaciones': 0}
+_stats_mapa_identidad_lock = threading.Lock()
+
+def _mapa_identidad():
+    """Mapa del request actual ({(tabla, llave): fila}), o None fuera de un request o si está desactivado."""
+    if not MAPA_IDENTIDAD_CONFIG['enabled'] or not has_request_context():
+        return None
+    mapa = g.get('_mapa_identidad')
+    if mapa is None:
+        mapa = g._mapa_identidad = {}
+        g._mapa_identidad_stats = {'aciertos': 0, 'invalidaciones': 0}
+    return mapa
+
+def _identidad_obtener(tabla, llave):
+    """Copia de la fila ya leída en este request (puede ser None: 'no existe'), o _SIN_DATO."""
+    mapa = _mapa_identidad()
+    if mapa is None or (tabla, llave) not in mapa:
+        return _SIN_DATO
+    g._mapa_identidad_stats['aciertos'] += 1
+    fila = mapa[(tabla, llave)]
+    return dict(fila) if fila is not None else None
+
+def _identidad_guardar(tabla, llave, fila):
+    """Registra la fila leída (o None) y la devuelve; el mapa guarda su propia copia."""
+    mapa = _mapa_identidad()
+    if mapa is not None:
+        mapa[(tabla, llave)] = dict(fila) if fila is not None else None
+    return fila
+
+def _olvidar_identidad(tabla):
+    """Descarta las filas de 'tabla' leídas en este request (llamar después de modificarla)."""
+    mapa = g.get('_mapa_identidad') if has_request_context() else None
+    if mapa:
+        for clave in [clave for clave in mapa if clave[0] == tabla]:
+            del mapa[clave]
+        g._mapa_identidad_stats['invalidaciones'] += 1
+
+def consultas_ahorradas_request():
+    """Lecturas que el mapa de identidad resolvió sin consultar la BD en el request actual."""
+    stats = g.get('_mapa_identidad_stats') if has_app_context() else None
+    return stats['aciertos'] if stats else 0
+
+def finalizar_mapa_identidad(exc=None):
+    """Acumula las estadísticas del request en las del proceso (registrado como teardown en main.py)."""
+    stats = g.pop('_mapa_identidad_stats', None)
+    g.pop('_mapa_identidad', None)
+    if stats is None:
+        return
+    with _stats_mapa_identidad_lock:
+        _stats_mapa_identidad['requests'] += 1
+        _stats_mapa_identidad['invalidaciones'] += stats['invalidaciones']
+        if stats['aciertos']:
+            _stats_mapa_identidad['requests_con_aciertos'] += 1
+            _stats_mapa_identidad['consultas_ahorradas'] += stats['aciertos']
+            _stats_mapa_identidad['max_por_request'] = max(_stats_mapa_identidad['max_por_request'], stats['aciertos'])
+
+def get_mapa_identidad_stats():
+    """Consultas ahorradas por el mapa de identidad en este proceso (requests que lo usaron)."""
+    with _stats_mapa_identidad_lock:
+        stats = dict(_stats_mapa_identidad)
+    stats['promedio_por_request'] = round(stats['consultas_ahorradas'] / stats['requests'], 2) if stats['requests'] else None
+    return stats
+
+
+def get_pool_stats():
+    """Estadísticas de uso del pool (checkouts, esperas, conexiones creadas, en uso...)."""
+    return get_pool().stats()
+
+
 def add_user(connection, nombre, usuario, password_plain, centro):
     """
     Añade un nuevo doctor/usuario a la tabla 'dr'.
@@ -56,7 +301,7 @@ def add_user(connection, nombre, usuario, password_plain, centro):
         cursor.execute(query_check, (usuario,))
         existing_user = cursor.fetchone()
         if existing_user:
-            print(f"Intento de registrar usuario '{usuario}' que ya existe.")
+            logger.debug("Intento de registrar usuario '%s' que ya existe.", usuario)
             return "exists" # Devolver string específico para este caso
 
         # 2. Hashear la contraseña
@@ -73,15 +318,16 @@ def add_user(connection, nombre, usuario, password_plain, centro):
         
         cursor.execute(query_insert, values_insert)
         new_user_id = cursor.lastrowid # Obtener el ID del registro insertado
+        _incrementar_version_catalogo(cursor, 'doctores')
 
         if new_user_id:
-            print(f"Usuario '{usuario}' añadido con ID: {new_user_id}")
+            logger.debug("Usuario '%s' añadido con ID: %s", usuario, new_user_id)
             return new_user_id # Éxito, devuelve el ID del nuevo usuario (valor "Truthy")
         else:
             # Esto podría pasar si el INSERT fue exitoso pero lastrowid no se obtuvo (raro con autocommit)
             # o si la tabla 'dr' no tiene un PK auto-incrementable llamado 'id_dr'
             # O si el commit no se hizo (con autocommit=True no debería ser problema inmediato para lastrowid)
-            print(f"Usuario '{usuario}' podría haber sido añadido, pero lastrowid es {new_user_id}. Asumiendo éxito si no hubo excepción.")
+            logger.debug("Usuario '%s' podría haber sido añadido, pero lastrowid es %s. Asumiendo éxito si no hubo excepción.", usuario, new_user_id)
             # Para estar seguros y evitar el 'else' en main.py, si no hay error, devolvemos True
             # si no tenemos un ID (aunque tener el ID es mejor).
             # Si la tabla tiene un PK auto_increment, lastrowid debería funcionar.
@@ -90,7 +336,7 @@ def add_user(connection, nombre, usuario, password_plain, centro):
             return True # Indica éxito general si no se obtuvo lastrowid pero no hubo error SQL
 
     except Error as e:
-        print(f"Error en add_user: {e}")
+        logger.error('Error en add_user: %s', e)
         # El rollback se maneja en la ruta Flask si no hay autocommit
         return False # Devolver False en caso de error de BD
     finally:
@@ -147,12 +393,14 @@ def add_patient(connection, id_dr, fecha, comoentero, nombre, apellidop, apellid
             emergencia, contacto, parentesco
         )
         cursor.execute(query, values)
-        connection.commit()
         new_patient_id = cursor.lastrowid
-        print(f"Paciente '{nombre} {apellidop}' añadido exitosamente (ID_PX: {new_patient_id}).")
+        _indexar_nombre_paciente(cursor, new_patient_id, nombre, apellidop, apellidom)
+        _olvidar_identidad('datos_personales')
+        connection.commit()
+        logger.debug("Paciente '%s %s' añadido exitosamente (ID_PX: %s).", nombre, apellidop, new_patient_id)
         return new_patient_id
     except Error as e:
-        print(f"Error añadiendo paciente: {e}")
+        logger.error('Error añadiendo paciente: %s', e)
         return None
     finally:
         if cursor:
@@ -160,6 +408,9 @@ def add_patient(connection, id_dr, fecha, comoentero, nombre, apellidop, apellid
 
 def get_patient_by_id(connection, patient_id):
     """Obtiene los datos personales de un paciente por su ID."""
+    en_mapa = _identidad_obtener('datos_personales', _entero_o_none(patient_id))
+    if en_mapa is not _SIN_DATO:
+        return en_mapa
     cursor = None
     try:
         query = """
@@ -177,16 +428,103 @@ def get_patient_by_id(connection, patient_id):
         if patient_data and patient_data.get('nacimiento'):
             patient_data['nacimiento'] = to_frontend_str(patient_data['nacimiento'])
             
-        return patient_data
+        return _identidad_guardar('datos_personales', _entero_o_none(patient_id), patient_data)
+    except Error as e:
+        logger.error('Error buscando paciente por ID: %s', e)
+        return None
+    finally:
+        if cursor:
+            cursor.close()
+
+# --- Índice de búsqueda de pacientes (tabla paciente_tokens, ver utils/busqueda_pacientes.py) ---
+# Cada palabra normalizada del nombre completo es una fila (token, id_px); la búsqueda por
+# prefijo ('mar%') usa la llave primaria en lugar de recorrer toda la tabla datos_personales.
+_indice_busqueda_listo = False
+
+def _indexar_nombre_paciente(cursor, id_px, nombre, apellidop, apellidom):
+    """
+    Reemplaza los tokens de búsqueda de un paciente. NO HACE COMMIT.
+    Si falla (p. ej. aún no se aplicó la migración 003) no impide guardar al paciente:
+    la búsqueda usa el LIKE original y 'flask reindexar-pacientes' reconstruye el índice.
+    """
+    try:
+        cursor.execute("DELETE FROM paciente_tokens WHERE id_px = %s", (id_px,))
+        tokens = tokens_nombre_paciente(nombre, apellidop, apellidom)
+        if tokens:
+            cursor.executemany("INSERT IGNORE INTO paciente_tokens (token, id_px) VALUES (%s, %s)",
+                               [(token, id_px) for token in tokens])
+    except Error as e:
+        logger.warning('No se pudo actualizar el índice de búsqueda del paciente %s: %s', id_px, e)
+
+def _indice_busqueda_disponible(connection):
+    """
+    True si reindexar_busqueda_pacientes ya completó el índice (fila en paciente_tokens_estado,
+    migración 006); se recuerda por proceso. Que paciente_tokens tenga filas no basta: los
+    pacientes guardados antes de la primera reindexación se indexan solos.
+    """
+    global _indice_busqueda_listo
+    if _indice_busqueda_listo:
+        return True
+    cursor = None
+    try:
+        cursor = connection.cursor(buffered=True)
+        cursor.execute("SELECT 1 FROM paciente_tokens_estado WHERE id = 1")
+        _indice_busqueda_listo = cursor.fetchone() is not None
+    except Error:
+        _indice_busqueda_listo = False  # Faltan las migraciones 003/006
+    finally:
+        if cursor:
+            cursor.close()
+    return _indice_busqueda_listo
+
+def reindexar_busqueda_pacientes(connection, lote=1000):
+    """
+    Reconstruye paciente_tokens para todos los pacientes y al terminar escribe la marca de índice
+    completo (paciente_tokens_estado). Devuelve el número de pacientes indexados.
+    """
+    global _indice_busqueda_listo
+    cursor = None
+    indexados = 0
+    try:
+        cursor = connection.cursor(dictionary=True, buffered=True)
+        ultimo_id = 0
+        while True:
+            cursor.execute("""
+                SELECT id_px, nombre, apellidop, apellidom FROM datos_personales
+                WHERE id_px > %s ORDER BY id_px LIMIT %s
+            """, (ultimo_id, lote))
+            pacientes = cursor.fetchall()
+            if not pacientes:
+                break
+            ids = [p['id_px'] for p in pacientes]
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(f"DELETE FROM paciente_tokens WHERE id_px IN ({placeholders})", tuple(ids))
+            filas = [(token, p['id_px']) for p in pacientes
+                     for token in tokens_nombre_paciente(p['nombre'], p['apellidop'], p['apellidom'])]
+            if filas:
+                cursor.executemany("INSERT IGNORE INTO paciente_tokens (token, id_px) VALUES (%s, %s)", filas)
+            connection.commit()
+            indexados += len(pacientes)
+            ultimo_id = ids[-1]
+        # Solo aquí se marca el índice como completo
+        cursor.execute("""
+            INSERT INTO paciente_tokens_estado (id, pacientes, completado) VALUES (1, %s, NOW())
+            ON DUPLICATE KEY UPDATE pacientes = VALUES(pacientes), completado = VALUES(completado)
+        """, (indexados,))
+        connection.commit()
+        _indice_busqueda_listo = False  # Se vuelve a comprobar en la siguiente búsqueda
+        return indexados
     except Error as e:
-        print(f"Error buscando paciente por ID: {e}")
+        logger.error('Error reindexando la búsqueda de pacientes: %s', e)
+        try: connection.rollback()
+        except Error: pass
         return None
     finally:
         if cursor:
             cursor.close()
 
-def search_patients_by_name(connection, search_term):
-    """Busca pacientes por nombre o apellido."""
+def _buscar_pacientes_like(connection, search_term, limit=50, offset=0):
+    """Búsqueda original (LIKE '%term%' en las tres columnas). Se usa si el índice no está disponible."""
     cursor = None
     try:
         search_pattern = f"%{search_term}%"
@@ -194,16 +532,59 @@ def search_patients_by_name(connection, search_term):
             SELECT id_px, nombre, apellidop, apellidom
             FROM datos_personales
             WHERE nombre LIKE %s OR apellidop LIKE %s OR apellidom LIKE %s
-            ORDER BY apellidop, apellidom, nombre
-            LIMIT 50
+            ORDER BY apellidop, apellidom, nombre, id_px
+            LIMIT %s OFFSET %s
         """
         cursor = connection.cursor(dictionary=True, buffered=True)
-        cursor.execute(query, (search_pattern, search_pattern, search_pattern))
+        cursor.execute(query, (search_pattern, search_pattern, search_pattern, limit, offset))
         results = cursor.fetchall()
         return results
     except Error as e:
-        print(f"Error buscando pacientes: {e}")
+        logger.error('Error buscando pacientes: %s', e)
+        return []
+    finally:
+        if cursor:
+            cursor.close()
+
+def search_patients_by_name(connection, search_term, limit=50, usar_indice=True, offset=0):
+    """
+    Busca pacientes por nombre o apellido.
+    Cada palabra de la búsqueda debe ser el inicio de alguna palabra del nombre completo
+    (sin importar acentos ni mayúsculas): "mar gon" encuentra a "María González".
+    Orden: primero los que coinciden con palabras completas, luego por apellidos y nombre
+    (estable, para poder paginar con 'offset').
+    """
+    terminos = terminos_busqueda(search_term)
+    if not terminos:
         return []
+    if not usar_indice or not _indice_busqueda_disponible(connection):
+        return _buscar_pacientes_like(connection, search_term, limit, offset)
+
+    cursor = None
+    try:
+        prefijos = [f"{t}%" for t in terminos]
+        lista = ', '.join(['%s'] * len(terminos))
+        condiciones = ' OR '.join(['pt.token LIKE %s'] * len(terminos))
+        todos = ' AND '.join(['MAX(pt.token LIKE %s) = 1'] * len(terminos))
+        query = f"""
+            SELECT dp.id_px, dp.nombre, dp.apellidop, dp.apellidom
+            FROM (
+                SELECT pt.id_px, SUM(pt.token IN ({lista})) AS exactos
+                FROM paciente_tokens pt
+                WHERE {condiciones}
+                GROUP BY pt.id_px
+                HAVING {todos}
+            ) coincidencias
+            JOIN datos_personales dp ON dp.id_px = coincidencias.id_px
+            ORDER BY coincidencias.exactos DESC, dp.apellidop, dp.apellidom, dp.nombre, dp.id_px
+            LIMIT %s OFFSET %s
+        """
+        cursor = connection.cursor(dictionary=True, buffered=True)
+        cursor.execute(query, tuple(terminos + prefijos + prefijos + [limit, offset]))
+        return cursor.fetchall()
+    except Error as e:
+        logger.error('Error buscando pacientes en el índice: %s', e)
+        return _buscar_pacientes_like(connection, search_term, limit, offset)
     finally:
         if cursor:
             cursor.close()
@@ -223,7 +604,7 @@ def get_recent_patients(connection, limit=5):
         recent_patients = cursor.fetchall()
         return recent_patients
     except Error as e:
-        print(f"Error obteniendo pacientes recientes: {e}")
+        logger.error('Error obteniendo pacientes recientes: %s', e)
         return []
     finally:
         if cursor:
@@ -248,7 +629,7 @@ def get_antecedentes_summary(connection, patient_id):
         summary_list = cursor.fetchall()
         return summary_list
     except Error as e:
-        print(f"Error obteniendo resumen de antecedentes: {e}")
+        logger.error('Error obteniendo resumen de antecedentes: %s', e)
         return []
     finally:
         if cursor:
@@ -272,7 +653,7 @@ def get_specific_antecedente(connection, id_antecedente):
              except (TypeError, ValueError): antecedente_data['calzado'] = 0.0
         return antecedente_data
     except Error as e:
-        print(f"Error obteniendo antecedente específico por ID {id_antecedente}: {e}")
+        logger.error('Error obteniendo antecedente específico por ID %s: %s', id_antecedente, e)
         return None
     finally:
         if cursor:
@@ -299,10 +680,10 @@ def get_specific_antecedente_by_date(connection, patient_id, fecha_str):
              except (TypeError, ValueError): antecedente_data['calzado'] = 0.0
         return antecedente_data
     except ValueError as ve:
-        print(f"Error de fecha en get_specific_antecedente_by_date: {ve}")
+        logger.error('Error de fecha en get_specific_antecedente_by_date: %s', ve)
         return None
     except Error as e:
-        print(f"Error obteniendo antecedente específico (px:{patient_id}, fecha:{fecha_str}): {e}")
+        logger.error('Error obteniendo antecedente específico (px:%s, fecha:%s): %s', patient_id, fecha_str, e)
         return None
     finally:
         if cursor:
@@ -317,7 +698,7 @@ def save_antecedentes(connection, data):
     cursor = None
     required_keys = ['id_px', 'fecha']
     if not all(key in data and data[key] is not None for key in required_keys):
-         print("Error: Faltan id_px o fecha en los datos a guardar.")
+         logger.error('Faltan id_px o fecha en los datos a guardar.')
          return False
 
     # Columnas REALES de la tabla 'antecedentes' (excluyendo PK)
@@ -343,7 +724,7 @@ def save_antecedentes(connection, data):
         try:
             fecha_sql = parse_date(data.get('fecha'))
         except ValueError as ve:
-            print(f"Error fatal (save_antecedentes): {ve}")
+            logger.error('Error fatal (save_antecedentes): %s', ve)
             return False
 
         if id_to_update:
@@ -363,7 +744,7 @@ def save_antecedentes(connection, data):
             values_list.append(id_to_update) # Añadimos el ID al final para el WHERE
             values = tuple(values_list)
             
-            print(f"Actualizando antecedentes para ID_ANTECEDENTE: {id_to_update}")
+            logger.debug('Actualizando antecedentes para ID_ANTECEDENTE: %s', id_to_update)
             cursor.execute(query, values)
             saved_id = id_to_update
         else:
@@ -381,16 +762,16 @@ def save_antecedentes(connection, data):
             
             values = tuple(values_list)
 
-            print(f"Insertando nuevos antecedentes para ID_PX: {data.get('id_px')} en Fecha: {fecha_sql}")
+            logger.debug('Insertando nuevos antecedentes para ID_PX: %s en Fecha: %s', data.get('id_px'), fecha_sql)
             cursor.execute(query, values)
             saved_id = cursor.lastrowid
 
         # connection.commit() # Mantenemos autocommit=True por ahora
-        print("Antecedentes guardados/actualizados exitosamente.")
+        logger.debug('Antecedentes guardados/actualizados exitosamente.')
         return True # Devolver True en éxito como antes (aunque devolver saved_id podría ser útil)
 
     except Error as e:
-        print(f"Error guardando/actualizando antecedentes: {e}")
+        logger.error('Error guardando/actualizando antecedentes: %s', e)
         # connection.rollback() # No necesario con autocommit
         return False
     finally:
@@ -419,7 +800,7 @@ def get_anamnesis_summary(connection, patient_id):
         # print(f"Resumen de Anamnesis encontrado para paciente {patient_id}: {summary_list}") # Debug opcional
         return summary_list
     except Error as e:
-        print(f"Error obteniendo resumen de anamnesis: {e}")
+        logger.error('Error obteniendo resumen de anamnesis: %s', e)
         return []
     finally:
         if cursor:
@@ -442,7 +823,7 @@ def get_specific_anamnesis(connection, id_anamnesis):
         anamnesis_data = cursor.fetchone()
         return anamnesis_data # Devuelve diccionario o None
     except Error as e:
-        print(f"Error obteniendo anamnesis específica por ID {id_anamnesis}: {e}")
+        logger.error('Error obteniendo anamnesis específica por ID %s: %s', id_anamnesis, e)
         return None
     finally:
         if cursor:
@@ -468,10 +849,10 @@ def get_specific_anamnesis_by_date(connection, patient_id, fecha_str):
         anamnesis_data = cursor.fetchone()
         return anamnesis_data # Devuelve diccionario con id_anamnesis o None
     except ValueError as ve:
-        print(f"Error de fecha en get_specific_anamnesis_by_date: {ve}")
+        logger.error('Error de fecha en get_specific_anamnesis_by_date: %s', ve)
         return None
     except Error as e:
-        print(f"Error obteniendo anamnesis específica por fecha (px:{patient_id}, fecha:{fecha_str}): {e}")
+        logger.error('Error obteniendo anamnesis específica por fecha (px:%s, fecha:%s): %s', patient_id, fecha_str, e)
         return None
     finally:
         if cursor:
@@ -485,7 +866,7 @@ def save_anamnesis(connection, data):
     cursor = None
     required_keys = ['id_px', 'fecha']
     if not all(key in data and data[key] is not None for key in required_keys):
-         print("Error: Faltan id_px o fecha en los datos de anamnesis a guardar.")
+         logger.error('Faltan id_px o fecha en los datos de anamnesis a guardar.')
          return False
 
     # Columnas de datos a insertar/actualizar (quitando lesión e historia)
@@ -503,7 +884,7 @@ def save_anamnesis(connection, data):
         try:
             fecha_sql = parse_date(data.get('fecha'))
         except ValueError as ve:
-            print(f"Error fatal (save_anamnesis): {ve}")
+            logger.error('Error fatal (save_anamnesis): %s', ve)
             return False
 
         if id_to_update:
@@ -521,7 +902,7 @@ def save_anamnesis(connection, data):
             query = f"UPDATE anamnesis SET {set_clause} WHERE id_anamnesis=%s"
             values_list.append(id_to_update)
             values = tuple(values_list)
-            print(f"Actualizando anamnesis (con historia) para ID_ANAMNESIS: {id_to_update}")
+            logger.debug('Actualizando anamnesis (con historia) para ID_ANAMNESIS: %s', id_to_update)
         else:
             # INSERT
             insert_columns = ['id_px', 'fecha'] + data_columns
@@ -534,29 +915,29 @@ def save_anamnesis(connection, data):
             for col in data_columns:
                 values_list.append(data.get(col))
             values = tuple(values_list)
-            print(f"Insertando nueva anamnesis (con historia) para ID_PX: {data.get('id_px')} en Fecha: {fecha_sql}")
+            logger.debug('Insertando nueva anamnesis (con historia) para ID_PX: %s en Fecha: %s', data.get('id_px'), fecha_sql)
 
         cursor.execute(query, values)
         connection.commit()
-        print("Anamnesis guardada/actualizada exitosamente.")
+        logger.debug('Anamnesis guardada/actualizada exitosamente.')
         return True
     except IntegrityError as ie:
         # Verifica si el error es específicamente por la restricción UNIQUE que creamos
         if 'uq_anamnesis_paciente_fecha' in str(ie):
-            print(f"ERROR (save_anamnesis): Intento de duplicar registro para paciente {data.get('id_px')} en fecha {data.get('fecha')}.")
+            logger.error('save_anamnesis: Intento de duplicar registro para paciente %s en fecha %s.', data.get('id_px'), data.get('fecha'))
             # Devuelve un valor especial para indicar duplicado
             return "duplicate" 
         else:
             # Si es otro error de integridad, regístralo y devuelve False
-            print(f"ERROR (save_anamnesis): Error de Integridad no esperado: {ie}")
+            logger.error('save_anamnesis: Error de Integridad no esperado: %s', ie)
             return False
     except Error as e:
         # Captura otros errores de la base de datos
-        print(f"ERROR (save_anamnesis): Error de Base de Datos: {e}")
+        logger.error('save_anamnesis: Error de Base de Datos: %s', e)
         return False
     except Exception as ex:
          # Captura cualquier otro error inesperado
-         print(f"ERROR (save_anamnesis): Error inesperado: {ex}")
+         logger.error('save_anamnesis: Error inesperado: %s', ex)
          return False
     finally:
         if cursor:
@@ -585,7 +966,7 @@ def get_latest_antecedente(connection, patient_id):
              except (TypeError, ValueError): antecedente_data['calzado'] = 0.0
         return antecedente_data # Devuelve diccionario o None
     except Error as e:
-        print(f"Error obteniendo el último antecedente para paciente {patient_id}: {e}")
+        logger.error('Error obteniendo el último antecedente para paciente %s: %s', patient_id, e)
         return None
     finally:
         if cursor:
@@ -611,7 +992,7 @@ def get_latest_anamnesis(connection, patient_id):
         anamnesis_data = cursor.fetchone()
         return anamnesis_data # Devuelve diccionario o None
     except Error as e:
-        print(f"Error obteniendo la última anamnesis para paciente {patient_id}: {e}")
+        logger.error('Error obteniendo la última anamnesis para paciente %s: %s', patient_id, e)
         return None
     finally:
         if cursor:
@@ -641,7 +1022,7 @@ def get_postura_summary(connection, patient_id):
               
         return dates
     except Error as e:
-        print(f"Error obteniendo resumen de postura: {e}")
+        logger.error('Error obteniendo resumen de postura: %s', e)
         return []
     finally:
         if cursor:
@@ -656,8 +1037,12 @@ def get_specific_postura_by_date(connection, patient_id, fecha_str):
     try:
         fecha_sql_str = parse_date(fecha_str)
     except ValueError as e:
-        print(f"Error (get_specific_postura_by_date): {e}")
+        logger.error('get_specific_postura_by_date: %s', e)
         return None
+    llave = (_entero_o_none(patient_id), str(fecha_sql_str))
+    en_mapa = _identidad_obtener('postura', llave)
+    if en_mapa is not _SIN_DATO:
+        return en_mapa
     
     try:
         # 2. Modificar la consulta para usar la comparación de string directa
@@ -681,9 +1066,9 @@ def get_specific_postura_by_date(connection, patient_id, fecha_str):
                  if key in postura_data and postura_data[key] is not None:
                      try: postura_data[key] = float(postura_data[key])
                      except (TypeError, ValueError): postura_data[key] = 0.0
-        return postura_data
+        return _identidad_guardar('postura', llave, postura_data)
     except Error as e:
-        print(f"Error obteniendo postura específica (px:{patient_id}, fecha:{fecha_str}): {e}")
+        logger.error('Error obteniendo postura específica (px:%s, fecha:%s): %s', patient_id, fecha_str, e)
         return None
     finally:
         if cursor:
@@ -692,7 +1077,7 @@ def get_specific_postura_by_date(connection, patient_id, fecha_str):
 def save_postura(connection, data):
     cursor = None
     required_keys = ['id_px', 'fecha']
-    if not all(key in data for key in required_keys): print("Error save_postura: Faltan claves."); return None
+    if not all(key in data for key in required_keys): logger.error('Error save_postura: Faltan claves.'); return None
 
     # --- Lista COMPLETA de columnas (sin PK) ---
     data_columns = [
@@ -719,7 +1104,7 @@ def save_postura(connection, data):
              if existing_data_temp and existing_data_temp.get('id_postura') == id_to_update:
                   existing_data = existing_data_temp
              else: # Inconsistencia si el ID pasado no coincide con la fecha/paciente
-                  print(f"WARN: ID de postura {id_to_update} no coincide con paciente/fecha {data['id_px']}/{data['fecha']}")
+                  logger.warning('ID de postura %s no coincide con paciente/fecha %s/%s', id_to_update, data['id_px'], data['fecha'])
                   # Podrías lanzar un error aquí o continuar bajo riesgo
                   existing_data = {}
 
@@ -738,8 +1123,9 @@ def save_postura(connection, data):
             set_clause = ", ".join([f"`{col}`=%s" for col in update_columns])
             query = f"UPDATE postura SET {set_clause} WHERE id_postura=%s"
             values = tuple(data.get(col) for col in update_columns) + (id_to_update,)
-            print(f"Actualizando postura para ID_POSTURA: {id_to_update}")
+            logger.debug('Actualizando postura para ID_POSTURA: %s', id_to_update)
             cursor.execute(query, values)
+            _olvidar_identidad('postura')
             saved_id_postura = id_to_update
         else:
             # INSERT 
@@ -752,7 +1138,7 @@ def save_postura(connection, data):
             try:
                 fecha_str_yyyymmdd = to_db_str(fecha_str_ddmmyyyy)
             except ValueError as e:
-                print(f"Error fatal (save_postura): {e}")
+                logger.error('Error fatal (save_postura): %s', e)
                 raise Error(f"La fecha '{fecha_str_ddmmyyyy}' tiene un formato inválido.")
 
             # 3. Separamos 'fecha' del resto de columnas
@@ -775,18 +1161,19 @@ def save_postura(connection, data):
             
             values = tuple(values_list_insert)
             
-            print(f"Insertando nueva postura (Python-side) para ID_PX: {data.get('id_px')} en Fecha: {fecha_str_yyyymmdd}")
+            logger.debug('Insertando nueva postura (Python-side) para ID_PX: %s en Fecha: %s', data.get('id_px'), fecha_str_yyyymmdd)
             
             cursor.execute(query, values)
             # --- !! FIN DEL NUEVO BLOQUE CORREGIDO !! ---
             saved_id_postura = cursor.lastrowid
+            _olvidar_identidad('postura')
 
         # NO Commit (se hace en la ruta)
-        print(f"Operación en 'postura' lista para commit. ID afectado/nuevo: {saved_id_postura}")
+        logger.debug("Operación en 'postura' lista para commit. ID afectado/nuevo: %s", saved_id_postura)
         return saved_id_postura
 
     except Error as e:
-        print(f"Error en save_postura: {e}")
+        logger.error('Error en save_postura: %s', e)
         return None
     finally:
         if cursor: cursor.close()
@@ -807,7 +1194,7 @@ def get_radiografias_for_postura(connection, id_postura):
         rx_list = cursor.fetchall()
         return rx_list if rx_list else [] # Devolver lista vacía si no hay nada
     except Error as e:
-        print(f"Error obteniendo radiografías para id_postura {id_postura}: {e}")
+        logger.error('Error obteniendo radiografías para id_postura %s: %s', id_postura, e)
         return [] # Devolver lista vacía en caso de error
     finally:
         if cursor:
@@ -825,15 +1212,176 @@ def insert_radiografia(connection, id_postura, ruta_archivo):
         values = (id_postura, ruta_archivo)
         cursor.execute(query, values)
         # No necesitamos commit aquí si se hace después de todas las inserciones en la ruta
-        print(f"Insertado registro en radiografias para id_postura {id_postura}, ruta: {ruta_archivo}")
+        logger.debug('Insertado registro en radiografias para id_postura %s, ruta: %s', id_postura, ruta_archivo)
         return cursor.lastrowid
     except Error as e:
-        print(f"Error insertando radiografía: {e}")
+        logger.error('Error insertando radiografía: %s', e)
         raise # Re-lanzar para que la ruta haga rollback si es necesario
     finally:
         if cursor:
             cursor.close()
 
+# --- Trabajos en segundo plano de imágenes de postura (tabla 'trabajos_imagen') ---
+# Columnas de 'postura' que puede actualizar un trabajo (nunca se interpola otra cosa en el SQL)
+COLUMNAS_IMAGEN_POSTURA = ('frente', 'lado', 'postura_extra')
+
+
+def crear_trabajo_imagen(connection, id_postura, columna, view_type, ruta_original):
+    """
+    Registra un trabajo de procesamiento de imagen ya tomado por este proceso
+    (estado 'procesando'). Devuelve el id_trabajo o None.
+    """
+    if columna not in COLUMNAS_IMAGEN_POSTURA:
+        logger.error("Error crear_trabajo_imagen: columna no permitida '%s'.", columna)
+        return None
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute("""
+            INSERT INTO trabajos_imagen (id_postura, columna, view_type, ruta_original, estado, intentos)
+            VALUES (%s, %s, %s, %s, 'procesando', 1)
+        """, (id_postura, columna, view_type, ruta_original))
+        connection.commit()
+        return cursor.lastrowid
+    except Error as e:
+        logger.error('Error creando trabajo de imagen (postura %s, %s): %s', id_postura, columna, e)
+        return None
+    finally:
+        if cursor:
+            cursor.close()
+
+
+def tomar_trabajo_imagen(connection, id_trabajo):
+    """Marca un trabajo 'pendiente' como 'procesando'. Devuelve True solo si este proceso lo tomó."""
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute("""
+            UPDATE trabajos_imagen SET estado = 'procesando', intentos = intentos + 1
+            WHERE id_trabajo = %s AND estado = 'pendiente'
+        """, (id_trabajo,))
+        connection.commit()
+        return cursor.rowcount == 1
+    except Error as e:
+        logger.error('Error tomando trabajo de imagen %s: %s', id_trabajo, e)
+        return False
+    finally:
+        if cursor:
+            cursor.close()
+
+
+def completar_trabajo_imagen(connection, trabajo, ruta_resultado):
+    """
+    Guarda la imagen anotada en 'postura' y marca el trabajo como completado (una transacción).
+    Solo reemplaza la columna si todavía apunta al original del trabajo (si mientras tanto
+    se subió otra foto, no se pisa). Devuelve True si se actualizó 'postura'.
+    """
+    columna = trabajo['columna']
+    if columna not in COLUMNAS_IMAGEN_POSTURA:
+        logger.error("Error completar_trabajo_imagen: columna no permitida '%s'.", columna)
+        return False
+    cursor = None
+    try:
+        connection.start_transaction()
+        cursor = connection.cursor()
+        cursor.execute(
+            f"UPDATE postura SET {columna} = %s WHERE id_postura = %s AND {columna} = %s",
+            (ruta_resultado, trabajo['id_postura'], trabajo['ruta_original'])
+        )
+        postura_actualizada = cursor.rowcount == 1
+        _olvidar_identidad('postura')
+        cursor.execute("""
+            UPDATE trabajos_imagen SET estado = 'completado', ruta_resultado = %s, error = NULL
+            WHERE id_trabajo = %s
+        """, (ruta_resultado, trabajo['id_trabajo']))
+        connection.commit()
+        return postura_actualizada
+    except Error as e:
+        logger.error('Error completando trabajo de imagen %s: %s', trabajo.get('id_trabajo'), e)
+        try: connection.rollback()
+        except Error: pass
+        return False
+    finally:
+        if cursor:
+            cursor.close()
+
+
+def fallar_trabajo_imagen(connection, id_trabajo, mensaje_error):
+    """Marca un trabajo como 'error' (la postura conserva la foto original sin anotar)."""
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "UPDATE trabajos_imagen SET estado = 'error', error = %s WHERE id_trabajo = %s",
+            (str(mensaje_error)[:1000], id_trabajo)
+        )
+        connection.commit()
+    except Error as e:
+        logger.error('Error marcando trabajo de imagen %s como fallido: %s', id_trabajo, e)
+    finally:
+        if cursor:
+            cursor.close()
+
+
+def get_trabajos_imagen_pendientes(connection, minutos_estancado=10, max_intentos=3):
+    """
+    Trabajos por reanudar al arrancar: los 'pendiente' y los 'procesando' sin avance en
+    'minutos_estancado' (el proceso que los tenía terminó). Estos últimos vuelven a 'pendiente'.
+    Los que ya fallaron 'max_intentos' veces se marcan como error.
+    """
+    cursor = None
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("""
+            UPDATE trabajos_imagen SET estado = 'error', error = 'Se agotaron los reintentos.'
+            WHERE estado IN ('pendiente', 'procesando') AND intentos >= %s
+            AND fecha_actualizacion < NOW() - INTERVAL %s MINUTE
+        """, (max_intentos, minutos_estancado))
+        cursor.execute("""
+            UPDATE trabajos_imagen SET estado = 'pendiente'
+            WHERE estado = 'procesando' AND fecha_actualizacion < NOW() - INTERVAL %s MINUTE
+        """, (minutos_estancado,))
+        connection.commit()
+        cursor.execute("""
+            SELECT t.id_trabajo, t.id_postura, p.id_px, t.columna, t.view_type, t.ruta_original
+            FROM trabajos_imagen t
+            JOIN postura p ON p.id_postura = t.id_postura
+            WHERE t.estado = 'pendiente'
+            ORDER BY t.id_trabajo
+        """)
+        return cursor.fetchall()
+    except Error as e:
+        logger.error('Error obteniendo trabajos de imagen pendientes: %s', e)
+        return []
+    finally:
+        if cursor:
+            cursor.close()
+
+
+def get_trabajos_imagen_por_postura(connection, id_postura, id_px):
+    """Último trabajo de cada columna de imagen de un registro de postura (para el estado en el formulario)."""
+    cursor = None
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT t.id_trabajo, t.columna, t.estado, t.ruta_original, t.ruta_resultado, t.error
+            FROM trabajos_imagen t
+            JOIN (
+                SELECT columna, MAX(id_trabajo) AS id_trabajo
+                FROM trabajos_imagen
+                WHERE id_postura = %s
+                GROUP BY columna
+            ) ultimos ON ultimos.id_trabajo = t.id_trabajo
+            JOIN postura p ON p.id_postura = t.id_postura AND p.id_px = %s
+        """, (id_postura, id_px))
+        return cursor.fetchall()
+    except Error as e:
+        logger.error('Error obteniendo trabajos de imagen de postura %s: %s', id_postura, e)
+        return []
+    finally:
+        if cursor:
+            cursor.close()
+
 def get_revaloraciones_summary(connection, patient_id):
     """Obtiene lista de IDs y fechas de revaloraciones para un paciente."""
     # --- SIN CAMBIOS ---
@@ -851,7 +1399,7 @@ def get_revaloraciones_summary(connection, patient_id):
         summary_list = cursor.fetchall()
         return summary_list
     except Error as e:
-        print(f"Error obteniendo resumen de revaloraciones: {e}")
+        logger.error('Error obteniendo resumen de revaloraciones: %s', e)
         return []
     finally:
         if cursor:
@@ -889,7 +1437,7 @@ def get_specific_revaloracion(connection, id_revaloracion):
         revaloracion_data = cursor.fetchone()
         return revaloracion_data # Devuelve diccionario o None
     except Error as e:
-        print(f"Error obteniendo revaloración específica por ID {id_revaloracion}: {e}")
+        logger.error('Error obteniendo revaloración específica por ID %s: %s', id_revaloracion, e)
         return None
     finally:
         if cursor:
@@ -905,7 +1453,7 @@ def get_specific_revaloracion_by_date(connection, patient_id, fecha_str):
     try:
         fecha_sql_str = parse_date(fecha_str)
     except ValueError as e:
-        print(f"Error (get_specific_revaloracion_by_date): {e}")
+        logger.error('get_specific_revaloracion_by_date: %s', e)
         return None
     # --- !! FIN DE LA CORRECCIÓN !! ---
 
@@ -931,7 +1479,7 @@ def get_specific_revaloracion_by_date(connection, patient_id, fecha_str):
         revaloracion_data = cursor.fetchone()
         return revaloracion_data # Devuelve diccionario o None
     except Error as e:
-        print(f"Error obteniendo revaloración específica por fecha (px:{patient_id}, fecha:{fecha_str}): {e}")
+        logger.error('Error obteniendo revaloración específica por fecha (px:%s, fecha:%s): %s', patient_id, fecha_str, e)
         return None
     finally:
         if cursor:
@@ -942,7 +1490,7 @@ def save_revaloracion(connection, data):
     cursor = None
     required_keys = ['id_px', 'id_dr', 'fecha']
     if not all(key in data for key in required_keys): 
-        print("Error save_revaloracion: Faltan claves.")
+        logger.error('Error save_revaloracion: Faltan claves.')
         return None
 
     data_columns = [
@@ -974,7 +1522,7 @@ def save_revaloracion(connection, data):
         try:
             fecha_sql_str = parse_date(fecha_str_ddmmyyyy)
         except ValueError as e:
-            print(f"Error fatal (save_revaloracion): {e}")
+            logger.error('Error fatal (save_revaloracion): %s', e)
             raise Error(f"La fecha '{fecha_str_ddmmyyyy}' tiene un formato inválido.")
         
         # --- !! FIN DE LA CORRECCIÓN DE FECHA !! ---
@@ -1000,7 +1548,7 @@ def save_revaloracion(connection, data):
             
             values = tuple(values_list_update)
             
-            print(f"Actualizando revaloración (Python-side) para ID: {id_to_update}")
+            logger.debug('Actualizando revaloración (Python-side) para ID: %s', id_to_update)
             cursor.execute(query, values)
             saved_id = id_to_update
         else:
@@ -1023,14 +1571,14 @@ def save_revaloracion(connection, data):
             
             values = tuple(values_list_insert)
             
-            print(f"Insertando nueva revaloración (Python-side) para ID_PX: {data['id_px']} en Fecha: {fecha_sql_str}")
+            logger.debug('Insertando nueva revaloración (Python-side) para ID_PX: %s en Fecha: %s', data['id_px'], fecha_sql_str)
             cursor.execute(query, values)
             saved_id = cursor.lastrowid
 
-        print(f"Operación en 'revaloraciones' lista para commit. ID afectado/nuevo: {saved_id}")
+        logger.debug("Operación en 'revaloraciones' lista para commit. ID afectado/nuevo: %s", saved_id)
         return saved_id
     except Error as e:
-        print(f"Error en save_revaloracion: {e}")
+        logger.error('Error en save_revaloracion: %s', e)
         return None
     finally:
         if cursor:
@@ -1067,10 +1615,10 @@ def get_latest_revaloracion_on_or_before_date(connection, patient_id, target_dat
         revaloracion_data = cursor.fetchone()
         return revaloracion_data # Devuelve diccionario o None
     except ValueError:
-        print(f"Error: Formato de fecha inválido '{target_date_str}' al buscar última revaloración.")
+        logger.error("Formato de fecha inválido '%s' al buscar última revaloración.", target_date_str)
         return None
     except Error as e:
-        print(f"Error obteniendo última revaloración (px:{patient_id}, hasta fecha:{target_date_str}): {e}")
+        logger.error('Error obteniendo última revaloración (px:%s, hasta fecha:%s): %s', patient_id, target_date_str, e)
         return None
     finally:
         if cursor:
@@ -1107,7 +1655,7 @@ def get_latest_revaloracion_overall(connection, patient_id):
         revaloracion_data = cursor.fetchone()
         return revaloracion_data # Devuelve diccionario o None
     except Error as e:
-        print(f"Error obteniendo última revaloración general para paciente {patient_id}: {e}")
+        logger.error('Error obteniendo última revaloración general para paciente %s: %s', patient_id, e)
         return None
     finally:
         if cursor:
@@ -1118,70 +1666,49 @@ def get_clinical_dates_with_types(connection, patient_id):
     Obtiene una lista de diccionarios, cada uno con una fecha y booleanos
     indicando qué tipos de registros clínicos existen para esa fecha,
     ordenada por fecha ascendente.
+    Se resuelve en una sola consulta (UNION ALL + GROUP BY) que usa los
+    índices (id_px, fecha) de cada tabla, en vez de consultar cada fecha por separado.
     """
     cursor = None
-    dates_info = {}
     try:
-        cursor = connection.cursor(dictionary=True, buffered=True)
-
-        # 1. Obtener todas las fechas distintas
-        all_dates = set()
-        tables_to_check = ['antecedentes', 'anamnesis', 'postura', 'revaloraciones']
-        for table in tables_to_check:
-            query_dates = f"SELECT DISTINCT fecha FROM {table} WHERE id_px = %s"
-            cursor.execute(query_dates, (patient_id,))
-            for row in cursor.fetchall():
-                 if row and row.get('fecha'):
-                    date_val = row['fecha']
-                    formatted_date = None
-                    
-                    if isinstance(date_val, (date, datetime, str)):
-                        formatted_date = to_frontend_str(date_val)
-                    
-                    if formatted_date:
-                        all_dates.add(formatted_date)
+        cursor = connection.cursor(dictionary=True)
+        query = """
+            SELECT fecha,
+                   MAX(tipo = 1) AS has_antecedentes,
+                   MAX(tipo = 2) AS has_anamnesis,
+                   MAX(tipo = 3) AS has_postura,
+                   MAX(tipo = 4) AS has_revaloracion
+            FROM (
+                SELECT fecha, 1 AS tipo FROM antecedentes WHERE id_px = %s
+                UNION ALL
+                SELECT fecha, 2 AS tipo FROM anamnesis WHERE id_px = %s
+                UNION ALL
+                SELECT fecha, 3 AS tipo FROM postura WHERE id_px = %s
+                UNION ALL
+                SELECT fecha, 4 AS tipo FROM revaloraciones WHERE id_px = %s
+            ) AS registros
+            WHERE fecha IS NOT NULL
+            GROUP BY fecha
+            ORDER BY fecha ASC
+        """
+        cursor.execute(query, (patient_id, patient_id, patient_id, patient_id))
 
-        # 2. Para cada fecha, verificar registros
-        for fecha_str in all_dates:
-            info = {
-                'fecha': fecha_str,
-                'has_antecedentes': False,
-                'has_anamnesis': False,
-                'has_postura': False,
-                'has_revaloracion': False
-            }
-            
-            # Convertir fecha_str (dd/mm/yyyy) a SQL (YYYY-MM-DD) para la consulta
-            fecha_sql = to_db_str(fecha_str)
-            if not fecha_sql:
+        dates_info = []
+        for row in cursor.fetchall():
+            fecha_str = to_frontend_str(row['fecha'])
+            if not fecha_str:
                 continue
-
-            # Usar "AS flag" para asegurar el nombre de la clave
-            query_check = "SELECT EXISTS(SELECT 1 FROM {table} WHERE id_px = %s AND fecha = %s LIMIT 1) AS flag"
-            try:
-                 cursor.execute(query_check.format(table='antecedentes'), (patient_id, fecha_sql))
-                 info['has_antecedentes'] = bool(cursor.fetchone().get('flag', 0))
-
-                 cursor.execute(query_check.format(table='anamnesis'), (patient_id, fecha_sql))
-                 info['has_anamnesis'] = bool(cursor.fetchone().get('flag', 0))
-
-                 cursor.execute(query_check.format(table='postura'), (patient_id, fecha_sql))
-                 info['has_postura'] = bool(cursor.fetchone().get('flag', 0))
-
-                 cursor.execute(query_check.format(table='revaloraciones'), (patient_id, fecha_sql))
-                 info['has_revaloracion'] = bool(cursor.fetchone().get('flag', 0))
-
-                 dates_info[fecha_str] = info
-            except Error as check_err:
-                 print(f"WARN: Error verificando registros para fecha {fecha_str}: {check_err}")
-
-        # 3. Convertir y ordenar
-        if not dates_info: return []
-        sorted_list = sorted(dates_info.values(), key=lambda item: to_db_str(item['fecha']))
-        return sorted_list
+            dates_info.append({
+                'fecha': fecha_str,
+                'has_antecedentes': bool(row['has_antecedentes']),
+                'has_anamnesis': bool(row['has_anamnesis']),
+                'has_postura': bool(row['has_postura']),
+                'has_revaloracion': bool(row['has_revaloracion'])
+            })
+        return dates_info
 
     except Error as e:
-        print(f"Error obteniendo fechas clínicas con tipos para paciente {patient_id}: {e}")
+        logger.error('Error obteniendo fechas clínicas con tipos para paciente %s: %s', patient_id, e)
         return []
     finally:
         if cursor: cursor.close()
@@ -1210,10 +1737,10 @@ def get_latest_antecedente_on_or_before_date(connection, patient_id, target_date
              except (TypeError, ValueError): data['calzado'] = 0.0
         return data
     except ValueError:
-        print(f"Error: Formato de fecha inválido '{target_date_str}' al buscar último antecedente.")
+        logger.error("Formato de fecha inválido '%s' al buscar último antecedente.", target_date_str)
         return None
     except Error as e:
-        print(f"Error obteniendo último antecedente (px:{patient_id}, hasta fecha:{target_date_str}): {e}")
+        logger.error('Error obteniendo último antecedente (px:%s, hasta fecha:%s): %s', patient_id, target_date_str, e)
         return None
     finally:
         if cursor: cursor.close()
@@ -1241,10 +1768,10 @@ def get_latest_anamnesis_on_or_before_date(connection, patient_id, target_date_s
         data = cursor.fetchone()
         return data
     except ValueError:
-        print(f"Error: Formato de fecha inválido '{target_date_str}' al buscar última anamnesis.")
+        logger.error("Formato de fecha inválido '%s' al buscar última anamnesis.", target_date_str)
         return None
     except Error as e:
-        print(f"Error obteniendo última anamnesis (px:{patient_id}, hasta fecha:{target_date_str}): {e}")
+        logger.error('Error obteniendo última anamnesis (px:%s, hasta fecha:%s): %s', patient_id, target_date_str, e)
         return None
     finally:
         if cursor: cursor.close()
@@ -1278,10 +1805,10 @@ def get_latest_postura_on_or_before_date(connection, patient_id, target_date_str
                     except (TypeError, ValueError): data[key] = 0.0
         return data
     except ValueError:
-        print(f"Error: Formato de fecha inválido '{target_date_str}' al buscar última postura.")
+        logger.error("Formato de fecha inválido '%s' al buscar última postura.", target_date_str)
         return None
     except Error as e:
-        print(f"Error obteniendo última postura (px:{patient_id}, hasta fecha:{target_date_str}): {e}")
+        logger.error('Error obteniendo última postura (px:%s, hasta fecha:%s): %s', patient_id, target_date_str, e)
         return None
     finally:
         if cursor: cursor.close()
@@ -1302,7 +1829,7 @@ def get_seguimiento_summary(connection, patient_id):
         summary_list = cursor.fetchall()
         return summary_list
     except Error as e:
-        print(f"Error obteniendo resumen de seguimiento: {e}")
+        logger.error('Error obteniendo resumen de seguimiento: %s', e)
         return []
     finally:
         if cursor:
@@ -1312,6 +1839,9 @@ def get_specific_seguimiento(connection, id_seguimiento):
     """Obtiene los datos de un registro de seguimiento específico por su ID.
        Incluye el nombre del doctor.
     """
+    en_mapa = _identidad_obtener('quiropractico', _entero_o_none(id_seguimiento))
+    if en_mapa is not _SIN_DATO:
+        return en_mapa
     cursor = None
     try:
         # --- CAMBIO: JOIN con la tabla 'dr' para obtener nombre_doctor ---
@@ -1332,9 +1862,9 @@ def get_specific_seguimiento(connection, id_seguimiento):
         cursor = connection.cursor(dictionary=True, buffered=True)
         cursor.execute(query, (id_seguimiento,))
         seguimiento_data = cursor.fetchone()
-        return seguimiento_data
+        return _identidad_guardar('quiropractico', _entero_o_none(id_seguimiento), seguimiento_data)
     except Error as e:
-        print(f"Error obteniendo seguimiento específico por ID {id_seguimiento}: {e}")
+        logger.error('Error obteniendo seguimiento específico por ID %s: %s', id_seguimiento, e)
         return None
     finally:
         if cursor:
@@ -1348,7 +1878,7 @@ def get_specific_seguimiento_by_date(connection, patient_id, fecha_str):
     try:
         fecha_sql_str = parse_date(fecha_str)
     except ValueError as e:
-        print(f"Error (get_specific_seguimiento_by_date): {e}")
+        logger.error('get_specific_seguimiento_by_date: %s', e)
         return None
     try:
         # --- CAMBIO: JOIN con la tabla 'dr' ---
@@ -1373,7 +1903,66 @@ def get_specific_seguimiento_by_date(connection, patient_id, fecha_str):
         seguimiento_data = cursor.fetchone()
         return seguimiento_data
     except Error as e:
-        print(f"Error obteniendo seguimiento específico por fecha (px:{patient_id}, fecha:{fecha_str}): {e}")
+        logger.error('Error obteniendo seguimiento específico por fecha (px:%s, fecha:%s): %s', patient_id, fecha_str, e)
+        return None
+    finally:
+        if cursor:
+            cursor.close()
+
+
+def _ajustar_contadores_plan(cursor, id_plan, delta_qp, delta_tf):
+    """Suma/resta sesiones consumidas (QP/TF) a los contadores de un plan. NO HACE COMMIT."""
+    cursor.execute("""
+        UPDATE plancuidado
+        SET visitas_qp_realizadas = GREATEST(visitas_qp_realizadas + %s, 0),
+            visitas_tf_realizadas = GREATEST(visitas_tf_realizadas + %s, 0)
+        WHERE id_plan = %s
+    """, (delta_qp, delta_tf, id_plan))
+    _olvidar_identidad('plancuidado')
+
+
+def recalcular_contadores_planes(connection, aplicar=False):
+    """
+    Recalcula visitas_qp_realizadas / visitas_tf_realizadas de todos los planes a partir
+    de la tabla 'quiropractico' y los compara con los contadores guardados.
+    Devuelve la lista de planes con diferencias (id_plan, guardados y calculados).
+    Si 'aplicar' es True, corrige los contadores (para backfill o reparación).
+    """
+    cursor = None
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT id_plan_cuidado_asociado, terapia
+            FROM quiropractico
+            WHERE id_plan_cuidado_asociado IS NOT NULL
+        """)
+        calculados = {}
+        for row in cursor.fetchall():
+            conteo = calculados.setdefault(row['id_plan_cuidado_asociado'], [0, 0])
+            conteo[0] += 1
+            if _seguimiento_tiene_tf(row.get('terapia')):
+                conteo[1] += 1
+
+        cursor.execute("SELECT id_plan, visitas_qp_realizadas, visitas_tf_realizadas FROM plancuidado")
+        diferencias = []
+        for plan in cursor.fetchall():
+            qp_calc, tf_calc = calculados.get(plan['id_plan'], (0, 0))
+            if plan['visitas_qp_realizadas'] != qp_calc or plan['visitas_tf_realizadas'] != tf_calc:
+                diferencias.append({
+                    'id_plan': plan['id_plan'],
+                    'qp_guardado': plan['visitas_qp_realizadas'], 'qp_calculado': qp_calc,
+                    'tf_guardado': plan['visitas_tf_realizadas'], 'tf_calculado': tf_calc
+                })
+
+        if aplicar and diferencias:
+            cursor.executemany(
+                "UPDATE plancuidado SET visitas_qp_realizadas = %s, visitas_tf_realizadas = %s WHERE id_plan = %s",
+                [(d['qp_calculado'], d['tf_calculado'], d['id_plan']) for d in diferencias]
+            )
+            _olvidar_identidad('plancuidado')
+        return diferencias
+    except Error as e:
+        logger.error('Error recalculando contadores de planes: %s', e)
         return None
     finally:
         if cursor:
@@ -1391,7 +1980,7 @@ def save_seguimiento(connection, data):
     cursor = None
     required_keys = ['id_px', 'id_dr', 'fecha'] 
     if not all(key in data and data[key] is not None for key in required_keys):
-         print("Error: Faltan id_px, id_dr o fecha en los datos de seguimiento a guardar.")
+         logger.error('Faltan id_px, id_dr o fecha en los datos de seguimiento a guardar.')
          return None
 
     # Lista completa de columnas de la tabla 'quiropractico' (excepto id_seguimiento, id_px)
@@ -1407,7 +1996,7 @@ def save_seguimiento(connection, data):
         try:
             fecha_sql_str = parse_date(data.get('fecha'))
         except ValueError as e:
-            print(f"Error fatal (save_seguimiento): {e}")
+            logger.error('Error fatal (save_seguimiento): %s', e)
             raise Error(f"La fecha '{data.get('fecha')}' tiene un formato inválido.")
 
         cursor = connection.cursor()
@@ -1442,7 +2031,7 @@ def save_seguimiento(connection, data):
             values_list_update.append(id_to_update)
             
             values = tuple(values_list_update)
-            print(f"Actualizando seguimiento (Python-side) para ID: {id_to_update}")
+            logger.debug('Actualizando seguimiento (Python-side) para ID: %s', id_to_update)
         else:
             # --- INSERT ---
             data_columns_no_fecha = [col for col in data_columns if col != 'fecha']
@@ -1455,46 +2044,39 @@ def save_seguimiento(connection, data):
             for col_name in data_columns_no_fecha:
                 values_list_insert.append(data.get(col_name))
             values = tuple(values_list_insert)
-            print(f"Insertando nuevo seguimiento (Python-side) para ID_PX: {data['id_px']} en Fecha: {fecha_sql_str}")
+            logger.debug('Insertando nuevo seguimiento (Python-side) para ID_PX: %s en Fecha: %s', data['id_px'], fecha_sql_str)
 
         cursor.execute(query, values)
+        _olvidar_identidad('quiropractico')
 
         if not id_to_update:
             saved_id = cursor.lastrowid
         else:
             saved_id = id_to_update
 
-        print(f"Operación en 'quiropractico' lista para commit. ID afectado/nuevo: {saved_id}")
+        # Mantener los contadores de consumo del plan (misma transacción que el seguimiento)
+        plan_nuevo = data.get('id_plan_cuidado_asociado')
+        tf_nuevo = 1 if _seguimiento_tiene_tf(data.get('terapia')) else 0
+        plan_anterior = existing_data.get('id_plan_cuidado_asociado') if id_to_update else None
+        tf_anterior = 1 if (id_to_update and _seguimiento_tiene_tf(existing_data.get('terapia'))) else 0
+        if plan_anterior and plan_anterior == plan_nuevo:
+            if tf_nuevo != tf_anterior:
+                _ajustar_contadores_plan(cursor, plan_nuevo, 0, tf_nuevo - tf_anterior)
+        else:
+            if plan_anterior:
+                _ajustar_contadores_plan(cursor, plan_anterior, -1, -tf_anterior)
+            if plan_nuevo:
+                _ajustar_contadores_plan(cursor, plan_nuevo, 1, tf_nuevo)
+
+        logger.debug("Operación en 'quiropractico' lista para commit. ID afectado/nuevo: %s", saved_id)
         return saved_id
     except Error as e:
-        print(f"Error guardando/actualizando seguimiento: {e}")
+        logger.error('Error guardando/actualizando seguimiento: %s', e)
         return None
     finally:
         if cursor:
             cursor.close()
 
-def get_terapias_fisicas(connection):
-    """Obtiene la lista de terapias físicas disponibles (adicional=2)."""
-    cursor = None
-    try:
-        # Selecciona ID y nombre de productos donde 'adicional' es 2 (o el valor que uses)
-        query = """
-            SELECT id_prod, nombre
-            FROM productos_servicios
-            WHERE adicional = 2
-            ORDER BY nombre ASC
-        """
-        cursor = connection.cursor(dictionary=True, buffered=True)
-        cursor.execute(query)
-        therapies = cursor.fetchall()
-        return therapies if therapies else [] # Devuelve lista de diccionarios o lista vacía
-    except Error as e:
-        print(f"Error obteniendo terapias físicas: {e}")
-        return [] # Devuelve lista vacía en caso de error
-    finally:
-        if cursor:
-            cursor.close()
-
 def get_latest_postura_overall(connection, patient_id):
     """
     Obtiene el registro de postura/pruebas más reciente en general para un paciente
@@ -1523,7 +2105,7 @@ def get_latest_postura_overall(connection, patient_id):
                     except (TypeError, ValueError): data[key] = 0.0 # o None
         return data # Devuelve diccionario o None
     except Error as e:
-        print(f"Error obteniendo última postura general (px:{patient_id}): {e}")
+        logger.error('Error obteniendo última postura general (px:%s): %s', patient_id, e)
         return None
     finally:
         if cursor: cursor.close()
@@ -1555,7 +2137,7 @@ def get_latest_radiografias_overall(connection, patient_id, limit=5):
         latest_rx = cursor.fetchall()
         return latest_rx if latest_rx else []
     except Error as e:
-        print(f"Error obteniendo últimas radiografías generales para paciente {patient_id}: {e}")
+        logger.error('Error obteniendo últimas radiografías generales para paciente %s: %s', patient_id, e)
         return []
     finally:
         if cursor:
@@ -1584,7 +2166,7 @@ def get_earliest_anamnesis(connection, patient_id):
         initial_anamnesis_data = cursor.fetchone()
         return initial_anamnesis_data # Devuelve diccionario o None
     except Error as e:
-        print(f"Error obteniendo la primera anamnesis para paciente {patient_id}: {e}")
+        logger.error('Error obteniendo la primera anamnesis para paciente %s: %s', patient_id, e)
         return None
     finally:
         if cursor:
@@ -1596,7 +2178,7 @@ def get_revaloraciones_linked_to_anamnesis(connection, id_anamnesis_inicial):
     ordenados por fecha ascendente.
     """
     cursor = None
-    print(f"DEBUG DB: Entrando a get_revaloraciones_linked_to_anamnesis con id_anamnesis_inicial = {id_anamnesis_inicial} (Tipo: {type(id_anamnesis_inicial)})") # NUEVO
+    logger.debug('Entrando a get_revaloraciones_linked_to_anamnesis con id_anamnesis_inicial = %s (Tipo: %s)', id_anamnesis_inicial, type(id_anamnesis_inicial)) # NUEVO
     try:
         query = """
             SELECT id_revaloracion, id_px, id_dr, fecha, id_anamnesis_inicial,
@@ -1613,17 +2195,17 @@ def get_revaloraciones_linked_to_anamnesis(connection, id_anamnesis_inicial):
         
         # Verificar el tipo del parámetro que se pasa a execute
         param_tuple = (id_anamnesis_inicial,)
-        print(f"DEBUG DB: Ejecutando consulta con parámetro: {param_tuple}") # NUEVO
+        logger.debug('Ejecutando consulta con parámetro: %s', param_tuple) # NUEVO
 
         cursor.execute(query, param_tuple)
         linked_revals = cursor.fetchall()
         
-        print(f"DEBUG DB: Resultado de fetchall(): {linked_revals}") # NUEVO (Esto es crucial)
-        print(f"DEBUG DB: Número de filas encontradas: {cursor.rowcount}") # NUEVO
+        logger.debug('Resultado de fetchall(): %s', linked_revals) # NUEVO (Esto es crucial)
+        logger.debug('Número de filas encontradas: %s', cursor.rowcount) # NUEVO
 
         return linked_revals if linked_revals else []
     except Error as e:
-        print(f"Error obteniendo revaloraciones vinculadas a anamnesis ID {id_anamnesis_inicial}: {e}")
+        logger.error('Error obteniendo revaloraciones vinculadas a anamnesis ID %s: %s', id_anamnesis_inicial, e)
         return []
     finally:
         if cursor:
@@ -1644,7 +2226,7 @@ def get_plan_cuidado_summary(connection, patient_id):
         summary_list = cursor.fetchall()
         return summary_list if summary_list else []
     except Error as e:
-        print(f"Error obteniendo resumen de planes de cuidado: {e}")
+        logger.error('Error obteniendo resumen de planes de cuidado: %s', e)
         return []
     finally:
         if cursor:
@@ -1652,6 +2234,9 @@ def get_plan_cuidado_summary(connection, patient_id):
 
 def get_specific_plan_cuidado(connection, id_plan):
     """Obtiene los datos de un plan de cuidado específico por su ID único."""
+    en_mapa = _identidad_obtener('plancuidado', ('id', _entero_o_none(id_plan)))
+    if en_mapa is not _SIN_DATO:
+        return en_mapa
     cursor = None
     try:
         # Seleccionar TODAS las columnas de la tabla plancuidado (estructura nueva)
@@ -1671,9 +2256,11 @@ def get_specific_plan_cuidado(connection, id_plan):
                  if key in plan_data and plan_data[key] is not None:
                       try: plan_data[key] = float(plan_data[key])
                       except (ValueError, TypeError): plan_data[key] = 0.0
-        return plan_data # Devuelve diccionario o None
+            _identidad_guardar('plancuidado', ('adicionales', plan_data['id_plan']),
+                               {'id_px': plan_data['id_px'], 'adicionales_ids': plan_data['adicionales_ids']})
+        return _identidad_guardar('plancuidado', ('id', _entero_o_none(id_plan)), plan_data) # Devuelve diccionario o None
     except Error as e:
-        print(f"Error obteniendo plan de cuidado específico por ID {id_plan}: {e}")
+        logger.error('Error obteniendo plan de cuidado específico por ID %s: %s', id_plan, e)
         return None
     finally:
         if cursor:
@@ -1685,7 +2272,7 @@ def get_specific_plan_cuidado_by_date(connection, patient_id, fecha_str):
     try:
         fecha_sql_str = parse_date(fecha_str)
     except ValueError as e:
-        print(f"Error (get_specific_plan_cuidado_by_date): {e}")
+        logger.error('get_specific_plan_cuidado_by_date: %s', e)
         return None
     try:
         # Seleccionar TODAS las columnas
@@ -1709,7 +2296,7 @@ def get_specific_plan_cuidado_by_date(connection, patient_id, fecha_str):
                       except (ValueError, TypeError): plan_data[key] = 0.0
         return plan_data # Devuelve diccionario o None
     except Error as e:
-        print(f"Error obteniendo plan de cuidado específico por fecha (px:{patient_id}, fecha:{fecha_str}): {e}")
+        logger.error('Error obteniendo plan de cuidado específico por fecha (px:%s, fecha:%s): %s', patient_id, fecha_str, e)
         return None
     finally:
         if cursor:
@@ -1724,7 +2311,7 @@ def save_plan_cuidado(connection, data):
     cursor = None
     required_keys = ['id_px', 'id_dr', 'fecha']
     if not all(key in data and data[key] is not None for key in required_keys):
-         print("Error: Faltan id_px, id_dr o fecha en los datos del plan a guardar.")
+         logger.error('Faltan id_px, id_dr o fecha en los datos del plan a guardar.')
          return None
 
     # Columnas específicas de la tabla plancuidado (excluyendo PK y timestamp)
@@ -1739,7 +2326,7 @@ def save_plan_cuidado(connection, data):
         try:
             fecha_sql_str = parse_date(data.get('fecha'))
         except ValueError as e:
-            print(f"Error fatal (save_plan_cuidado): {e}")
+            logger.error('Error fatal (save_plan_cuidado): %s', e)
             raise Error(f"La fecha '{data.get('fecha')}' tiene un formato inválido.")
         
         cursor = connection.cursor()
@@ -1765,7 +2352,7 @@ def save_plan_cuidado(connection, data):
             values_list_update.append(id_to_update)
             
             values = tuple(values_list_update)
-            print(f"Actualizando plan de cuidado (Python-side) para ID: {id_to_update}")
+            logger.debug('Actualizando plan de cuidado (Python-side) para ID: %s', id_to_update)
         else:
             # --- INSERT ---
             data_columns_no_fecha = [col for col in data_columns if col != 'fecha']
@@ -1781,9 +2368,10 @@ def save_plan_cuidado(connection, data):
                 data.get('ahorro_calculado', 0.0), data.get('adicionales_ids'), data.get('notas_plan')
             ]
             values = tuple(values_list_insert)
-            print(f"Insertando nuevo plan de cuidado (Python-side) para ID_PX: {data.get('id_px')} en Fecha: {fecha_sql_str}")
+            logger.debug('Insertando nuevo plan de cuidado (Python-side) para ID_PX: %s en Fecha: %s', data.get('id_px'), fecha_sql_str)
 
         cursor.execute(query, values)
+        _olvidar_identidad('plancuidado')
 
         if not id_to_update:
             saved_id = cursor.lastrowid
@@ -1791,10 +2379,10 @@ def save_plan_cuidado(connection, data):
             saved_id = id_to_update
 
         # NO HACER COMMIT AQUÍ
-        print(f"Operación en 'plancuidado' lista para commit. ID afectado/nuevo: {saved_id}")
+        logger.debug("Operación en 'plancuidado' lista para commit. ID afectado/nuevo: %s", saved_id)
         return saved_id
     except Error as e:
-        print(f"Error guardando/actualizando plan de cuidado: {e}")
+        logger.error('Error guardando/actualizando plan de cuidado: %s', e)
         return None
     finally:
         if cursor:
@@ -1802,59 +2390,12 @@ def save_plan_cuidado(connection, data):
 
 def get_productos_servicios_by_type(connection, tipo_adicional=1):
     """Obtiene productos/servicios filtrados por tipo (ej: 1=Adicionales, 2=Terapia Física)."""
-    cursor = None
-    try:
-        query = """
-            SELECT id_prod, nombre, venta as costo # Asumimos que 'venta' es el costo al paciente
-            FROM productos_servicios
-            WHERE adicional = %s
-            ORDER BY nombre ASC
-        """
-        cursor = connection.cursor(dictionary=True, buffered=True)
-        cursor.execute(query, (tipo_adicional,))
-        productos = cursor.fetchall()
-        # Convertir costo a float por seguridad
-        if productos:
-            for prod in productos:
-                if 'costo' in prod and prod['costo'] is not None:
-                     try: prod['costo'] = float(prod['costo'])
-                     except (ValueError, TypeError): prod['costo'] = 0.0
-        return productos if productos else []
-    except Error as e:
-        print(f"Error obteniendo productos/servicios (tipo {tipo_adicional}): {e}")
-        return []
-    finally:
-        if cursor:
-            cursor.close()
-
-def get_all_doctors(connection, centro_id=None):
-    """Obtiene una lista de doctores (ID y Nombre), opcionalmente filtrada por centro."""
-    cursor = None
-    try:
-        if centro_id is not None:
-            # Filtrar por centro si se proporciona
-            query = "SELECT id_dr, nombre FROM dr WHERE centro = %s ORDER BY nombre ASC"
-            params = (centro_id,)
-        else:
-            # Obtener todos si no se filtra
-            query = "SELECT id_dr, nombre FROM dr ORDER BY nombre ASC"
-            params = ()
-
-        cursor = connection.cursor(dictionary=True, buffered=True)
-        cursor.execute(query, params)
-        doctors = cursor.fetchall()
-        return doctors if doctors else []
-    except Error as e:
-        print(f"Error obteniendo lista de doctores (centro={centro_id}): {e}")
+    catalogo = _catalogo(connection, 'productos')
+    if catalogo is None:
         return []
-    finally:
-        if cursor:
-            cursor.close()
-
-# Asegúrate que get_terapias_fisicas ahora llame a la nueva función genérica:
-def get_terapias_fisicas(connection):
-    """Obtiene la lista de terapias físicas disponibles (adicional=2)."""
-    return get_productos_servicios_by_type(connection, tipo_adicional=2)
+    # 'costo' es el precio al paciente (columna 'venta')
+    return [{'id_prod': p['id_prod'], 'nombre': p['nombre'], 'costo': p['venta']}
+            for p in catalogo.por('adicional', tipo_adicional)]
 
 def get_productos_by_ids(connection, ids_list):
     """Obtiene detalles de productos/servicios basados en una lista de IDs, incluyendo el costo."""
@@ -1887,7 +2428,7 @@ def get_productos_by_ids(connection, ids_list):
                     prod['costo'] = 0.0
         return productos if productos else []
     except Error as e:
-        print(f"Error obteniendo productos por IDs ({valid_ids}): {e}")
+        logger.error('Error obteniendo productos por IDs (%s): %s', valid_ids, e)
         return []
     finally:
         if cursor:
@@ -1895,20 +2436,36 @@ def get_productos_by_ids(connection, ids_list):
 
 def get_producto_costo_interno(connection, id_prod):
     """Función auxiliar para obtener solo el costo interno de un producto."""
-    cursor = None
-    try:
-        query = "SELECT costo FROM productos_servicios WHERE id_prod = %s"
-        cursor = connection.cursor(dictionary=True, buffered=True)
-        cursor.execute(query, (id_prod,))
-        result = cursor.fetchone()
-        if result and result['costo'] is not None:
-            return float(result['costo'])
-        return 0.00 # Default si no se encuentra o el costo es NULL
-    except Error as e:
-        print(f"Error obteniendo costo interno para producto ID {id_prod}: {e}")
-        return 0.00 # Retornar un default en caso de error
-    finally:
-        if cursor: cursor.close()
+    catalogo = _catalogo(connection, 'productos')
+    producto = catalogo.por_id.get(_entero_o_none(id_prod)) if catalogo else None
+    if producto and producto['costo'] is not None:
+        return producto['costo']
+    return 0.00 # Default si no se encuentra o el costo es NULL
+
+def get_costos_internos_productos(connection, ids_prod):
+    """
+    Costo interno de varios productos a la vez: {id_prod: costo} (0.0 si es NULL o no existe).
+    Usa el catálogo en caché si está vigente; si no, una sola consulta con IN.
+    """
+    ids = sorted({i for i in (_entero_o_none(id_prod) for id_prod in ids_prod) if i is not None})
+    if not ids:
+        return {}
+    catalogo = _catalogo(connection, 'productos', solo_cache=True)
+    if catalogo is not None:
+        costos = {id_prod: catalogo.por_id[id_prod]['costo'] for id_prod in ids if id_prod in catalogo.por_id}
+    else:
+        cursor = None
+        costos = {}
+        try:
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor = connection.cursor(buffered=True)
+            cursor.execute(f"SELECT id_prod, costo FROM productos_servicios WHERE id_prod IN ({placeholders})", tuple(ids))
+            costos = {id_prod: float(costo) if costo is not None else None for id_prod, costo in cursor.fetchall()}
+        except Error as e:
+            logger.error('Error obteniendo costos internos para productos %s: %s', ids, e)
+        finally:
+            if cursor: cursor.close()
+    return {id_prod: costos.get(id_prod) if costos.get(id_prod) is not None else 0.00 for id_prod in ids}
 
 def update_patient_details(connection, patient_data):
     """
@@ -1918,7 +2475,7 @@ def update_patient_details(connection, patient_data):
     cursor = None
     required_keys = ['id_px'] # Solo se necesita el ID para el WHERE
     if 'id_px' not in patient_data:
-        print("Error: Falta 'id_px' para actualizar paciente.")
+        logger.error("Falta 'id_px' para actualizar paciente.")
         return False
 
     # Columnas que se pueden actualizar (excluyendo id_px, id_dr, fecha de registro original)
@@ -1938,7 +2495,7 @@ def update_patient_details(connection, patient_data):
             values.append(patient_data[col])
 
     if not set_parts: # No hay nada que actualizar
-        print("Advertencia: No se proporcionaron campos para actualizar en update_patient_details.")
+        logger.warning('Advertencia: No se proporcionaron campos para actualizar en update_patient_details.')
         return True # Técnicamente no es un error si no se actualizó nada
 
     try:
@@ -1948,59 +2505,36 @@ def update_patient_details(connection, patient_data):
         
         values.append(patient_data['id_px']) # Añadir id_px para el WHERE
         
-        print(f"DEBUG DB UPDATE Paciente Query: {query}")
-        print(f"DEBUG DB UPDATE Paciente Values: {tuple(values)}")
+        logger.debug('UPDATE Paciente Query: %s', query)
 
         cursor.execute(query, tuple(values))
         # connection.commit() # Asumiendo autocommit=True o se hace en la ruta
+        filas_actualizadas = cursor.rowcount
+        _olvidar_identidad('datos_personales')
+
+        # Si cambió el nombre, actualizar el índice de búsqueda (con los valores ya guardados)
+        if filas_actualizadas > 0 and any(col in patient_data for col in ('nombre', 'apellidop', 'apellidom')):
+            cursor.execute("SELECT nombre, apellidop, apellidom FROM datos_personales WHERE id_px = %s",
+                           (patient_data['id_px'],))
+            filas = cursor.fetchall()
+            if filas:
+                _indexar_nombre_paciente(cursor, patient_data['id_px'], *filas[0])
         
-        if cursor.rowcount > 0:
-            print(f"Datos del paciente ID: {patient_data['id_px']} actualizados exitosamente.")
+        if filas_actualizadas > 0:
+            logger.debug('Datos del paciente ID: %s actualizados exitosamente.', patient_data['id_px'])
             return True
         else:
-            print(f"No se actualizó ninguna fila para el paciente ID: {patient_data['id_px']} (quizás los datos eran los mismos).")
+            logger.debug('No se actualizó ninguna fila para el paciente ID: %s (quizás los datos eran los mismos).', patient_data['id_px'])
             return True # O False si quieres que indique que no hubo cambios
             
     except Error as e:
-        print(f"Error actualizando datos del paciente ID {patient_data.get('id_px')}: {e}")
+        logger.error('Error actualizando datos del paciente ID %s: %s', patient_data.get('id_px'), e)
         # if connection: connection.rollback() # Si no usas autocommit
         return False
     finally:
         if cursor:
             cursor.close()
 
-def get_productos_servicios_venta(connection):
-    """
-    Obtiene productos/servicios disponibles para agregar a un recibo.
-    (Ej: Todos excepto los de tipo 'Terapia Física Seguimiento').
-    Devuelve lista de diccionarios con id_prod, nombre, venta (costo).
-    """
-    cursor = None
-    try:
-        # Excluimos adicional=2 (Terapias de Seguimiento) por defecto, ajusta si es necesario
-        query = """
-            SELECT id_prod, nombre, venta
-            FROM productos_servicios
-            WHERE adicional != 2 OR adicional IS NULL
-            ORDER BY nombre ASC
-        """
-        cursor = connection.cursor(dictionary=True, buffered=True)
-        cursor.execute(query)
-        productos = cursor.fetchall()
-        # Convertir venta a float
-        if productos:
-            for prod in productos:
-                if 'venta' in prod and prod['venta'] is not None:
-                    try: prod['venta'] = float(prod['venta'])
-                    except (ValueError, TypeError): prod['venta'] = 0.0
-        return productos if productos else []
-    except Error as e:
-        print(f"Error obteniendo productos/servicios para venta: {e}")
-        return []
-    finally:
-        if cursor:
-            cursor.close()
-
 def save_recibo(connection, datos_recibo, detalles_recibo):
     """
     Guarda un nuevo recibo y sus detalles.
@@ -2013,13 +2547,13 @@ def save_recibo(connection, datos_recibo, detalles_recibo):
     required_detalle = ['id_prod', 'cantidad', 'costo_unitario_venta', 'subtotal_linea_neto']
 
     if not all(key in datos_recibo for key in required_recibo):
-        print("Error: Faltan datos requeridos para guardar el recibo principal.")
+        logger.error('Faltan datos requeridos para guardar el recibo principal.')
         return None
     if not isinstance(detalles_recibo, list) or not detalles_recibo:
-        print("Error: Se requiere al menos una línea de detalle para guardar el recibo.")
+        logger.error('Se requiere al menos una línea de detalle para guardar el recibo.')
         return None
     if not all(all(key in detalle for key in required_detalle) for detalle in detalles_recibo):
-         print("Error: Faltan datos requeridos en una o más líneas de detalle del recibo.")
+         logger.error('Faltan datos requeridos en una o más líneas de detalle del recibo.')
          return None
 
     try:
@@ -2035,7 +2569,7 @@ def save_recibo(connection, datos_recibo, detalles_recibo):
                 fecha_sql_str = str(fecha_obj) # Fallback por si acaso
 
         except ValueError as e:
-            print(f"Error fatal (save_recibo): {e}")
+            logger.error('Error fatal (save_recibo): %s', e)
             raise Error(f"La fecha '{datos_recibo.get('fecha')}' tiene un formato inválido.")
         
         cursor = connection.cursor()
@@ -2061,21 +2595,14 @@ def save_recibo(connection, datos_recibo, detalles_recibo):
         )
         cursor.execute(sql_recibo, valores_recibo)
         id_nuevo_recibo = cursor.lastrowid
-        print(f"DEBUG DB: Insertado recibo principal con ID: {id_nuevo_recibo}")
+        logger.debug('Insertado recibo principal con ID: %s', id_nuevo_recibo)
+
+        # Costo interno actual de todos los productos del recibo (una consulta o desde la caché)
+        costos_internos = get_costos_internos_productos(connection, [d['id_prod'] for d in detalles_recibo])
 
-        # --- CAMBIO: Modificar INSERT para incluir costo_unitario_compra ---
-        sql_detalle = """
-            INSERT INTO recibo_detalle
-            (id_recibo, id_prod, cantidad, descripcion_prod, 
-             costo_unitario_venta, costo_unitario_compra,  -- Nueva columna
-             descuento_linea, subtotal_linea_neto)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """
         valores_detalles_final = []
         for detalle in detalles_recibo:
-            # Obtener el costo interno actual del producto
-            costo_interno_actual = get_producto_costo_interno(connection, detalle['id_prod'])
-            
+            costo_interno_actual = costos_internos.get(_entero_o_none(detalle['id_prod']), 0.00)
             valores_detalles_final.append((
                 id_nuevo_recibo,
                 detalle['id_prod'],
@@ -2087,12 +2614,21 @@ def save_recibo(connection, datos_recibo, detalles_recibo):
                 detalle['subtotal_linea_neto']
             ))
 
-        cursor.executemany(sql_detalle, valores_detalles_final)
-        print(f"DEBUG DB: Insertados {len(valores_detalles_final)} detalles para recibo ID: {id_nuevo_recibo}")
+        # Todas las líneas en un solo INSERT de varias filas
+        sql_detalle = f"""
+            INSERT INTO recibo_detalle
+            (id_recibo, id_prod, cantidad, descripcion_prod,
+             costo_unitario_venta, costo_unitario_compra,
+             descuento_linea, subtotal_linea_neto)
+            VALUES {', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s)'] * len(valores_detalles_final))}
+        """
+        cursor.execute(sql_detalle, tuple(v for fila in valores_detalles_final for v in fila))
+        logger.debug('Insertados %s detalles para recibo ID: %s', len(valores_detalles_final), id_nuevo_recibo)
+        _acumular_resumen_ingresos(cursor, id_nuevo_recibo)
 
         return id_nuevo_recibo
     except Error as e:
-        print(f"Error en save_recibo (con costo_unitario_compra): {e}")
+        logger.error('Error en save_recibo (con costo_unitario_compra): %s', e)
         # Considera re-lanzar 'e' si el llamador (main.py) debe manejar el rollback
         # raise e 
         return None
@@ -2126,7 +2662,7 @@ def get_recibos_summary(connection, patient_id):
                      except (ValueError, TypeError): recibo['total_neto'] = 0.0
         return summary if summary else []
     except Error as e:
-        print(f"Error obteniendo resumen de recibos: {e}")
+        logger.error('Error obteniendo resumen de recibos: %s', e)
         return []
     finally:
         if cursor:
@@ -2193,7 +2729,7 @@ def get_specific_recibo(connection, id_recibo):
         return recibo_completo
 
     except Error as e:
-        print(f"Error obteniendo recibo específico ID {id_recibo}: {e}")
+        logger.error('Error obteniendo recibo específico ID %s: %s', id_recibo, e)
         return None
     finally:
         if cursor:
@@ -2229,7 +2765,7 @@ def get_active_plans_for_patient(connection, patient_id):
 
         return plans if plans else []
     except Error as e:
-        print(f"Error obteniendo planes de cuidado activos para paciente {patient_id}: {e}")
+        logger.error('Error obteniendo planes de cuidado activos para paciente %s: %s', patient_id, e)
         return []
     finally:
         if cursor:
@@ -2254,7 +2790,7 @@ def get_seguimientos_for_plan(connection, id_plan_cuidado):
         seguimientos_del_plan = cursor.fetchall()
         return seguimientos_del_plan if seguimientos_del_plan else []
     except Error as e:
-        print(f"Error obteniendo seguimientos para plan ID {id_plan_cuidado}: {e}")
+        logger.error('Error obteniendo seguimientos para plan ID %s: %s', id_plan_cuidado, e)
         return []
     finally:
         if cursor:
@@ -2262,51 +2798,18 @@ def get_seguimientos_for_plan(connection, id_plan_cuidado):
 
 def get_all_productos_servicios(connection, include_inactive=True): # Nuevo parámetro
     """Obtiene todos los productos y servicios, opcionalmente filtrando por activos."""
-    cursor = None
-    try:
-        query = "SELECT id_prod, nombre, costo, venta, adicional, esta_activo FROM productos_servicios"
-        if not include_inactive:
-            query += " WHERE esta_activo = 1" # Solo activos
-        query += " ORDER BY adicional ASC, nombre ASC" 
-        
-        cursor = connection.cursor(dictionary=True, buffered=True)
-        cursor.execute(query)
-        productos = cursor.fetchall()
-        if productos:
-            for prod in productos:
-                for key in ['costo', 'venta']:
-                    if key in prod and prod[key] is not None:
-                        try: prod[key] = float(prod[key])
-                        except (ValueError, TypeError): prod[key] = 0.0
-                # Convertir esta_activo a booleano para la lógica
-                prod['esta_activo'] = bool(prod.get('esta_activo', 0))
-        return productos if productos else []
-    except Error as e:
-        print(f"Error obteniendo productos/servicios: {e}")
+    catalogo = _catalogo(connection, 'productos')
+    if catalogo is None:
         return []
-    finally:
-        if cursor: cursor.close()
+    productos = [dict(p) for p in catalogo.filas if include_inactive or p['esta_activo']]
+    # Mismo orden que 'ORDER BY adicional ASC, nombre ASC' (NULL primero); sorted es estable
+    return sorted(productos, key=lambda p: (p['adicional'] is not None, p['adicional'] or 0))
 
 def get_producto_servicio_by_id(connection, id_prod):
     """Obtiene un producto/servicio específico por su ID, incluyendo su estado activo."""
-    cursor = None
-    try:
-        query = "SELECT id_prod, nombre, costo, venta, adicional, esta_activo FROM productos_servicios WHERE id_prod = %s" # Añadir esta_activo
-        cursor = connection.cursor(dictionary=True, buffered=True)
-        cursor.execute(query, (id_prod,))
-        producto = cursor.fetchone()
-        if producto:
-            for key in ['costo', 'venta']:
-                if key in producto and producto[key] is not None:
-                    try: producto[key] = float(producto[key])
-                    except (ValueError, TypeError): producto[key] = 0.0
-            producto['esta_activo'] = bool(producto.get('esta_activo', 0))
-        return producto
-    except Error as e:
-        print(f"Error obteniendo producto/servicio por ID {id_prod}: {e}")
-        return None
-    finally:
-        if cursor: cursor.close()
+    catalogo = _catalogo(connection, 'productos')
+    producto = catalogo.por_id.get(_entero_o_none(id_prod)) if catalogo else None
+    return dict(producto) if producto else None
 
 def add_producto_servicio(connection, data):
     """Añade un nuevo producto/servicio. 'data' es un diccionario.
@@ -2316,7 +2819,7 @@ def add_producto_servicio(connection, data):
     cursor = None
     required_keys = ['nombre', 'venta', 'adicional']
     if not all(key in data for key in required_keys):
-        print("Error: Faltan datos requeridos para añadir producto/servicio.")
+        logger.error('Faltan datos requeridos para añadir producto/servicio.')
         return None
     try:
         cursor = connection.cursor()
@@ -2333,10 +2836,11 @@ def add_producto_servicio(connection, data):
         )
         cursor.execute(query, values)
         new_id = cursor.lastrowid
-        print(f"Producto/servicio añadido con ID: {new_id}")
+        _incrementar_version_catalogo(cursor, 'productos')
+        logger.debug('Producto/servicio añadido con ID: %s', new_id)
         return new_id
     except Error as e:
-        print(f"Error añadiendo producto/servicio: {e}")
+        logger.error('Error añadiendo producto/servicio: %s', e)
         return None
     finally:
         if cursor: cursor.close()
@@ -2348,7 +2852,7 @@ def update_producto_servicio(connection, data):
     cursor = None
     required_keys = ['id_prod', 'nombre', 'venta', 'adicional'] # esta_activo puede ser opcional en data
     if not all(key in data for key in required_keys):
-        print("Error: Faltan datos requeridos para actualizar producto/servicio.")
+        logger.error('Faltan datos requeridos para actualizar producto/servicio.')
         return False
     try:
         cursor = connection.cursor()
@@ -2367,12 +2871,13 @@ def update_producto_servicio(connection, data):
         )
         cursor.execute(query, values)
         if cursor.rowcount > 0:
-            print(f"Producto/servicio ID {data['id_prod']} actualizado.")
+            _incrementar_version_catalogo(cursor, 'productos')
+            logger.debug('Producto/servicio ID %s actualizado.', data['id_prod'])
             return True
-        print(f"Producto/servicio ID {data['id_prod']} no encontrado o datos sin cambios.")
+        logger.debug('Producto/servicio ID %s no encontrado o datos sin cambios.', data['id_prod'])
         return False
     except Error as e:
-        print(f"Error actualizando producto/servicio ID {data.get('id_prod')}: {e}")
+        logger.error('Error actualizando producto/servicio ID %s: %s', data.get('id_prod'), e)
         return False
     finally:
         if cursor: cursor.close()
@@ -2390,13 +2895,14 @@ def set_producto_servicio_active_status(connection, id_prod, status):
         db_status = 1 if status else 0
         cursor.execute(query, (db_status, id_prod))
         if cursor.rowcount > 0:
+            _incrementar_version_catalogo(cursor, 'productos')
             action = "habilitado" if status else "deshabilitado"
-            print(f"Producto/servicio ID {id_prod} {action}.")
+            logger.debug('Producto/servicio ID %s %s.', id_prod, action)
             return True
-        print(f"Producto/servicio ID {id_prod} no encontrado.")
+        logger.debug('Producto/servicio ID %s no encontrado.', id_prod)
         return False
     except Error as e:
-        print(f"Error cambiando estado de producto/servicio ID {id_prod}: {e}")
+        logger.error('Error cambiando estado de producto/servicio ID %s: %s', id_prod, e)
         return False
     finally:
         if cursor: cursor.close()
@@ -2407,36 +2913,12 @@ def get_productos_servicios_venta(connection):
     Obtiene productos/servicios ACTIVOS disponibles para agregar a un recibo.
     Devuelve id_prod, nombre, venta (precio al público), y costo (interno).
     """
-    cursor = None
-    try:
-        # --- CAMBIO: Añadir 'costo' a la selección ---
-        query = """
-            SELECT id_prod, nombre, venta, costo 
-            FROM productos_servicios
-            WHERE (adicional != 2 OR adicional IS NULL) AND esta_activo = 1
-            ORDER BY nombre ASC
-        """
-        cursor = connection.cursor(dictionary=True, buffered=True)
-        cursor.execute(query)
-        productos = cursor.fetchall()
-        if productos:
-            for prod in productos:
-                if 'venta' in prod and prod['venta'] is not None:
-                    try: prod['venta'] = float(prod['venta'])
-                    except (ValueError, TypeError): prod['venta'] = 0.0
-                # --- CAMBIO: Formatear también el costo ---
-                if 'costo' in prod and prod['costo'] is not None:
-                    try: prod['costo'] = float(prod['costo'])
-                    except (ValueError, TypeError): prod['costo'] = 0.0
-                else: # Si el costo es NULL en la BD, asignarle 0.0
-                    prod['costo'] = 0.0
-        return productos if productos else []
-    except Error as e:
-        print(f"Error obteniendo productos/servicios activos para venta: {e}")
+    catalogo = _catalogo(connection, 'productos')
+    if catalogo is None:
         return []
-    finally:
-        if cursor: cursor.close()
-
+    return [{'id_prod': p['id_prod'], 'nombre': p['nombre'], 'venta': p['venta'],
+             'costo': p['costo'] if p['costo'] is not None else 0.0}
+            for p in catalogo.filas if p['adicional'] != 2 and p['esta_activo']]
 
 def search_productos_servicios(connection, search_term):
     """ Busca productos/servicios ACTIVOS por nombre para autocompletado. """
@@ -2461,26 +2943,18 @@ def search_productos_servicios(connection, search_term):
                     except (ValueError, TypeError): prod['venta'] = 0.0
         return productos if productos else []
     except Error as e:
-        print(f"Error buscando productos/servicios activos ('{search_term}'): {e}")
+        logger.error("Error buscando productos/servicios activos ('%s'): %s", search_term, e)
         return []
     finally:
         if cursor: cursor.close()
 
 def get_terapias_fisicas(connection): # Las terapias para seguimiento también deben estar activas
     """Obtiene la lista de terapias físicas (adicional=2) ACTIVAS."""
-    cursor = None
-    try:
-        query = "SELECT id_prod, nombre FROM productos_servicios WHERE adicional = 2 AND esta_activo = 1 ORDER BY nombre ASC" # <-- SOLO ACTIVAS
-        # ... (resto de la función como antes) ...
-        cursor = connection.cursor(dictionary=True, buffered=True)
-        cursor.execute(query)
-        therapies = cursor.fetchall()
-        return therapies if therapies else []
-    except Error as e:
-        print(f"Error obteniendo terapias físicas activas: {e}")
+    catalogo = _catalogo(connection, 'productos')
+    if catalogo is None:
         return []
-    finally:
-        if cursor: cursor.close()
+    return [{'id_prod': p['id_prod'], 'nombre': p['nombre']}
+            for p in catalogo.por('adicional', 2) if p['esta_activo']]
 
 def get_all_doctors(connection, include_inactive=True, filter_by_centro_id=None): # Nuevo parámetro
     """
@@ -2489,39 +2963,19 @@ def get_all_doctors(connection, include_inactive=True, filter_by_centro_id=None)
     - filter_by_centro_id: Si se provee un ID de centro, filtra por ese centro.
                          Si es None, no filtra por centro (útil para admin).
     """
-    cursor = None
-    try:
-        query_base = "SELECT id_dr, nombre, usuario, centro, esta_activo FROM dr"
-        conditions = []
-        params = []
-
-        if not include_inactive:
-            conditions.append("esta_activo = 1")
-        
-        if filter_by_centro_id is not None: # Solo filtrar si se proporciona un ID de centro
-            conditions.append("centro = %s")
-            params.append(filter_by_centro_id)
-
-        if conditions:
-            query_base += " WHERE " + " AND ".join(conditions)
-        
-        query_base += " ORDER BY nombre ASC"
-        
-        cursor = connection.cursor(dictionary=True, buffered=True)
-        cursor.execute(query_base, tuple(params)) # Pasar la tupla de parámetros
-        doctores = cursor.fetchall()
-
-        if doctores:
-            for dr in doctores:
-                dr['esta_activo'] = bool(dr.get('esta_activo', 0))
-                dr['is_admin_role'] = (dr.get('centro') == 0) 
-        return doctores if doctores else []
-    except Error as e:
-        print(f"Error obteniendo doctores: {e}")
+    catalogo = _catalogo(connection, 'doctores')
+    if catalogo is None:
         return []
-    finally:
-        if cursor:
-            cursor.close()
+    doctores = catalogo.filas
+    if filter_by_centro_id is not None: # Solo filtrar si se proporciona un ID de centro
+        doctores = catalogo.por('centro', _entero_o_none(filter_by_centro_id))
+    return [dict(dr) for dr in doctores if include_inactive or dr['esta_activo']]
+
+def get_nombre_doctor(connection, id_dr, default=None):
+    """Nombre de un doctor por su ID (desde el catálogo), o 'default' si no existe."""
+    catalogo = _catalogo(connection, 'doctores')
+    doctor = catalogo.por_id.get(_entero_o_none(id_dr)) if catalogo else None
+    return doctor['nombre'] if doctor else default
 
 def get_doctor_by_id(connection, id_dr):
     """Obtiene un doctor específico por su ID, incluyendo su estado activo."""
@@ -2537,7 +2991,7 @@ def get_doctor_by_id(connection, id_dr):
             doctor['is_admin_role'] = (doctor.get('centro') == 0)
         return doctor # Devuelve el diccionario del doctor o None si no se encuentra
     except Error as e:
-        print(f"Error obteniendo doctor por ID {id_dr}: {e}")
+        logger.error('Error obteniendo doctor por ID %s: %s', id_dr, e)
         return None
     finally:
         if cursor:
@@ -2552,7 +3006,7 @@ def update_doctor_details(connection, data):
     cursor = None
     required_keys = ['id_dr', 'nombre', 'usuario'] # 'centro' y 'esta_activo' pueden ser opcionales
     if 'id_dr' not in data:
-        print("Error: Falta 'id_dr' para actualizar doctor.")
+        logger.error("Falta 'id_dr' para actualizar doctor.")
         return False
 
     # Columnas que se pueden actualizar
@@ -2568,7 +3022,7 @@ def update_doctor_details(connection, data):
             values.append(value_to_add)
 
     if not set_parts:
-        print("Advertencia: No se proporcionaron campos para actualizar en update_doctor_details.")
+        logger.warning('Advertencia: No se proporcionaron campos para actualizar en update_doctor_details.')
         return True # No es error si no hay nada que actualizar
 
     try:
@@ -2577,17 +3031,17 @@ def update_doctor_details(connection, data):
         query = f"UPDATE dr SET {set_clause} WHERE id_dr=%s"
         values.append(data['id_dr']) # Añadir id_dr para el WHERE
         
-        print(f"DEBUG DB UPDATE Doctor Query: {query}")
-        print(f"DEBUG DB UPDATE Doctor Values: {tuple(values)}")
+        logger.debug('UPDATE Doctor Query: %s', query)
         
         cursor.execute(query, tuple(values))
         if cursor.rowcount > 0:
-            print(f"Detalles del doctor ID {data['id_dr']} actualizados.")
+            _incrementar_version_catalogo(cursor, 'doctores')
+            logger.debug('Detalles del doctor ID %s actualizados.', data['id_dr'])
             return True
-        print(f"Doctor ID {data['id_dr']} no encontrado o datos sin cambios.")
+        logger.debug('Doctor ID %s no encontrado o datos sin cambios.', data['id_dr'])
         return True # Considerar True si no hubo error, aunque no haya filas afectadas
     except Error as e:
-        print(f"Error actualizando detalles del doctor ID {data.get('id_dr')}: {e}")
+        logger.error('Error actualizando detalles del doctor ID %s: %s', data.get('id_dr'), e)
         # Manejo de error de duplicidad de usuario (código 1062)
         if e.errno == 1062: # Duplicate entry
             raise ValueError(f"El nombre de usuario '{data.get('usuario')}' ya está en uso.")
@@ -2603,7 +3057,7 @@ def update_doctor_password(connection, id_dr, new_password_plain):
     """
     cursor = None
     if not new_password_plain:
-        print("Error: La nueva contraseña no puede estar vacía.")
+        logger.error('La nueva contraseña no puede estar vacía.')
         return False
     try:
         cursor = connection.cursor()
@@ -2611,12 +3065,12 @@ def update_doctor_password(connection, id_dr, new_password_plain):
         query = "UPDATE dr SET contraseña = %s WHERE id_dr = %s"
         cursor.execute(query, (hashed_password, id_dr))
         if cursor.rowcount > 0:
-            print(f"Contraseña del doctor ID {id_dr} actualizada.")
+            logger.debug('Contraseña del doctor ID %s actualizada.', id_dr)
             return True
-        print(f"Doctor ID {id_dr} no encontrado para actualizar contraseña.")
+        logger.debug('Doctor ID %s no encontrado para actualizar contraseña.', id_dr)
         return False
     except Error as e:
-        print(f"Error actualizando contraseña del doctor ID {id_dr}: {e}")
+        logger.error('Error actualizando contraseña del doctor ID %s: %s', id_dr, e)
         return False
     finally:
         if cursor:
@@ -2634,13 +3088,14 @@ def set_doctor_active_status(connection, id_dr, status):
         db_status = 1 if status else 0 # Convertir booleano a int
         cursor.execute(query, (db_status, id_dr))
         if cursor.rowcount > 0:
+            _incrementar_version_catalogo(cursor, 'doctores')
             action = "habilitado" if status else "deshabilitado"
-            print(f"Doctor ID {id_dr} {action}.")
+            logger.debug('Doctor ID %s %s.', id_dr, action)
             return True
-        print(f"Doctor ID {id_dr} no encontrado para cambiar estado.")
+        logger.debug('Doctor ID %s no encontrado para cambiar estado.', id_dr)
         return False
     except Error as e:
-        print(f"Error cambiando estado del doctor ID {id_dr}: {e}")
+        logger.error('Error cambiando estado del doctor ID %s: %s', id_dr, e)
         return False
     finally:
         if cursor:
@@ -2655,7 +3110,7 @@ def count_total_pacientes(connection):
         result = cursor.fetchone()
         return result['total_pacientes'] if result and 'total_pacientes' in result else 0
     except Error as e:
-        print(f"Error contando pacientes: {e}")
+        logger.error('Error contando pacientes: %s', e)
         return 0
     finally:
         if cursor:
@@ -2670,7 +3125,7 @@ def count_total_doctores(connection):
         result = cursor.fetchone()
         return result['total_doctores'] if result and 'total_doctores' in result else 0
     except Error as e:
-        print(f"Error contando doctores: {e}")
+        logger.error('Error contando doctores: %s', e)
         return 0
     finally:
         if cursor:
@@ -2686,7 +3141,7 @@ def count_seguimientos_hoy(connection, fecha_hoy_str_ddmmyyyy):
         result = cursor.fetchone()
         return result['total_seguimientos_hoy'] if result and 'total_seguimientos_hoy' in result else 0
     except Error as e:
-        print(f"Error contando seguimientos de hoy: {e}")
+        logger.error('Error contando seguimientos de hoy: %s', e)
         return 0
     finally:
         if cursor:
@@ -2695,42 +3150,21 @@ def count_seguimientos_hoy(connection, fecha_hoy_str_ddmmyyyy):
 
 def get_all_centros(connection):
     """Obtiene todos los centros/clínicas registrados."""
-    cursor = None
-    try:
-        query = "SELECT id_centro, nombre, direccion, cel, tel FROM centro ORDER BY nombre ASC"
-        cursor = connection.cursor(dictionary=True, buffered=True)
-        cursor.execute(query)
-        centros = cursor.fetchall()
-        return centros if centros else []
-    except Error as e:
-        print(f"Error obteniendo todos los centros: {e}")
-        return []
-    finally:
-        if cursor:
-            cursor.close()
+    catalogo = _catalogo(connection, 'centros')
+    return [dict(c) for c in catalogo.filas] if catalogo else []
 
 def get_centro_by_id(connection, id_centro):
     """Obtiene un centro/clínica específico por su ID."""
-    cursor = None
-    try:
-        query = "SELECT id_centro, nombre, direccion, cel, tel FROM centro WHERE id_centro = %s"
-        cursor = connection.cursor(dictionary=True, buffered=True)
-        cursor.execute(query, (id_centro,))
-        centro = cursor.fetchone()
-        return centro
-    except Error as e:
-        print(f"Error obteniendo centro por ID {id_centro}: {e}")
-        return None
-    finally:
-        if cursor:
-            cursor.close()
+    catalogo = _catalogo(connection, 'centros')
+    centro = catalogo.por_id.get(_entero_o_none(id_centro)) if catalogo else None
+    return dict(centro) if centro else None
 
 def add_centro(connection, data):
     """Añade un nuevo centro/clínica. 'data' es un diccionario. NO HACE COMMIT."""
     cursor = None
     required_keys = ['nombre'] # Mínimo requerido
     if not all(key in data for key in required_keys):
-        print("Error: Falta 'nombre' para añadir centro.")
+        logger.error("Falta 'nombre' para añadir centro.")
         return None
     try:
         cursor = connection.cursor()
@@ -2746,10 +3180,11 @@ def add_centro(connection, data):
         )
         cursor.execute(query, values)
         new_id = cursor.lastrowid
-        print(f"Centro añadido con ID: {new_id}")
+        _incrementar_version_catalogo(cursor, 'centros')
+        logger.debug('Centro añadido con ID: %s', new_id)
         return new_id
     except Error as e:
-        print(f"Error añadiendo centro: {e}")
+        logger.error('Error añadiendo centro: %s', e)
         return None
     finally:
         if cursor:
@@ -2760,7 +3195,7 @@ def update_centro(connection, data):
     cursor = None
     required_keys = ['id_centro', 'nombre']
     if not all(key in data for key in required_keys):
-        print("Error: Faltan datos ('id_centro', 'nombre') para actualizar centro.")
+        logger.error("Faltan datos ('id_centro', 'nombre') para actualizar centro.")
         return False
     try:
         cursor = connection.cursor()
@@ -2778,124 +3213,251 @@ def update_centro(connection, data):
         )
         cursor.execute(query, values)
         if cursor.rowcount > 0:
-            print(f"Centro ID {data['id_centro']} actualizado.")
+            _incrementar_version_catalogo(cursor, 'centros')
+            logger.debug('Centro ID %s actualizado.', data['id_centro'])
             return True
-        print(f"Centro ID {data['id_centro']} no encontrado o datos sin cambios.")
+        logger.debug('Centro ID %s no encontrado o datos sin cambios.', data['id_centro'])
         return False # O True si no hubo error pero no se modificó
     except Error as e:
-        print(f"Error actualizando centro ID {data.get('id_centro')}: {e}")
+        logger.error('Error actualizando centro ID %s: %s', data.get('id_centro'), e)
         return False
     finally:
         if cursor:
             cursor.close()
 
-def get_ingresos_por_periodo(connection, fecha_inicio_str, fecha_fin_str, doctor_id=None):
+# --- Resumen diario de ingresos (tabla resumen_ingresos_diario, migración 004) ---
+# Una fila por fecha x doctor x clínica con ingresos, costo, utilidad y número de recibos.
+# save_recibo la actualiza en la misma transacción; los reportes de ingresos y utilidad leen de
+# ella en lugar de agregar recibos/recibo_detalle. Los recibos sin doctor quedan con id_dr = 0 y
+# la clínica es la del doctor al momento de guardar el recibo.
+_resumen_ingresos_listo = False
+
+# Agregado diario calculado desde recibos/recibo_detalle. {filtro} es la condición sobre 'r'.
+# Primero se agregan las líneas por recibo (para no contar total_neto una vez por línea).
+_SELECT_RESUMEN_INGRESOS = """
+    SELECT rr.fecha, IFNULL(rr.id_dr, 0) AS id_dr, IFNULL(d.centro, 0) AS id_centro,
+           SUM(rr.total_neto) AS ingresos, SUM(rr.costo) AS costo,
+           SUM(rr.venta - rr.costo) AS utilidad, COUNT(*) AS num_recibos
+    FROM (
+        SELECT r.id_recibo, r.fecha, r.id_dr, IFNULL(r.total_neto, 0) AS total_neto,
+               IFNULL(SUM(rd.cantidad * rd.costo_unitario_venta - IFNULL(rd.descuento_linea, 0)), 0) AS venta,
+               IFNULL(SUM(rd.cantidad * IFNULL(rd.costo_unitario_compra, 0)), 0) AS costo
+        FROM recibos r
+        LEFT JOIN recibo_detalle rd ON rd.id_recibo = r.id_recibo
+        WHERE {filtro}
+        GROUP BY r.id_recibo, r.fecha, r.id_dr, r.total_neto
+    ) rr
+    LEFT JOIN dr d ON d.id_dr = rr.id_dr
+    GROUP BY rr.fecha, IFNULL(rr.id_dr, 0), IFNULL(d.centro, 0)
+"""
+
+_INSERT_RESUMEN_INGRESOS = """
+    INSERT INTO resumen_ingresos_diario (fecha, id_dr, id_centro, ingresos, costo, utilidad, num_recibos)
+    {select}
+    ON DUPLICATE KEY UPDATE
+        resumen_ingresos_diario.ingresos = resumen_ingresos_diario.ingresos + VALUES(ingresos),
+        resumen_ingresos_diario.costo = resumen_ingresos_diario.costo + VALUES(costo),
+        resumen_ingresos_diario.utilidad = resumen_ingresos_diario.utilidad + VALUES(utilidad),
+        resumen_ingresos_diario.num_recibos = resumen_ingresos_diario.num_recibos + VALUES(num_recibos)
+"""
+
+def _acumular_resumen_ingresos(cursor, id_recibo):
     """
-    Calcula los ingresos totales agrupados por día, mes o año según el rango de fechas.
-    Las fechas de entrada deben estar en formato 'YYYY-MM-DD'.
+    Suma un recibo recién insertado (con sus detalles) al resumen diario. NO HACE COMMIT.
+    Si falla (p. ej. aún no se aplicó la migración 004) no impide guardar el recibo:
+    'flask resumen-ingresos --recalcular' reconstruye el resumen.
     """
+    try:
+        cursor.execute(
+            _INSERT_RESUMEN_INGRESOS.format(select=_SELECT_RESUMEN_INGRESOS.format(filtro="r.id_recibo = %s")),
+            (id_recibo,)
+        )
+    except Error as e:
+        logger.warning('No se pudo actualizar el resumen de ingresos con el recibo %s: %s', id_recibo, e)
+
+def _resumen_ingresos_disponible(connection):
+    """True si la tabla resumen_ingresos_diario existe y tiene datos (se recuerda por proceso)."""
+    global _resumen_ingresos_listo
+    if _resumen_ingresos_listo:
+        return True
     cursor = None
-    resultados = []
     try:
-        # Convertir fechas de entrada a objetos datetime para calcular la diferencia
-        fecha_inicio_dt = datetime.strptime(fecha_inicio_str, '%Y-%m-%d')
-        fecha_fin_dt = datetime.strptime(fecha_fin_str, '%Y-%m-%d')
-        diferencia_dias = (fecha_fin_dt - fecha_inicio_dt).days
+        cursor = connection.cursor(buffered=True)
+        cursor.execute("SELECT 1 FROM resumen_ingresos_diario LIMIT 1")
+        _resumen_ingresos_listo = cursor.fetchone() is not None
+    except Error:
+        _resumen_ingresos_listo = False  # Falta la migración 004
+    finally:
+        if cursor:
+            cursor.close()
+    return _resumen_ingresos_listo
 
-        # Determinar el nivel de agrupación
-        group_by_format_sql = ""
-        group_by_format_python = ""
-        select_date_column = ""
-        order_by_clause = ""
+def recalcular_resumen_ingresos(connection, fecha_inicio_str, fecha_fin_str):
+    """
+    Reconstruye el resumen diario entre dos fechas ('YYYY-MM-DD', inclusive) a partir de los recibos.
+    NO HACE COMMIT. Devuelve el número de filas de resumen generadas o None si hubo error.
+    """
+    global _resumen_ingresos_listo
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM resumen_ingresos_diario WHERE fecha BETWEEN %s AND %s",
+                       (fecha_inicio_str, fecha_fin_str))
+        cursor.execute(
+            _INSERT_RESUMEN_INGRESOS.format(select=_SELECT_RESUMEN_INGRESOS.format(filtro="r.fecha BETWEEN %s AND %s")),
+            (fecha_inicio_str, fecha_fin_str)
+        )
+        _resumen_ingresos_listo = False  # Se vuelve a comprobar en el siguiente reporte
+        return cursor.rowcount
+    except Error as e:
+        logger.error('Error recalculando el resumen de ingresos (%s - %s): %s', fecha_inicio_str, fecha_fin_str, e)
+        return None
+    finally:
+        if cursor:
+            cursor.close()
 
-        # --- Lógica de agrupación por fecha (simplificada) ---
-        if diferencia_dias <= 45: # Agrupar por día
-            select_date_column = "fecha AS periodo"
-            group_by_format_sql = "fecha"
-            group_by_format_python = "%Y-%m-%d" # El tipo DATE de MySQL se devuelve así
-            order_by_clause = "fecha ASC"
-        elif diferencia_dias <= 365 * 2: # Agrupar por mes
-            select_date_column = "DATE_FORMAT(fecha, '%Y-%m') AS periodo"
-            group_by_format_sql = "periodo"
-            group_by_format_python = "%Y-%m"
-            order_by_clause = "periodo ASC"
-        else: # Agrupar por año
-            select_date_column = "YEAR(fecha) AS periodo"
-            group_by_format_sql = "periodo"
-            group_by_format_python = "%Y"
-            order_by_clause = "periodo ASC"
+def verificar_resumen_ingresos(connection, fecha_inicio_str, fecha_fin_str):
+    """
+    Compara el resumen guardado con el calculado desde los recibos entre dos fechas.
+    Devuelve la lista de diferencias ({'fecha', 'id_dr', 'id_centro', 'guardado', 'calculado'}) o None si hubo error.
+    """
+    cursor = None
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(_SELECT_RESUMEN_INGRESOS.format(filtro="r.fecha BETWEEN %s AND %s"),
+                       (fecha_inicio_str, fecha_fin_str))
+        calculados = {(row['fecha'], row['id_dr'], row['id_centro']): row for row in cursor.fetchall()}
+        cursor.execute("""
+            SELECT fecha, id_dr, id_centro, ingresos, costo, utilidad, num_recibos
+            FROM resumen_ingresos_diario WHERE fecha BETWEEN %s AND %s
+        """, (fecha_inicio_str, fecha_fin_str))
+        guardados = {(row['fecha'], row['id_dr'], row['id_centro']): row for row in cursor.fetchall()}
+
+        columnas = ('ingresos', 'costo', 'utilidad', 'num_recibos')
+        diferencias = []
+        for clave in sorted(set(calculados) | set(guardados)):
+            guardado, calculado = guardados.get(clave), calculados.get(clave)
+            valores_g = tuple(float(guardado[c] or 0) for c in columnas) if guardado else (0.0,) * len(columnas)
+            valores_c = tuple(float(calculado[c] or 0) for c in columnas) if calculado else (0.0,) * len(columnas)
+            if any(abs(g - c) > 0.005 for g, c in zip(valores_g, valores_c)):
+                diferencias.append({
+                    'fecha': clave[0], 'id_dr': clave[1], 'id_centro': clave[2],
+                    'guardado': dict(zip(columnas, valores_g)), 'calculado': dict(zip(columnas, valores_c))
+                })
+        return diferencias
+    except Error as e:
+        logger.error('Error verificando el resumen de ingresos: %s', e)
+        return None
+    finally:
+        if cursor:
+            cursor.close()
 
-        params = [fecha_inicio_str, fecha_fin_str]
+def _fuente_resumen_ingresos(connection, fecha_inicio_str, fecha_fin_str, usar_resumen):
+    """
+    FROM de los reportes (alias 'rid') y sus parámetros: la tabla de resumen o, si no está
+    disponible, el mismo agregado diario calculado al vuelo desde los recibos del rango.
+    """
+    if usar_resumen and _resumen_ingresos_disponible(connection):
+        return "resumen_ingresos_diario rid", []
+    subconsulta = _SELECT_RESUMEN_INGRESOS.format(filtro="r.fecha BETWEEN %s AND %s")
+    return f"({subconsulta}) rid", [fecha_inicio_str, fecha_fin_str]
+
+def _agrupacion_por_rango(fecha_inicio_str, fecha_fin_str):
+    """
+    Agrupación de los reportes según el largo del rango: día (<= 45 días), mes (<= 2 años) o año.
+    Devuelve (columna 'periodo', GROUP BY, formato python). Lanza ValueError si las fechas no son válidas.
+    """
+    fecha_inicio_dt = datetime.strptime(fecha_inicio_str, '%Y-%m-%d')
+    fecha_fin_dt = datetime.strptime(fecha_fin_str, '%Y-%m-%d')
+    diferencia_dias = (fecha_fin_dt - fecha_inicio_dt).days
+    if diferencia_dias <= 45: # Agrupar por día
+        return "rid.fecha AS periodo", "rid.fecha", "%Y-%m-%d"
+    elif diferencia_dias <= 365 * 2: # Agrupar por mes
+        return "DATE_FORMAT(rid.fecha, '%Y-%m') AS periodo", "periodo", "%Y-%m"
+    else: # Agrupar por año
+        return "YEAR(rid.fecha) AS periodo", "periodo", "%Y"
+
+def _formatear_periodo(res, formato_python):
+    if isinstance(res['periodo'], date):
+        # Si es un objeto 'date' (agrupado por día), formatearlo
+        res['periodo'] = res['periodo'].strftime('%d/%m/%Y')
+    else:
+        # Si es string ('YYYY-MM') o int (YYYY), convertir a string
+        res['periodo'] = str(res['periodo'])
+    res['formato_periodo_python'] = formato_python
+
+def get_ingresos_por_periodo(connection, fecha_inicio_str, fecha_fin_str, doctor_id=None, usar_resumen=True):
+    """
+    Calcula los ingresos totales agrupados por día, mes o año según el rango de fechas.
+    Las fechas de entrada deben estar en formato 'YYYY-MM-DD'.
+    Lee del resumen diario (usar_resumen=False agrega los recibos directamente).
+    """
+    cursor = None
+    resultados = []
+    try:
+        select_date_column, group_by, group_by_format_python = _agrupacion_por_rango(fecha_inicio_str, fecha_fin_str)
+        fuente, params = _fuente_resumen_ingresos(connection, fecha_inicio_str, fecha_fin_str, usar_resumen)
+        params += [fecha_inicio_str, fecha_fin_str]
         filtro_doctor = ""
         if doctor_id:
-            filtro_doctor = "AND id_dr = %s "
+            filtro_doctor = "AND rid.id_dr = %s "
             params.append(doctor_id)
 
         query = f"""
             SELECT 
                 {select_date_column}, 
-                SUM(total_neto) AS total_ingresos_periodo,
-                COUNT(id_recibo) AS numero_recibos
-            FROM recibos
-            WHERE fecha BETWEEN %s AND %s 
+                SUM(rid.ingresos) AS total_ingresos_periodo,
+                SUM(rid.num_recibos) AS numero_recibos
+            FROM {fuente}
+            WHERE rid.fecha BETWEEN %s AND %s 
             {filtro_doctor}
-            GROUP BY {group_by_format_sql}
-            ORDER BY {order_by_clause};
+            GROUP BY {group_by}
+            ORDER BY {group_by} ASC;
         """
         
         cursor = connection.cursor(dictionary=True)
-        print(f"Query Reporte Ingresos: {query}")
-        print(f"Params: {tuple(params)}")
-        
         cursor.execute(query, tuple(params))
         resultados = cursor.fetchall()
 
         for res in resultados:
             res['total_ingresos_periodo'] = float(res.get('total_ingresos_periodo', 0.0) or 0.0)
-            
-            # --- CORRECCIÓN de formato de periodo ---
-            if isinstance(res['periodo'], date):
-                # Si es un objeto 'date' (agrupado por día), formatearlo
-                res['periodo'] = res['periodo'].strftime('%d/%m/%Y')
-            else:
-                # Si es string ('YYYY-MM') o int (YYYY), convertir a string
-                res['periodo'] = str(res['periodo'])
-            
-            res['formato_periodo_python'] = group_by_format_python
+            res['numero_recibos'] = int(res.get('numero_recibos') or 0)
+            _formatear_periodo(res, group_by_format_python)
 
         return resultados
     except ValueError as ve:
-        print(f"Error de formato de fecha en get_ingresos_por_periodo: {ve}")
+        logger.error('Error de formato de fecha en get_ingresos_por_periodo: %s', ve)
         return []
     except Error as e:
-        print(f"Error en get_ingresos_por_periodo: {e}")
+        logger.error('Error en get_ingresos_por_periodo: %s', e)
         return []
     finally:
         if cursor:
             cursor.close()
 
-def get_ingresos_por_doctor_periodo(connection, fecha_inicio_str, fecha_fin_str, doctor_id=None):
+def get_ingresos_por_doctor_periodo(connection, fecha_inicio_str, fecha_fin_str, doctor_id=None, usar_resumen=True):
     """
     Calcula los ingresos totales generados por cada doctor en un periodo específico.
     Si se provee un doctor_id, filtra solo para ese doctor.
     """
     cursor = None
     try:
-        params = [fecha_inicio_str, fecha_fin_str]
+        fuente, params = _fuente_resumen_ingresos(connection, fecha_inicio_str, fecha_fin_str, usar_resumen)
+        params += [fecha_inicio_str, fecha_fin_str]
         filtro_doctor = ""
         if doctor_id:
-            filtro_doctor = "AND r.id_dr = %s "
+            filtro_doctor = "AND rid.id_dr = %s "
             params.append(doctor_id)
 
         query = f"""
             SELECT 
                 d.id_dr,
                 d.nombre AS nombre_doctor,
-                SUM(r.total_neto) AS total_ingresos_doctor,
-                COUNT(r.id_recibo) AS numero_recibos_doctor
-            FROM recibos r
-            JOIN dr d ON r.id_dr = d.id_dr
-            WHERE r.fecha BETWEEN %s AND %s
+                SUM(rid.ingresos) AS total_ingresos_doctor,
+                SUM(rid.num_recibos) AS numero_recibos_doctor
+            FROM {fuente}
+            JOIN dr d ON rid.id_dr = d.id_dr
+            WHERE rid.fecha BETWEEN %s AND %s
             {filtro_doctor}
             GROUP BY d.id_dr, d.nombre
             ORDER BY total_ingresos_doctor DESC, d.nombre ASC;
@@ -2906,157 +3468,126 @@ def get_ingresos_por_doctor_periodo(connection, fecha_inicio_str, fecha_fin_str,
 
         for res in resultados:
             res['total_ingresos_doctor'] = float(res.get('total_ingresos_doctor', 0.0) or 0.0)
+            res['numero_recibos_doctor'] = int(res.get('numero_recibos_doctor') or 0)
         
         return resultados
-    except ValueError as ve:
-        print(f"Error de formato de fecha en get_ingresos_por_doctor_periodo: {ve}")
-        return []
     except Error as e:
-        print(f"Error en get_ingresos_por_doctor_periodo: {e}")
+        logger.error('Error en get_ingresos_por_doctor_periodo: %s', e)
         return []
     finally:
         if cursor:
             cursor.close()
             
-def get_utilidad_estimada_por_periodo(connection, fecha_inicio_str, fecha_fin_str, doctor_id=None):
+def get_utilidad_estimada_por_periodo(connection, fecha_inicio_str, fecha_fin_str, doctor_id=None, usar_resumen=True):
     """
     Calcula la utilidad estimada total agrupada por día, mes o año.
     Si se provee un doctor_id, filtra para ese doctor.
+    Utilidad por línea: cantidad * precio - descuento de línea - cantidad * costo de compra.
     """
     cursor = None
     try:
-        fecha_inicio_dt = datetime.strptime(fecha_inicio_str, '%Y-%m-%d')
-        fecha_fin_dt = datetime.strptime(fecha_fin_str, '%Y-%m-%d')
-        diferencia_dias = (fecha_fin_dt - fecha_inicio_dt).days
-
-        group_by_format_sql = ""
-        group_by_format_python = ""
-        select_date_column = ""
-        order_by_clause = ""
-        
-        if diferencia_dias <= 45: # Agrupar por día
-            select_date_column = "r.fecha AS periodo"
-            group_by_format_sql = "r.fecha"
-            group_by_format_python = "%Y-%m-%d"
-            order_by_clause = "r.fecha ASC"
-        elif diferencia_dias <= 365 * 2: # Agrupar por mes
-            select_date_column = "DATE_FORMAT(r.fecha, '%Y-%m') AS periodo"
-            group_by_format_sql = "periodo"
-            group_by_format_python = "%Y-%m"
-            order_by_clause = "periodo ASC"
-        else: # Agrupar por año
-            select_date_column = "YEAR(r.fecha) AS periodo"
-            group_by_format_sql = "periodo"
-            group_by_format_python = "%Y"
-            order_by_clause = "periodo ASC"
-
-        params = [fecha_inicio_str, fecha_fin_str]
+        select_date_column, group_by, group_by_format_python = _agrupacion_por_rango(fecha_inicio_str, fecha_fin_str)
+        fuente, params = _fuente_resumen_ingresos(connection, fecha_inicio_str, fecha_fin_str, usar_resumen)
+        params += [fecha_inicio_str, fecha_fin_str]
         filtro_doctor = ""
         if doctor_id:
-            filtro_doctor = "AND r.id_dr = %s "
+            filtro_doctor = "AND rid.id_dr = %s "
             params.append(doctor_id)
 
         query = f"""
             SELECT 
                 {select_date_column},
-                SUM(
-                    (rd.cantidad * rd.costo_unitario_venta - IFNULL(rd.descuento_linea, 0)) 
-                    - 
-                    (rd.cantidad * IFNULL(rd.costo_unitario_compra, 0))
-                ) AS total_utilidad_estimada_periodo,
-                COUNT(DISTINCT r.id_recibo) AS numero_recibos_con_utilidad,
-                SUM(r.total_neto) AS total_ingresos_netos_periodo
-            FROM recibos r
-            JOIN recibo_detalle rd ON r.id_recibo = rd.id_recibo
-            WHERE r.fecha BETWEEN %s AND %s
+                SUM(rid.utilidad) AS total_utilidad_estimada_periodo,
+                SUM(rid.num_recibos) AS numero_recibos_con_utilidad,
+                SUM(rid.ingresos) AS total_ingresos_netos_periodo
+            FROM {fuente}
+            WHERE rid.fecha BETWEEN %s AND %s
             {filtro_doctor}
-            GROUP BY {group_by_format_sql}
-            ORDER BY {order_by_clause};
+            GROUP BY {group_by}
+            ORDER BY {group_by} ASC;
         """
         
         cursor = connection.cursor(dictionary=True)
-        print(f"Query Reporte Utilidad Periodo: {query}")
-        print(f"Params: {tuple(params)}")
-        
         cursor.execute(query, tuple(params))
         resultados = cursor.fetchall()
 
         for res in resultados:
             res['total_utilidad_estimada_periodo'] = float(res.get('total_utilidad_estimada_periodo', 0.0) or 0.0)
             res['total_ingresos_netos_periodo'] = float(res.get('total_ingresos_netos_periodo', 0.0) or 0.0)
-            
-            if isinstance(res['periodo'], date):
-                res['periodo'] = res['periodo'].strftime('%d/%m/%Y')
-            else:
-                res['periodo'] = str(res['periodo'])
-            
-            res['formato_periodo_python'] = group_by_format_python
+            res['numero_recibos_con_utilidad'] = int(res.get('numero_recibos_con_utilidad') or 0)
+            _formatear_periodo(res, group_by_format_python)
         
         return resultados
     except ValueError as ve:
-        print(f"Error de formato de fecha en get_utilidad_estimada_por_periodo: {ve}")
+        logger.error('Error de formato de fecha en get_utilidad_estimada_por_periodo: %s', ve)
         return []
     except Error as e:
-        print(f"Error en get_utilidad_estimada_por_periodo: {e}")
+        logger.error('Error en get_utilidad_estimada_por_periodo: %s', e)
         return []
     finally:
         if cursor:
             cursor.close()
 
-def get_utilidad_estimada_por_doctor_periodo(connection, fecha_inicio_str, fecha_fin_str, doctor_id=None):
+def get_utilidad_estimada_por_doctor_periodo(connection, fecha_inicio_str, fecha_fin_str, doctor_id=None, usar_resumen=True):
     """
     Calcula la utilidad estimada generada por cada doctor en un periodo específico.
     Si se provee un doctor_id, filtra solo para ese doctor.
     """
     cursor = None
     try:
-        params = [fecha_inicio_str, fecha_fin_str]
+        fuente, params = _fuente_resumen_ingresos(connection, fecha_inicio_str, fecha_fin_str, usar_resumen)
+        params += [fecha_inicio_str, fecha_fin_str]
         filtro_doctor = ""
         if doctor_id:
-            filtro_doctor = "AND r.id_dr = %s "
+            filtro_doctor = "AND rid.id_dr = %s "
             params.append(doctor_id)
 
         query = f"""
             SELECT 
                 dr.id_dr,
                 dr.nombre AS nombre_doctor,
-                SUM(
-                    (rd.cantidad * rd.costo_unitario_venta - IFNULL(rd.descuento_linea, 0)) 
-                    - 
-                    (rd.cantidad * IFNULL(rd.costo_unitario_compra, 0))
-                ) AS total_utilidad_estimada_doctor,
-                COUNT(DISTINCT r.id_recibo) AS numero_recibos_doctor,
-                SUM(r.total_neto) AS total_ingresos_netos_doctor
-            FROM recibos r
-            JOIN recibo_detalle rd ON r.id_recibo = rd.id_recibo
-            JOIN dr ON r.id_dr = dr.id_dr 
-            WHERE r.fecha BETWEEN %s AND %s
+                SUM(rid.utilidad) AS total_utilidad_estimada_doctor,
+                SUM(rid.num_recibos) AS numero_recibos_doctor,
+                SUM(rid.ingresos) AS total_ingresos_netos_doctor
+            FROM {fuente}
+            JOIN dr ON rid.id_dr = dr.id_dr 
+            WHERE rid.fecha BETWEEN %s AND %s
             {filtro_doctor}
             GROUP BY dr.id_dr, dr.nombre
             ORDER BY total_utilidad_estimada_doctor DESC, dr.nombre ASC;
         """
         cursor = connection.cursor(dictionary=True)
-        print(f"Query Reporte Utilidad Doctor: {query}")
-        print(f"Params: {tuple(params)}")
-
         cursor.execute(query, tuple(params))
         resultados = cursor.fetchall()
 
         for res in resultados:
             res['total_utilidad_estimada_doctor'] = float(res.get('total_utilidad_estimada_doctor', 0.0) or 0.0)
             res['total_ingresos_netos_doctor'] = float(res.get('total_ingresos_netos_doctor', 0.0) or 0.0)
+            res['numero_recibos_doctor'] = int(res.get('numero_recibos_doctor') or 0)
         
         return resultados
-    except ValueError as ve:
-        print(f"Error de formato de fecha en get_utilidad_estimada_por_doctor_periodo: {ve}")
-        return []
     except Error as e:
-        print(f"Error en get_utilidad_estimada_por_doctor_periodo: {e}")
+        logger.error('Error en get_utilidad_estimada_por_doctor_periodo: %s', e)
         return []
     finally:
         if cursor:
             cursor.close()
 
+def _etiqueta_periodo_grafica(periodo_label_raw):
+    """Etiqueta legible de un periodo agrupado por día (date), mes ('YYYY-MM') o año (int)."""
+    # --- CORRECCIÓN: Formatear etiquetas basado en el TIPO de dato devuelto ---
+    if isinstance(periodo_label_raw, date): 
+        # Agrupado por día, la BD devuelve un objeto date
+        return periodo_label_raw.strftime('%d %b %Y')
+    elif isinstance(periodo_label_raw, str): 
+        # Agrupado por mes ('YYYY-MM')
+        try:
+            return datetime.strptime(periodo_label_raw, '%Y-%m').strftime('%b %Y')
+        except (ValueError, TypeError):
+            return periodo_label_raw
+    # Agrupado por año (YYYY) o fallback
+    return str(periodo_label_raw)
+
 def get_pacientes_nuevos_por_periodo(connection, fecha_inicio_str, fecha_fin_str, doctor_id=0):
     """
     Obtiene la lista de pacientes nuevos y el conteo agrupado.
@@ -3126,44 +3657,23 @@ def get_pacientes_nuevos_por_periodo(connection, fecha_inicio_str, fecha_fin_str
             ORDER BY {order_by_clause_grafica};
         """
         
-        print(f"Query Reporte Pacientes Nuevos (Gráfica): {query_grafica}")
-        print(f"Params (Gráfica): {tuple(params_grafica)}")
 
         cursor.execute(query_grafica, tuple(params_grafica))
         conteo_agrupado_para_grafica_raw = cursor.fetchall()
 
-        # --- CORRECCIÓN: Formatear etiquetas basado en el TIPO de dato devuelto ---
         for item in conteo_agrupado_para_grafica_raw:
-            periodo_label_raw = item.get('periodo_grafica')
-            label_para_grafica = "Error Etiqueta"
-            
-            if isinstance(periodo_label_raw, date): 
-                # Agrupado por día, la BD devuelve un objeto date
-                label_para_grafica = periodo_label_raw.strftime('%d %b %Y')
-            elif isinstance(periodo_label_raw, str): 
-                # Agrupado por mes ('YYYY-MM')
-                try:
-                    label_para_grafica = datetime.strptime(periodo_label_raw, '%Y-%m').strftime('%b %Y')
-                except (ValueError, TypeError):
-                    label_para_grafica = periodo_label_raw
-            elif isinstance(periodo_label_raw, int): 
-                # Agrupado por año (YYYY)
-                label_para_grafica = str(periodo_label_raw)
-            else:
-                label_para_grafica = str(periodo_label_raw) # Fallback
-            
             conteo_agrupado_para_grafica.append({
-                'periodo_label': label_para_grafica,
+                'periodo_label': _etiqueta_periodo_grafica(item.get('periodo_grafica')),
                 'conteo': item.get('conteo_pacientes_nuevos', 0)
             })
         
         return pacientes_nuevos_lista, conteo_agrupado_para_grafica
 
     except ValueError as ve:
-        print(f"Error de formato de fecha en get_pacientes_nuevos_por_periodo: {ve}")
+        logger.error('Error de formato de fecha en get_pacientes_nuevos_por_periodo: %s', ve)
         return [], []
     except Error as e:
-        print(f"Error en get_pacientes_nuevos_por_periodo: {e}")
+        logger.error('Error en get_pacientes_nuevos_por_periodo: %s', e)
         return [], []
     finally:
         if cursor:
@@ -3194,18 +3704,16 @@ def get_pacientes_mas_frecuentes(connection, fecha_inicio_str, fecha_fin_str, li
             LIMIT %s;
         """
         cursor = connection.cursor(dictionary=True)
-        print(f"Query Reporte Pacientes Frecuentes: {query}")
-        print(f"Params: {fecha_inicio_db}, {fecha_fin_db}, {limit}")
         
         cursor.execute(query, (fecha_inicio_db, fecha_fin_db, limit))
         resultados = cursor.fetchall()
         
         return resultados
     except ValueError as ve:
-        print(f"Error de formato de fecha en get_pacientes_mas_frecuentes: {ve}")
+        logger.error('Error de formato de fecha en get_pacientes_mas_frecuentes: %s', ve)
         return []
     except Error as e:
-        print(f"Error en get_pacientes_mas_frecuentes: {e}")
+        logger.error('Error en get_pacientes_mas_frecuentes: %s', e)
         return []
     finally:
         if cursor:
@@ -3237,33 +3745,75 @@ def get_seguimientos_por_doctor_periodo(connection, fecha_inicio_str, fecha_fin_
             ORDER BY numero_consultas DESC, d.nombre ASC;
         """
         cursor = connection.cursor(dictionary=True)
-        print(f"Query Reporte Consultas por Doctor: {query}")
-        print(f"Params: {tuple(params)}")
         
         cursor.execute(query, tuple(params))
         resultados = cursor.fetchall()
         
         return resultados
     except ValueError as ve:
-        print(f"Error de formato de fecha en get_seguimientos_por_doctor_periodo: {ve}")
+        logger.error('Error de formato de fecha en get_seguimientos_por_doctor_periodo: %s', ve)
         return []
     except Error as e:
-        print(f"Error en get_seguimientos_por_doctor_periodo: {e}")
+        logger.error('Error en get_seguimientos_por_doctor_periodo: %s', e)
         return []
     finally:
         if cursor:
             cursor.close()
 
-def get_uso_planes_de_cuidado(connection, fecha_inicio_str, fecha_fin_str):
+# Totales de get_uso_planes_de_cuidado (también los usa get_reportes_combinados_periodo)
+_SELECT_TOTALES_USO_PLANES = """
+    SELECT COUNT(*) AS total_creados,
+           COALESCE(SUM(pc.visitas_qp_realizadas >= COALESCE(pc.visitas_qp, 0)), 0) AS completados
+"""
+
+def _from_uso_planes(fecha_inicio_str, fecha_fin_str, doctor_id=None, centro_id=None):
+    """FROM/WHERE comunes de los reportes de uso de planes (totales y lista detallada) y sus parámetros."""
+    filtros_sql = "pc.fecha BETWEEN %s AND %s"
+    filtros_params = [fecha_inicio_str, fecha_fin_str]
+    if doctor_id:
+        filtros_sql += " AND pc.id_dr = %s"
+        filtros_params.append(doctor_id)
+    if centro_id:
+        filtros_sql += " AND dr.centro = %s"
+        filtros_params.append(centro_id)
+
+    # Las visitas realizadas salen del contador del plan (visitas_qp_realizadas)
+    from_sql = f"""
+        FROM plancuidado pc
+        JOIN datos_personales dp ON pc.id_px = dp.id_px
+        LEFT JOIN dr ON pc.id_dr = dr.id_dr
+        WHERE {filtros_sql}
+    """
+    return from_sql, tuple(filtros_params)
+
+def get_uso_planes_de_cuidado(connection, fecha_inicio_str, fecha_fin_str,
+                              doctor_id=None, centro_id=None, pagina=1, por_pagina=None):
     """
     Analiza los planes de cuidado creados dentro de un rango de fechas
     y determina su estado (Activo o Completado).
+    Las visitas realizadas de todos los planes se cuentan con un único JOIN agrupado.
+    - doctor_id / centro_id (opcionales, 0 o None = todos): filtran por el doctor que creó
+      el plan o por la clínica de ese doctor.
+    - por_pagina (opcional): pagina 'lista_detallada_planes'; los totales (creados, activos,
+      completados) siempre cubren todo el rango.
     """
     cursor = None
-    planes_analizados = []
+    resultado_vacio = {'total_creados': 0, 'activos': 0, 'completados': 0, 'lista_detallada_planes': [],
+                       'pagina': 1, 'por_pagina': por_pagina, 'total_paginas': 0}
     try:
-        # 1. Obtener los planes creados en el periodo
-        query_planes = """
+        from_sql, params = _from_uso_planes(fecha_inicio_str, fecha_fin_str, doctor_id, centro_id)
+        cursor = connection.cursor(dictionary=True, buffered=True)
+
+        # 1. Totales del rango completo (una sola consulta agregada)
+        cursor.execute(_SELECT_TOTALES_USO_PLANES + from_sql, params)
+        totales = cursor.fetchone() or {}
+        total_creados = int(totales.get('total_creados') or 0)
+        if total_creados == 0:
+            return resultado_vacio
+        planes_completados = int(totales.get('completados') or 0)
+
+        # 2. Lista detallada (paginada si se pidió)
+        query_planes = f"""
             SELECT 
                 pc.id_plan, 
                 pc.id_px,
@@ -3273,67 +3823,191 @@ def get_uso_planes_de_cuidado(connection, fecha_inicio_str, fecha_fin_str):
                 pc.fecha AS fecha_creacion_plan, 
                 pc.pb_diagnostico,
                 pc.visitas_qp AS visitas_qp_planificadas,
-                dr.nombre AS nombre_doctor_plan
-            FROM plancuidado pc
-            JOIN datos_personales dp ON pc.id_px = dp.id_px
-            LEFT JOIN dr ON pc.id_dr = dr.id_dr
-            WHERE pc.fecha BETWEEN %s AND %s
-            ORDER BY pc.fecha DESC, pc.id_plan DESC;
+                dr.nombre AS nombre_doctor_plan,
+                pc.visitas_qp_realizadas
+            {from_sql}
+            ORDER BY pc.fecha DESC, pc.id_plan DESC
         """
-        cursor = connection.cursor(dictionary=True, buffered=True) # buffered para reutilizar
-        print(f"Query Uso Planes (Planes Creados): {query_planes}")
-        print(f"Params: {fecha_inicio_str}, {fecha_fin_str}")
-        cursor.execute(query_planes, (fecha_inicio_str, fecha_fin_str))
+        pagina = max(1, int(pagina or 1))
+        total_paginas = 1
+        if por_pagina:
+            total_paginas = max(1, -(-total_creados // por_pagina))
+            pagina = min(pagina, total_paginas)
+            query_planes += " LIMIT %s OFFSET %s"
+            params = params + (por_pagina, (pagina - 1) * por_pagina)
+        cursor.execute(query_planes, params)
         planes_creados = cursor.fetchall()
 
-        if not planes_creados:
-            return {
-                'total_creados': 0,
-                'activos': 0,
-                'completados': 0,
-                'lista_detallada_planes': []
-            }
-
-        # 2. Para cada plan, contar los seguimientos asociados
-        query_conteo_seguimientos = """
-            SELECT COUNT(id_seguimiento) as conteo
-            FROM quiropractico
-            WHERE id_plan_cuidado_asociado = %s;
-        """
-        
-        planes_activos = 0
-        planes_completados = 0
-
         for plan in planes_creados:
-            cursor.execute(query_conteo_seguimientos, (plan['id_plan'],))
-            resultado_conteo = cursor.fetchone()
-            visitas_qp_realizadas = resultado_conteo['conteo'] if resultado_conteo else 0
-            
-            plan['visitas_qp_realizadas'] = visitas_qp_realizadas
             visitas_planificadas = plan.get('visitas_qp_planificadas') or 0
-
-            if visitas_qp_realizadas >= visitas_planificadas:
-                plan['estado_plan'] = 'Completado'
-                planes_completados += 1
-            else:
-                plan['estado_plan'] = 'Activo'
-                planes_activos += 1
-            
-            plan['nombre_completo_paciente'] = f"{plan.get('nombre_paciente','')} {plan.get('apellidop_paciente','')} {plan.get('apellidom_paciente','').strip()}".strip()
+            plan['visitas_qp_realizadas'] = int(plan['visitas_qp_realizadas'])
+            plan['estado_plan'] = 'Completado' if plan['visitas_qp_realizadas'] >= visitas_planificadas else 'Activo'
+            plan['nombre_completo_paciente'] = f"{plan.get('nombre_paciente') or ''} {plan.get('apellidop_paciente') or ''} {(plan.get('apellidom_paciente') or '').strip()}".strip()
 
         return {
-            'total_creados': len(planes_creados),
-            'activos': planes_activos,
+            'total_creados': total_creados,
+            'activos': total_creados - planes_completados,
             'completados': planes_completados,
-            'lista_detallada_planes': planes_creados 
+            'lista_detallada_planes': planes_creados,
+            'pagina': pagina,
+            'por_pagina': por_pagina,
+            'total_paginas': total_paginas
         }
 
     except ValueError as ve:
-        print(f"Error de formato de fecha en get_uso_planes_de_cuidado: {ve}")
-        return {'total_creados': 0, 'activos': 0, 'completados': 0, 'lista_detallada_planes': []}
+        logger.error('Error de formato de fecha en get_uso_planes_de_cuidado: %s', ve)
+        return resultado_vacio
+    except Error as e:
+        logger.error('Error en get_uso_planes_de_cuidado: %s', e)
+        return resultado_vacio
+    finally:
+        if cursor:
+            cursor.close()
+
+def get_reportes_combinados_periodo(connection, fecha_inicio_str, fecha_fin_str, doctor_id=0, centro_id=0,
+                                    usar_resumen=True):
+    """
+    Calcula en una sola sesión los datos de las gráficas del dashboard de reportes para un rango:
+    ingresos y utilidad (por periodo y por doctor), pacientes nuevos por periodo, seguimientos
+    por doctor y uso de planes (totales).
+    - Ingresos y utilidad salen de UNA consulta al resumen diario agrupada por periodo y doctor;
+      los totales por periodo y por doctor se arman aquí a partir de ella.
+    - doctor_id / centro_id (0 = todos) filtran todos los reportes.
+    Devuelve un dict (listo para JSON) o None si hubo error.
+    """
+    cursor = None
+    try:
+        select_periodo, group_by, formato_python = _agrupacion_por_rango(fecha_inicio_str, fecha_fin_str)
+        agrupacion = {'%Y-%m-%d': 'dia', '%Y-%m': 'mes', '%Y': 'anio'}[formato_python]
+        cursor = connection.cursor(dictionary=True, buffered=True)
+
+        # 1. Ingresos y utilidad: periodo x doctor en una sola pasada
+        fuente, params = _fuente_resumen_ingresos(connection, fecha_inicio_str, fecha_fin_str, usar_resumen)
+        params += [fecha_inicio_str, fecha_fin_str]
+        filtros = ""
+        if doctor_id:
+            filtros += " AND rid.id_dr = %s"
+            params.append(doctor_id)
+        if centro_id:
+            filtros += " AND rid.id_centro = %s"
+            params.append(centro_id)
+        group_by_doctor = "rid.fecha, rid.id_dr, d.nombre" if group_by == "rid.fecha" else "periodo, rid.id_dr, d.nombre"
+        cursor.execute(f"""
+            SELECT {select_periodo}, rid.id_dr, d.nombre AS nombre_doctor,
+                   SUM(rid.ingresos) AS ingresos, SUM(rid.utilidad) AS utilidad, SUM(rid.num_recibos) AS num_recibos
+            FROM {fuente}
+            LEFT JOIN dr d ON d.id_dr = rid.id_dr
+            WHERE rid.fecha BETWEEN %s AND %s{filtros}
+            GROUP BY {group_by_doctor}
+            ORDER BY {group_by} ASC
+        """, tuple(params))
+        por_periodo = {}
+        por_doctor = {}
+        for fila in cursor.fetchall():
+            _formatear_periodo(fila, formato_python)
+            ingresos, utilidad = float(fila['ingresos'] or 0), float(fila['utilidad'] or 0)
+            recibos = int(fila['num_recibos'] or 0)
+            periodo = por_periodo.setdefault(fila['periodo'], {
+                'periodo': fila['periodo'], 'total_ingresos_periodo': 0.0, 'numero_recibos': 0,
+                'total_utilidad_estimada_periodo': 0.0,
+            })
+            periodo['total_ingresos_periodo'] += ingresos
+            periodo['numero_recibos'] += recibos
+            periodo['total_utilidad_estimada_periodo'] += utilidad
+            if fila['nombre_doctor'] is not None:  # Recibos sin doctor no aparecen en el desglose por doctor
+                doctor = por_doctor.setdefault(fila['id_dr'], {
+                    'id_dr': fila['id_dr'], 'nombre_doctor': fila['nombre_doctor'],
+                    'total_ingresos_doctor': 0.0, 'numero_recibos_doctor': 0, 'total_utilidad_estimada_doctor': 0.0,
+                })
+                doctor['total_ingresos_doctor'] += ingresos
+                doctor['numero_recibos_doctor'] += recibos
+                doctor['total_utilidad_estimada_doctor'] += utilidad
+        periodos = list(por_periodo.values())
+        doctores = list(por_doctor.values())
+        for periodo in periodos:
+            periodo['total_ingresos_periodo'] = round(periodo['total_ingresos_periodo'], 2)
+            periodo['total_utilidad_estimada_periodo'] = round(periodo['total_utilidad_estimada_periodo'], 2)
+        for doctor in doctores:
+            doctor['total_ingresos_doctor'] = round(doctor['total_ingresos_doctor'], 2)
+            doctor['total_utilidad_estimada_doctor'] = round(doctor['total_utilidad_estimada_doctor'], 2)
+
+        # 2. Pacientes nuevos por periodo
+        select_periodo_dp = select_periodo.replace('rid.fecha', 'dp.fecha').replace('AS periodo', 'AS periodo_grafica')
+        group_by_dp = 'dp.fecha' if group_by == 'rid.fecha' else 'periodo_grafica'
+        params = [fecha_inicio_str, fecha_fin_str]
+        filtros = ""
+        if doctor_id:
+            filtros += " AND dp.id_dr = %s"
+            params.append(doctor_id)
+        if centro_id:
+            filtros += " AND dr.centro = %s"
+            params.append(centro_id)
+        cursor.execute(f"""
+            SELECT {select_periodo_dp}, COUNT(dp.id_px) AS conteo
+            FROM datos_personales dp
+            LEFT JOIN dr ON dr.id_dr = dp.id_dr
+            WHERE dp.fecha BETWEEN %s AND %s{filtros}
+            GROUP BY {group_by_dp}
+            ORDER BY {group_by_dp} ASC
+        """, tuple(params))
+        nuevos = [{'periodo_label': _etiqueta_periodo_grafica(f['periodo_grafica']), 'conteo': int(f['conteo'])}
+                  for f in cursor.fetchall()]
+
+        # 3. Seguimientos por doctor
+        params = [fecha_inicio_str, fecha_fin_str]
+        filtros = ""
+        if doctor_id:
+            filtros += " AND q.id_dr = %s"
+            params.append(doctor_id)
+        if centro_id:
+            filtros += " AND d.centro = %s"
+            params.append(centro_id)
+        cursor.execute(f"""
+            SELECT d.id_dr, d.nombre AS nombre_doctor, COUNT(q.id_seguimiento) AS numero_consultas
+            FROM quiropractico q
+            JOIN dr d ON q.id_dr = d.id_dr
+            WHERE q.fecha BETWEEN %s AND %s{filtros}
+            GROUP BY d.id_dr, d.nombre
+            ORDER BY numero_consultas DESC, d.nombre ASC
+        """, tuple(params))
+        seguimientos = [{'id_dr': f['id_dr'], 'nombre_doctor': f['nombre_doctor'], 'numero_consultas': int(f['numero_consultas'])}
+                        for f in cursor.fetchall()]
+
+        # 4. Uso de planes (solo totales; la lista detallada sigue en get_uso_planes_de_cuidado)
+        from_sql, params = _from_uso_planes(fecha_inicio_str, fecha_fin_str, doctor_id, centro_id)
+        cursor.execute(_SELECT_TOTALES_USO_PLANES + from_sql, params)
+        totales = cursor.fetchone() or {}
+        total_creados = int(totales.get('total_creados') or 0)
+        completados = int(totales.get('completados') or 0)
+
+        return {
+            'rango': {'fecha_inicio': fecha_inicio_str, 'fecha_fin': fecha_fin_str, 'agrupacion': agrupacion,
+                      'doctor_id': doctor_id or 0, 'centro_id': centro_id or 0},
+            'ingresos': {
+                'por_periodo': [{k: p[k] for k in ('periodo', 'total_ingresos_periodo', 'numero_recibos')} for p in periodos],
+                'por_doctor': sorted(
+                    ({k: d[k] for k in ('id_dr', 'nombre_doctor', 'total_ingresos_doctor', 'numero_recibos_doctor')} for d in doctores),
+                    key=lambda d: (-d['total_ingresos_doctor'], d['nombre_doctor'])),
+                'total': round(sum(p['total_ingresos_periodo'] for p in periodos), 2),
+            },
+            'utilidad': {
+                'por_periodo': [{k: p[k] for k in ('periodo', 'total_utilidad_estimada_periodo')} for p in periodos],
+                'por_doctor': sorted(
+                    ({k: d[k] for k in ('id_dr', 'nombre_doctor', 'total_utilidad_estimada_doctor')} for d in doctores),
+                    key=lambda d: (-d['total_utilidad_estimada_doctor'], d['nombre_doctor'])),
+                'total': round(sum(p['total_utilidad_estimada_periodo'] for p in periodos), 2),
+            },
+            'nuevos_pacientes': {'por_periodo': nuevos, 'total': sum(n['conteo'] for n in nuevos)},
+            'seguimientos': {'por_doctor': seguimientos, 'total': sum(s['numero_consultas'] for s in seguimientos)},
+            'uso_planes': {'total_creados': total_creados, 'activos': total_creados - completados,
+                           'completados': completados},
+        }
+    except ValueError as ve:
+        logger.error('Error de formato de fecha en get_reportes_combinados_periodo: %s', ve)
+        return None
     except Error as e:
-        print(f"Error en get_uso_planes_de_cuidado: {e}")
-        return {'total_creados': 0, 'activos': 0, 'completados': 0, 'lista_detallada_planes': []}
+        logger.error('Error en get_reportes_combinados_periodo: %s', e)
+        return None
     finally:
         if cursor:
             cursor.close()
@@ -3375,7 +4049,7 @@ def get_historial_compras_paciente(connection, id_px):
             
         return historial if historial else []
     except Error as e:
-        print(f"Error obteniendo historial de compras para paciente ID {id_px}: {e}")
+        logger.error('Error obteniendo historial de compras para paciente ID %s: %s', id_px, e)
         return []
     finally:
         if cursor:
@@ -3395,9 +4069,7 @@ def get_planes_cuidado_paciente(connection, id_px):
                 pc.inversion_total,
                 pc.adicionales_ids,
                 dr.nombre as nombre_doctor_plan,
-                (SELECT COUNT(q.id_seguimiento) 
-                 FROM quiropractico q 
-                 WHERE q.id_plan_cuidado_asociado = pc.id_plan) as visitas_realizadas
+                pc.visitas_qp_realizadas as visitas_realizadas
             FROM plancuidado pc
             LEFT JOIN dr ON pc.id_dr = dr.id_dr
             WHERE pc.id_px = %s
@@ -3432,44 +4104,40 @@ def get_planes_cuidado_paciente(connection, id_px):
 
         return planes if planes else []
     except Error as e:
-        print(f"Error obteniendo planes de cuidado para paciente ID {id_px}: {e}")
+        logger.error('Error obteniendo planes de cuidado para paciente ID %s: %s', id_px, e)
         return []
     finally:
         if cursor:
             cursor.close()
 
 def get_plan_cuidado_activo_para_paciente(connection, id_px): # Nueva función auxiliar
+    en_mapa = _identidad_obtener('plancuidado', ('activo', _entero_o_none(id_px)))
+    if en_mapa is not _SIN_DATO:
+        return en_mapa
     cursor = None
     try:
-        # Esta query podría necesitar ajustes para definir "activo" 
-        # (ej. no completado, más reciente, o un campo 'esta_activo' en plancuidado)
-        # Esta versión asume que un plan activo es aquel donde las visitas realizadas
-        # son menores que las planificadas.
+        # Un plan activo es aquel donde las visitas realizadas son menores que las planificadas.
+        # Los contadores visitas_qp_realizadas / visitas_tf_realizadas los mantiene save_seguimiento,
+        # así que esto es una lectura sobre el índice (id_px, fecha) sin agregar 'quiropractico'.
+        # (Un plan sin seguimientos se considera activo aunque visitas_qp sea 0, como antes.)
         query = """
             SELECT 
                 pc.id_plan, 
+                pc.id_px,
                 pc.visitas_qp, 
                 pc.visitas_tf, 
                 pc.adicionales_ids, 
                 pc.inversion_total,
                 pc.fecha AS fecha_creacion_plan,
-                (SELECT COUNT(q.id_seguimiento) 
-                 FROM quiropractico q 
-                 WHERE q.id_plan_cuidado_asociado = pc.id_plan) as visitas_realizadas
+                pc.visitas_qp_realizadas AS visitas_realizadas,
+                pc.visitas_qp_realizadas,
+                pc.visitas_tf_realizadas
             FROM plancuidado pc
-            LEFT JOIN (
-                SELECT id_plan_cuidado_asociado, COUNT(id_seguimiento) as seguimientos_realizados
-                FROM quiropractico
-                GROUP BY id_plan_cuidado_asociado
-            ) q_count ON pc.id_plan = q_count.id_plan_cuidado_asociado
             WHERE pc.id_px = %s 
-            AND (q_count.seguimientos_realizados IS NULL OR q_count.seguimientos_realizados < pc.visitas_qp)
+            AND (pc.visitas_qp_realizadas = 0 OR pc.visitas_qp_realizadas < pc.visitas_qp)
             ORDER BY pc.fecha DESC, pc.id_plan DESC
             LIMIT 1;
         """
-        # Si tienes un campo 'esta_activo' en tu tabla 'plancuidado', la condición WHERE sería más simple:
-        # WHERE pc.id_px = %s AND pc.esta_activo = 1 
-        # ORDER BY STR_TO_DATE(pc.fecha, '%d/%m/%Y') DESC, pc.id_plan DESC LIMIT 1;
 
         cursor = connection.cursor(dictionary=True, buffered=True) # buffered=True es bueno si reutilizas
         cursor.execute(query, (id_px,))
@@ -3485,41 +4153,58 @@ def get_plan_cuidado_activo_para_paciente(connection, id_px): # Nueva función a
             if plan.get('inversion_total') is not None:
                 try: plan['inversion_total'] = float(plan['inversion_total'])
                 except (ValueError, TypeError): plan['inversion_total'] = 0.0
+            _identidad_guardar('plancuidado', ('adicionales', plan['id_plan']),
+                               {'id_px': plan['id_px'], 'adicionales_ids': plan['adicionales_ids']})
         
-        return plan # Devuelve el plan o None si no se encontró
+        return _identidad_guardar('plancuidado', ('activo', _entero_o_none(id_px)), plan) # Devuelve el plan o None si no se encontró
     except Error as e:
-        print(f"Error obteniendo plan activo para paciente ID {id_px}: {e}")
+        logger.error('Error obteniendo plan activo para paciente ID %s: %s', id_px, e)
         return None
     finally:
         if cursor:
             cursor.close()
 
    
+# SELECT compartido por get_recibo_detalles_by_id y get_recibos_para_exportar (lote)
+# COALESCE se usa para obtener el nombre del producto desde productos_servicios
+# si la descripcion_prod en recibo_detalle es NULL o vacía.
+# También se incluye costo_unitario_compra.
+_SELECT_DETALLES_RECIBO = """
+    SELECT 
+        rd.id_detalle,
+        rd.id_recibo,
+        rd.id_prod,
+        rd.cantidad,
+        COALESCE(NULLIF(TRIM(rd.descripcion_prod), ''), ps.nombre, 'Producto/Servicio Desconocido') AS descripcion_item,
+        rd.costo_unitario_venta,
+        rd.costo_unitario_compra, 
+        rd.descuento_linea,
+        rd.subtotal_linea_neto,
+        ps.nombre AS nombre_producto_original,
+        ps.venta AS precio_venta_original_producto,
+        ps.costo AS costo_original_producto
+    FROM recibo_detalle rd
+    LEFT JOIN productos_servicios ps ON rd.id_prod = ps.id_prod
+"""
+
+def _normalizar_detalle_recibo(detalle):
+    """Asegura que los campos numéricos de un detalle sean del tipo correcto (float)."""
+    detalle['cantidad'] = float(detalle.get('cantidad', 0.0) or 0.0)
+    detalle['costo_unitario_venta'] = float(detalle.get('costo_unitario_venta', 0.0) or 0.0)
+    detalle['costo_unitario_compra'] = float(detalle.get('costo_unitario_compra', 0.0) or 0.0)
+    detalle['descuento_linea'] = float(detalle.get('descuento_linea', 0.0) or 0.0)
+    detalle['subtotal_linea_neto'] = float(detalle.get('subtotal_linea_neto', 0.0) or 0.0)
+    detalle['precio_venta_original_producto'] = float(detalle.get('precio_venta_original_producto', 0.0) or 0.0)
+    detalle['costo_original_producto'] = float(detalle.get('costo_original_producto', 0.0) or 0.0)
+    return detalle
+
 def get_recibo_detalles_by_id(connection, id_recibo):
     """
     Obtiene todos los detalles (líneas de ítem) para un recibo específico.
     """
     cursor = None
     try:
-        # COALESCE se usa para obtener el nombre del producto desde productos_servicios
-        # si la descripcion_prod en recibo_detalle es NULL o vacía.
-        # También se incluye costo_unitario_compra.
-        query = """
-            SELECT 
-                rd.id_detalle,
-                rd.id_recibo,
-                rd.id_prod,
-                rd.cantidad,
-                COALESCE(NULLIF(TRIM(rd.descripcion_prod), ''), ps.nombre, 'Producto/Servicio Desconocido') AS descripcion_item,
-                rd.costo_unitario_venta,
-                rd.costo_unitario_compra, 
-                rd.descuento_linea,
-                rd.subtotal_linea_neto,
-                ps.nombre AS nombre_producto_original,
-                ps.venta AS precio_venta_original_producto,
-                ps.costo AS costo_original_producto
-            FROM recibo_detalle rd
-            LEFT JOIN productos_servicios ps ON rd.id_prod = ps.id_prod
+        query = _SELECT_DETALLES_RECIBO + """
             WHERE rd.id_recibo = %s
             ORDER BY rd.id_detalle ASC;
         """
@@ -3527,20 +4212,9 @@ def get_recibo_detalles_by_id(connection, id_recibo):
         cursor.execute(query, (id_recibo,))
         detalles = cursor.fetchall()
 
-        # Asegurar que los campos numéricos sean del tipo correcto (float)
-        if detalles:
-            for detalle in detalles:
-                detalle['cantidad'] = float(detalle.get('cantidad', 0.0) or 0.0)
-                detalle['costo_unitario_venta'] = float(detalle.get('costo_unitario_venta', 0.0) or 0.0)
-                detalle['costo_unitario_compra'] = float(detalle.get('costo_unitario_compra', 0.0) or 0.0)
-                detalle['descuento_linea'] = float(detalle.get('descuento_linea', 0.0) or 0.0)
-                detalle['subtotal_linea_neto'] = float(detalle.get('subtotal_linea_neto', 0.0) or 0.0)
-                detalle['precio_venta_original_producto'] = float(detalle.get('precio_venta_original_producto', 0.0) or 0.0)
-                detalle['costo_original_producto'] = float(detalle.get('costo_original_producto', 0.0) or 0.0)
-        
-        return detalles if detalles else []
+        return [_normalizar_detalle_recibo(detalle) for detalle in detalles] if detalles else []
     except Error as e:
-        print(f"Error obteniendo detalles del recibo ID {id_recibo}: {e}")
+        logger.error('Error obteniendo detalles del recibo ID %s: %s', id_recibo, e)
         return []
     finally:
         if cursor:
@@ -3591,7 +4265,7 @@ def get_recibos_by_patient(connection, patient_id):
 
         return recibos if recibos else []
     except Error as e:
-        print(f"Error obteniendo recibos para el paciente ID {patient_id}: {e}")
+        logger.error('Error obteniendo recibos para el paciente ID %s: %s', patient_id, e)
         return []
     finally:
         if cursor:
@@ -3626,12 +4300,51 @@ def get_latest_recibo_id_for_patient(connection, patient_id):
             return result['id_recibo']
         return None
     except Error as e:
-        print(f"Error obteniendo el último ID de recibo para el paciente ID {patient_id}: {e}")
+        logger.error('Error obteniendo el último ID de recibo para el paciente ID %s: %s', patient_id, e)
         return None
     finally:
         if cursor:
             cursor.close()
 
+# SELECT compartido por get_recibo_by_id y get_recibos_para_exportar (lote)
+_SELECT_RECIBO = """
+    SELECT 
+        r.id_recibo,
+        r.id_px,
+        CONCAT(dp.nombre, ' ', dp.apellidop, IFNULL(CONCAT(' ', dp.apellidom), '')) AS nombre_paciente_completo,
+        r.id_dr,
+        dr.nombre AS nombre_doctor_recibo,
+        r.fecha,  -- <-- Obtenemos el objeto DATE
+        r.subtotal_bruto,
+        r.descuento_total,
+        r.total_neto,
+        r.pago_efectivo,
+        r.pago_tarjeta,
+        r.pago_transferencia,
+        r.pago_otro,
+        r.pago_otro_desc,
+        r.notas,
+        ce.nombre AS nombre_centro,
+        ce.direccion AS direccion_centro,
+        ce.tel AS telefono_centro,
+        ce.cel AS celular_centro
+    FROM recibos r
+    JOIN datos_personales dp ON r.id_px = dp.id_px
+    LEFT JOIN dr ON r.id_dr = dr.id_dr
+    LEFT JOIN centro ce ON dr.centro = ce.id_centro
+"""
+
+def _normalizar_recibo(recibo_data):
+    # 1. Convertir el objeto 'date' a string 'dd/mm/YYYY'
+    if 'fecha' in recibo_data and isinstance(recibo_data['fecha'], date):
+        recibo_data['fecha'] = recibo_data['fecha'].strftime('%d/%m/%Y')
+
+    # 2. Convertir campos numéricos
+    for key in ['subtotal_bruto', 'descuento_total', 'total_neto',
+                'pago_efectivo', 'pago_tarjeta', 'pago_transferencia', 'pago_otro']:
+        recibo_data[key] = float(recibo_data.get(key, 0.0) or 0.0)
+    return recibo_data
+
 def get_recibo_by_id(connection, recibo_id):
     """
     Obtiene los datos principales de un recibo específico por su ID.
@@ -3639,61 +4352,86 @@ def get_recibo_by_id(connection, recibo_id):
     """
     cursor = None
     try:
-        query = """
-            SELECT 
-                r.id_recibo,
-                r.id_px,
-                CONCAT(dp.nombre, ' ', dp.apellidop, IFNULL(CONCAT(' ', dp.apellidom), '')) AS nombre_paciente_completo,
-                r.id_dr,
-                dr.nombre AS nombre_doctor_recibo,
-                r.fecha,  -- <-- Obtenemos el objeto DATE
-                r.subtotal_bruto,
-                r.descuento_total,
-                r.total_neto,
-                r.pago_efectivo,
-                r.pago_tarjeta,
-                r.pago_transferencia,
-                r.pago_otro,
-                r.pago_otro_desc,
-                r.notas,
-                ce.nombre AS nombre_centro,
-                ce.direccion AS direccion_centro,
-                ce.tel AS telefono_centro,
-                ce.cel AS celular_centro
-            FROM recibos r
-            JOIN datos_personales dp ON r.id_px = dp.id_px
-            LEFT JOIN dr ON r.id_dr = dr.id_dr
-            LEFT JOIN centro ce ON dr.centro = ce.id_centro
-            WHERE r.id_recibo = %s;
-        """
+        query = _SELECT_RECIBO + " WHERE r.id_recibo = %s;"
         cursor = connection.cursor(dictionary=True)
         cursor.execute(query, (recibo_id,))
         recibo_data = cursor.fetchone()
 
         if recibo_data:
-            
-            # 1. Convertir el objeto 'date' a string 'dd/mm/YYYY'
-            if 'fecha' in recibo_data and isinstance(recibo_data['fecha'], date):
-                recibo_data['fecha'] = recibo_data['fecha'].strftime('%d/%m/%Y')
-            
-
-            # 2. Convertir campos numéricos (esto ya lo tenías)
-            recibo_data['subtotal_bruto'] = float(recibo_data.get('subtotal_bruto', 0.0) or 0.0)
-            recibo_data['descuento_total'] = float(recibo_data.get('descuento_total', 0.0) or 0.0)
-            recibo_data['total_neto'] = float(recibo_data.get('total_neto', 0.0) or 0.0)
-            recibo_data['pago_efectivo'] = float(recibo_data.get('pago_efectivo', 0.0) or 0.0)
-            recibo_data['pago_tarjeta'] = float(recibo_data.get('pago_tarjeta', 0.0) or 0.0)
-            recibo_data['pago_transferencia'] = float(recibo_data.get('pago_transferencia', 0.0) or 0.0)
-            recibo_data['pago_otro'] = float(recibo_data.get('pago_otro', 0.0) or 0.0)
+            _normalizar_recibo(recibo_data)
             
         return recibo_data
     except Error as e:
-        print(f"Error obteniendo el recibo ID {recibo_id}: {e}")
+        logger.error('Error obteniendo el recibo ID %s: %s', recibo_id, e)
         return None
     finally:
         if cursor:
             cursor.close()
 
+def get_ids_recibos_periodo(connection, fecha_inicio, fecha_fin, id_dr=None, id_centro=None):
+    """
+    IDs de los recibos emitidos entre fecha_inicio y fecha_fin (objetos date, inclusive),
+    opcionalmente de un doctor o de una clínica (la del doctor que emitió el recibo).
+    Ordenados por fecha e ID; solo se traen los IDs para no cargar todo el periodo en memoria.
+    """
+    cursor = None
+    try:
+        query = """
+            SELECT r.id_recibo
+            FROM recibos r
+            LEFT JOIN dr ON r.id_dr = dr.id_dr
+            WHERE r.fecha BETWEEN %s AND %s
+        """
+        params = [fecha_inicio, fecha_fin]
+        if id_dr:
+            query += " AND r.id_dr = %s"
+            params.append(id_dr)
+        if id_centro:
+            query += " AND dr.centro = %s"
+            params.append(id_centro)
+        query += " ORDER BY r.fecha ASC, r.id_recibo ASC"
+        cursor = connection.cursor()
+        cursor.execute(query, tuple(params))
+        return [fila[0] for fila in cursor.fetchall()]
+    except Error as e:
+        logger.error('Error obteniendo recibos del periodo %s - %s: %s', fecha_inicio, fecha_fin, e)
+        return []
+    finally:
+        if cursor:
+            cursor.close()
+
+def get_recibos_para_exportar(connection, ids_recibos):
+    """
+    Versión por lotes de get_recibo_by_id + get_recibo_detalles_by_id: dos consultas para
+    todos los IDs dados. Devuelve los recibos (con la lista 'detalles') en el orden de ids_recibos.
+    Los errores de la BD se propagan.
+    """
+    if not ids_recibos:
+        return []
+    cursor = None
+    try:
+        placeholders = ', '.join(['%s'] * len(ids_recibos))
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(_SELECT_RECIBO + f" WHERE r.id_recibo IN ({placeholders})", tuple(ids_recibos))
+        recibos = {r['id_recibo']: _normalizar_recibo(r) for r in cursor.fetchall()}
+        for recibo in recibos.values():
+            recibo['detalles'] = []
+
+        cursor.execute(_SELECT_DETALLES_RECIBO + f" WHERE rd.id_recibo IN ({placeholders}) ORDER BY rd.id_recibo, rd.id_detalle",
+                       tuple(ids_recibos))
+        for detalle in cursor.fetchall():
+            if detalle['id_recibo'] in recibos:
+                recibos[detalle['id_recibo']]['detalles'].append(_normalizar_detalle_recibo(detalle))
+
+        return [recibos[id_recibo] for id_recibo in ids_recibos if id_recibo in recibos]
+    except Error as e:
+        # Se propaga: devolver [] dejaría el lote fuera de la exportación sin aviso
+        logger.error('Error obteniendo lote de recibos para exportar: %s', e)
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+
 def get_patients_by_recent_followup(connection, limit=10):
     """
     Obtiene los 'limit' pacientes con el seguimiento más reciente.
@@ -3732,32 +4470,42 @@ def get_patients_by_recent_followup(connection, limit=10):
         
         return patients if patients else []
     except Error as e:
-        print(f"Error obteniendo pacientes por seguimiento reciente: {e}")
+        logger.error('Error obteniendo pacientes por seguimiento reciente: %s', e)
         return []
     finally:
         if cursor:
             cursor.close()
 
+def _seguimiento_tiene_tf(terapia_str):
+    """Un seguimiento consume 1 sesión de TF si su cadena 'terapia' (0,id,id) tiene algún ID distinto de '0'."""
+    return any(tid and tid != '0' for tid in (terapia_str or '0,').split(','))
+
+
+def _texto_terapias(terapia_str, terapias_map):
+    """Convierte la cadena de terapias (0,id,id) en los nombres separados por coma."""
+    terapias_ids = [tid for tid in (terapia_str or '0,').split(',') if tid and tid != '0']
+    terapias_nombres = [terapias_map.get(tid, f"ID:{tid}") for tid in terapias_ids]
+    return ', '.join(terapias_nombres) if terapias_nombres else 'Ninguna'
+
+
 def get_resumen_dia_anterior(connection):
     """
-    Obtiene un resumen de los pacientes atendidos el día anterior.
-    Con DEBUGGING activado.
+    Obtiene un resumen de los pacientes atendidos en el último día con seguimientos
+    (dentro de los últimos 30 días).
+    Carga cada dimensión (nombres, anamnesis, últimos seguimientos y planes con sus contadores de consumo)
+    para TODOS los pacientes del día con una consulta por dimensión (listas IN + ROW_NUMBER)
+    y arma el resultado en memoria: el número de consultas no depende del número de pacientes.
     """
     cursor = None
     resumen_pacientes = []
-    
-    print("\n--- DEBUG: Iniciando get_resumen_dia_anterior ---")
-    
+
     try:
         terapias_disponibles = get_terapias_fisicas(connection)
         terapias_map = {str(t['id_prod']): t['nombre'] for t in terapias_disponibles}
 
         cursor = connection.cursor(dictionary=True)
-        
-        # --- INICIO LÓGICA DE BÚSQUEDA (OPTIMIZADA) ---
-        print("DEBUG: Buscando última fecha con registros en los últimos 30 días...")
-        
-        # Consulta optimizada: Obtener la fecha máxima en el rango de los últimos 30 días
+
+        # 1. Última fecha con seguimientos en los últimos 30 días
         query_ultima_fecha = """
             SELECT MAX(fecha) as ultima_fecha 
             FROM quiropractico 
@@ -3765,65 +4513,41 @@ def get_resumen_dia_anterior(connection):
         """
         cursor.execute(query_ultima_fecha)
         result = cursor.fetchone()
-        
-        fecha_encontrada_str = None
-        if result and result.get('ultima_fecha'):
-            # Asegurar formato YYYY-MM-DD
-            fecha_obj = result['ultima_fecha']
-            if isinstance(fecha_obj, str):
-                fecha_encontrada_str = fecha_obj
-            else:
-                fecha_encontrada_str = fecha_obj.strftime('%Y-%m-%d')
-            print(f"DEBUG: ¡ENCONTRADO! Última fecha con datos: {fecha_encontrada_str}")
-        else:
-            print("ADVERTENCIA: No se encontraron seguimientos en los últimos 30 días.")
-            return [] 
-
-        # --- PASO 2: Obtener Pacientes ---
-        print(f"DEBUG: Buscando IDs de pacientes para {fecha_encontrada_str}")
-        
-        sql_pacientes_ayer = """
-            SELECT DISTINCT id_px
-            FROM quiropractico
-            WHERE fecha = %s
-            ORDER BY id_px; 
-        """
-        cursor.execute(sql_pacientes_ayer, (fecha_encontrada_str,))
+        if not result or not result.get('ultima_fecha'):
+            return []
+        fecha_obj = result['ultima_fecha']
+        fecha_encontrada_str = fecha_obj if isinstance(fecha_obj, str) else fecha_obj.strftime('%Y-%m-%d')
+
+        # 2. Pacientes atendidos ese día (con su nombre)
+        cursor.execute("""
+            SELECT q.id_px, dp.nombre, dp.apellidop, dp.apellidom
+            FROM (SELECT DISTINCT id_px FROM quiropractico WHERE fecha = %s) AS q
+            LEFT JOIN datos_personales dp ON dp.id_px = q.id_px
+            ORDER BY q.id_px
+        """, (fecha_encontrada_str,))
         pacientes_rows = cursor.fetchall()
-        pacientes_ayer_ids = [row['id_px'] for row in pacientes_rows]
-
-        print(f"DEBUG: Pacientes encontrados (IDs): {pacientes_ayer_ids}")
-
-        if not pacientes_ayer_ids:
-            print(f"DEBUG: Extraño... la búsqueda inicial dijo que sí había datos, pero ahora la lista de pacientes está vacía.")
+        if not pacientes_rows:
             return []
 
-        # 3. Procesar cada paciente (sin cambios en la lógica, solo prints)
-        for patient_id in pacientes_ayer_ids:
-            # ... (resto de tu lógica de procesamiento de pacientes, no necesitamos debuguear esto por ahora) ...
-            # Copia aquí el resto de tu función original (el bucle for completo)
-            # O para la prueba rápida, puedes dejar este bloque simple para ver si llega hasta aquí:
-            
-            paciente_info = {
-                'id_px': patient_id,
-                'nombre_completo': 'Test Debug',
-                 # ... Rellena con tu lógica original si quieres ver el reporte completo ...
-            }
-            # (Para no hacer el código gigante aquí, asumo que mantienes tu lógica del bucle for)
-            
-            # --- COPIA TU BUCLE FOR ORIGINAL AQUÍ ---
-            # ...
-            cursor.execute("SELECT nombre, apellidop, apellidom FROM datos_personales WHERE id_px = %s", (patient_id,))
-            paciente_db = cursor.fetchone()
-            if paciente_db:
-                paciente_info['nombre_completo'] = f"{paciente_db.get('nombre', '')} {paciente_db.get('apellidop', '')} {paciente_db.get('apellidom', '')}".strip()
-            
-            ultima_anamnesis_data = get_latest_anamnesis(connection, patient_id)
-            if ultima_anamnesis_data:
-                 paciente_info['condicion1_anamnesis'] = ultima_anamnesis_data.get('condicion1', 'N/A')
-
-            sql_ultimos_seguimientos = """
-                SELECT fecha, notas, terapia,
+        pacientes_ids = [row['id_px'] for row in pacientes_rows]
+        placeholders = ', '.join(['%s'] * len(pacientes_ids))
+
+        # 3. Última anamnesis de cada paciente
+        cursor.execute(f"""
+            SELECT id_px, condicion1 FROM (
+                SELECT id_px, condicion1,
+                       ROW_NUMBER() OVER (PARTITION BY id_px ORDER BY fecha DESC, id_anamnesis DESC) AS rn
+                FROM anamnesis
+                WHERE id_px IN ({placeholders})
+            ) AS a
+            WHERE rn = 1
+        """, tuple(pacientes_ids))
+        anamnesis_por_px = {row['id_px']: row for row in cursor.fetchall()}
+
+        # 4. Los dos últimos seguimientos de cada paciente
+        cursor.execute(f"""
+            SELECT id_px, fecha, notas, terapia, segmentos_ajustados, id_plan_cuidado_asociado FROM (
+                SELECT id_px, fecha, notas, terapia,
                        CONCAT_WS(', ',
                            NULLIF(occipital, ''), NULLIF(atlas, ''), NULLIF(axis, ''), NULLIF(c3, ''), NULLIF(c4, ''),
                            NULLIF(c5, ''), NULLIF(c6, ''), NULLIF(c7, ''), NULLIF(t1, ''), NULLIF(t2, ''),
@@ -3832,75 +4556,95 @@ def get_resumen_dia_anterior(connection):
                            NULLIF(l1, ''), NULLIF(l2, ''), NULLIF(l3, ''), NULLIF(l4, ''), NULLIF(l5, ''),
                            NULLIF(sacro, ''), NULLIF(coxis, ''), NULLIF(iliaco_d, ''), NULLIF(iliaco_i, ''), NULLIF(pubis, '')
                        ) AS segmentos_ajustados,
-                       id_plan_cuidado_asociado -- <-- Necesitamos esto para el plan
+                       id_plan_cuidado_asociado,
+                       ROW_NUMBER() OVER (PARTITION BY id_px ORDER BY fecha DESC, id_seguimiento DESC) AS rn
                 FROM quiropractico
-                WHERE id_px = %s
-                ORDER BY fecha DESC, id_seguimiento DESC
-                LIMIT 2;
-            """
-            cursor.execute(sql_ultimos_seguimientos, (patient_id,))
-            ultimos_seguimientos = cursor.fetchall()
+                WHERE id_px IN ({placeholders})
+            ) AS s
+            WHERE rn <= 2
+            ORDER BY id_px, rn
+        """, tuple(pacientes_ids))
+        seguimientos_por_px = {}
+        for row in cursor.fetchall():
+            seguimientos_por_px.setdefault(row['id_px'], []).append(row)
+
+        # 5. Planes: el vinculado al último seguimiento, o el plan activo más reciente como respaldo
+        planes_vinculados_ids = {segs[0]['id_plan_cuidado_asociado'] for segs in seguimientos_por_px.values()
+                                 if segs[0].get('id_plan_cuidado_asociado')}
+        planes_por_id = {}
+        if planes_vinculados_ids:
+            ph_planes = ', '.join(['%s'] * len(planes_vinculados_ids))
+            cursor.execute(f"""
+                SELECT id_plan, id_px, pb_diagnostico, visitas_qp, visitas_tf,
+                       visitas_qp_realizadas, visitas_tf_realizadas
+                FROM plancuidado
+                WHERE id_plan IN ({ph_planes})
+            """, tuple(planes_vinculados_ids))
+            planes_por_id = {row['id_plan']: row for row in cursor.fetchall()}
+
+        plan_por_px = {}
+        sin_plan_vinculado = []
+        for patient_id in pacientes_ids:
+            segs = seguimientos_por_px.get(patient_id)
+            id_plan_ayer = segs[0].get('id_plan_cuidado_asociado') if segs else None
+            if id_plan_ayer and id_plan_ayer in planes_por_id:
+                plan_por_px[patient_id] = planes_por_id[id_plan_ayer]
+            else:
+                sin_plan_vinculado.append(patient_id)
+
+        if sin_plan_vinculado:
+            # Mismo criterio que get_plan_cuidado_activo_para_paciente, para todos a la vez
+            ph_px = ', '.join(['%s'] * len(sin_plan_vinculado))
+            cursor.execute(f"""
+                SELECT id_plan, id_px, visitas_qp, visitas_tf, visitas_qp_realizadas, visitas_tf_realizadas FROM (
+                    SELECT pc.id_plan, pc.id_px, pc.visitas_qp, pc.visitas_tf,
+                           pc.visitas_qp_realizadas, pc.visitas_tf_realizadas,
+                           ROW_NUMBER() OVER (PARTITION BY pc.id_px ORDER BY pc.fecha DESC, pc.id_plan DESC) AS rn
+                    FROM plancuidado pc
+                    WHERE pc.id_px IN ({ph_px})
+                    AND (pc.visitas_qp_realizadas = 0 OR pc.visitas_qp_realizadas < pc.visitas_qp)
+                ) AS activos
+                WHERE rn = 1
+            """, tuple(sin_plan_vinculado))
+            for row in cursor.fetchall():
+                plan_por_px[row['id_px']] = row
 
-            id_plan_ayer = None
-            
+        # 6. Armar el resumen en memoria
+        for paciente_db in pacientes_rows:
+            patient_id = paciente_db['id_px']
+            paciente_info = {
+                'id_px': patient_id,
+                'nombre_completo': f"{paciente_db.get('nombre') or ''} {paciente_db.get('apellidop') or ''} {paciente_db.get('apellidom') or ''}".strip()
+            }
+
+            ultima_anamnesis_data = anamnesis_por_px.get(patient_id)
+            if ultima_anamnesis_data:
+                paciente_info['condicion1_anamnesis'] = ultima_anamnesis_data.get('condicion1', 'N/A')
+
+            ultimos_seguimientos = seguimientos_por_px.get(patient_id, [])
             if ultimos_seguimientos:
                 seg_ayer = ultimos_seguimientos[0]
-                id_plan_ayer = seg_ayer.get('id_plan_cuidado_asociado') # Obtener ID del plan
-                
-                terapias_ids_ayer = [tid for tid in seg_ayer.get('terapia', '0,').split(',') if tid and tid != '0']
-                terapias_nombres_ayer = [terapias_map.get(tid, f"ID:{tid}") for tid in terapias_ids_ayer]
-                terapias_texto_ayer = ', '.join(terapias_nombres_ayer) if terapias_nombres_ayer else 'Ninguna'
-                
-                # --- CORRECCIÓN EN LEER FECHA (Python DATE a String) ---
-                fecha_seg_ayer_str = seg_ayer.get('fecha')
-                if isinstance(fecha_seg_ayer_str, date): 
-                    fecha_seg_ayer_str = fecha_seg_ayer_str.strftime('%d/%m/%Y')
-
                 paciente_info['seguimiento_ayer'] = {
-                    'fecha': fecha_seg_ayer_str,
+                    'fecha': to_frontend_str(seg_ayer.get('fecha')),
                     'segmentos': seg_ayer.get('segmentos_ajustados') or 'Ninguno',
-                    'terapias': terapias_texto_ayer,
+                    'terapias': _texto_terapias(seg_ayer.get('terapia'), terapias_map),
                     'notas': seg_ayer.get('notas') or 'Sin notas.'
                 }
-
                 if len(ultimos_seguimientos) > 1:
                     seg_anterior = ultimos_seguimientos[1]
-                    terapias_ids_anterior = [tid for tid in seg_anterior.get('terapia', '0,').split(',') if tid and tid != '0']
-                    terapias_nombres_anterior = [terapias_map.get(tid, f"ID:{tid}") for tid in terapias_ids_anterior]
-                    terapias_texto_anterior = ', '.join(terapias_nombres_anterior) if terapias_nombres_anterior else 'Ninguna'
-                    
-                    fecha_seg_ant_str = seg_anterior.get('fecha')
-                    if isinstance(fecha_seg_ant_str, date): fecha_seg_ant_str = fecha_seg_ant_str.strftime('%d/%m/%Y')
-
                     paciente_info['seguimiento_anterior'] = {
-                        'fecha': fecha_seg_ant_str,
+                        'fecha': to_frontend_str(seg_anterior.get('fecha')),
                         'segmentos': seg_anterior.get('segmentos_ajustados') or 'Ninguno',
-                        'terapias': terapias_texto_anterior,
+                        'terapias': _texto_terapias(seg_anterior.get('terapia'), terapias_map),
                     }
 
-            # Lógica del plan (simplificada para el ejemplo, usa la tuya)
-            plan_activo_data = None
-            if id_plan_ayer:
-                 plan_activo_data = get_specific_plan_cuidado(connection, id_plan_ayer) 
-            if not plan_activo_data:
-                plan_activo_data = get_plan_cuidado_activo_para_paciente(connection, patient_id)
-
+            plan_activo_data = plan_por_px.get(patient_id)
             if plan_activo_data and plan_activo_data.get('id_plan'):
                 id_plan_activo = plan_activo_data['id_plan']
-                total_qp_plan = plan_activo_data.get('visitas_qp', 0)
-                total_tf_plan = plan_activo_data.get('visitas_tf', 0)
-                seguimientos_del_plan = get_seguimientos_for_plan(connection, id_plan_activo)
-                qp_consumidas = 0
-                tf_consumidas = 0
-                if seguimientos_del_plan:
-                    qp_consumidas = len(seguimientos_del_plan)
-                    for seg in seguimientos_del_plan:
-                        terapias_ids_seg = [tid for tid in seg.get('terapia', '0,').split(',') if tid and tid != '0']
-                        if terapias_ids_seg: tf_consumidas += 1
-                
-                qp_restantes = total_qp_plan - qp_consumidas
-                tf_restantes = total_tf_plan - tf_consumidas
-                
+                qp_consumidas = plan_activo_data.get('visitas_qp_realizadas') or 0
+                tf_consumidas = plan_activo_data.get('visitas_tf_realizadas') or 0
+                qp_restantes = (plan_activo_data.get('visitas_qp') or 0) - qp_consumidas
+                tf_restantes = (plan_activo_data.get('visitas_tf') or 0) - tf_consumidas
                 paciente_info['plan_activo'] = {
                     'nombre': plan_activo_data.get('pb_diagnostico', f'Plan ID:{id_plan_activo}'),
                     'qp_restantes': qp_restantes,
@@ -3909,12 +4653,11 @@ def get_resumen_dia_anterior(connection):
                 }
 
             resumen_pacientes.append(paciente_info)
-            # --- FIN COPIA BUCLE ---
 
         return resumen_pacientes
 
     except Error as e:
-        print(f"Error en get_resumen_dia_anterior: {e}")
+        logger.error('Error en get_resumen_dia_anterior: %s', e)
         return []
     finally:
         if cursor:
@@ -3938,7 +4681,7 @@ def get_first_postura_on_or_after_date(connection, patient_id, target_date_str):
         except ValueError:
              # Si falla (ej. ya viene en YYYY-MM-DD o es inválida), intentamos usarla tal cual o logueamos
              # Asumimos que viene en dd/mm/yyyy como dice el docstring
-             print(f"WARN: Fecha inválida en get_first_postura_on_or_after_date: {target_date_str}")
+             logger.warning('Fecha inválida en get_first_postura_on_or_after_date: %s', target_date_str)
              return None
 
         # 1. Intenta buscar en o después de la fecha
@@ -3954,7 +4697,7 @@ def get_first_postura_on_or_after_date(connection, patient_id, target_date_str):
 
         # 2. Fallback
         if not result:
-            print(f"INFO: No se encontró postura en o después de {target_date_str}. Buscando antes.")
+            logger.info('No se encontró postura en o después de %s. Buscando antes.', target_date_str)
             sql_before = f"""
                 SELECT *
                 FROM {tabla_posturas}
@@ -3967,7 +4710,7 @@ def get_first_postura_on_or_after_date(connection, patient_id, target_date_str):
 
         return result
     except Error as e:
-        print(f"Error en get_first_postura_on_or_after_date: {e}")
+        logger.error('Error en get_first_postura_on_or_after_date: %s', e)
         return None
     finally:
         if cursor:
@@ -3977,36 +4720,19 @@ def get_first_postura_on_or_after_date(connection, patient_id, target_date_str):
 def get_active_plan_status(connection, patient_id):
     """
     Obtiene el plan de cuidado activo MÁS reciente y calcula su estado de uso
-    (sesiones consumidas y restantes).
+    (sesiones consumidas y restantes) a partir de los contadores del plan.
     """
-    # 1. Obtener el plan activo más reciente
-    # Usamos la función que ya existe y que busca el plan activo (si no, la de más abajo)
-    # NOTA: get_plan_cuidado_activo_para_paciente ya busca el plan MÁS RECIENTE
     plan_data = get_plan_cuidado_activo_para_paciente(connection, patient_id)
 
     if not plan_data:
         # Si no se encontró un plan "activo", salimos.
-        # Podríamos buscar el último "completado", pero por ahora nos centramos en el activo.
         return None
 
-    # 2. Si se encontró un plan, obtener sus seguimientos
-    id_plan_activo = plan_data.get('id_plan')
-    total_qp_plan = plan_data.get('visitas_qp', 0)
-    total_tf_plan = plan_data.get('visitas_tf', 0)
-
-    seguimientos_del_plan = get_seguimientos_for_plan(connection, id_plan_activo)
-
-    # 3. Calcular sesiones consumidas (misma lógica que usamos en el resumen)
-    qp_consumidas = 0
-    tf_consumidas = 0
-    if seguimientos_del_plan:
-        qp_consumidas = len(seguimientos_del_plan) # Cada seguimiento cuenta como 1 QP
-        for seg in seguimientos_del_plan:
-            terapias_ids_seg = [tid for tid in seg.get('terapia', '0,').split(',') if tid and tid != '0']
-            if terapias_ids_seg: # Si el seguimiento tuvo terapias, cuenta como 1 TF
-                tf_consumidas += 1
+    total_qp_plan = plan_data.get('visitas_qp') or 0
+    total_tf_plan = plan_data.get('visitas_tf') or 0
+    qp_consumidas = plan_data.get('visitas_qp_realizadas') or 0 # Cada seguimiento cuenta como 1 QP
+    tf_consumidas = plan_data.get('visitas_tf_realizadas') or 0 # Cada seguimiento con terapias cuenta como 1 TF
 
-    # 4. Añadir los cálculos al diccionario del plan
     plan_data['qp_consumidas'] = qp_consumidas
     plan_data['tf_consumidas'] = tf_consumidas
     plan_data['qp_restantes'] = total_qp_plan - qp_consumidas
@@ -4022,7 +4748,7 @@ def update_postura_ortho_notes(connection, id_postura, notas):
     """
     cursor = None
     if not id_postura or notas is None: # Permite guardar notas vacías si se envían
-        print("WARN (update_postura_ortho_notes): Faltan id_postura o notas.")
+        logger.warning('update_postura_ortho_notes: Faltan id_postura o notas.')
         return False
 
     try:
@@ -4030,16 +4756,17 @@ def update_postura_ortho_notes(connection, id_postura, notas):
         # Asumiendo que el nombre de tu tabla es 'postura'
         query = "UPDATE postura SET notas_pruebas_ortoneuro = %s WHERE id_postura = %s"
         cursor.execute(query, (notas, id_postura))
+        _olvidar_identidad('postura')
 
         if cursor.rowcount > 0:
-            print(f"INFO: Notas ortopédicas actualizadas para id_postura {id_postura}.")
+            logger.info('Notas ortopédicas actualizadas para id_postura %s.', id_postura)
         else:
-            print(f"WARN: No se encontró id_postura {id_postura} para actualizar notas (o las notas eran las mismas).")
+            logger.warning('No se encontró id_postura %s para actualizar notas (o las notas eran las mismas).', id_postura)
 
         return True # Indica que la consulta se ejecutó
 
     except Error as e:
-        print(f"ERROR en update_postura_ortho_notes: {e}")
+        logger.error('ERROR en update_postura_ortho_notes: %s', e)
         return False # Indica fallo
     finally:
         if cursor:
@@ -4055,9 +4782,11 @@ def analizar_adicionales_plan(connection, id_plan):
     try:
         cursor = connection.cursor(dictionary=True, buffered=True)
 
-        # 1. Obtener el ID del paciente y los productos (sin cambios)
-        cursor.execute("SELECT id_px, adicionales_ids FROM plancuidado WHERE id_plan = %s", (id_plan,))
-        plan = cursor.fetchone()
+        # 1. Obtener el ID del paciente y los productos (normalmente ya leídos en este request)
+        plan = _identidad_obtener('plancuidado', ('adicionales', _entero_o_none(id_plan)))
+        if plan is _SIN_DATO:
+            cursor.execute("SELECT id_px, adicionales_ids FROM plancuidado WHERE id_plan = %s", (id_plan,))
+            plan = _identidad_guardar('plancuidado', ('adicionales', _entero_o_none(id_plan)), cursor.fetchone())
         if not plan or not plan.get('adicionales_ids'): return []
         patient_id = plan['id_px']
         adicionales_ids_str = plan['adicionales_ids'].strip('0,')
@@ -4066,10 +4795,15 @@ def analizar_adicionales_plan(connection, id_plan):
         if not adicionales_ids_list: return []
         placeholders = ', '.join(['%s'] * len(adicionales_ids_list))
 
-        # 2. Obtener los nombres de los productos (sin cambios)
-        query_productos = f"SELECT id_prod, nombre FROM productos_servicios WHERE id_prod IN ({placeholders})"
-        cursor.execute(query_productos, tuple(adicionales_ids_list))
-        recommended_products = {prod['id_prod']: prod for prod in cursor.fetchall()}
+        # 2. Obtener los nombres de los productos (del catálogo en caché si está vigente)
+        catalogo = _catalogo(connection, 'productos', solo_cache=True)
+        if catalogo is not None:
+            recommended_products = {id_prod: catalogo.por_id[id_prod] for id_prod in adicionales_ids_list
+                                    if id_prod in catalogo.por_id}
+        else:
+            query_productos = f"SELECT id_prod, nombre FROM productos_servicios WHERE id_prod IN ({placeholders})"
+            cursor.execute(query_productos, tuple(adicionales_ids_list))
+            recommended_products = {prod['id_prod']: prod for prod in cursor.fetchall()}
 
         # 3. Obtener el historial de compras (ya corregido, pide el objeto DATE)
         query_compras = f"""
@@ -4138,7 +4872,7 @@ def analizar_adicionales_plan(connection, id_plan):
                         analysis['status'] = 'Adquirido'
                 
                 except (ValueError, TypeError, AttributeError) as e:
-                    print(f"Error procesando fechas de renovación: {e}")
+                    logger.error('Error procesando fechas de renovación: %s', e)
                     analysis['status'] = 'Error en fecha'
             
             status_list.append(analysis)
@@ -4146,7 +4880,7 @@ def analizar_adicionales_plan(connection, id_plan):
         return status_list
 
     except Error as e:
-        print(f"Error en analizar_adicionales_plan: {e}")
+        logger.error('Error en analizar_adicionales_plan: %s', e)
         return []
     finally:
         if cursor:
@@ -4189,7 +4923,7 @@ def get_unseen_notes_for_patient(connection, patient_id):
 
         return notes if notes else []
     except Error as e:
-        print(f"Error obteniendo notas no vistas para paciente {patient_id}: {e}")
+        logger.error('Error obteniendo notas no vistas para paciente %s: %s', patient_id, e)
         return []
     finally:
         if cursor:
@@ -4218,10 +4952,10 @@ def mark_notes_as_seen(connection, note_ids_list):
         cursor = connection.cursor()
         cursor.execute(query, tuple(safe_ids))
         rows_affected = cursor.rowcount
-        print(f"Marcadas {rows_affected} notas como vistas.")
+        logger.debug('Marcadas %s notas como vistas.', rows_affected)
         return rows_affected
     except Error as e:
-        print(f"Error marcando notas como vistas: {e}")
+        logger.error('Error marcando notas como vistas: %s', e)
         raise # Re-lanzar para que la ruta de la API pueda hacer rollback
     finally:
         if cursor:
@@ -4243,10 +4977,10 @@ def add_general_note(connection, id_px, notas_text):
         cursor = connection.cursor()
         cursor.execute(query, (id_px, notas_text))
         new_note_id = cursor.lastrowid
-        print(f"Nota general añadida con ID: {new_note_id} para Paciente ID: {id_px}")
+        logger.debug('Nota general añadida con ID: %s para Paciente ID: %s', new_note_id, id_px)
         return new_note_id
     except Error as e:
-        print(f"Error añadiendo nota general: {e}")
+        logger.error('Error añadiendo nota general: %s', e)
         raise # Re-lanzar para que la API haga rollback
     finally:
         if cursor:
@@ -4273,10 +5007,10 @@ def get_latest_postura_on_or_before_date(connection, patient_id, target_date_str
         result = cursor.fetchone()
         return result
     except ValueError:
-        print(f"Error fecha inválida en get_latest_postura_on_or_before_date: {target_date_str}")
+        logger.error('Error fecha inválida en get_latest_postura_on_or_before_date: %s', target_date_str)
         return None
     except Error as e:
-        print(f"Error en get_latest_postura_on_or_before_date: {e}")
+        logger.error('Error en get_latest_postura_on_or_before_date: %s', e)
         return None
     finally:
         if cursor:
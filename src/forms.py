@@ -162,8 +162,10 @@ class FormPacientesFrecuentes(ReporteFechasForm):
 class FormSeguimientos(ReporteFechasDoctorForm):
     submit_seguimientos = SubmitField('Generar Reporte')
 
-# 8. Para "Uso de planes de cuidado"
-class FormUsoPlanes(ReporteFechasForm):
+# 8. Para "Uso de planes de cuidado" (filtrable por doctor y clínica, con lista paginada)
+class FormUsoPlanes(ReporteFechasDoctorForm):
+    centro_id = SelectField('Clínica:', coerce=int, default=0, validators=[Optional()])
+    pagina = IntegerField('Página', default=1, validators=[Optional(), NumberRange(min=1)])
     submit_uso_planes = SubmitField('Generar Reporte')
 
 class AntecedentesForm(FlaskForm):
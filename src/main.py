@@ -1,6 +1,8 @@
+import logging
 import os
-import google.generativeai as genai
-from groq import Groq
+import threading
+#import google.generativeai as genai # Se importa al usarse (utils/ia_models.py)
+#from groq import Groq
 #from openai import OpenAI
 #from dateutil.relativedelta import relativedelta
 #import time
@@ -8,10 +10,11 @@ from datetime import timedelta,datetime, date
 #import uuid
 #import base64
 import json
-from PIL import Image
-from flask import Flask, render_template, request, redirect, jsonify, session, flash, url_for, Response, current_app
+#from PIL import Image
+from flask import Flask, render_template, request, redirect, jsonify, session, flash, url_for, Response, current_app, g
 from database import (connect_to_db,  
-                      get_patients_by_recent_followup, get_resumen_dia_anterior
+                      get_patients_by_recent_followup, get_resumen_dia_anterior,
+                      release_request_connection, finalizar_mapa_identidad, consultas_ahorradas_request
                       )
 from utils.date_manager import to_frontend_str
 #from werkzeug.security import check_password_hash
@@ -24,6 +27,8 @@ from mysql.connector import Error
 #import mediapipe as mp
 from dotenv import load_dotenv
 load_dotenv()  # Cargar variables de entorno desde el archivo .env
+from utils.registro import configurar_logging
+configurar_logging()  # Antes de importar los blueprints (ver utils/registro.py)
 
 from blueprints.auth import auth_bp
 from blueprints.admin import admin_bp
@@ -31,6 +36,14 @@ from blueprints.patient import patient_bp
 from blueprints.clinical import clinical_bp
 
 from decorators import login_required#, admin_required
+from commands import register_commands
+from utils.pose_pool import start_pose_warm_up
+from utils.ia_models import cargar_modelo_generativo
+from utils.image_jobs import init_image_jobs
+from utils.pdf_jobs import init_pdf_jobs
+from utils.sql_metricas import encabezado_server_timing
+
+logger = logging.getLogger(__name__)
 
 
 app = Flask(__name__, static_folder='static', template_folder='../templates')
@@ -47,35 +60,26 @@ try:
     # 2. Cargar el JSON
     with open(config_path, 'r') as f:
         ia_config = json.load(f)
-    print(f"INFO: Configuración de IA cargada desde: {config_path}")
+    logger.info('Configuración de IA cargada desde: %s', config_path)
 except Exception as e:
-    print(f"ERROR: No se pudo cargar '{config_path}'. Usando defaults. Error: {e}")
+    logger.error("No se pudo cargar '%s'. Usando defaults. Error: %s", config_path, e)
     ia_config = {
         "text_models": ["meta-llama/llama-4-scout-17b-16e-instruct"],
-        "vision_model": "gemini-1.5-pro-latest" # Usar un default
+        "vision_model": "gemini-1.5-pro-latest", # Usar un default
+        # Generación de texto con hedging (ver utils/ia_texto.py). Ejemplo en ia_config.json:
+        # "text_hedging": {"enabled": true, "hedge_after_ms": 2500, "timeout_s": 20, "max_parallel": 3}
+        "text_hedging": {"enabled": False},
+        # Imágenes que se envían a Gemini (ver utils/ia_imagenes.py)
+        "vision_images": {"max_edge": 1280, "format": "JPEG", "quality": 85}
     }
 
 # 3. Guardar la configuración RAW (para los modelos de texto)
 app.config['IA_MODELS_CONFIG'] = ia_config 
 
-# 4. Configurar e INICIALIZAR el modelo de VISIÓN (Gemini)
-gemini_api_key = os.environ.get("GEMINI_API_KEY")
-if gemini_api_key:
-    genai.configure(api_key=gemini_api_key)
-    # Leemos el nombre del modelo de visión del JSON
-    vision_model_name = ia_config.get('vision_model', 'gemini-1.5-pro-latest')
-    print(f"INFO: Inicializando modelo de visión Gemini: {vision_model_name}")
-    try:
-        # Creamos el cliente con ESE modelo y lo guardamos
-        app.config['GENERATIVE_MODEL'] = genai.GenerativeModel(vision_model_name)
-    except Exception as e:
-        print(f"ERROR: No se pudo inicializar el modelo Gemini '{vision_model_name}'. Error: {e}")
-        app.config['GENERATIVE_MODEL'] = None
-else:
-    print("WARN: GEMINI_API_KEY no encontrada. El modelo generativo de visión estará deshabilitado.")
-    app.config['GENERATIVE_MODEL'] = None
-    
-    
+# 4. El modelo de VISIÓN (Gemini) se inicializa al primer uso (ver utils/ia_models.py)
+#    o en la precarga que se lanza con el primer request (ver iniciar_precargas más abajo).
+
+
 @app.template_filter('f_date')
 def format_date(value):
     """Formatea un objeto date/datetime a DD/MM/YYYY."""
@@ -124,6 +128,52 @@ app.register_blueprint(admin_bp)
 app.register_blueprint(patient_bp)
 app.register_blueprint(clinical_bp)
 
+# === POOL DE CONEXIONES ===
+# Cada request usa una sola conexión del pool (guardada en 'g'); aquí se devuelve al terminar.
+@app.teardown_appcontext
+def liberar_conexion_db(exc):
+    release_request_connection(exc)
+    finalizar_mapa_identidad(exc)
+
+# Métricas del request en los encabezados: Server-Timing (consultas y tiempo en la BD, ver
+# utils/sql_metricas.py) y las lecturas que el mapa de identidad de database.py resolvió sin ir a la BD
+@app.after_request
+def informar_metricas_request(response):
+    server_timing = encabezado_server_timing(g.get('db_pool_wait_ms'))
+    if server_timing:
+        response.headers['Server-Timing'] = server_timing
+    ahorradas = consultas_ahorradas_request()
+    if ahorradas:
+        response.headers['X-Consultas-Ahorradas'] = str(ahorradas)
+    return response
+
+# === COMANDOS DE CONSOLA (flask <comando>) ===
+register_commands(app)
+
+# === PRECARGA DE MODELOS (MediaPipe Pose, Gemini) ===
+# No se hace al importar (arranque del worker y comandos 'flask' rápidos): se lanza en segundo
+# plano con el primer request, cuando el worker ya está aceptando conexiones.
+# POSE_POOL_WARMUP=0 desactiva la precarga de Pose.
+_precargas_iniciadas = False
+
+@app.before_request
+def iniciar_precargas():
+    global _precargas_iniciadas
+    if _precargas_iniciadas:
+        return
+    _precargas_iniciadas = True
+    start_pose_warm_up()
+    threading.Thread(target=cargar_modelo_generativo, args=(app,), name='precarga-gemini', daemon=True).start()
+
+# === COLA DE IMÁGENES DE POSTURA (segundo plano) ===
+# Procesa las fotos de /pruebas fuera del request y reanuda trabajos pendientes. IMG_JOBS_WORKERS=0 la desactiva.
+init_image_jobs(app)
+
+# === GENERACIÓN DE PDF FUERA DEL REQUEST ===
+# pisa (y el informe de IA del reporte integral) corren en segundo plano; el request espera
+# PDF_JOBS_WAIT_S y si no terminó muestra una página que consulta el estado. PDF_JOBS_WORKERS=0 la desactiva.
+init_pdf_jobs(app)
+
 def index():
      # Si ya está logueado, redirigir a main directo desde el index
     if 'usuario' in session:
@@ -204,7 +254,7 @@ def resumen_dia_anterior():
                                fecha_resumen=fecha_ayer_str)
 
     except Exception as e:
-        print(f"Error en resumen_dia_anterior: {e}")
+        logger.error('Error en resumen_dia_anterior: %s', e)
         flash("Ocurrió un error al generar el resumen del día anterior.", "danger")
         # Redirige al dashboard principal en caso de error grave
         return redirect(url_for('main'))
@@ -189,6 +189,11 @@ function initializePatientSearch(searchInputId, searchButtonId, resultsDivId, re
     let currentSelectedPatientId = null;
     let highlightedElement = null;
     const initialResultsHTML = resultsDiv.innerHTML; // Guardar contenido inicial
+    const SEARCH_DEBOUNCE_MS = 250;  // Espera tras la última tecla antes de buscar
+    const SEARCH_MIN_CHARS = 2;      // Mínimo para buscar mientras se escribe (Enter busca con 1)
+    let searchTimer = null;
+    let searchController = null;     // AbortController de la búsqueda en curso
+    let lastSearchTerm = null;       // Término de los resultados que se muestran
 
     function highlightPatientRow(rowElement) {
         if (highlightedElement) { highlightedElement.classList.remove('highlighted'); }
@@ -216,6 +221,8 @@ function initializePatientSearch(searchInputId, searchButtonId, resultsDivId, re
     }
 
     function clearSelection() {
+        cancelPendingSearch();
+        lastSearchTerm = null;
         highlightPatientRow(null); // Limpiar resaltado y display superior
         searchInput.value = '';
         resultsLabel.textContent = 'Pacientes Recientes:'; // Restaurar label
@@ -223,8 +230,18 @@ function initializePatientSearch(searchInputId, searchButtonId, resultsDivId, re
         addListenersToInitialResults(); // Re-añadir listeners
     }
 
+    function cancelPendingSearch() {
+        clearTimeout(searchTimer);
+        if (searchController) {
+            searchController.abort(); // La respuesta de una búsqueda vieja ya no se muestra
+            searchController = null;
+        }
+    }
+
     function performSearch() {
         const searchTerm = searchInput.value.trim();
+        if (searchTerm.length > 0 && searchTerm === lastSearchTerm) return; // Ya se muestran estos resultados
+        cancelPendingSearch();
         resultsLabel.textContent = 'Resultados de la búsqueda:'; // Cambiar label
         resultsDiv.innerHTML = '<div class="text-center text-muted p-3"><div class="spinner-border spinner-border-sm" role="status"><span class="visually-hidden">Loading...</span></div> Buscando...</div>';
         highlightPatientRow(null); // Limpiar selección previa
@@ -234,9 +251,14 @@ function initializePatientSearch(searchInputId, searchButtonId, resultsDivId, re
             return;
         }
 
-        fetch(`/api/search_patients?term=${encodeURIComponent(searchTerm)}`)
+        // El servidor responde con ETag: el navegador revalida (304) en vez de volver a descargar
+        const controller = new AbortController();
+        searchController = controller;
+        fetch(`/api/search_patients?term=${encodeURIComponent(searchTerm)}`, { signal: controller.signal })
             .then(response => response.ok ? response.json() : Promise.reject(`Error HTTP: ${response.status}`))
             .then(data => {
+                if (searchController === controller) searchController = null;
+                lastSearchTerm = searchTerm;
                 resultsDiv.innerHTML = '';
                 if (data && data.length > 0) {
                     data.forEach(patient => {
@@ -271,6 +293,9 @@ function initializePatientSearch(searchInputId, searchButtonId, resultsDivId, re
                 }
             })
             .catch(error => {
+                if (error && error.name === 'AbortError') return; // Cancelada por una búsqueda más reciente
+                if (searchController === controller) searchController = null;
+                lastSearchTerm = null;
                 console.error('Error en la búsqueda:', error);
                 resultsDiv.innerHTML = '<div class="alert alert-danger py-1 px-2">Error al buscar.</div>';
             });
@@ -296,6 +321,14 @@ function initializePatientSearch(searchInputId, searchButtonId, resultsDivId, re
     // Listeners iniciales
     searchButton.addEventListener('click', performSearch);
     searchInput.addEventListener('keypress', function(event) { if (event.key === 'Enter') { event.preventDefault(); performSearch(); } });
+    searchInput.addEventListener('input', function() {
+        // Búsqueda mientras se escribe, con debounce
+        clearTimeout(searchTimer);
+        const searchTerm = searchInput.value.trim();
+        if (searchTerm.length === 0) { clearSelection(); return; }
+        if (searchTerm.length < SEARCH_MIN_CHARS) return;
+        searchTimer = setTimeout(performSearch, SEARCH_DEBOUNCE_MS);
+    });
     clearSelectionButton.addEventListener('click', clearSelection);
     addListenersToInitialResults(); // Para los pacientes recientes
 }
@@ -0,0 +1,38 @@
+import re
+import unicodedata
+
+
+# Normalización de nombres para el índice de búsqueda de pacientes (tabla 'paciente_tokens').
+# "José María Peña" -> ['jose', 'maria', 'pena']: minúsculas, sin acentos, separado en palabras.
+MAX_LARGO_TOKEN = 40      # Igual que la columna 'token'
+MAX_TERMINOS_BUSQUEDA = 5  # Palabras de la búsqueda que se consideran
+
+_SEPARADORES = re.compile(r"[^0-9a-z]+")
+
+
+def normalizar_texto(texto):
+    """Minúsculas y sin acentos/diéresis (la ñ queda como n)."""
+    if not texto:
+        return ''
+    descompuesto = unicodedata.normalize('NFKD', str(texto).lower())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def tokens_texto(texto):
+    """Palabras normalizadas de un texto, sin repetir y en orden de aparición."""
+    vistos = []
+    for token in _SEPARADORES.split(normalizar_texto(texto)):
+        token = token[:MAX_LARGO_TOKEN]
+        if token and token not in vistos:
+            vistos.append(token)
+    return vistos
+
+
+def tokens_nombre_paciente(nombre, apellidop, apellidom):
+    """Tokens que se indexan para un paciente (nombre completo)."""
+    return tokens_texto(f"{nombre or ''} {apellidop or ''} {apellidom or ''}")
+
+
+def terminos_busqueda(texto):
+    """Términos de una búsqueda (cada uno se busca como prefijo de alguna palabra del nombre)."""
+    return tokens_texto(texto)[:MAX_TERMINOS_BUSQUEDA]
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from utils.busqueda_pacientes import terminos_busqueda
+
+
+# Caché de resultados de /api/search_patients (el buscador consulta en cada tecla).
+# Es por proceso y de vida corta: al crear o editar un paciente se vacía en este worker;
+# en los demás la entrada expira sola tras 'ttl_s'.
+BUSQUEDA_CACHE_CONFIG = {
+    'ttl_s': float(os.environ.get('BUSQUEDA_CACHE_TTL_S', 30)),   # 0 = sin caché
+    'max_entradas': int(os.environ.get('BUSQUEDA_CACHE_MAX', 1000)),
+    'limite': 50,            # Resultados por página si no se indica ?limit=
+    'limite_max': 100,
+    'desplazamiento_max': 1000,
+}
+
+
+class CacheBusquedaPacientes:
+    """
+    LRU con expiración de resultados de búsqueda.
+    - La clave es (términos normalizados, centro, límite, desplazamiento): "José  Pérez" y
+      "jose perez" comparten entrada.
+    - Cada entrada guarda también su ETag, así un 304 no necesita volver a serializar.
+    - 'generacion' evita guardar un resultado consultado antes de una invalidación.
+    """
+
+    def __init__(self, ttl_s=30, max_entradas=1000):
+        self.ttl_s = float(ttl_s)
+        self.max_entradas = int(max_entradas)
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # clave -> (expira, resultado)
+        self._generacion = 0
+        self._stats = {'hits': 0, 'misses': 0, 'expirados': 0, 'invalidaciones': 0}
+
+    @property
+    def habilitada(self):
+        return self.ttl_s > 0 and self.max_entradas > 0
+
+    @property
+    def generacion(self):
+        with self._lock:
+            return self._generacion
+
+    def obtener(self, clave):
+        if not self.habilitada:
+            return None
+        with self._lock:
+            entrada = self._cache.get(clave)
+            if entrada is None:
+                self._stats['misses'] += 1
+                return None
+            if entrada[0] < time.monotonic():
+                del self._cache[clave]
+                self._stats['expirados'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._cache.move_to_end(clave)
+            self._stats['hits'] += 1
+            return entrada[1]
+
+    def guardar(self, clave, resultado, generacion):
+        if not self.habilitada:
+            return
+        with self._lock:
+            if generacion != self._generacion:
+                return  # Se invalidó mientras se consultaba
+            self._cache[clave] = (time.monotonic() + self.ttl_s, resultado)
+            self._cache.move_to_end(clave)
+            while len(self._cache) > self.max_entradas:
+                self._cache.popitem(last=False)
+
+    def invalidar(self):
+        """Vacía la caché (llamar después de crear o editar un paciente)."""
+        with self._lock:
+            self._cache.clear()
+            self._generacion += 1
+            self._stats['invalidaciones'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entradas'] = len(self._cache)
+        consultas = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / consultas, 3) if consultas else None
+        stats['ttl_s'] = self.ttl_s
+        return stats
+
+
+cache_busqueda_pacientes = CacheBusquedaPacientes(
+    ttl_s=BUSQUEDA_CACHE_CONFIG['ttl_s'], max_entradas=BUSQUEDA_CACHE_CONFIG['max_entradas']
+)
+
+
+def etag_resultado(pacientes):
+    return hashlib.sha256(json.dumps(pacientes, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:32]
+
+
+def buscar_pacientes_cacheado(search_term, id_centro, limite, desplazamiento, consultar, cache=None):
+    """
+    Devuelve {'pacientes', 'siguiente', 'etag'} para una búsqueda, desde la caché si es posible.
+    - consultar(limite, desplazamiento) hace la búsqueda en la BD (solo se llama en un miss,
+      así que la conexión se puede abrir ahí). Si devuelve None (p. ej. sin conexión) esta
+      función devuelve None y no se guarda nada.
+    - 'siguiente' es el desplazamiento de la página siguiente o None si no hay más resultados.
+    """
+    cache = cache or cache_busqueda_pacientes
+    terminos = terminos_busqueda(search_term)
+    if not terminos:
+        return {'pacientes': [], 'siguiente': None, 'etag': etag_resultado([])}
+
+    clave = (' '.join(terminos), id_centro, limite, desplazamiento)
+    resultado = cache.obtener(clave)
+    if resultado is not None:
+        return resultado
+
+    generacion = cache.generacion
+    filas = consultar(limite + 1, desplazamiento)  # Una fila extra indica si hay otra página
+    if filas is None:
+        return None
+    pacientes = filas[:limite]
+    resultado = {
+        'pacientes': pacientes,
+        'siguiente': desplazamiento + limite if len(filas) > limite else None,
+        'etag': etag_resultado(pacientes),
+    }
+    cache.guardar(clave, resultado, generacion)
+    return resultado
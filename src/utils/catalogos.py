@@ -0,0 +1,89 @@
+import os
+import threading
+
+
+# Caché por proceso de las tablas de catálogo (productos_servicios, dr, centro).
+# Cada catálogo tiene una versión compartida en la tabla 'catalogo_version' (migración 005) que
+# las funciones de escritura incrementan en la misma transacción; cada worker compara esa versión
+# (una consulta por request) y recarga la tabla completa solo si cambió.
+CATALOGOS_CONFIG = {
+    'enabled': os.environ.get('CATALOGOS_CACHE_ENABLED', '1') == '1',
+}
+
+# catálogo -> (columna id, columnas con índice)
+DEFINICIONES_CATALOGOS = {
+    'productos': ('id_prod', ('adicional',)),
+    'doctores': ('id_dr', ('centro',)),
+    'centros': ('id_centro', ()),
+}
+
+
+class Catalogo:
+    """
+    Contenido de una tabla de catálogo con índices por id y por columna.
+    No se modifica después de crearse: las funciones de database.py devuelven copias de las filas.
+    """
+
+    def __init__(self, nombre, version, filas):
+        clave_id, columnas_indice = DEFINICIONES_CATALOGOS[nombre]
+        self.nombre = nombre
+        self.version = version
+        self.filas = filas  # En el orden de la consulta (por nombre)
+        self.por_id = {fila[clave_id]: fila for fila in filas}
+        self._indices = {}
+        for columna in columnas_indice:
+            indice = {}
+            for fila in filas:
+                indice.setdefault(fila.get(columna), []).append(fila)
+            self._indices[columna] = indice
+
+    def por(self, columna, valor):
+        """Filas con columna == valor (solo columnas indexadas), en orden por nombre."""
+        return self._indices[columna].get(valor, [])
+
+
+class CacheCatalogos:
+    """Un Catalogo por nombre, válido mientras su versión coincida con la compartida."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._catalogos = {}
+        self._stats = {'hits': 0, 'recargas': 0, 'sin_version': 0, 'invalidaciones': 0}
+
+    def obtener(self, nombre, version, cargar):
+        """
+        Devuelve el Catalogo 'nombre' para la versión compartida 'version'.
+        cargar() devuelve las filas de la tabla; solo se llama si no hay un catálogo de esa versión.
+        Con version None (falta la migración o caché desactivada) se carga sin guardar.
+        """
+        if version is None or not CATALOGOS_CONFIG['enabled']:
+            with self._lock:
+                self._stats['sin_version'] += 1
+            return Catalogo(nombre, None, cargar())
+        with self._lock:
+            catalogo = self._catalogos.get(nombre)
+            if catalogo is not None and catalogo.version == version:
+                self._stats['hits'] += 1
+                return catalogo
+        catalogo = Catalogo(nombre, version, cargar())
+        with self._lock:
+            self._catalogos[nombre] = catalogo
+            self._stats['recargas'] += 1
+        return catalogo
+
+    def invalidar(self, nombre):
+        with self._lock:
+            self._catalogos.pop(nombre, None)
+            self._stats['invalidaciones'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['catalogos'] = {nombre: {'version': c.version, 'filas': len(c.filas)}
+                                  for nombre, c in self._catalogos.items()}
+        consultas = stats['hits'] + stats['recargas']
+        stats['hit_ratio'] = round(stats['hits'] / consultas, 3) if consultas else None
+        return stats
+
+
+cache_catalogos = CacheCatalogos()
@@ -0,0 +1,206 @@
+import logging
+import threading
+import time
+from collections import deque
+
+import mysql.connector
+from mysql.connector import Error
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Error):
+    """Se lanza cuando no se obtiene una conexión del pool dentro del timeout."""
+    pass
+
+
+class PooledConnection:
+    """
+    Envoltura ligera sobre una conexión de MySQL prestada por el pool.
+    Delega todo a la conexión real, excepto close(): en lugar de cerrar el
+    socket, devuelve la conexión al pool (o no hace nada si la conexión
+    pertenece al request actual y la liberará el teardown).
+    Si se indica 'envolver_cursor', cursor() devuelve envolver_cursor(cursor real)
+    (p. ej. para medir las consultas, ver utils/sql_metricas.py).
+    """
+
+    def __init__(self, pool, raw_connection, request_scoped=False, envolver_cursor=None):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_raw', raw_connection)
+        object.__setattr__(self, '_request_scoped', request_scoped)
+        object.__setattr__(self, '_envolver_cursor', envolver_cursor)
+        object.__setattr__(self, '_released', False)
+        object.__setattr__(self, '_autocommit_changed', False)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        # Las rutas cambian 'autocommit' para manejar transacciones; lo
+        # registramos para restaurarlo al devolver la conexión al pool.
+        if name == 'autocommit':
+            object.__setattr__(self, '_autocommit_changed', True)
+        setattr(self._raw, name, value)
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._raw.cursor(*args, **kwargs)
+        if self._envolver_cursor is not None:
+            return self._envolver_cursor(cursor)
+        return cursor
+
+    def close(self):
+        """Las rutas siguen llamando close(); la conexión del request vive hasta el teardown."""
+        if self._request_scoped:
+            return
+        self.release()
+
+    def release(self):
+        """Devuelve la conexión real al pool (solo la primera vez)."""
+        if self._released:
+            return
+        object.__setattr__(self, '_released', True)
+        self._pool.release(self._raw, reset_autocommit=self._autocommit_changed)
+
+
+class ConnectionPool:
+    """
+    Pool acotado de conexiones MySQL.
+    - 'pool_size' conexiones se mantienen abiertas y se reutilizan.
+    - 'max_overflow' conexiones extra se pueden abrir en picos; se cierran al devolverse.
+    - Si no hay conexiones disponibles se espera hasta 'timeout' segundos.
+    - Las conexiones inactivas más de 'ping_interval' segundos se verifican antes de prestarse.
+    """
+
+    def __init__(self, db_config, pool_size=5, max_overflow=5, timeout=10.0,
+                 ping_interval=30.0, connect_timeout=10):
+        self.db_config = db_config
+        self.pool_size = max(1, int(pool_size))
+        self.max_overflow = max(0, int(max_overflow))
+        self.timeout = float(timeout)
+        self.ping_interval = float(ping_interval)
+        self.connect_timeout = int(connect_timeout)
+
+        self._idle = deque()  # (conexión, timestamp de devolución)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.pool_size + self.max_overflow)
+
+        self._stats = {
+            'checkouts': 0,
+            'checkout_timeouts': 0,
+            'connections_created': 0,
+            'connections_closed': 0,
+            'connection_errors': 0,
+            'in_use': 0,
+            'peak_in_use': 0,
+            'wait_total_ms': 0.0,
+            'wait_max_ms': 0.0,
+        }
+
+    def _new_connection(self):
+        connection = mysql.connector.connect(
+            host=self.db_config['host'],
+            user=self.db_config['user'],
+            password=self.db_config['password'],
+            database=self.db_config['database'],
+            port=self.db_config['port'],
+            autocommit=True,
+            connection_timeout=self.connect_timeout
+        )
+        with self._lock:
+            self._stats['connections_created'] += 1
+        return connection
+
+    def _close_quietly(self, connection):
+        try:
+            connection.close()
+        except Error:
+            pass
+        with self._lock:
+            self._stats['connections_closed'] += 1
+
+    def acquire(self):
+        """
+        Presta una conexión real. Devuelve (conexión, ms_esperados).
+        Lanza PoolTimeoutError si el pool está agotado más allá del timeout.
+        """
+        inicio = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats['checkout_timeouts'] += 1
+            raise PoolTimeoutError(
+                f"Pool de conexiones agotado ({self.pool_size}+{self.max_overflow}) tras {self.timeout}s de espera."
+            )
+        wait_ms = (time.perf_counter() - inicio) * 1000.0
+
+        try:
+            connection = None
+            while connection is None:
+                with self._lock:
+                    item = self._idle.pop() if self._idle else None
+                if item is None:
+                    connection = self._new_connection()
+                    break
+                candidate, devuelta_en = item
+                # Solo verificamos las conexiones que llevan tiempo inactivas (evita un ping por request)
+                if time.monotonic() - devuelta_en > self.ping_interval and not candidate.is_connected():
+                    self._close_quietly(candidate)
+                    continue
+                connection = candidate
+        except Error:
+            with self._lock:
+                self._stats['connection_errors'] += 1
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['in_use'] += 1
+            self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._stats['in_use'])
+            self._stats['wait_total_ms'] += wait_ms
+            self._stats['wait_max_ms'] = max(self._stats['wait_max_ms'], wait_ms)
+        return connection, wait_ms
+
+    def release(self, connection, reset_autocommit=False):
+        """Devuelve una conexión al pool, limpiando transacciones pendientes."""
+        try:
+            reusable = False
+            try:
+                if connection.is_connected():
+                    if connection.in_transaction:
+                        connection.rollback()
+                    if reset_autocommit:
+                        connection.autocommit = True
+                    reusable = True
+            except Error as e:
+                logger.warning('Conexión descartada al devolverla al pool: %s', e)
+
+            with self._lock:
+                self._stats['in_use'] -= 1
+                if reusable and len(self._idle) < self.pool_size:
+                    self._idle.append((connection, time.monotonic()))
+                    connection = None
+            if connection is not None:
+                self._close_quietly(connection)
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        """Copia de las estadísticas del pool para mostrarlas en el panel de administración."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+        stats['pool_size'] = self.pool_size
+        stats['max_overflow'] = self.max_overflow
+        stats['timeout_s'] = self.timeout
+        stats['wait_avg_ms'] = round(stats['wait_total_ms'] / stats['checkouts'], 3) if stats['checkouts'] else 0.0
+        stats['wait_total_ms'] = round(stats['wait_total_ms'], 3)
+        stats['wait_max_ms'] = round(stats['wait_max_ms'], 3)
+        return stats
+
+    def dispose(self):
+        """Cierra todas las conexiones inactivas (útil al apagar el proceso)."""
+        with self._lock:
+            items = list(self._idle)
+            self._idle.clear()
+        for connection, _ in items:
+            self._close_quietly(connection)
@@ -0,0 +1,157 @@
+import csv
+import io
+import os
+import zipfile
+from datetime import datetime
+
+from flask import current_app, render_template
+
+from database import get_recibos_para_exportar
+from utils.pdf_jobs import renderizar_pdf
+from utils.recursos import logo_data_uri
+
+
+# Exportación masiva de recibos (cierre de mes para contabilidad).
+# Los recibos se procesan por lotes: una consulta por lote, render de HTML y conversión con pisa
+# en paralelo (pool de procesos). En memoria solo hay un lote a la vez, sin importar el periodo.
+EXPORTAR_RECIBOS_CONFIG = {
+    'lote': int(os.environ.get('EXPORT_RECIBOS_LOTE', 40)),
+    'max_pdf_unico': int(os.environ.get('EXPORT_RECIBOS_MAX_PDF', 500)),  # El PDF combinado vive en memoria
+}
+
+ARCHIVO_ERROR_ZIP = 'ERROR_EXPORTACION_INCOMPLETA.txt'
+
+CENTRO_GENERICO = {'nombre': 'Chiropractic Care Center', 'direccion': 'N/A', 'cel': 'N/A', 'tel': 'N/A'}
+
+
+class ExportacionIncompletaError(RuntimeError):
+    """Un lote no se pudo leer completo: la exportación no debe presentarse como terminada."""
+
+
+class _SalidaEnStreaming(io.RawIOBase):
+    """Destino de escritura que acumula bytes hasta que se vacían (para ir enviando el ZIP por partes)."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._buffer.extend(b)
+        return len(b)
+
+    def vaciar(self):
+        datos = bytes(self._buffer)
+        self._buffer.clear()
+        return datos
+
+
+def _datos_plantilla(recibo, logo_uri, anio):
+    """Adapta un recibo de get_recibos_para_exportar a lo que espera recibo_pdf_template.html."""
+    recibo['patient_nombre_completo'] = recibo.get('nombre_paciente_completo')
+    recibo['nombre_doctor'] = recibo.get('nombre_doctor_recibo')
+    for detalle in recibo['detalles']:
+        detalle['descripcion_prod'] = detalle.get('descripcion_item')
+        detalle['nombre_producto'] = detalle.get('nombre_producto_original')
+    # El centro del doctor que emitió el recibo (no el del usuario que exporta)
+    if recibo.get('nombre_centro'):
+        recibo['centro_info'] = {
+            'nombre': recibo['nombre_centro'], 'direccion': recibo.get('direccion_centro'),
+            'cel': recibo.get('celular_centro'), 'tel': recibo.get('telefono_centro')
+        }
+    else:
+        recibo['centro_info'] = CENTRO_GENERICO
+    recibo['logo_base64_uri'] = logo_uri
+    recibo['current_year_for_pdf'] = anio
+    return recibo
+
+
+def _nombre_archivo(recibo):
+    fecha = datetime.strptime(recibo['fecha'], '%d/%m/%Y').strftime('%Y-%m-%d') if recibo.get('fecha') else 'sin_fecha'
+    return f"{fecha}_recibo{recibo['id_recibo']}_px{recibo['id_px']}.pdf"
+
+
+def generar_pdfs_recibos(connection, ids_recibos, executor=None, lote=None):
+    """
+    Genera (recibo, bytes_pdf) en el orden de ids_recibos, lote por lote.
+    Con 'executor' (ProcessPoolExecutor) pisa corre en paralelo; sin él, en este proceso.
+    Necesita contexto de aplicación (render_template).
+    Lanza ExportacionIncompletaError si un lote falla o le faltan recibos.
+    """
+    lote = lote or EXPORTAR_RECIBOS_CONFIG['lote']
+    logo_uri = logo_data_uri(current_app.static_folder)
+    anio = datetime.now().year
+    for inicio in range(0, len(ids_recibos), lote):
+        ids_lote = ids_recibos[inicio:inicio + lote]
+        try:
+            recibos = get_recibos_para_exportar(connection, ids_lote)
+        except Exception as e:
+            raise ExportacionIncompletaError(
+                f"No se pudieron leer los recibos {ids_lote[0]}-{ids_lote[-1]}: {e}") from e
+        if len(recibos) != len(ids_lote):
+            encontrados = {r['id_recibo'] for r in recibos}
+            faltantes = [id_recibo for id_recibo in ids_lote if id_recibo not in encontrados]
+            raise ExportacionIncompletaError(f"Recibos no encontrados al exportar: {faltantes}")
+        htmls = [render_template('recibo_pdf_template.html', data=_datos_plantilla(r, logo_uri, anio)) for r in recibos]
+        pdfs = executor.map(renderizar_pdf, htmls) if executor else map(renderizar_pdf, htmls)
+        for recibo, contenido in zip(recibos, pdfs):
+            yield recibo, contenido
+
+
+def exportar_zip(connection, ids_recibos, executor=None):
+    """
+    Genera por partes (bytes) un ZIP con un PDF por recibo y un 'resumen.csv' con los totales.
+    Pensado para Response(stream_with_context(...)) o para escribir a un archivo.
+    Si falla a la mitad, el ZIP se cierra con ARCHIVO_ERROR_ZIP (y sin 'resumen.csv', cuyos totales
+    estarían incompletos) y después se relanza la excepción.
+    """
+    error = None
+    salida = _SalidaEnStreaming()
+    resumen = io.StringIO()
+    escritor = csv.writer(resumen)
+    escritor.writerow(['id_recibo', 'fecha', 'id_px', 'paciente', 'doctor', 'subtotal', 'descuento', 'total',
+                       'efectivo', 'tarjeta', 'transferencia', 'otro', 'archivo'])
+    with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        exportados = 0
+        try:
+            for recibo, contenido in generar_pdfs_recibos(connection, ids_recibos, executor):
+                nombre = _nombre_archivo(recibo)
+                zf.writestr(nombre, contenido)
+                escritor.writerow([
+                    recibo['id_recibo'], recibo.get('fecha'), recibo['id_px'], recibo.get('nombre_paciente_completo'),
+                    recibo.get('nombre_doctor_recibo'), recibo['subtotal_bruto'], recibo['descuento_total'],
+                    recibo['total_neto'], recibo['pago_efectivo'], recibo['pago_tarjeta'],
+                    recibo['pago_transferencia'], recibo['pago_otro'], nombre
+                ])
+                exportados += 1
+                yield salida.vaciar()
+        except Exception as e:
+            error = e
+            zf.writestr(ARCHIVO_ERROR_ZIP, (
+                f"EXPORTACIÓN INCOMPLETA: {exportados} de {len(ids_recibos)} recibos.\n"
+                f"Error: {e}\nVuelva a generar la exportación; no use este archivo para el cierre.\n"
+            ).encode('utf-8'))
+        else:
+            zf.writestr('resumen.csv', resumen.getvalue().encode('utf-8-sig'))  # BOM: Excel lo abre con acentos
+    yield salida.vaciar()
+    if error is not None:
+        raise error
+
+
+def exportar_pdf_unico(connection, ids_recibos, executor=None):
+    """
+    Devuelve un solo PDF (bytes) con todos los recibos, uno tras otro.
+    A diferencia del ZIP, el documento combinado se arma en memoria: se limita a
+    'max_pdf_unico' recibos (ValueError si se excede).
+    """
+    if len(ids_recibos) > EXPORTAR_RECIBOS_CONFIG['max_pdf_unico']:
+        raise ValueError(f"El PDF combinado admite hasta {EXPORTAR_RECIBOS_CONFIG['max_pdf_unico']} recibos; "
+                         f"el periodo tiene {len(ids_recibos)}. Use el formato ZIP.")
+    from pypdf import PdfReader, PdfWriter  # Dependencia de xhtml2pdf; se carga solo aquí
+    writer = PdfWriter()
+    for _, contenido in generar_pdfs_recibos(connection, ids_recibos, executor):
+        writer.append(PdfReader(io.BytesIO(contenido)))
+    salida = io.BytesIO()
+    writer.write(salida)
+    return salida.getvalue()
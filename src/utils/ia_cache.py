@@ -0,0 +1,221 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Caché persistente (en disco) de respuestas de Gemini para los informes con imágenes.
+# La clave es un hash del modelo, el texto del prompt y el contenido de cada imagen:
+# si nada cambió, volver a abrir un informe no vuelve a llamar a la API.
+_SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IA_CACHE_CONFIG = {
+    'dir': os.environ.get('IA_CACHE_DIR', os.path.join(_SRC_DIR, 'instance', 'ia_cache')),
+    'ttl_s': float(os.environ.get('IA_CACHE_TTL_HORAS', 24 * 7)) * 3600,
+    'max_bytes': int(float(os.environ.get('IA_CACHE_MAX_MB', 50)) * 1024 * 1024),
+    'enabled': os.environ.get('IA_CACHE_ENABLED', '1') == '1',
+}
+VERSION_CLAVE = 'v1'  # Cambiar si cambia el formato de la clave o de las entradas
+
+
+class RespuestaIABloqueada(Exception):
+    """La IA no devolvió contenido (p. ej. filtro de seguridad). Lleva el 'response' original."""
+
+    def __init__(self, response):
+        super().__init__("La IA no generó una respuesta (posible bloqueo por filtros de contenido).")
+        self.response = response
+
+
+class CacheRespuestasIA:
+    """
+    Caché en disco: un archivo JSON por respuesta en <dir>/<2 primeros caracteres>/<clave>.json.
+    - Expira por antigüedad ('ttl_s') y se recorta por tamaño total ('max_bytes'),
+      eliminando primero las entradas usadas hace más tiempo (el uso actualiza el mtime).
+    - Varios procesos pueden compartir el directorio (escrituras atómicas con os.replace).
+    """
+
+    def __init__(self, directorio, ttl_s, max_bytes):
+        self.directorio = directorio
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._bytes_totales = None  # Se calcula la primera vez que se escribe
+        self._hash_archivos = {}    # (ruta, mtime, tamaño) -> sha256 del contenido
+        self._metricas = {'hits': 0, 'misses': 0, 'bypass': 0, 'guardadas': 0, 'expiradas': 0, 'desalojadas': 0}
+
+    # --- Clave ---
+    def _hash_archivo(self, ruta):
+        st = os.stat(ruta)
+        memo = (ruta, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if memo in self._hash_archivos:
+                return self._hash_archivos[memo]
+        h = hashlib.sha256()
+        with open(ruta, 'rb') as f:
+            for bloque in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(bloque)
+        digest = h.hexdigest()
+        with self._lock:
+            if len(self._hash_archivos) > 2000:
+                self._hash_archivos.clear()
+            self._hash_archivos[memo] = digest
+        return digest
+
+    def _hash_parte(self, parte):
+        if isinstance(parte, str):
+            return 't:' + hashlib.sha256(parte.encode('utf-8')).hexdigest()
+        if isinstance(parte, (bytes, bytearray)):
+            return 'b:' + hashlib.sha256(parte).hexdigest()
+        if isinstance(parte, dict) and 'data' in parte:
+            return 'b:' + hashlib.sha256(parte['data']).hexdigest()
+        ruta = getattr(parte, 'filename', None)  # Imagen de PIL abierta desde archivo
+        if ruta and os.path.exists(ruta):
+            return 'f:' + self._hash_archivo(ruta)
+        if hasattr(parte, 'tobytes'):
+            return 'i:' + hashlib.sha256(parte.tobytes()).hexdigest()
+        raise TypeError(f"Parte de prompt no soportada por la caché: {type(parte).__name__}")
+
+    def clave(self, nombre_modelo, prompt_parts):
+        componentes = [VERSION_CLAVE, nombre_modelo or ''] + [self._hash_parte(p) for p in prompt_parts]
+        return hashlib.sha256(json.dumps(componentes).encode('utf-8')).hexdigest()
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, clave[:2], f"{clave}.json")
+
+    # --- Lectura / escritura ---
+    def obtener(self, clave):
+        ruta = self._ruta(clave)
+        try:
+            st = os.stat(ruta)
+            with open(ruta, 'r', encoding='utf-8') as f:
+                entrada = json.load(f)
+        except (OSError, ValueError):
+            self._contar('misses')
+            return None
+        if time.time() - entrada.get('creado', 0) > self.ttl_s:
+            self._contar('expiradas')
+            self._contar('misses')
+            self._eliminar(ruta, st.st_size)
+            return None
+        try:
+            os.utime(ruta, None)  # Marca de último uso (para desalojar las menos usadas)
+        except OSError:
+            pass
+        self._contar('hits')
+        return entrada.get('texto')
+
+    def guardar(self, clave, nombre_modelo, texto):
+        ruta = self._ruta(clave)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        contenido = json.dumps({'modelo': nombre_modelo, 'creado': time.time(), 'texto': texto}, ensure_ascii=False)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        try:
+            with open(temporal, 'w', encoding='utf-8') as f:
+                f.write(contenido)
+            os.replace(temporal, ruta)
+        except OSError as e:
+            logger.warning('No se pudo guardar la respuesta de IA en caché: %s', e)
+            return
+        self._contar('guardadas')
+        with self._lock:
+            if self._bytes_totales is None:
+                self._bytes_totales = self._calcular_bytes()
+            else:
+                self._bytes_totales += len(contenido.encode('utf-8'))
+            excedido = self._bytes_totales > self.max_bytes
+        if excedido:
+            self.recortar()
+
+    def _eliminar(self, ruta, tamano):
+        try:
+            os.remove(ruta)
+        except OSError:
+            return
+        with self._lock:
+            if self._bytes_totales is not None:
+                self._bytes_totales -= tamano
+
+    def _entradas(self):
+        for raiz, _, archivos in os.walk(self.directorio):
+            for nombre in archivos:
+                if nombre.endswith('.json'):
+                    ruta = os.path.join(raiz, nombre)
+                    try:
+                        st = os.stat(ruta)
+                    except OSError:
+                        continue
+                    yield ruta, st.st_size, st.st_mtime
+
+    def _calcular_bytes(self):
+        return sum(tamano for _, tamano, _ in self._entradas())
+
+    def recortar(self):
+        """Elimina las entradas expiradas y, si aún se excede el tamaño, las usadas hace más tiempo."""
+        ahora = time.time()
+        entradas = sorted(self._entradas(), key=lambda e: e[2])
+        total = sum(e[1] for e in entradas)
+        for ruta, tamano, mtime in entradas:
+            expirada = ahora - mtime > self.ttl_s
+            if not expirada and total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(ruta)
+                total -= tamano
+                self._contar('expiradas' if expirada else 'desalojadas')
+            except OSError:
+                pass
+        with self._lock:
+            self._bytes_totales = total
+
+    def _contar(self, metrica):
+        with self._lock:
+            self._metricas[metrica] += 1
+
+    def metricas(self):
+        with self._lock:
+            metricas = dict(self._metricas)
+            metricas['bytes'] = self._bytes_totales
+        consultas = metricas['hits'] + metricas['misses']
+        metricas['hit_ratio'] = round(metricas['hits'] / consultas, 3) if consultas else None
+        metricas['ttl_horas'] = round(self.ttl_s / 3600, 1)
+        metricas['max_mb'] = round(self.max_bytes / (1024 * 1024), 1)
+        return metricas
+
+
+cache_ia = CacheRespuestasIA(IA_CACHE_CONFIG['dir'], IA_CACHE_CONFIG['ttl_s'], IA_CACHE_CONFIG['max_bytes'])
+
+
+def generar_contenido_con_cache(generative_model, prompt_parts, forzar=False, al_llamar=None):
+    """
+    Devuelve el texto de generative_model.generate_content(prompt_parts), usando la caché.
+    - forzar=True ignora la respuesta guardada (regenerar) y guarda la nueva.
+    - al_llamar() se ejecuta solo si se va a llamar a la API (p. ej. LoteImagenesIA.registrar).
+    - Solo se guardan respuestas con contenido; si la IA no devuelve partes se lanza RespuestaIABloqueada.
+    """
+    nombre_modelo = getattr(generative_model, 'model_name', None)
+    clave = None
+    if IA_CACHE_CONFIG['enabled']:
+        try:
+            clave = cache_ia.clave(nombre_modelo, prompt_parts)
+        except (OSError, TypeError) as e:
+            logger.warning('No se pudo calcular la clave de caché de IA: %s', e)
+        if clave and not forzar:
+            texto = cache_ia.obtener(clave)
+            if texto is not None:
+                logger.info('Respuesta de IA obtenida de la caché.')
+                return texto
+        elif clave:
+            cache_ia._contar('bypass')
+
+    if al_llamar is not None:
+        al_llamar()
+    response = generative_model.generate_content(prompt_parts)
+    if not response.parts:
+        raise RespuestaIABloqueada(response)
+    texto = response.text.strip()
+    if clave and texto:
+        cache_ia.guardar(clave, nombre_modelo, texto)
+    return texto
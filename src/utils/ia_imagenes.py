@@ -0,0 +1,149 @@
+import io
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+# Valores por defecto de la sección "vision_images" de ia_config.json
+IMAGENES_IA_DEFAULTS = {
+    'max_edge': 1280,   # Lado mayor (px) de la imagen que se envía a Gemini
+    'format': 'JPEG',   # 'JPEG' o 'WEBP'
+    'quality': 85,
+    'cache_mb': 64,     # Memoria máxima de imágenes ya preparadas (por proceso)
+}
+
+_MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+
+
+def _config_imagenes(config):
+    cfg = dict(IMAGENES_IA_DEFAULTS)
+    cfg.update(config or {})
+    cfg['format'] = str(cfg['format']).upper()
+    if cfg['format'] not in _MIME_TYPES:
+        logger.warning("Formato de imagen para IA no soportado '%s'; se usa JPEG.", cfg['format'])
+        cfg['format'] = 'JPEG'
+    return cfg
+
+
+class PreparadorImagenesIA:
+    """
+    Reduce y recodifica las fotos clínicas antes de enviarlas a Gemini.
+    - La imagen se orienta según EXIF, se reduce a 'max_edge' y se recodifica en JPEG/WebP.
+    - El resultado se guarda en memoria por archivo (ruta, mtime, tamaño y parámetros):
+      regenerar un informe con las mismas fotos no vuelve a decodificarlas.
+    - Devuelve partes {'mime_type', 'data'} que generate_content acepta directamente
+      (y que la caché de respuestas de utils/ia_cache.py sabe hashear).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # clave -> (parte, bytes_originales)
+        self._bytes_cache = 0
+        self._stats = {
+            'cache_hits': 0, 'cache_misses': 0, 'preparacion_total_ms': 0.0,
+            'solicitudes': 0, 'imagenes_enviadas': 0, 'bytes_originales': 0, 'bytes_enviados': 0,
+        }
+
+    def preparar(self, ruta_imagen, config=None):
+        """Devuelve (parte, bytes_originales). Lanza FileNotFoundError/OSError si no se puede leer."""
+        cfg = _config_imagenes(config)
+        st = os.stat(ruta_imagen)
+        clave = (ruta_imagen, st.st_mtime_ns, st.st_size, int(cfg['max_edge']), cfg['format'], int(cfg['quality']))
+
+        with self._lock:
+            if clave in self._cache:
+                self._cache.move_to_end(clave)
+                self._stats['cache_hits'] += 1
+                return self._cache[clave]
+            self._stats['cache_misses'] += 1
+
+        inicio = time.perf_counter()
+        parte = {'mime_type': _MIME_TYPES[cfg['format']], 'data': self._recodificar(ruta_imagen, cfg)}
+        with self._lock:
+            self._stats['preparacion_total_ms'] += (time.perf_counter() - inicio) * 1000.0
+            self._guardar(clave, (parte, st.st_size), int(float(cfg['cache_mb']) * 1024 * 1024))
+        return parte, st.st_size
+
+    def _recodificar(self, ruta_imagen, cfg):
+        from PIL import Image, ImageOps  # Import diferido: PIL no se carga al arrancar la app
+        with Image.open(ruta_imagen) as img:
+            img = ImageOps.exif_transpose(img)
+            max_edge = int(cfg['max_edge'])
+            if max_edge > 0 and max(img.size) > max_edge:
+                img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            if cfg['format'] == 'JPEG' and img.mode != 'RGB':
+                img = img.convert('RGB')
+            elif cfg['format'] == 'WEBP' and img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGB')
+            salida = io.BytesIO()
+            opciones = {'quality': int(cfg['quality'])}
+            if cfg['format'] == 'JPEG':
+                opciones['optimize'] = True
+            img.save(salida, format=cfg['format'], **opciones)
+            return salida.getvalue()
+
+    def _guardar(self, clave, valor, max_bytes):
+        """Guarda una imagen preparada y desaloja las menos usadas si se excede 'max_bytes' (con el lock tomado)."""
+        tamano = len(valor[0]['data'])
+        if tamano > max_bytes:
+            return
+        self._cache[clave] = valor
+        self._bytes_cache += tamano
+        while self._bytes_cache > max_bytes and self._cache:
+            _, (parte, _) = self._cache.popitem(last=False)
+            self._bytes_cache -= len(parte['data'])
+
+    def registrar_envio(self, nombre, partes, bytes_originales):
+        """Registra (y muestra en el log) los bytes de imagen que se envían en una solicitud."""
+        enviados = sum(len(p['data']) for p in partes)
+        with self._lock:
+            self._stats['solicitudes'] += 1
+            self._stats['imagenes_enviadas'] += len(partes)
+            self._stats['bytes_originales'] += bytes_originales
+            self._stats['bytes_enviados'] += enviados
+        logger.info('%s: %s imágenes, %.0f KB enviados (originales %.0f KB).', nombre, len(partes), enviados / 1024, bytes_originales / 1024)
+        return enviados
+
+    def stats(self):
+        """Copia de las estadísticas para el panel de administración."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['imagenes_en_cache'] = len(self._cache)
+            stats['bytes_en_cache'] = self._bytes_cache
+        stats['preparacion_total_ms'] = round(stats['preparacion_total_ms'], 1)
+        if stats['bytes_originales']:
+            stats['reduccion'] = round(1 - stats['bytes_enviados'] / stats['bytes_originales'], 3)
+        return stats
+
+
+preparador_imagenes_ia = PreparadorImagenesIA()
+
+
+class LoteImagenesIA:
+    """
+    Imágenes de una solicitud a Gemini. Uso:
+        lote = LoteImagenesIA(config)
+        prompt_parts.append(lote.agregar(ruta))
+        ...
+        generar_contenido_con_cache(modelo, prompt_parts,
+                                    al_llamar=lambda: lote.registrar("Informe de postura"))
+    registrar() cuenta los bytes enviados: solo debe llamarse si la solicitud llega a la API.
+    """
+
+    def __init__(self, config=None):
+        self.config = config
+        self.partes = []
+        self.bytes_originales = 0
+
+    def agregar(self, ruta_imagen):
+        parte, bytes_originales = preparador_imagenes_ia.preparar(ruta_imagen, self.config)
+        self.partes.append(parte)
+        self.bytes_originales += bytes_originales
+        return parte
+
+    def registrar(self, nombre):
+        return preparador_imagenes_ia.registrar_envio(nombre, self.partes, self.bytes_originales)
@@ -0,0 +1,66 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+# google.generativeai tarda varios segundos y bastante memoria en importarse; se carga
+# la primera vez que se necesita el modelo (o en la precarga tras el primer request).
+_lock = threading.Lock()
+
+
+def cargar_modelo_generativo(app):
+    """
+    Devuelve el modelo de visión Gemini configurado en ia_config.json (o None si no hay
+    GEMINI_API_KEY o falló la inicialización). Se crea una sola vez por proceso y se guarda
+    en app.config['GENERATIVE_MODEL'].
+    """
+    if 'GENERATIVE_MODEL' in app.config:
+        return app.config['GENERATIVE_MODEL']
+
+    with _lock:
+        if 'GENERATIVE_MODEL' in app.config:
+            return app.config['GENERATIVE_MODEL']
+
+        modelo = None
+        gemini_api_key = os.environ.get("GEMINI_API_KEY")
+        if gemini_api_key:
+            import google.generativeai as genai
+            genai.configure(api_key=gemini_api_key)
+            # Leemos el nombre del modelo de visión del JSON
+            vision_model_name = app.config.get('IA_MODELS_CONFIG', {}).get('vision_model', 'gemini-1.5-pro-latest')
+            logger.info('Inicializando modelo de visión Gemini: %s', vision_model_name)
+            try:
+                modelo = genai.GenerativeModel(vision_model_name)
+            except Exception as e:
+                logger.error("No se pudo inicializar el modelo Gemini '%s'. Error: %s", vision_model_name, e)
+        else:
+            logger.warning('GEMINI_API_KEY no encontrada. El modelo generativo de visión estará deshabilitado.')
+
+        app.config['GENERATIVE_MODEL'] = modelo
+        return modelo
+
+
+def cargar_cliente_groq(app):
+    """
+    Devuelve el cliente de Groq para los modelos de texto (o None si no hay GROQ_API_KEY).
+    Se crea una sola vez por proceso y se guarda en app.config['GROQ_CLIENT'].
+    """
+    if 'GROQ_CLIENT' in app.config:
+        return app.config['GROQ_CLIENT']
+
+    with _lock:
+        if 'GROQ_CLIENT' in app.config:
+            return app.config['GROQ_CLIENT']
+
+        cliente = None
+        groq_api_key = os.environ.get("GROQ_API_KEY")
+        if groq_api_key:
+            try:
+                from groq import Groq
+                cliente = Groq(api_key=groq_api_key)
+            except Exception as e:
+                logger.error('No se pudo inicializar el cliente de Groq. Error: %s', e)
+        app.config['GROQ_CLIENT'] = cliente
+        return cliente
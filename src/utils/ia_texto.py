@@ -0,0 +1,211 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+
+# Valores por defecto de la sección "text_hedging" de ia_config.json
+HEDGING_DEFAULTS = {
+    'enabled': False,        # False: se prueba un candidato tras otro (comportamiento original)
+    'hedge_after_ms': 2500,  # Si el candidato en curso no responde en este tiempo, se lanza el siguiente
+    'timeout_s': 20,         # Tiempo máximo por llamada (y para toda la generación)
+    'max_parallel': 3,       # Máximo de candidatos en vuelo a la vez
+}
+
+# Hilos compartidos para las llamadas a los proveedores (las llamadas son I/O de red)
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='ia-texto')
+
+
+class CandidatoIA:
+    """
+    Un proveedor/modelo que puede generar texto: nombre + función(system_prompt, user_prompt, timeout_s) -> str.
+    Los de Groq y Gemini se construyen con los helpers de abajo; los 'fake' sirven para probar sin red.
+    """
+
+    def __init__(self, nombre, generar):
+        self.nombre = nombre
+        self.generar = generar
+
+    def __repr__(self):
+        return f"CandidatoIA({self.nombre})"
+
+
+def candidato_groq(groq_client, model_name):
+    def generar(system_prompt, user_prompt, timeout_s):
+        chat_completion = groq_client.chat.completions.create(
+            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
+            model=model_name,
+            timeout=timeout_s
+        )
+        return chat_completion.choices[0].message.content
+    return CandidatoIA(f"groq:{model_name}", generar)
+
+
+def candidato_gemini(generative_model):
+    def generar(system_prompt, user_prompt, timeout_s):
+        response = generative_model.generate_content(
+            f"{system_prompt}\n{user_prompt}", request_options={'timeout': timeout_s}
+        )
+        return response.text
+    return CandidatoIA("gemini", generar)
+
+
+def candidato_fake(nombre, latencia_s=0.0, respuesta="Texto de prueba.", falla=False):
+    """Proveedor local para pruebas (sin red): espera 'latencia_s' y responde o falla."""
+    def generar(system_prompt, user_prompt, timeout_s):
+        time.sleep(min(latencia_s, timeout_s))
+        if latencia_s > timeout_s:
+            raise TimeoutError(f"{nombre}: tiempo de espera agotado ({timeout_s}s).")
+        if falla:
+            raise RuntimeError(f"{nombre}: falla simulada.")
+        return respuesta
+    return CandidatoIA(f"fake:{nombre}", generar)
+
+
+def candidatos_fake_desde_config(lista_config):
+    """Construye candidatos fake desde ia_config.json: [{"nombre", "latencia_s", "respuesta", "falla"}, ...]."""
+    return [
+        candidato_fake(c.get('nombre', f"fake{i}"), float(c.get('latencia_s', 0)),
+                       c.get('respuesta', "Texto de prueba."), bool(c.get('falla', False)))
+        for i, c in enumerate(lista_config or [])
+    ]
+
+
+class EstadisticasIA:
+    """Latencias y resultados por proveedor (para el panel de administración)."""
+
+    def __init__(self, ventana=200):
+        self._lock = threading.Lock()
+        self._ventana = ventana
+        self._datos = {}
+
+    def registrar(self, nombre, resultado, ms):
+        """resultado: 'ok', 'error', 'vacio' o 'descartado' (llegó tarde, ya había ganador)."""
+        with self._lock:
+            d = self._datos.setdefault(nombre, {
+                'llamadas': 0, 'ok': 0, 'error': 0, 'vacio': 0, 'descartado': 0, 'ganadas': 0,
+                'latencias': deque(maxlen=self._ventana), 'max_ms': 0.0
+            })
+            d['llamadas'] += 1
+            d[resultado] += 1
+            d['latencias'].append(ms)
+            d['max_ms'] = max(d['max_ms'], ms)
+
+    def registrar_ganador(self, nombre):
+        with self._lock:
+            if nombre in self._datos:
+                self._datos[nombre]['ganadas'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            resultado = {}
+            for nombre, d in self._datos.items():
+                latencias = sorted(d['latencias'])
+                fila = {k: v for k, v in d.items() if k != 'latencias'}
+                fila['max_ms'] = round(fila['max_ms'], 1)
+                if latencias:
+                    fila['p50_ms'] = round(latencias[len(latencias) // 2], 1)
+                    fila['p95_ms'] = round(latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))], 1)
+                resultado[nombre] = fila
+            return resultado
+
+
+estadisticas_ia = EstadisticasIA()
+
+
+def _llamar(candidato, system_prompt, user_prompt, timeout_s, cancelado):
+    """Ejecuta un candidato y registra su latencia. Devuelve el texto (o None si vacío); lanza si falla."""
+    inicio = time.perf_counter()
+    try:
+        texto = candidato.generar(system_prompt, user_prompt, timeout_s)
+        texto = texto.strip() if texto else None
+        resultado = 'ok' if texto else 'vacio'
+        return texto
+    except Exception:
+        resultado = 'error'
+        raise
+    finally:
+        ms = (time.perf_counter() - inicio) * 1000.0
+        # Si ya hubo un ganador, la respuesta se descarta (no se puede interrumpir la llamada HTTP)
+        estadisticas_ia.registrar(candidato.nombre, 'descartado' if cancelado.is_set() else resultado, ms)
+
+
+def generar_texto_con_cobertura(candidatos, system_prompt, user_prompt, config=None):
+    """
+    Genera texto con la lista ordenada de candidatos y devuelve (texto, nombre_candidato)
+    o (None, None) si ninguno respondió.
+    - Sin hedging: se prueban uno tras otro, cada uno con 'timeout_s'.
+    - Con hedging: se lanza el primero; si no responde en 'hedge_after_ms' (o falla) se lanza
+      el siguiente, hasta 'max_parallel' en vuelo. Gana la primera respuesta válida y el resto
+      se descarta. Todo termina a más tardar en 'timeout_s'.
+    """
+    cfg = dict(HEDGING_DEFAULTS)
+    cfg.update(config or {})
+    timeout_s = float(cfg['timeout_s'])
+
+    if not candidatos:
+        return None, None
+
+    if not cfg['enabled']:
+        cancelado = threading.Event()
+        for candidato in candidatos:
+            logger.info('Intentando generar texto con %s...', candidato.nombre)
+            try:
+                texto = _llamar(candidato, system_prompt, user_prompt, timeout_s, cancelado)
+                if texto:
+                    estadisticas_ia.registrar_ganador(candidato.nombre)
+                    return texto, candidato.nombre
+                logger.warning('Respuesta vacía de %s. Probando siguiente.', candidato.nombre)
+            except Exception as e:
+                logger.warning('%s falló: %s. Probando siguiente.', candidato.nombre, e)
+        return None, None
+
+    hedge_s = float(cfg['hedge_after_ms']) / 1000.0
+    max_parallel = max(1, int(cfg['max_parallel']))
+    cancelado = threading.Event()
+    limite = time.monotonic() + timeout_s
+    pendientes_por_lanzar = list(candidatos)
+    en_vuelo = {}
+
+    def lanzar_siguiente():
+        if pendientes_por_lanzar and len(en_vuelo) < max_parallel:
+            candidato = pendientes_por_lanzar.pop(0)
+            restante = max(0.1, limite - time.monotonic())
+            logger.info('Lanzando generación de texto con %s (timeout %.1fs)...', candidato.nombre, restante)
+            future = _executor.submit(_llamar, candidato, system_prompt, user_prompt, restante, cancelado)
+            en_vuelo[future] = candidato
+            return True
+        return False
+
+    lanzar_siguiente()
+    try:
+        while en_vuelo:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                logger.warning('Ningún proveedor de IA respondió en %ss.', timeout_s)
+                break
+            listos, _ = wait(list(en_vuelo), timeout=min(hedge_s, restante), return_when=FIRST_COMPLETED)
+            if not listos:
+                # Nadie respondió a tiempo: cubrir con el siguiente candidato
+                lanzar_siguiente()
+                continue
+            for future in listos:
+                candidato = en_vuelo.pop(future)
+                try:
+                    texto = future.result()
+                except Exception as e:
+                    logger.warning('%s falló: %s.', candidato.nombre, e)
+                    texto = None
+                if texto:
+                    estadisticas_ia.registrar_ganador(candidato.nombre)
+                    return texto, candidato.nombre
+            # Los que terminaron fallaron: lanzar el siguiente sin esperar el umbral
+            lanzar_siguiente()
+        return None, None
+    finally:
+        cancelado.set()
+        for future in en_vuelo:
+            future.cancel()
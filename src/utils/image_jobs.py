@@ -0,0 +1,174 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from database import (
+    connect_to_db, crear_trabajo_imagen, tomar_trabajo_imagen, completar_trabajo_imagen,
+    fallar_trabajo_imagen, get_trabajos_imagen_pendientes
+)
+from utils.pdf_cache import invalidar_pdfs_de_tabla
+from utils.postura_imagen import anotar_imagen_postura
+
+logger = logging.getLogger(__name__)
+
+
+# Configuración por variables de entorno. IMG_JOBS_WORKERS=0 desactiva la cola
+# (las fotos se vuelven a procesar dentro del request, como antes).
+IMG_JOBS_CONFIG = {
+    'workers': int(os.environ.get('IMG_JOBS_WORKERS', 1)),
+    'minutos_estancado': int(os.environ.get('IMG_JOBS_STALE_MINUTES', 10)),
+}
+
+
+def ruta_resultado_para(ruta_original):
+    """Ruta (relativa a static) de la foto anotada que corresponde a una foto original."""
+    carpeta, nombre = os.path.split(ruta_original)
+    base, extension = os.path.splitext(nombre)
+    base = base.replace('_orig_', '_', 1) if '_orig_' in base else f"{base}_pose"
+    return f"{carpeta}/{base}{extension}" if carpeta else f"{base}{extension}"
+
+
+class ImageJobQueue:
+    """
+    Cola local de procesamiento de fotos de postura.
+    - Los trabajos se registran en la tabla 'trabajos_imagen' (durable: sobreviven a un reinicio).
+    - El dibujo de la pose corre en un pool de procesos (no bloquea el worker web ni el GIL).
+    - Al terminar, el hilo del pool actualiza la columna de 'postura' y el estado del trabajo.
+    """
+
+    def __init__(self, static_folder, workers=1, minutos_estancado=10):
+        self.static_folder = static_folder
+        self.workers = max(0, int(workers))
+        self.minutos_estancado = int(minutos_estancado)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def habilitada(self):
+        return self.workers > 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # 'spawn': no heredamos hilos ni modelos cargados del proceso web
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def encolar(self, connection, id_px, id_postura, columna, view_type, ruta_original):
+        """Registra y envía un trabajo nuevo. Devuelve el id_trabajo o None si no se pudo encolar."""
+        id_trabajo = crear_trabajo_imagen(connection, id_postura, columna, view_type, ruta_original)
+        if not id_trabajo:
+            return None
+        self._enviar({
+            'id_trabajo': id_trabajo, 'id_px': id_px, 'id_postura': id_postura, 'columna': columna,
+            'view_type': view_type, 'ruta_original': ruta_original
+        })
+        return id_trabajo
+
+    def _enviar(self, trabajo):
+        ruta_resultado = ruta_resultado_para(trabajo['ruta_original'])
+        try:
+            future = self._get_executor().submit(
+                anotar_imagen_postura,
+                os.path.join(self.static_folder, trabajo['ruta_original']),
+                os.path.join(self.static_folder, ruta_resultado),
+                trabajo['view_type']
+            )
+        except (BrokenProcessPool, RuntimeError) as e:
+            # El pool murió (p. ej. un proceso se cayó): se recrea en el siguiente envío
+            logger.error('No se pudo enviar el trabajo de imagen %s: %s', trabajo['id_trabajo'], e)
+            with self._lock:
+                self._executor = None
+            self._registrar_fallo(trabajo, e)
+            return
+        future.add_done_callback(lambda f: self._terminar(trabajo, ruta_resultado, f))
+
+    def _terminar(self, trabajo, ruta_resultado, future):
+        try:
+            ok, error = future.result()
+        except BrokenProcessPool as e:
+            with self._lock:
+                self._executor = None
+            ok, error = False, f"El proceso de imágenes terminó inesperadamente: {e}"
+        except Exception as e:
+            ok, error = False, str(e)
+
+        if not ok:
+            logger.error('Trabajo de imagen %s falló: %s', trabajo['id_trabajo'], error)
+            self._registrar_fallo(trabajo, error)
+            return
+
+        connection = connect_to_db()
+        if not connection:
+            # Queda en 'procesando'; se reanuda al arrancar cuando se considere estancado
+            logger.error('Sin conexión para completar el trabajo de imagen %s.', trabajo['id_trabajo'])
+            return
+        try:
+            if completar_trabajo_imagen(connection, trabajo, ruta_resultado):
+                # Los PDF que muestran las fotos de postura (plantillas, informe integral) quedan viejos
+                invalidar_pdfs_de_tabla('postura', trabajo['id_px'])
+                ruta_original_abs = os.path.join(self.static_folder, trabajo['ruta_original'])
+                if os.path.exists(ruta_original_abs):
+                    os.remove(ruta_original_abs)
+            logger.info('Trabajo de imagen %s completado: %s', trabajo['id_trabajo'], ruta_resultado)
+        except Exception as e:
+            logger.error('Completando trabajo de imagen %s: %s', trabajo['id_trabajo'], e)
+        finally:
+            connection.close()
+
+    def _registrar_fallo(self, trabajo, error):
+        connection = connect_to_db()
+        if not connection:
+            return
+        try:
+            fallar_trabajo_imagen(connection, trabajo['id_trabajo'], error)
+        finally:
+            connection.close()
+
+    def reanudar_pendientes(self):
+        """Reenvía los trabajos que quedaron pendientes (o estancados) de una ejecución anterior."""
+        connection = connect_to_db()
+        if not connection:
+            logger.warning('Sin conexión para reanudar trabajos de imagen pendientes.')
+            return
+        try:
+            reanudados = 0
+            for trabajo in get_trabajos_imagen_pendientes(connection, self.minutos_estancado):
+                # Con varios workers de gunicorn, solo uno toma cada trabajo
+                if tomar_trabajo_imagen(connection, trabajo['id_trabajo']):
+                    self._enviar(trabajo)
+                    reanudados += 1
+            if reanudados:
+                logger.info('%s trabajos de imagen reanudados.', reanudados)
+        finally:
+            connection.close()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False)
+
+
+_cola = None
+
+
+def get_image_jobs():
+    """Cola de trabajos de imagen del proceso (None si no se inicializó con init_image_jobs)."""
+    return _cola
+
+
+def init_image_jobs(app):
+    """Crea la cola con la carpeta 'static' de la app y reanuda (en segundo plano) los trabajos pendientes."""
+    global _cola
+    _cola = ImageJobQueue(app.static_folder, workers=IMG_JOBS_CONFIG['workers'],
+                          minutos_estancado=IMG_JOBS_CONFIG['minutos_estancado'])
+    # Los procesos hijos del pool también importan la app: solo el proceso principal reanuda trabajos
+    if _cola.habilitada and multiprocessing.current_process().name == 'MainProcess':
+        threading.Thread(target=_cola.reanudar_pendientes, name='reanudar-trabajos-imagen', daemon=True).start()
+    return _cola
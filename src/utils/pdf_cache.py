@@ -0,0 +1,174 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+from io import BytesIO
+
+from flask import current_app, render_template, request, Response
+
+logger = logging.getLogger(__name__)
+
+
+# Caché en disco de los PDF generados (plan de cuidado, recibo, plantillas, informe integral).
+# La versión de cada PDF es un hash de la plantilla y de los datos con los que se renderiza:
+# si los registros no cambiaron se sirven los mismos bytes (y el navegador recibe 304 con ETag).
+_SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PDF_CACHE_CONFIG = {
+    'dir': os.environ.get('PDF_CACHE_DIR', os.path.join(_SRC_DIR, 'instance', 'pdf_cache')),
+    'enabled': os.environ.get('PDF_CACHE_ENABLED', '1') == '1',
+}
+
+# Documentos que dependen de cada tabla (para invalidar al guardar)
+PDFS_POR_TABLA = {
+    'plancuidado': ('plan',),
+    'recibos': ('recibo',),
+    'postura': ('plantillas', 'integral'),
+    'anamnesis': ('integral',),
+}
+
+
+class CachePDF:
+    """
+    Un archivo por documento: <dir>/<tipo>/px<id_px>/<id_doc>_<version>.pdf
+    Al guardar una versión nueva se borran las anteriores del mismo documento, así que
+    en disco queda como máximo un PDF por documento.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self._lock = threading.Lock()
+        self._metricas = {'hits': 0, 'misses': 0, 'not_modified': 0, 'invalidados': 0}
+
+    def _carpeta(self, tipo, id_px):
+        return os.path.join(self.directorio, tipo, f"px{int(id_px)}")
+
+    def _ruta(self, tipo, id_px, id_doc, version):
+        return os.path.join(self._carpeta(tipo, id_px), f"{id_doc}_{version}.pdf")
+
+    def existe(self, tipo, id_px, id_doc, version):
+        return os.path.exists(self._ruta(tipo, id_px, id_doc, version))
+
+    def obtener(self, tipo, id_px, id_doc, version):
+        try:
+            with open(self._ruta(tipo, id_px, id_doc, version), 'rb') as f:
+                contenido = f.read()
+        except OSError:
+            self._contar('misses')
+            return None
+        self._contar('hits')
+        return contenido
+
+    def guardar(self, tipo, id_px, id_doc, version, contenido):
+        ruta = self._ruta(tipo, id_px, id_doc, version)
+        try:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            temporal = f"{ruta}.{os.getpid()}.tmp"
+            with open(temporal, 'wb') as f:
+                f.write(contenido)
+            os.replace(temporal, ruta)
+        except OSError as e:
+            logger.warning('No se pudo guardar el PDF en caché (%s %s): %s', tipo, id_doc, e)
+            return
+        # Versiones anteriores del mismo documento ya no se van a pedir
+        for anterior in glob.glob(os.path.join(self._carpeta(tipo, id_px), f"{glob.escape(str(id_doc))}_*.pdf")):
+            if anterior != ruta:
+                self._borrar(anterior)
+
+    def invalidar(self, tipo, id_px, id_doc=None):
+        """Borra los PDF de un documento (o todos los de ese tipo para el paciente si id_doc es None)."""
+        patron = f"{glob.escape(str(id_doc))}_*.pdf" if id_doc is not None else "*.pdf"
+        for ruta in glob.glob(os.path.join(self._carpeta(tipo, id_px), patron)):
+            if self._borrar(ruta):
+                self._contar('invalidados')
+
+    def _borrar(self, ruta):
+        try:
+            os.remove(ruta)
+            return True
+        except OSError:
+            return False
+
+    def _contar(self, metrica):
+        with self._lock:
+            self._metricas[metrica] += 1
+
+    def metricas(self):
+        with self._lock:
+            metricas = dict(self._metricas)
+        consultas = metricas['hits'] + metricas['misses'] + metricas['not_modified']
+        metricas['hit_ratio'] = round((metricas['hits'] + metricas['not_modified']) / consultas, 3) if consultas else None
+        return metricas
+
+
+cache_pdf = CachePDF(PDF_CACHE_CONFIG['dir'])
+
+
+def invalidar_pdfs_de_tabla(tabla, id_px, id_doc=None):
+    """Invalida los PDF que dependen de 'tabla' para un paciente (llamar después de guardar)."""
+    for tipo in PDFS_POR_TABLA.get(tabla, ()):
+        # Plantillas e informe integral no se identifican por id_postura: se invalidan todos los del paciente
+        cache_pdf.invalidar(tipo, id_px, id_doc if tipo in ('plan', 'recibo') else None)
+
+
+def version_pdf(plantilla, data):
+    """Hash de la plantilla (su código fuente) y de los datos con los que se renderiza."""
+    fuente, _, _ = current_app.jinja_env.loader.get_source(current_app.jinja_env, plantilla)
+    h = hashlib.sha256(fuente.encode('utf-8'))
+    h.update(json.dumps(data, sort_keys=True, default=str).encode('utf-8'))
+    return h.hexdigest()[:32]
+
+
+def respuesta_pdf(contenido, version, nombre_archivo):
+    response = Response(contenido, mimetype='application/pdf')
+    response.headers['Content-Disposition'] = f'inline; filename={nombre_archivo}'
+    response.set_etag(version)
+    # 'no-cache': el navegador guarda el PDF pero pregunta antes de reutilizarlo (If-None-Match -> 304)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def respuesta_no_modificado(version):
+    cache_pdf._contar('not_modified')
+    response = Response(status=304)
+    response.set_etag(version)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def responder_pdf(tipo, id_px, id_doc, plantilla, data, nombre_archivo):
+    """
+    Devuelve (response, error) para un PDF renderizado desde 'plantilla' con 'data'.
+    - Si el navegador ya tiene esta versión (If-None-Match) responde 304 sin renderizar.
+    - Si está en la caché de disco devuelve esos bytes; si no, renderiza con pisa y lo guarda.
+    - Con la cola de PDF activa (utils/pdf_jobs.py) pisa corre fuera del request: se espera
+      hasta un plazo y, si no terminó, se devuelve la página "generando".
+    - error es el mensaje de pisa si la conversión falló (response es None).
+    """
+    version = version_pdf(plantilla, data)
+    if PDF_CACHE_CONFIG['enabled']:
+        if request.if_none_match.contains(version):
+            return respuesta_no_modificado(version), None
+        contenido = cache_pdf.obtener(tipo, id_px, id_doc, version)
+        if contenido is not None:
+            return respuesta_pdf(contenido, version, nombre_archivo), None
+
+    html_content = render_template(plantilla, data=data)
+
+    from utils.pdf_jobs import get_pdf_jobs, responder_trabajo_pdf  # pdf_jobs importa este módulo
+    cola = get_pdf_jobs()
+    if PDF_CACHE_CONFIG['enabled'] and cola and cola.habilitada:
+        trabajo = cola.enviar(tipo, id_px, id_doc, nombre_archivo, clave=version, html=html_content, version=version)
+        return responder_trabajo_pdf(trabajo)
+
+    from xhtml2pdf import pisa  # Import diferido: solo se carga al generar un PDF
+    pdf_buffer = BytesIO()
+    pisa_status = pisa.CreatePDF(html_content.encode('utf-8'), dest=pdf_buffer, encoding='utf-8')
+    if pisa_status.err:
+        return None, pisa_status.err
+
+    contenido = pdf_buffer.getvalue()
+    if PDF_CACHE_CONFIG['enabled']:
+        cache_pdf.guardar(tipo, id_px, id_doc, version, contenido)
+    return respuesta_pdf(contenido, version, nombre_archivo), None
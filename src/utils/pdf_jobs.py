@@ -0,0 +1,255 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import render_template, request, Response, url_for
+
+from utils.pdf_cache import cache_pdf, version_pdf, respuesta_pdf, respuesta_no_modificado
+
+logger = logging.getLogger(__name__)
+
+
+# Configuración por variables de entorno. PDF_JOBS_WORKERS=0 desactiva la cola
+# (los PDF se vuelven a generar dentro del request, como antes).
+_SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PDF_JOBS_CONFIG = {
+    'workers': int(os.environ.get('PDF_JOBS_WORKERS', 2)),
+    'espera_s': float(os.environ.get('PDF_JOBS_WAIT_S', 4)),     # Espera del request antes de mostrar "generando"
+    'espera_max_s': 30.0,                                        # Límite para ?esperar=N
+    'estancado_s': float(os.environ.get('PDF_JOBS_STALE_S', 180)),
+    'dir': os.environ.get('PDF_JOBS_DIR', os.path.join(_SRC_DIR, 'instance', 'pdf_jobs')),
+    'ttl_s': 6 * 3600,                                           # Se borran los estados más viejos
+}
+
+
+def renderizar_pdf(html_content):
+    """Convierte HTML a PDF con pisa. Corre en un proceso del pool; devuelve los bytes."""
+    from io import BytesIO
+    from xhtml2pdf import pisa
+    pdf_buffer = BytesIO()
+    pisa_status = pisa.CreatePDF(html_content.encode('utf-8'), dest=pdf_buffer, encoding='utf-8')
+    if pisa_status.err:
+        raise RuntimeError(f"pisa reportó {pisa_status.err} errores al generar el PDF.")
+    return pdf_buffer.getvalue()
+
+
+class PDFJobQueue:
+    """
+    Generación de PDF fuera del request.
+    - Un hilo por trabajo prepara los datos (p. ej. el informe de IA del reporte integral) y
+      renderiza la plantilla; la conversión con pisa corre en un pool de procesos.
+    - El resultado queda en la caché de PDF (utils/pdf_cache.py) y el estado del trabajo en un
+      JSON en disco, así que cualquier worker de gunicorn puede responder el estado o la descarga.
+    - El id del trabajo se deriva del documento: pedir dos veces el mismo PDF no lo genera dos veces.
+    """
+
+    def __init__(self, app, workers=2, directorio=None, estancado_s=180, ttl_s=6 * 3600):
+        self.app = app
+        self.workers = max(0, int(workers))
+        self.directorio = directorio
+        self.estancado_s = float(estancado_s)
+        self.ttl_s = float(ttl_s)
+        self._procesos = None
+        self._hilos = ThreadPoolExecutor(max_workers=max(1, self.workers * 2), thread_name_prefix='pdf-trabajo')
+        self._lock = threading.Lock()
+        self._eventos = {}  # id_trabajo -> Event (trabajos de este proceso)
+        self._ultima_limpieza = 0.0
+
+    @property
+    def habilitada(self):
+        return self.workers > 0
+
+    def _get_procesos(self):
+        with self._lock:
+            if self._procesos is None:
+                self._procesos = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._procesos
+
+    def pool_procesos(self):
+        """Pool de procesos de pisa (lo reutiliza la exportación masiva de recibos)."""
+        return self._get_procesos()
+
+    # --- Estado en disco ---
+    def _ruta_estado(self, id_trabajo):
+        return os.path.join(self.directorio, f"{id_trabajo}.json")
+
+    def estado(self, id_trabajo):
+        """Estado del trabajo (dict) o None si no existe. id_trabajo viene de la URL: se valida."""
+        if not id_trabajo or not id_trabajo.isalnum():
+            return None
+        try:
+            with open(self._ruta_estado(id_trabajo), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _guardar_estado(self, trabajo):
+        os.makedirs(self.directorio, exist_ok=True)
+        ruta = self._ruta_estado(trabajo['id'])
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(trabajo, f)
+        os.replace(temporal, ruta)
+
+    def _limpiar(self):
+        ahora = time.time()
+        if ahora - self._ultima_limpieza < 600:
+            return
+        self._ultima_limpieza = ahora
+        try:
+            for nombre in os.listdir(self.directorio):
+                ruta = os.path.join(self.directorio, nombre)
+                if ahora - os.path.getmtime(ruta) > self.ttl_s:
+                    os.remove(ruta)
+        except OSError:
+            pass
+
+    def _reutilizable(self, trabajo):
+        """Un trabajo anterior sirve si sigue en curso (y no está estancado) o si su PDF sigue en caché."""
+        if not trabajo:
+            return False
+        if trabajo['estado'] == 'procesando':
+            return time.time() - trabajo['creado'] < self.estancado_s
+        if trabajo['estado'] == 'completado':
+            return cache_pdf.existe(trabajo['tipo'], trabajo['id_px'], trabajo['id_doc'], trabajo['version'])
+        return False
+
+    # --- Envío ---
+    def enviar(self, tipo, id_px, id_doc, nombre_archivo, clave, html=None, version=None,
+               plantilla=None, preparar=None):
+        """
+        Registra (o reutiliza) el trabajo de un PDF y devuelve su estado.
+        - Con 'html' y 'version' ya calculados solo se convierte con pisa.
+        - Con 'plantilla' y 'preparar' (función sin argumentos que devuelve el 'data' de la
+          plantilla) también se preparan los datos y se renderiza fuera del request.
+        - 'clave' identifica el contenido (p. ej. la versión); con la misma clave se reutiliza el trabajo.
+        """
+        id_trabajo = hashlib.sha256(f"{tipo}:{id_px}:{id_doc}:{clave}".encode('utf-8')).hexdigest()[:24]
+        with self._lock:
+            anterior = self.estado(id_trabajo)
+            if self._reutilizable(anterior):
+                return anterior
+            trabajo = {
+                'id': id_trabajo, 'tipo': tipo, 'id_px': id_px, 'id_doc': id_doc, 'version': version,
+                'nombre_archivo': nombre_archivo, 'estado': 'procesando', 'error': None,
+                'creado': time.time(), 'ms': None,
+            }
+            self._guardar_estado(trabajo)
+            self._eventos[id_trabajo] = threading.Event()
+        self._limpiar()
+        self._hilos.submit(self._ejecutar, trabajo, html, plantilla, preparar)
+        return trabajo
+
+    def _ejecutar(self, trabajo, html, plantilla, preparar):
+        inicio = time.perf_counter()
+        try:
+            with self.app.app_context():
+                if preparar is not None:
+                    data = preparar()
+                    trabajo['version'] = version_pdf(plantilla, data)
+                    if cache_pdf.existe(trabajo['tipo'], trabajo['id_px'], trabajo['id_doc'], trabajo['version']):
+                        html = None
+                    else:
+                        html = render_template(plantilla, data=data)
+            if html is not None:
+                try:
+                    contenido = self._get_procesos().submit(renderizar_pdf, html).result()
+                except BrokenProcessPool:
+                    with self._lock:
+                        self._procesos = None
+                    raise
+                cache_pdf.guardar(trabajo['tipo'], trabajo['id_px'], trabajo['id_doc'], trabajo['version'], contenido)
+            trabajo['estado'] = 'completado'
+        except Exception as e:
+            logger.error('Trabajo de PDF %s (%s, px %s) falló: %s', trabajo['id'], trabajo['tipo'], trabajo['id_px'], e)
+            trabajo['estado'] = 'error'
+            trabajo['error'] = str(e)
+        trabajo['ms'] = round((time.perf_counter() - inicio) * 1000.0, 1)
+        try:
+            self._guardar_estado(trabajo)
+        except OSError as e:
+            logger.error('No se pudo guardar el estado del trabajo de PDF %s: %s', trabajo['id'], e)
+        with self._lock:
+            evento = self._eventos.pop(trabajo['id'], None)
+        if evento:
+            evento.set()
+
+    def esperar(self, trabajo, timeout_s):
+        """Espera hasta timeout_s a que termine el trabajo y devuelve su estado más reciente."""
+        if trabajo['estado'] != 'procesando':
+            return trabajo
+        with self._lock:
+            evento = self._eventos.get(trabajo['id'])
+        if evento:
+            evento.wait(timeout_s)
+        else:
+            # Lo está generando otro proceso: se consulta el estado en disco
+            limite = time.monotonic() + timeout_s
+            while time.monotonic() < limite:
+                estado = self.estado(trabajo['id'])
+                if estado and estado['estado'] != 'procesando':
+                    return estado
+                time.sleep(0.25)
+        return self.estado(trabajo['id']) or trabajo
+
+    def shutdown(self):
+        with self._lock:
+            procesos, self._procesos = self._procesos, None
+        if procesos:
+            procesos.shutdown(wait=False)
+        self._hilos.shutdown(wait=False)
+
+
+_cola = None
+
+
+def get_pdf_jobs():
+    """Cola de PDF del proceso (None si no se inicializó con init_pdf_jobs)."""
+    return _cola
+
+
+def init_pdf_jobs(app):
+    global _cola
+    _cola = PDFJobQueue(app, workers=PDF_JOBS_CONFIG['workers'], directorio=PDF_JOBS_CONFIG['dir'],
+                        estancado_s=PDF_JOBS_CONFIG['estancado_s'], ttl_s=PDF_JOBS_CONFIG['ttl_s'])
+    return _cola
+
+
+def segundos_de_espera():
+    """Espera del request: ?esperar=N (0 = mostrar la página de "generando" de inmediato) o la configurada."""
+    try:
+        espera = float(request.args.get('esperar', PDF_JOBS_CONFIG['espera_s']))
+    except ValueError:
+        espera = PDF_JOBS_CONFIG['espera_s']
+    return max(0.0, min(espera, PDF_JOBS_CONFIG['espera_max_s']))
+
+
+def responder_trabajo_pdf(trabajo):
+    """
+    Devuelve (response, error) para un trabajo de PDF: el PDF si terminó dentro del plazo,
+    la página "generando" (que consulta el estado) si no, o el error si falló.
+    """
+    trabajo = get_pdf_jobs().esperar(trabajo, segundos_de_espera())
+    if trabajo['estado'] == 'error':
+        return None, trabajo['error']
+    if trabajo['estado'] == 'completado':
+        if request.if_none_match.contains(trabajo['version']):
+            return respuesta_no_modificado(trabajo['version']), None
+        contenido = cache_pdf.obtener(trabajo['tipo'], trabajo['id_px'], trabajo['id_doc'], trabajo['version'])
+        if contenido is not None:
+            return respuesta_pdf(contenido, trabajo['version'], trabajo['nombre_archivo']), None
+
+    html = render_template(
+        'pdf_generando.html',
+        nombre_archivo=trabajo['nombre_archivo'],
+        url_estado=url_for('clinical.estado_trabajo_pdf', patient_id=trabajo['id_px'], id_trabajo=trabajo['id']),
+    )
+    return Response(html, status=202), None
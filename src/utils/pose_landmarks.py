@@ -0,0 +1,93 @@
+import json
+import logging
+import os
+
+from utils.pose_pool import get_pose_pool, POSE_POSTURA
+
+logger = logging.getLogger(__name__)
+
+
+# Archivo "sidecar" junto a cada imagen: <imagen>.landmarks.json
+# Guarda los 33 puntos de MediaPipe Pose como [x, y, z, visibility] normalizados (0-1),
+# para que los informes no tengan que volver a correr el modelo sobre la imagen.
+SUFIJO_LANDMARKS = '.landmarks.json'
+DECIMALES = 5
+
+# Índices de los puntos de MediaPipe Pose que usan los análisis (topología fija de 33 puntos;
+# equivalen a mp.solutions.pose.PoseLandmark.* sin tener que importar mediapipe)
+HOMBRO_IZQ, HOMBRO_DER = 11, 12
+CADERA_IZQ, CADERA_DER = 23, 24
+TOBILLO_IZQ, TOBILLO_DER = 27, 28
+TALON_IZQ, TALON_DER = 29, 30
+
+
+def ruta_landmarks(ruta_imagen):
+    """Ruta del archivo de landmarks asociado a una imagen."""
+    return f"{ruta_imagen}{SUFIJO_LANDMARKS}"
+
+
+def landmarks_a_lista(pose_landmarks):
+    """Convierte results.pose_landmarks de MediaPipe a una lista compacta de [x, y, z, visibility]."""
+    if not pose_landmarks:
+        return None
+    return [
+        [round(lm.x, DECIMALES), round(lm.y, DECIMALES), round(lm.z, DECIMALES), round(lm.visibility, DECIMALES)]
+        for lm in pose_landmarks.landmark
+    ]
+
+
+def guardar_landmarks(ruta_imagen, landmarks, config=POSE_POSTURA):
+    """
+    Guarda los landmarks de una imagen. 'landmarks' puede ser None si no se detectó pose
+    (así tampoco se vuelve a intentar al generar el informe).
+    """
+    datos = {'v': 1, 'config': list(config), 'landmarks': landmarks}
+    ruta = ruta_landmarks(ruta_imagen)
+    temporal = f"{ruta}.tmp"
+    try:
+        with open(temporal, 'w') as f:
+            json.dump(datos, f, separators=(',', ':'))
+        os.replace(temporal, ruta)
+        return True
+    except OSError as e:
+        logger.warning('No se pudieron guardar los landmarks de %s: %s', ruta_imagen, e)
+        return False
+
+
+def cargar_landmarks(ruta_imagen):
+    """
+    Devuelve el contenido guardado ({'config': [...], 'landmarks': [...] o None})
+    o None si la imagen no tiene archivo de landmarks (imágenes anteriores).
+    """
+    ruta = ruta_landmarks(ruta_imagen)
+    if not os.path.exists(ruta):
+        return None
+    try:
+        with open(ruta, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning('Archivo de landmarks inválido %s: %s', ruta, e)
+        return None
+
+
+def obtener_landmarks(ruta_imagen, config=POSE_POSTURA):
+    """
+    Landmarks de una imagen: usa los guardados al subirla; si no existen (imágenes
+    anteriores a este cambio) corre el modelo una vez y los guarda para la próxima.
+    Un "sin pose" guardado con otra configuración (p. ej. otro umbral de confianza)
+    no se reutiliza: se vuelve a intentar con la configuración pedida.
+    """
+    datos = cargar_landmarks(ruta_imagen)
+    if datos is not None:
+        if datos.get('landmarks') is not None or datos.get('config') == list(config):
+            return datos.get('landmarks')
+
+    import cv2
+    image = cv2.imread(ruta_imagen)
+    if image is None:
+        raise ValueError("OpenCV no pudo leer la imagen.")
+    with get_pose_pool().pose(*config) as pose:
+        results = pose.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    landmarks = landmarks_a_lista(results.pose_landmarks)
+    guardar_landmarks(ruta_imagen, landmarks, config)
+    return landmarks
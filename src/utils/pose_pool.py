@@ -0,0 +1,170 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Configuración por variables de entorno (mismo esquema que DB_POOL_CONFIG en database.py)
+POSE_POOL_CONFIG = {
+    'size': int(os.environ.get('POSE_POOL_SIZE', 2)),          # Instancias por configuración
+    'timeout': float(os.environ.get('POSE_POOL_TIMEOUT', 30)),  # Segundos de espera antes de crear una temporal
+    'warmup': os.environ.get('POSE_POOL_WARMUP', '1') == '1',
+}
+
+# Configuraciones que usan las rutas clínicas: (model_complexity, min_detection_confidence)
+POSE_POSTURA = (2, 0.5)  # procesar_y_guardar_imagen_postura / analizar_coordenadas_postura
+POSE_PODAL = (2, 0.1)    # analizar_coordenadas_podal
+
+
+class _PoseLease:
+    """Context manager que presta una instancia de Pose y la devuelve al salir."""
+
+    def __init__(self, pool, key):
+        self._pool = pool
+        self._key = key
+        self._pose = None
+        self._temporal = False
+
+    def __enter__(self):
+        self._pose, self._temporal = self._pool._acquire(self._key)
+        return self._pose
+
+    def __exit__(self, exc_type, exc, tb):
+        self._pool._release(self._key, self._pose, self._temporal)
+        return False
+
+
+class PosePool:
+    """
+    Pool de instancias de MediaPipe Pose ya cargadas, agrupadas por configuración
+    (model_complexity, min_detection_confidence).
+    - Una instancia de Pose NO es thread-safe: cada hilo usa la suya mientras la tiene prestada.
+    - Se crean bajo demanda hasta 'size' instancias por configuración y se reutilizan.
+    - Si todas están ocupadas se espera hasta 'timeout' segundos; después se usa una
+      instancia temporal (se cierra al devolverse) para no bloquear el request.
+    Uso:
+        with get_pose_pool().pose(*POSE_POSTURA) as pose:
+            results = pose.process(image_rgb)
+    """
+
+    def __init__(self, size=2, timeout=30.0):
+        self.size = max(1, int(size))
+        self.timeout = float(timeout)
+        self._lock = threading.Lock()
+        self._idle = {}     # key -> LifoQueue de instancias libres
+        self._created = {}  # key -> instancias creadas (pooled)
+        self._stats = {
+            'checkouts': 0,
+            'instances_created': 0,
+            'temporary_instances': 0,
+            'load_total_ms': 0.0,
+            'wait_max_ms': 0.0,
+        }
+
+    def _new_pose(self, key):
+        import mediapipe as mp  # Import diferido: mediapipe tarda varios segundos en cargarse
+        model_complexity, min_detection_confidence = key
+        inicio = time.perf_counter()
+        pose = mp.solutions.pose.Pose(
+            static_image_mode=True,
+            model_complexity=model_complexity,
+            min_detection_confidence=min_detection_confidence
+        )
+        with self._lock:
+            self._stats['load_total_ms'] += (time.perf_counter() - inicio) * 1000.0
+        return pose
+
+    def _acquire(self, key):
+        with self._lock:
+            idle = self._idle.setdefault(key, queue.LifoQueue())
+            puede_crear = self._created.get(key, 0) < self.size and idle.empty()
+            if puede_crear:
+                self._created[key] = self._created.get(key, 0) + 1
+                self._stats['instances_created'] += 1
+            self._stats['checkouts'] += 1
+
+        if puede_crear:
+            try:
+                return self._new_pose(key), False
+            except Exception:
+                with self._lock:
+                    self._created[key] -= 1
+                raise
+
+        inicio = time.perf_counter()
+        try:
+            pose = idle.get(timeout=self.timeout)
+            with self._lock:
+                self._stats['wait_max_ms'] = max(self._stats['wait_max_ms'], (time.perf_counter() - inicio) * 1000.0)
+            return pose, False
+        except queue.Empty:
+            logger.warning('Pool de Pose %s ocupado tras %ss; se usa una instancia temporal.', key, self.timeout)
+            with self._lock:
+                self._stats['temporary_instances'] += 1
+            return self._new_pose(key), True
+
+    def _release(self, key, pose, temporal):
+        if pose is None:
+            return
+        if temporal:
+            pose.close()
+            return
+        self._idle[key].put(pose)
+
+    def pose(self, model_complexity=2, min_detection_confidence=0.5):
+        """Devuelve un context manager con una instancia de Pose para esa configuración."""
+        return _PoseLease(self, (model_complexity, min_detection_confidence))
+
+    def warm_up(self, keys):
+        """Carga una instancia por configuración y ejecuta una inferencia en blanco (inicializa el grafo)."""
+        import numpy as np
+        imagen_vacia = np.zeros((800, 600, 3), dtype=np.uint8)
+        for key in keys:
+            try:
+                inicio = time.perf_counter()
+                with self.pose(*key) as pose:
+                    pose.process(imagen_vacia)
+                logger.info('Modelo Pose %s precargado en %.0f ms.', key, (time.perf_counter() - inicio) * 1000.0)
+            except Exception as e:
+                logger.warning('No se pudo precargar el modelo Pose %s: %s', key, e)
+
+    def stats(self):
+        """Copia de las estadísticas del pool para el panel de administración."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['instances'] = {f"{k[0]}/{k[1]}": n for k, n in self._created.items()}
+            stats['idle'] = {f"{k[0]}/{k[1]}": q.qsize() for k, q in self._idle.items()}
+        stats['size'] = self.size
+        stats['load_total_ms'] = round(stats['load_total_ms'], 3)
+        stats['wait_max_ms'] = round(stats['wait_max_ms'], 3)
+        return stats
+
+
+_pose_pool = None
+_pose_pool_lock = threading.Lock()
+
+
+def get_pose_pool():
+    """Devuelve el pool de Pose del proceso (se crea la primera vez)."""
+    global _pose_pool
+    if _pose_pool is None:
+        with _pose_pool_lock:
+            if _pose_pool is None:
+                _pose_pool = PosePool(size=POSE_POOL_CONFIG['size'], timeout=POSE_POOL_CONFIG['timeout'])
+    return _pose_pool
+
+
+def start_pose_warm_up():
+    """
+    Precarga en segundo plano los modelos que usan las rutas clínicas, para que la
+    primera imagen no pague la carga del modelo. Se desactiva con POSE_POOL_WARMUP=0.
+    """
+    if not POSE_POOL_CONFIG['warmup']:
+        return None
+    hilo = threading.Thread(target=get_pose_pool().warm_up, args=([POSE_POSTURA, POSE_PODAL],),
+                            name='pose-warm-up', daemon=True)
+    hilo.start()
+    return hilo
@@ -0,0 +1,144 @@
+import logging
+import os
+
+from utils.pose_pool import get_pose_pool, POSE_POSTURA
+from utils.pose_landmarks import landmarks_a_lista, guardar_landmarks
+
+logger = logging.getLogger(__name__)
+
+
+def anotar_imagen_postura(ruta_entrada, ruta_salida, view_type='frontal'):
+    """
+    Procesa una imagen de postura replicando EXACTAMENTE la lógica y apariencia de pose.py.
+    Lee 'ruta_entrada', la re-escala y, si 'view_type' es 'frontal', 'lateral_izq' o 'lateral_der',
+    dibuja los puntos y líneas de la pose; con view_type=None solo se re-escala (sin correr el modelo).
+    Escribe el resultado en 'ruta_salida' junto con sus landmarks. Devuelve (True, None) o (False, error).
+    No depende de Flask: se usa tanto en el request como en los procesos de trabajos en segundo plano.
+    """
+    import cv2  # Import diferido: OpenCV solo se carga al procesar la primera imagen
+    image_to_save = None
+    landmarks_detectados = None
+    pose_procesada = False  # Solo entonces los landmarks (o su ausencia) son un resultado válido
+
+    try:
+        image = cv2.imread(ruta_entrada)
+        if image is None: raise ValueError("OpenCV no pudo leer la imagen.")
+
+        # Replicar el re-escalado del script para consistencia
+        image = cv2.resize(image, (600, 800), interpolation=cv2.INTER_AREA)
+        h, w, _ = image.shape
+        
+        results = None
+        if view_type:
+            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            # Instancia de Pose ya cargada del pool del proceso (no se recarga el modelo por imagen)
+            with get_pose_pool().pose(*POSE_POSTURA) as pose:
+                results = pose.process(image_rgb)
+            landmarks_detectados = landmarks_a_lista(results.pose_landmarks)
+            pose_procesada = True
+        annotated_image = image.copy()
+
+        if results and results.pose_landmarks:
+            landmarks = results.pose_landmarks.landmark
+            
+            # --- LÓGICA FRONTAL (IDÉNTICA A POSE.PY) ---
+            if view_type == 'frontal':
+                # Extraer coordenadas
+                p = {id: (int(landmarks[id].x * w), int(landmarks[id].y * h)) for id in [0, 2, 5, 11, 12, 13, 14, 23, 24, 25, 26, 27, 28]}
+                
+                cv2.circle(annotated_image, (p[0]), 6, (0, 255, 255), -1)
+                cv2.circle(annotated_image, (p[2]), 6, (0, 255, 255), -1)
+                cv2.circle(annotated_image, (p[5]), 6, (0, 255, 255), -1)
+                cv2.circle(annotated_image, (p[11]), 6, (0, 255, 255), -1)
+                cv2.circle(annotated_image, (p[12]), 6, (0, 255, 255), -1)
+                cv2.circle(annotated_image, (p[13]), 6, (0, 255, 255), -1)
+                cv2.circle(annotated_image, (p[14]), 6, (0, 255, 255), -1)
+                cv2.circle(annotated_image, (p[23]), 6, (0, 255, 255), -1)
+                cv2.circle(annotated_image, (p[24]), 6, (0, 255, 255), -1)
+                cv2.circle(annotated_image, (p[25]), 6, (0, 255, 255), -1)
+                cv2.circle(annotated_image, (p[26]), 6, (0, 255, 255), -1)
+                cv2.circle(annotated_image, (p[27]), 6, (0, 255, 255), -1)
+                cv2.circle(annotated_image, (p[28]), 6, (0, 255, 255), -1)
+
+                # Dibujar esqueleto básico (opcional, pero ayuda a visualizar)
+                
+                cv2.line(annotated_image, (p[5]), (p[2]), (0, 0, 255), 2)
+                cv2.line(annotated_image, (p[11]), (p[12]), (0, 0, 255), 2)
+                cv2.line(annotated_image, (p[13]), (p[14]), (0, 0, 255), 2)
+                cv2.line(annotated_image, (p[23]), (p[24]), (0, 0, 255), 2)
+                cv2.line(annotated_image, (p[25]), (p[26]), (0, 0, 255), 2)
+                cv2.line(annotated_image, (p[27]), (p[28]), (0, 0, 255), 2)
+
+                # Líneas horizontales de nivelación (ROJO en tu script)
+                cv2.line(annotated_image, p[11], p[12], (0, 0, 255), 2)
+                cv2.line(annotated_image, p[23], p[24], (0, 0, 255), 2)
+                
+                # Puntos medios y Línea de Plomada (ROJO en tu script)
+                puntos_medios = [
+                    ((p[2][0] + p[5][0]) // 2, (p[2][1] + p[5][1]) // 2),
+                    ((p[11][0] + p[12][0]) // 2, (p[11][1] + p[12][1]) // 2),
+                    ((p[13][0] + p[14][0]) // 2, (p[13][1] + p[14][1]) // 2),
+                    ((p[23][0] + p[24][0]) // 2, (p[23][1] + p[24][1]) // 2),
+                    ((p[25][0] + p[26][0]) // 2, (p[25][1] + p[26][1]) // 2),
+                    ((p[27][0] + p[28][0]) // 2, (p[27][1] + p[28][1]) // 2),
+                ]
+                for i in range(len(puntos_medios) - 1):
+                    cv2.line(annotated_image, puntos_medios[i], puntos_medios[i+1], (0, 0, 255), 2)
+                xm=int((p[27][0] + p[28][0])/2)
+                ym=int((p[27][1] + p[28][1])/2)
+                cv2.line(annotated_image, (xm, ym+50), (xm, 1), (50, 205, 50), 2)
+                
+
+            # --- LÓGICA LATERAL (IDÉNTICA A POSE.PY) ---
+            elif view_type in ['lateral_izq', 'lateral_der']:
+                side_map = {'lateral_der': (7, 11, 23, 25, 27), 'lateral_izq': (8, 12, 24, 26, 28)}
+                ids = side_map[view_type]
+                p = {
+                    'oreja': (int(landmarks[ids[0]].x * w), int(landmarks[ids[0]].y * h)),
+                    'hombro': (int(landmarks[ids[1]].x * w), int(landmarks[ids[1]].y * h)),
+                    'cadera': (int(landmarks[ids[2]].x * w), int(landmarks[ids[2]].y * h)),
+                    'rodilla': (int(landmarks[ids[3]].x * w), int(landmarks[ids[3]].y * h)),
+                    'tobillo': (int(landmarks[ids[4]].x * w), int(landmarks[ids[4]].y * h)),
+                }
+                
+                # Líneas de conexión (ROJO)
+                cv2.line(annotated_image, p['oreja'], p['hombro'], (0, 0, 255), 2)
+                cv2.line(annotated_image, p['hombro'], p['cadera'], (0, 0, 255), 2)
+                cv2.line(annotated_image, p['cadera'], p['rodilla'], (0, 0, 255), 2)
+                cv2.line(annotated_image, p['rodilla'], p['tobillo'], (0, 0, 255), 2)
+
+                # Círculos en las articulaciones (AMARILLO)
+                cv2.circle(annotated_image, p['oreja'], 6, (0, 255, 255), -1)
+                cv2.circle(annotated_image, p['hombro'], 6, (0, 255, 255), -1)
+                cv2.circle(annotated_image, p['cadera'], 6, (0, 255, 255), -1)
+                cv2.circle(annotated_image, p['rodilla'], 6 ,(0 , 255, 255), -1)
+                cv2.circle(annotated_image, p['tobillo'], 6, (0, 255, 255), -1)
+                
+                # Líneas de referencia para CVA (VERDE)
+                cv2.line(annotated_image, (p['tobillo'][0], p['tobillo'][1]+50), (p['tobillo'][0], 1), (0, 255, 0), 2)
+
+
+
+            image_to_save = annotated_image
+        else:
+            if view_type:
+                logger.warning('No se detectó pose en %s.', os.path.basename(ruta_salida))
+            image_to_save = image # Guardar la imagen re-escalada pero sin anotar
+
+    except Exception as e:
+        logger.error('Error durante el procesamiento de pose: %s. Se guardará la imagen original.', e)
+        image_to_save = cv2.imread(ruta_entrada)
+        pose_procesada = False  # Sin sidecar: obtener_landmarks volverá a analizar la imagen
+
+    if image_to_save is not None:
+        save_success = cv2.imwrite(ruta_salida, image_to_save)
+        if save_success:
+            logger.info('Imagen guardada en %s', ruta_salida)
+            if view_type and pose_procesada:
+                # Guardar los 33 landmarks junto a la imagen para que los informes no repitan la inferencia
+                guardar_landmarks(ruta_salida, landmarks_detectados, POSE_POSTURA)
+            return True, None
+        else:
+            return False, f"OpenCV no pudo guardar la imagen en {ruta_salida}."
+    else:
+        return False, "La imagen a guardar estaba vacía."
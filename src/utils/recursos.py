@@ -0,0 +1,89 @@
+import base64
+import io
+import logging
+import mimetypes
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+# Recursos de marca (logo) que se incrustan en los PDF como data URI.
+# Se leen y codifican una sola vez por proceso; se recargan si cambia el archivo (mtime/tamaño).
+RECURSOS_CONFIG = {
+    'logo': 'img/logo.png',                                    # Relativo a la carpeta static
+    'logo_max_px': int(os.environ.get('LOGO_PDF_MAX_PX', 400)),  # 0 = no reducir
+}
+
+
+class RegistroRecursos:
+    """
+    Cache por proceso de archivos de 'static' convertidos a data URI (base64).
+    - La clave es (ruta, max_px); la entrada guarda mtime y tamaño del archivo para invalidarse sola.
+    - Si se indica max_px y PIL está disponible, la imagen se reduce antes de codificarla
+      (el logo se imprime a ~50px de alto: no hace falta incrustar el original).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entradas = {}  # (ruta, max_px) -> (mtime_ns, tamaño, data_uri)
+        self._stats = {'hits': 0, 'cargas': 0}
+
+    def data_uri(self, ruta_absoluta, max_px=0):
+        """Devuelve el data URI del archivo o None si no existe."""
+        try:
+            st = os.stat(ruta_absoluta)
+        except OSError:
+            return None
+        clave = (ruta_absoluta, max_px)
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada and entrada[0] == st.st_mtime_ns and entrada[1] == st.st_size:
+                self._stats['hits'] += 1
+                return entrada[2]
+
+        uri = self._codificar(ruta_absoluta, max_px)
+        with self._lock:
+            self._entradas[clave] = (st.st_mtime_ns, st.st_size, uri)
+            self._stats['cargas'] += 1
+        logger.info('Recurso cargado para PDF: %s (%.0f KB en base64).', ruta_absoluta, len(uri) / 1024)
+        return uri
+
+    def _codificar(self, ruta_absoluta, max_px):
+        mime_type = mimetypes.guess_type(ruta_absoluta)[0] or 'application/octet-stream'
+        with open(ruta_absoluta, 'rb') as f:
+            contenido = f.read()
+        if max_px and mime_type.startswith('image/'):
+            contenido, mime_type = self._reducir(contenido, mime_type, max_px)
+        return f"data:{mime_type};base64,{base64.b64encode(contenido).decode('utf-8')}"
+
+    def _reducir(self, contenido, mime_type, max_px):
+        try:
+            from PIL import Image  # Import diferido; si no está disponible se usa el original
+            with Image.open(io.BytesIO(contenido)) as img:
+                if max(img.size) <= max_px:
+                    return contenido, mime_type
+                img.thumbnail((max_px, max_px), Image.LANCZOS)
+                salida = io.BytesIO()
+                img.save(salida, format='PNG', optimize=True)  # PNG conserva la transparencia del logo
+            reducido = salida.getvalue()
+            if len(reducido) < len(contenido):
+                return reducido, 'image/png'
+        except Exception as e:
+            logger.warning('No se pudo reducir el recurso para PDF: %s', e)
+        return contenido, mime_type
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['recursos'] = len(self._entradas)
+        return stats
+
+
+registro_recursos = RegistroRecursos()
+
+
+def logo_data_uri(static_folder):
+    """Logo del centro como data URI para las plantillas PDF (None si no existe el archivo)."""
+    return registro_recursos.data_uri(os.path.join(static_folder, RECURSOS_CONFIG['logo']),
+                                      RECURSOS_CONFIG['logo_max_px'])
@@ -0,0 +1,187 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import has_request_context, request, session
+
+
+# Registro (logging) de la aplicación. Cada módulo usa su propio logger (logging.getLogger(__name__))
+# y configurar_logging() conecta la raíz a una cola: el request solo encola el registro y un hilo lo
+# escribe, así una salida lenta (pipe lleno, disco) no bloquea las respuestas.
+# - LOG_LEVEL: nivel mínimo (DEBUG, INFO, WARNING, ERROR). Los mensajes de depuración con datos de
+#   pacientes quedan en DEBUG y no se escriben con el nivel por defecto.
+# - LOG_FORMATO: 'json' (una línea JSON por registro) o 'texto'.
+# - LOG_LIMITE_POR_MINUTO: repeticiones del mismo mensaje (misma plantilla) por minuto; el resto se
+#   cuenta y se informa en el siguiente que pase. LOG_MUESTREO_DEBUG: fracción de DEBUG que se escribe.
+LOGGING_CONFIG = {
+    'nivel': os.environ.get('LOG_LEVEL', 'INFO').upper(),
+    'formato': os.environ.get('LOG_FORMATO', 'json'),
+    'limite_por_minuto': int(os.environ.get('LOG_LIMITE_POR_MINUTO', 60)),  # 0 = sin límite
+    'muestreo_debug': float(os.environ.get('LOG_MUESTREO_DEBUG', 1.0)),
+    'cola_max': int(os.environ.get('LOG_COLA_MAX', 10000)),
+}
+
+_stats = {'encolados': 0, 'descartados_cola': 0, 'omitidos_limite': 0, 'omitidos_muestreo': 0}
+_stats_lock = threading.Lock()
+_listener = None
+_cola = None
+
+
+def _contar(clave, n=1):
+    with _stats_lock:
+        _stats[clave] += n
+
+
+class FiltroLimite(logging.Filter):
+    """
+    Limita cada mensaje (logger + nivel + plantilla, sin los valores) a 'limite' por ventana de
+    'ventana_s' segundos y muestrea DEBUG. Los omitidos se informan en el siguiente que pase
+    (atributo 'omitidos').
+    """
+
+    def __init__(self, limite=60, ventana_s=60.0, muestreo_debug=1.0):
+        super().__init__()
+        self.limite = int(limite)
+        self.ventana_s = float(ventana_s)
+        self.muestreo_debug = float(muestreo_debug)
+        self._lock = threading.Lock()
+        self._ventanas = {}  # clave -> [inicio, pasados, omitidos]
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and self.muestreo_debug < 1.0 and random.random() >= self.muestreo_debug:
+            _contar('omitidos_muestreo')
+            return False
+        if self.limite <= 0:
+            return True
+        clave = (record.name, record.levelno, str(record.msg))
+        ahora = time.monotonic()
+        with self._lock:
+            ventana = self._ventanas.get(clave)
+            if ventana is None or ahora - ventana[0] >= self.ventana_s:
+                omitidos = ventana[2] if ventana else 0
+                if len(self._ventanas) > 5000:
+                    self._ventanas.clear()
+                self._ventanas[clave] = [ahora, 1, 0]
+                if omitidos:
+                    record.omitidos = omitidos
+                return True
+            if ventana[1] < self.limite:
+                ventana[1] += 1
+                return True
+            ventana[2] += 1
+        _contar('omitidos_limite')
+        return False
+
+
+class FiltroContexto(logging.Filter):
+    """Agrega método, ruta y doctor del request (se evalúa en el hilo del request, antes de encolar)."""
+
+    def filter(self, record):
+        if has_request_context():
+            record.metodo = request.method
+            record.ruta = request.path
+            record.id_dr = session.get('id_dr')
+        return True
+
+
+class ColaNoBloqueante(QueueHandler):
+    """QueueHandler que descarta (y cuenta) los registros si la cola está llena en vez de bloquear."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            _contar('encolados')
+        except queue.Full:
+            _contar('descartados_cola')
+
+
+_CAMPOS_EXTRA = ('metodo', 'ruta', 'id_dr', 'omitidos')
+
+
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por registro: ts, nivel, logger, funcion, mensaje y el contexto del request."""
+
+    def format(self, record):
+        datos = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            'nivel': record.levelname,
+            'logger': record.name,
+            'funcion': record.funcName,
+            'mensaje': record.getMessage(),
+        }
+        for campo in _CAMPOS_EXTRA:
+            valor = getattr(record, campo, None)
+            if valor is not None:
+                datos[campo] = valor
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            datos['excepcion'] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class FormatoTexto(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s.%(funcName)s: %(message)s')
+
+    def format(self, record):
+        texto = super().format(record)
+        if getattr(record, 'ruta', None):
+            texto += f" [{record.metodo} {record.ruta}]"
+        if getattr(record, 'omitidos', None):
+            texto += f" (+{record.omitidos} repetidos omitidos)"
+        return texto
+
+
+def configurar_logging(stream=None):
+    """
+    Conecta el logger raíz a la cola (una sola vez por proceso) e inicia el hilo que escribe en
+    'stream' (stdout por defecto, donde antes escribían los print).
+    """
+    global _listener, _cola
+    if _listener is not None:
+        return
+    nivel = getattr(logging, LOGGING_CONFIG['nivel'], logging.INFO)
+    salida = logging.StreamHandler(stream or sys.stdout)
+    salida.setFormatter(FormatoJSON() if LOGGING_CONFIG['formato'] == 'json' else FormatoTexto())
+
+    _cola = queue.Queue(maxsize=max(1, LOGGING_CONFIG['cola_max']))
+    encolador = ColaNoBloqueante(_cola)
+    encolador.addFilter(FiltroLimite(LOGGING_CONFIG['limite_por_minuto'], 60.0, LOGGING_CONFIG['muestreo_debug']))
+    encolador.addFilter(FiltroContexto())
+
+    raiz = logging.getLogger()
+    raiz.setLevel(nivel)
+    raiz.addHandler(encolador)
+    # Bibliotecas muy verbosas en DEBUG
+    for nombre in ('urllib3', 'PIL', 'mysql.connector', 'werkzeug'):
+        logging.getLogger(nombre).setLevel(max(nivel, logging.INFO))
+
+    _listener = QueueListener(_cola, salida, respect_handler_level=True)
+    _listener.start()
+    atexit.register(detener_logging)
+
+
+def detener_logging():
+    """Escribe lo pendiente en la cola y detiene el hilo (se registra con atexit)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def stats_logging():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['en_cola'] = _cola.qsize() if _cola is not None else 0
+    stats['nivel'] = LOGGING_CONFIG['nivel']
+    stats['limite_por_minuto'] = LOGGING_CONFIG['limite_por_minuto']
+    stats['muestreo_debug'] = LOGGING_CONFIG['muestreo_debug']
+    return stats
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from database import connect_to_db, get_reportes_combinados_periodo
+
+
+# Reporte combinado del dashboard de administración (todas las gráficas de un rango en una petición).
+# El resultado se guarda por proceso unos minutos: cambiar de pestaña o recargar el dashboard
+# con el mismo rango no vuelve a consultar la BD. ?refrescar=1 lo recalcula.
+REPORTES_CONFIG = {
+    'ttl_s': float(os.environ.get('REPORTES_CACHE_TTL_S', 120)),  # 0 = sin caché
+    'max_entradas': 64,
+    'max_dias': 366 * 10,  # Rango máximo aceptado
+}
+
+
+class CacheReportes:
+    """LRU con expiración de reportes combinados; la clave es (inicio, fin, doctor, centro)."""
+
+    def __init__(self, ttl_s=120, max_entradas=64):
+        self.ttl_s = float(ttl_s)
+        self.max_entradas = int(max_entradas)
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # clave -> (expira, reporte)
+        self._stats = {'hits': 0, 'misses': 0, 'calculos_ms': 0.0}
+
+    def obtener(self, clave):
+        if self.ttl_s <= 0:
+            return None
+        with self._lock:
+            entrada = self._cache.get(clave)
+            if entrada is None or entrada[0] < time.monotonic():
+                self._cache.pop(clave, None)
+                self._stats['misses'] += 1
+                return None
+            self._cache.move_to_end(clave)
+            self._stats['hits'] += 1
+            return entrada[1]
+
+    def guardar(self, clave, reporte, ms):
+        with self._lock:
+            self._stats['calculos_ms'] += ms
+            if self.ttl_s <= 0:
+                return
+            self._cache[clave] = (time.monotonic() + self.ttl_s, reporte)
+            self._cache.move_to_end(clave)
+            while len(self._cache) > self.max_entradas:
+                self._cache.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entradas'] = len(self._cache)
+        stats['calculos_ms'] = round(stats['calculos_ms'], 1)
+        consultas = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / consultas, 3) if consultas else None
+        return stats
+
+
+cache_reportes = CacheReportes(ttl_s=REPORTES_CONFIG['ttl_s'], max_entradas=REPORTES_CONFIG['max_entradas'])
+
+
+def validar_rango(fecha_inicio_str, fecha_fin_str):
+    """Devuelve un mensaje de error si el rango no es válido ('YYYY-MM-DD', inicio <= fin, no excesivo) o None."""
+    try:
+        inicio = datetime.strptime(fecha_inicio_str or '', '%Y-%m-%d')
+        fin = datetime.strptime(fecha_fin_str or '', '%Y-%m-%d')
+    except ValueError:
+        return "Las fechas deben tener el formato YYYY-MM-DD."
+    if inicio > fin:
+        return "La fecha de inicio no puede ser posterior a la fecha de fin."
+    if (fin - inicio).days > REPORTES_CONFIG['max_dias']:
+        return "El rango de fechas es demasiado amplio."
+    return None
+
+
+def obtener_reportes_combinados(fecha_inicio_str, fecha_fin_str, doctor_id=0, centro_id=0, refrescar=False):
+    """
+    Reporte combinado del rango (ver get_reportes_combinados_periodo) desde la caché o recalculado.
+    Devuelve (reporte, etag) o (None, None) si no hubo conexión o falló la consulta.
+    El reporte incluye 'generado' (fecha y hora del cálculo) y 'ms' (duración del cálculo).
+    """
+    clave = (fecha_inicio_str, fecha_fin_str, int(doctor_id or 0), int(centro_id or 0))
+    if not refrescar:
+        en_cache = cache_reportes.obtener(clave)
+        if en_cache is not None:
+            return en_cache
+
+    connection = connect_to_db()
+    if not connection:
+        return None, None
+    try:
+        inicio = time.perf_counter()
+        reporte = get_reportes_combinados_periodo(connection, fecha_inicio_str, fecha_fin_str,
+                                                  doctor_id=clave[2], centro_id=clave[3])
+        ms = (time.perf_counter() - inicio) * 1000.0
+    finally:
+        connection.close()
+    if reporte is None:
+        return None, None
+
+    # El ETag depende solo de los datos: un recálculo con el mismo resultado conserva el ETag (304)
+    etag = hashlib.sha256(json.dumps(reporte, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:32]
+    reporte['generado'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    reporte['ms'] = round(ms, 1)
+    cache_reportes.guardar(clave, (reporte, etag), ms)
+    return reporte, etag
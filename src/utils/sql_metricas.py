@@ -0,0 +1,239 @@
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from functools import lru_cache
+
+from flask import g, has_app_context
+
+logger = logging.getLogger(__name__)
+
+
+# Instrumentación de las consultas SQL. connect_to_db envuelve cada cursor (ver PooledConnection en
+# utils/db_pool.py) y cada execute() se registra con su huella (la sentencia sin valores), duración,
+# filas y la función que la ejecutó.
+# - Por request: encabezado Server-Timing (número de consultas y tiempo total en la BD).
+# - Por proceso: las huellas más lentas (/admin/sistema/sql).
+# - Las consultas que tardan más de 'lento_ms' se escriben en el log.
+SQL_METRICAS_CONFIG = {
+    'enabled': os.environ.get('SQL_METRICAS_ENABLED', '1') == '1',
+    'lento_ms': float(os.environ.get('SQL_LENTO_MS', 200)),
+    'top_n': int(os.environ.get('SQL_TOP_N', 25)),
+    'max_huellas': 500,       # Huellas distintas que se acumulan por proceso
+    'max_por_request': 200,   # Consultas que se guardan con detalle por request
+}
+
+# Cadenas y comentarios en una sola pasada (lo que aparezca primero gana: un apóstrofo dentro de
+# un comentario no abre una cadena)
+_CADENAS_Y_COMENTARIOS = re.compile(
+    r"(?P<cadena>'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\")|(?P<comentario>/\*.*?\*/|--[^\n]*|#[^\n]*)", re.S
+)
+_MARCADORES = re.compile(r"%\(\w+\)s|%s")
+_NUMEROS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LISTAS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_FILAS_MULTIPLES = re.compile(r"\(\?\+\)(?:\s*,\s*\(\?\+\))+")
+_ESPACIOS = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def huella_sql(sql):
+    """
+    Sentencia normalizada para agrupar ejecuciones: sin comentarios ni valores y con las listas
+    colapsadas ("WHERE id IN (%s, %s, %s) LIMIT 5" -> "WHERE id IN (?+) LIMIT ?").
+    """
+    texto = _CADENAS_Y_COMENTARIOS.sub(lambda m: '?' if m.group('cadena') else ' ', sql)
+    texto = _MARCADORES.sub('?', texto)
+    texto = _NUMEROS.sub('?', texto)
+    texto = _LISTAS.sub('(?+)', texto)
+    texto = _FILAS_MULTIPLES.sub('(?+)+', texto)
+    return _ESPACIOS.sub(' ', texto).strip()[:1000]
+
+
+def _llamador():
+    """'modulo.funcion' que ejecutó la consulta (el primer frame fuera de este archivo)."""
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    if frame is None:
+        return '?'
+    modulo = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+    return f"{modulo}.{frame.f_code.co_name}"
+
+
+class RegistroSQL:
+    """Consultas de un request: totales y el detalle de las primeras 'max_detalle'."""
+
+    def __init__(self, max_detalle=200):
+        self.max_detalle = int(max_detalle)
+        self.consultas = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.lentas = 0
+        self.detalle = []  # (huella, ms, filas, llamador)
+
+    def agregar(self, huella, ms, filas, llamador, lenta):
+        self.consultas += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        if lenta:
+            self.lentas += 1
+        if len(self.detalle) < self.max_detalle:
+            self.detalle.append((huella, round(ms, 3), filas, llamador))
+
+
+class MetricasSQL:
+    """
+    Acumulado por proceso, por huella: ejecuciones, tiempo total y máximo, filas y llamadores.
+    Guarda a lo más 'max_huellas' huellas; al llenarse descarta las de menor tiempo total.
+    """
+
+    def __init__(self, max_huellas=500):
+        self.max_huellas = int(max_huellas)
+        self._lock = threading.Lock()
+        self._huellas = {}
+        self._stats = {'consultas': 0, 'total_ms': 0.0, 'lentas': 0, 'huellas_descartadas': 0}
+        self._desde = time.time()
+
+    def registrar(self, huella, ms, filas, llamador, lenta):
+        with self._lock:
+            self._stats['consultas'] += 1
+            self._stats['total_ms'] += ms
+            if lenta:
+                self._stats['lentas'] += 1
+            datos = self._huellas.get(huella)
+            if datos is None:
+                if len(self._huellas) >= self.max_huellas:
+                    self._descartar()
+                datos = self._huellas[huella] = {
+                    'huella': huella, 'ejecuciones': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'lentas': 0, 'filas': 0, 'llamadores': {},
+                }
+            datos['ejecuciones'] += 1
+            datos['total_ms'] += ms
+            datos['max_ms'] = max(datos['max_ms'], ms)
+            if lenta:
+                datos['lentas'] += 1
+            if filas and filas > 0:
+                datos['filas'] += filas
+            datos['llamadores'][llamador] = datos['llamadores'].get(llamador, 0) + 1
+
+    def _descartar(self):
+        """Quita la décima parte de las huellas con menor tiempo total (con el lock tomado)."""
+        orden = sorted(self._huellas.values(), key=lambda d: d['total_ms'])
+        for datos in orden[:max(1, self.max_huellas // 10)]:
+            del self._huellas[datos['huella']]
+            self._stats['huellas_descartadas'] += 1
+
+    def top(self, n=25, orden='max_ms'):
+        """Las 'n' huellas con mayor 'orden' (max_ms, total_ms o ejecuciones)."""
+        with self._lock:
+            huellas = [dict(d, llamadores=dict(d['llamadores'])) for d in self._huellas.values()]
+        huellas.sort(key=lambda d: d[orden], reverse=True)
+        for datos in huellas[:n]:
+            datos['prom_ms'] = round(datos['total_ms'] / datos['ejecuciones'], 3)
+            datos['total_ms'] = round(datos['total_ms'], 3)
+            datos['max_ms'] = round(datos['max_ms'], 3)
+        return huellas[:n]
+
+    def stats(self, n=25, orden='max_ms'):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['huellas'] = len(self._huellas)
+        stats['total_ms'] = round(stats['total_ms'], 3)
+        stats['desde'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self._desde))
+        stats['lento_ms'] = SQL_METRICAS_CONFIG['lento_ms']
+        stats['orden'] = orden
+        stats['top'] = self.top(n, orden)
+        return stats
+
+    def reiniciar(self):
+        with self._lock:
+            self._huellas.clear()
+            self._stats = {'consultas': 0, 'total_ms': 0.0, 'lentas': 0, 'huellas_descartadas': 0}
+            self._desde = time.time()
+
+
+metricas_sql = MetricasSQL(max_huellas=SQL_METRICAS_CONFIG['max_huellas'])
+
+
+def observar_consulta(sql, ms, filas):
+    """Registra una ejecución en el request actual (si hay contexto de app) y en el acumulado del proceso."""
+    if not isinstance(sql, str):
+        sql = sql.decode('utf-8', 'replace') if isinstance(sql, (bytes, bytearray)) else str(sql)
+    huella = huella_sql(sql)
+    llamador = _llamador()
+    lenta = ms >= SQL_METRICAS_CONFIG['lento_ms']
+    metricas_sql.registrar(huella, ms, filas, llamador, lenta)
+    if lenta:
+        logger.warning('SQL lenta (%.1f ms, %s filas) en %s: %s', ms, filas, llamador, huella[:300])
+    if has_app_context():
+        registro = g.get('_registro_sql')
+        if registro is None:
+            registro = g._registro_sql = RegistroSQL(SQL_METRICAS_CONFIG['max_por_request'])
+        registro.agregar(huella, ms, filas, llamador, lenta)
+
+
+class CursorInstrumentado:
+    """Envoltura de un cursor de mysql.connector que mide execute/executemany; el resto se delega."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def _medir(self, metodo, operacion, args, kwargs):
+        inicio = time.perf_counter()
+        try:
+            return metodo(operacion, *args, **kwargs)
+        finally:
+            ms = (time.perf_counter() - inicio) * 1000.0
+            try:
+                filas = self._cursor.rowcount  # -1 en cursores sin buffer hasta leer las filas
+            except Exception:
+                filas = -1
+            observar_consulta(operacion, ms, filas)
+
+    def execute(self, operacion, *args, **kwargs):
+        return self._medir(self._cursor.execute, operacion, args, kwargs)
+
+    def executemany(self, operacion, *args, **kwargs):
+        return self._medir(self._cursor.executemany, operacion, args, kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+        return False
+
+
+def instrumentar_cursor(cursor):
+    return CursorInstrumentado(cursor)
+
+
+def registro_request():
+    """RegistroSQL del request actual o None si no hubo consultas."""
+    return g.get('_registro_sql') if has_app_context() else None
+
+
+def encabezado_server_timing(espera_pool_ms=None):
+    """
+    Valor del encabezado Server-Timing del request actual, p. ej.:
+    db;dur=12.4;desc="7 consultas", db-max;dur=5.1, db-pool;dur=0.2
+    """
+    partes = []
+    registro = registro_request()
+    if registro is not None:
+        partes.append(f'db;dur={registro.total_ms:.1f};desc="{registro.consultas} consultas"')
+        partes.append(f'db-max;dur={registro.max_ms:.1f}')
+        if registro.lentas:
+            partes.append(f'db-lentas;desc="{registro.lentas}"')
+    if espera_pool_ms is not None:
+        partes.append(f'db-pool;dur={espera_pool_ms:.1f}')
+    return ', '.join(partes)